@@ -70,6 +70,10 @@ class SchedulerConfig:
     batch_size: int = 100
     retry_attempts: int = 3
     retry_delay_seconds: float = 5.0
+    overlap_policy: str = "skip"  # skip | queue
+    lease_ttl_seconds: int = 600
+    queue_timeout_seconds: int = 3600
+    min_run_interval_seconds: int = 3600
 
 class Settings:
     """Main settings class."""
@@ -166,7 +170,11 @@ class Settings:
             max_execution_time=int(os.getenv('MAX_EXECUTION_TIME', '3600')),
             batch_size=int(os.getenv('BATCH_SIZE', '100')),
             retry_attempts=int(os.getenv('SCHEDULER_RETRY_ATTEMPTS', '3')),
-            retry_delay_seconds=float(os.getenv('SCHEDULER_RETRY_DELAY', '5.0'))
+            retry_delay_seconds=float(os.getenv('SCHEDULER_RETRY_DELAY', '5.0')),
+            overlap_policy=os.getenv('SCHEDULER_OVERLAP_POLICY', 'skip'),
+            lease_ttl_seconds=int(os.getenv('SCHEDULER_LEASE_TTL', '600')),
+            queue_timeout_seconds=int(os.getenv('SCHEDULER_QUEUE_TIMEOUT', '3600')),
+            min_run_interval_seconds=int(os.getenv('SCHEDULER_MIN_RUN_INTERVAL', '3600'))
         )
 
     def validate(self) -> List[str]:
@@ -198,6 +206,9 @@ class Settings:
         except ValueError:
             errors.append("Invalid extraction time format (must be HH:MM)")
 
+        if self.scheduler.overlap_policy not in ("skip", "queue"):
+            errors.append("Invalid scheduler overlap policy (must be 'skip' or 'queue')")
+
         return errors
 
     def to_dict(self) -> Dict[str, Any]:
@@ -244,7 +255,9 @@ class Settings:
                 "extraction_time": self.scheduler.extraction_time,
                 "timezone": self.scheduler.timezone,
                 "max_execution_time": self.scheduler.max_execution_time,
-                "batch_size": self.scheduler.batch_size
+                "batch_size": self.scheduler.batch_size,
+                "overlap_policy": self.scheduler.overlap_policy,
+                "lease_ttl_seconds": self.scheduler.lease_ttl_seconds
             }
         }
 
@@ -241,4 +241,112 @@ class Update(Base):
         }
 
     def __repr__(self):
-        return f"<Update(tender_id='{self.tender_id}', fuente='{self.fuente}', titulo='{self.titulo[:50]}...')>"
\ No newline at end of file
+        return f"<Update(tender_id='{self.tender_id}', fuente='{self.fuente}', titulo='{self.titulo[:50]}...')>"
+
+class RunLease(Base):
+    """Model for the run_leases table: one row per job while a run holds it."""
+
+    __tablename__ = 'run_leases'
+
+    job_name = Column(String(100), primary_key=True)
+    holder = Column(String(255), nullable=False)
+    acquired_at = Column(TIMESTAMP, nullable=False)
+    heartbeat_at = Column(TIMESTAMP, nullable=False)
+    expires_at = Column(TIMESTAMP, nullable=False)
+
+    def __repr__(self):
+        return f"<RunLease(job_name='{self.job_name}', holder='{self.holder}', expires_at='{self.expires_at}')>"
+
+
+class RunLedger(Base):
+    """Model for the run_ledger table recording every scheduler trigger."""
+
+    __tablename__ = 'run_ledger'
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    job_name = Column(String(100), nullable=False)
+    trigger = Column(String(50), nullable=True)
+    holder = Column(String(255), nullable=True)
+
+    # running, success, error, skipped, abandoned
+    status = Column(String(20), nullable=False)
+
+    triggered_at = Column(TIMESTAMP, nullable=False)
+    started_at = Column(TIMESTAMP, nullable=True)
+    finished_at = Column(TIMESTAMP, nullable=True)
+    queue_delay_seconds = Column(DECIMAL(12, 3), nullable=True)
+    duration_seconds = Column(DECIMAL(12, 3), nullable=True)
+    error = Column(Text, nullable=True)
+    details = Column(JSONB, nullable=True)
+
+    __table_args__ = (
+        Index('idx_run_ledger_job_triggered', 'job_name', 'triggered_at'),
+    )
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Convert model to dictionary.
+
+        Returns:
+            Dictionary representation of the model
+        """
+        return {
+            'id': self.id,
+            'job_name': self.job_name,
+            'trigger': self.trigger,
+            'holder': self.holder,
+            'status': self.status,
+            'triggered_at': self.triggered_at.isoformat() if self.triggered_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+            'queue_delay_seconds': float(self.queue_delay_seconds) if self.queue_delay_seconds is not None else None,
+            'duration_seconds': float(self.duration_seconds) if self.duration_seconds is not None else None,
+            'error': self.error,
+            'details': self.details
+        }
+
+
+class MetricsDailyRollup(Base):
+    """Model for the metrics_daily_rollup table: per-(day, source) aggregates of updates."""
+
+    __tablename__ = 'metrics_daily_rollup'
+
+    day = Column(DATE, primary_key=True)
+    fuente = Column(String(50), primary_key=True)
+
+    total_records = Column(Integer, nullable=False, default=0)
+    processed_count = Column(Integer, nullable=False, default=0)
+    with_tender_id = Column(Integer, nullable=False, default=0)
+    with_title = Column(Integer, nullable=False, default=0)
+    with_description = Column(Integer, nullable=False, default=0)
+    with_opening_date = Column(Integer, nullable=False, default=0)
+    with_catalog_date = Column(Integer, nullable=False, default=0)
+    with_entity = Column(Integer, nullable=False, default=0)
+    with_state = Column(Integer, nullable=False, default=0)
+    with_city = Column(Integer, nullable=False, default=0)
+    with_value = Column(Integer, nullable=False, default=0)
+    with_type = Column(Integer, nullable=False, default=0)
+    with_url = Column(Integer, nullable=False, default=0)
+    with_semantic_text = Column(Integer, nullable=False, default=0)
+    with_embeddings = Column(Integer, nullable=False, default=0)
+    description_length_sum = Column(DECIMAL(20, 0), nullable=False, default=0)
+    semantic_length_sum = Column(DECIMAL(20, 0), nullable=False, default=0)
+
+    first_extraction = Column(TIMESTAMP, nullable=True)
+    last_extraction = Column(TIMESTAMP, nullable=True)
+
+    def __repr__(self):
+        return f"<MetricsDailyRollup(day='{self.day}', fuente='{self.fuente}', total_records={self.total_records})>"
+
+
+class MetricsRollupState(Base):
+    """Model for the metrics_rollup_state table: watermark of the last update folded into the rollup."""
+
+    __tablename__ = 'metrics_rollup_state'
+
+    name = Column(String(100), primary_key=True)
+    last_seen_id = Column(Integer, nullable=False, default=0)
+    refreshed_at = Column(TIMESTAMP, nullable=True)
+
+    def __repr__(self):
+        return f"<MetricsRollupState(name='{self.name}', last_seen_id={self.last_seen_id})>"
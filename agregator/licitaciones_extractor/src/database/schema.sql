@@ -39,6 +39,64 @@ CREATE INDEX IF NOT EXISTS idx_metadata_gin ON updates USING gin (metadata);
 CREATE INDEX IF NOT EXISTS idx_unprocessed ON updates (fecha_extraccion) WHERE procesado = FALSE;
 CREATE INDEX IF NOT EXISTS idx_recent_extractions ON updates (fecha_extraccion) WHERE fecha_extraccion >= CURRENT_DATE - INTERVAL '7 days';
 
+-- Scheduler run coordination: one lease row per job, plus a ledger of every trigger
+CREATE TABLE IF NOT EXISTS run_leases (
+    job_name VARCHAR(100) PRIMARY KEY,
+    holder VARCHAR(255) NOT NULL,
+    acquired_at TIMESTAMP NOT NULL,
+    heartbeat_at TIMESTAMP NOT NULL,
+    expires_at TIMESTAMP NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS run_ledger (
+    id SERIAL PRIMARY KEY,
+    job_name VARCHAR(100) NOT NULL,
+    trigger VARCHAR(50),
+    holder VARCHAR(255),
+    status VARCHAR(20) NOT NULL,
+    triggered_at TIMESTAMP NOT NULL,
+    started_at TIMESTAMP,
+    finished_at TIMESTAMP,
+    queue_delay_seconds DECIMAL(12,3),
+    duration_seconds DECIMAL(12,3),
+    error TEXT,
+    details JSONB
+);
+
+CREATE INDEX IF NOT EXISTS idx_run_ledger_job_triggered ON run_ledger (job_name, triggered_at);
+
+-- Monitoring rollup: per-(day, source) aggregates maintained incrementally from updates.id
+CREATE TABLE IF NOT EXISTS metrics_daily_rollup (
+    day DATE NOT NULL,
+    fuente VARCHAR(50) NOT NULL,
+    total_records INTEGER NOT NULL DEFAULT 0,
+    processed_count INTEGER NOT NULL DEFAULT 0,
+    with_tender_id INTEGER NOT NULL DEFAULT 0,
+    with_title INTEGER NOT NULL DEFAULT 0,
+    with_description INTEGER NOT NULL DEFAULT 0,
+    with_opening_date INTEGER NOT NULL DEFAULT 0,
+    with_catalog_date INTEGER NOT NULL DEFAULT 0,
+    with_entity INTEGER NOT NULL DEFAULT 0,
+    with_state INTEGER NOT NULL DEFAULT 0,
+    with_city INTEGER NOT NULL DEFAULT 0,
+    with_value INTEGER NOT NULL DEFAULT 0,
+    with_type INTEGER NOT NULL DEFAULT 0,
+    with_url INTEGER NOT NULL DEFAULT 0,
+    with_semantic_text INTEGER NOT NULL DEFAULT 0,
+    with_embeddings INTEGER NOT NULL DEFAULT 0,
+    description_length_sum DECIMAL(20,0) NOT NULL DEFAULT 0,
+    semantic_length_sum DECIMAL(20,0) NOT NULL DEFAULT 0,
+    first_extraction TIMESTAMP,
+    last_extraction TIMESTAMP,
+    PRIMARY KEY (day, fuente)
+);
+
+CREATE TABLE IF NOT EXISTS metrics_rollup_state (
+    name VARCHAR(100) PRIMARY KEY,
+    last_seen_id INTEGER NOT NULL DEFAULT 0,
+    refreshed_at TIMESTAMP
+);
+
 -- Optional: Create pgvector extension and update embeddings column type
 -- Uncomment the following lines when pgvector extension is available:
 
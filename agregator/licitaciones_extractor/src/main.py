@@ -475,6 +475,12 @@ def main():
         help="Run without saving to database"
     )
 
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Run the daily job even if it succeeded within the minimum run interval"
+    )
+
     parser.add_argument(
         "--verbose",
         "-v",
@@ -525,7 +531,12 @@ def main():
                 sys.exit(1)
 
         elif args.mode == "daily":
-            run_daily_job()
+            # Coordinated with the continuous scheduler so cron and scheduler never overlap
+            scheduler = DailyScheduler()
+            scheduler.set_job_function(run_daily_job)
+            outcome = scheduler.run_now(trigger="cli", force=args.force)
+            if outcome['status'] == 'error':
+                sys.exit(1)
 
         elif args.mode == "scheduler":
             logger.logger.info("Starting continuous scheduler mode")
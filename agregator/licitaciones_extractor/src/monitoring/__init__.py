@@ -5,9 +5,11 @@ Monitoring module for tender extraction system
 from .metrics_collector import MetricsCollector
 from .performance_monitor import PerformanceMonitor
 from .data_quality import DataQualityAnalyzer
+from .metrics_rollup import MetricsRollup
 
 __all__ = [
     'MetricsCollector',
     'PerformanceMonitor',
-    'DataQualityAnalyzer'
+    'DataQualityAnalyzer',
+    'MetricsRollup'
 ]
\ No newline at end of file
@@ -4,15 +4,18 @@ Dashboard system for real-time monitoring of tender extraction system
 
 import json
 import os
+import threading
+import time
 from datetime import datetime, timedelta
 from pathlib import Path
-from typing import Dict, List, Optional, Any
+from typing import Callable, Dict, List, Optional, Any
 from flask import Flask, render_template_string, jsonify, request
 from flask_cors import CORS
 import plotly.graph_objs as go
 import plotly.utils
 
 from .metrics_collector import MetricsCollector
+from .metrics_rollup import MetricsRollup
 from .data_quality import DataQualityAnalyzer
 from .performance_monitor import PerformanceMonitor
 from ..database.connection import DatabaseConnection
@@ -22,7 +25,7 @@ from ..utils.logger import get_logger
 class Dashboard:
     """Web-based dashboard for monitoring system metrics"""
 
-    def __init__(self, host: str = "127.0.0.1", port: int = 5000):
+    def __init__(self, host: str = "127.0.0.1", port: int = 5000, chart_cache_ttl: int = 60):
         self.app = Flask(__name__)
         CORS(self.app)
         self.host = host
@@ -31,10 +34,16 @@ class Dashboard:
 
         # Initialize monitoring components
         self.db_connection = DatabaseConnection()
-        self.metrics_collector = MetricsCollector(self.db_connection)
-        self.quality_analyzer = DataQualityAnalyzer(self.db_connection)
+        self.rollup = MetricsRollup(self.db_connection)
+        self.metrics_collector = MetricsCollector(self.db_connection, self.rollup)
+        self.quality_analyzer = DataQualityAnalyzer(self.db_connection, self.rollup)
         self.performance_monitor = PerformanceMonitor()
 
+        # Serialized Plotly figures keyed by chart name: (data version, expiry, figure JSON)
+        self.chart_cache_ttl = chart_cache_ttl
+        self._chart_cache: Dict[str, tuple] = {}
+        self._chart_cache_lock = threading.Lock()
+
         # Setup routes
         self._setup_routes()
 
@@ -98,7 +107,7 @@ class Dashboard:
         def extraction_trend():
             """Get extraction trend chart data"""
             try:
-                chart_data = self._generate_extraction_trend_chart()
+                chart_data = self._cached_chart("extraction_trend", self._generate_extraction_trend_chart, self._rollup_version())
                 return jsonify(chart_data)
             except Exception as e:
                 self.logger.error(f"Error generating extraction trend: {e}")
@@ -108,7 +117,7 @@ class Dashboard:
         def quality_overview():
             """Get quality overview chart data"""
             try:
-                chart_data = self._generate_quality_overview_chart()
+                chart_data = self._cached_chart("quality_overview", self._generate_quality_overview_chart, self._rollup_version())
                 return jsonify(chart_data)
             except Exception as e:
                 self.logger.error(f"Error generating quality overview: {e}")
@@ -118,7 +127,7 @@ class Dashboard:
         def performance_history():
             """Get performance history chart data"""
             try:
-                chart_data = self._generate_performance_history_chart()
+                chart_data = self._cached_chart("performance_history", self._generate_performance_history_chart, self._metrics_file_version())
                 return jsonify(chart_data)
             except Exception as e:
                 self.logger.error(f"Error generating performance history: {e}")
@@ -153,62 +162,69 @@ class Dashboard:
                     "timestamp": datetime.now().isoformat()
                 }), 503
 
+    def _cached_chart(self, name: str, builder: Callable[[], Dict], version: Any) -> Dict:
+        """Return a chart's Plotly JSON, rebuilding it only when its data changed or the TTL expired"""
+        now = time.monotonic()
+        with self._chart_cache_lock:
+            cached = self._chart_cache.get(name)
+            if cached and cached[0] == version and cached[1] > now:
+                return cached[2]
+
+        chart_data = builder()
+        if chart_data:
+            with self._chart_cache_lock:
+                self._chart_cache[name] = (version, now + self.chart_cache_ttl, chart_data)
+        return chart_data
+
+    def _rollup_version(self) -> int:
+        """Version of the rollup-backed charts: the last updates id folded into the rollup"""
+        self.rollup.refresh()
+        return self.rollup.last_seen_id
+
+    def _metrics_file_version(self) -> Optional[float]:
+        """Version of the performance history chart: modification time of the metrics file"""
+        metrics_file = Path("logs/metrics.json")
+        return metrics_file.stat().st_mtime if metrics_file.exists() else None
+
     def _generate_extraction_trend_chart(self) -> Dict:
         """Generate extraction trend chart data"""
         try:
-            # Get extraction data for last 30 days
-            from sqlalchemy import text
-
-            with self.db_connection.get_session() as session:
-                query = """
-                    SELECT
-                        DATE(fecha_extraccion) as date,
-                        fuente,
-                        COUNT(*) as count
-                    FROM updates
-                    WHERE fecha_extraccion >= CURRENT_DATE - INTERVAL '30 days'
-                    GROUP BY DATE(fecha_extraccion), fuente
-                    ORDER BY date, fuente
-                """
-
-                result = session.execute(text(query))
-
-                # Organize data by source
-                data_by_source = {}
-                for row in result:
-                    date = str(row[0])
-                    source = row[1]
-                    count = row[2]
-
-                    if source not in data_by_source:
-                        data_by_source[source] = {"dates": [], "counts": []}
-
-                    data_by_source[source]["dates"].append(date)
-                    data_by_source[source]["counts"].append(count)
-
-                # Create Plotly traces
-                traces = []
-                for source, data in data_by_source.items():
-                    trace = go.Scatter(
-                        x=data["dates"],
-                        y=data["counts"],
-                        mode='lines+markers',
-                        name=source.upper(),
-                        hovertemplate='%{y} records<br>%{x}'
-                    )
-                    traces.append(trace)
-
-                # Create layout
-                layout = go.Layout(
-                    title='Extraction Trend (Last 30 Days)',
-                    xaxis=dict(title='Date'),
-                    yaxis=dict(title='Records Extracted'),
-                    hovermode='x unified'
+            # Organize the last 30 days of the daily rollup by source
+            data_by_source = {}
+            for row in self.rollup.get_daily_counts(days=30):
+                date = str(row["day"])
+                source = row["fuente"]
+                count = row["count"]
+
+                if source not in data_by_source:
+                    data_by_source[source] = {"dates": [], "counts": []}
+
+                data_by_source[source]["dates"].append(date)
+                data_by_source[source]["counts"].append(count)
+
+            # Create Plotly traces
+            traces = []
+            for source, data in data_by_source.items():
+                trace = go.Scatter(
+                    x=data["dates"],
+                    y=data["counts"],
+                    mode='lines+markers',
+                    name=source.upper(),
+                    hovertemplate='%{y} records<br>%{x}'
                 )
+                traces.append(trace)
+
+            # Create layout
+            layout = go.Layout(
+                title='Extraction Trend (Last 30 Days)',
+                xaxis=dict(title='Date'),
+                yaxis=dict(title='Records Extracted'),
+                hovermode='x unified'
+            )
 
-                # Convert to JSON
-                fig = go.Figure(data=traces, layout=layout)
-                return json.loads(plotly.utils.PlotlyJSONEncoder().encode(fig))
+            # Convert to JSON
+            fig = go.Figure(data=traces, layout=layout)
+            return json.loads(plotly.utils.PlotlyJSONEncoder().encode(fig))
 
         except Exception as e:
             self.logger.error(f"Error generating extraction trend chart: {e}")
@@ -11,14 +11,18 @@ from sqlalchemy.orm import Session
 
 from ..database.connection import DatabaseConnection
 from ..utils.logger import get_logger
+from ..utils.near_duplicates import NearDuplicateDetector
+from .metrics_rollup import MetricsRollup
 
 
 class DataQualityAnalyzer:
     """Analyzes and reports on data quality metrics"""
 
-    def __init__(self, db_connection: Optional[DatabaseConnection] = None):
+    def __init__(self, db_connection: Optional[DatabaseConnection] = None,
+                 rollup: Optional[MetricsRollup] = None):
         self.db_connection = db_connection or DatabaseConnection()
         self.logger = get_logger(self.__class__.__name__)
+        self.rollup = rollup or MetricsRollup(self.db_connection)
 
         # Quality thresholds
         self.thresholds = {
@@ -42,104 +46,79 @@ class DataQualityAnalyzer:
     def analyze_completeness(self, source: str = None, days: int = 7) -> Dict[str, Any]:
         """Analyze data completeness for required fields"""
         try:
-            with self.db_connection.get_session() as session:
-                # Base query with source filter if provided
-                where_clause = f"WHERE fecha_extraccion >= CURRENT_DATE - INTERVAL '{days} days'"
-                if source:
-                    where_clause += f" AND fuente = '{source}'"
-
-                query = f"""
-                    SELECT
-                        fuente,
-                        COUNT(*) as total_records,
-                        COUNT(tender_id) as with_tender_id,
-                        COUNT(titulo) as with_title,
-                        COUNT(descripcion) as with_description,
-                        COUNT(fecha_apertura) as with_opening_date,
-                        COUNT(fecha_catalogacion) as with_catalog_date,
-                        COUNT(entidad) as with_entity,
-                        COUNT(estado) as with_state,
-                        COUNT(ciudad) as with_city,
-                        COUNT(valor_estimado) as with_value,
-                        COUNT(tipo_licitacion) as with_type,
-                        COUNT(url_original) as with_url,
-                        COUNT(texto_semantico) as with_semantic_text,
-                        COUNT(embeddings) as with_embeddings,
-                        AVG(LENGTH(COALESCE(descripcion, ''))) as avg_description_length,
-                        AVG(LENGTH(COALESCE(texto_semantico, ''))) as avg_semantic_length
-                    FROM updates
-                    {where_clause}
-                    GROUP BY fuente
-                    ORDER BY fuente
-                """
-
-                result = session.execute(text(query))
-
-                analysis = {}
-                for row in result:
-                    source_name = row[0]
-                    total = row[1]
-
-                    if total == 0:
-                        continue
-
-                    # Calculate completeness percentages
-                    field_completeness = {
-                        "tender_id": self._calculate_percentage(row[2], total),
-                        "title": self._calculate_percentage(row[3], total),
-                        "description": self._calculate_percentage(row[4], total),
-                        "opening_date": self._calculate_percentage(row[5], total),
-                        "catalog_date": self._calculate_percentage(row[6], total),
-                        "entity": self._calculate_percentage(row[7], total),
-                        "state": self._calculate_percentage(row[8], total),
-                        "city": self._calculate_percentage(row[9], total),
-                        "estimated_value": self._calculate_percentage(row[10], total),
-                        "tender_type": self._calculate_percentage(row[11], total),
-                        "original_url": self._calculate_percentage(row[12], total),
-                        "semantic_text": self._calculate_percentage(row[13], total),
-                        "embeddings": self._calculate_percentage(row[14], total)
-                    }
-
-                    # Calculate overall completeness
-                    critical_fields = ["tender_id", "title", "description", "semantic_text"]
-                    important_fields = ["opening_date", "entity", "tender_type"]
-                    optional_fields = ["state", "city", "estimated_value"]
-
-                    critical_avg = sum(field_completeness[f] for f in critical_fields) / len(critical_fields)
-                    important_avg = sum(field_completeness[f] for f in important_fields) / len(important_fields)
-                    optional_avg = sum(field_completeness[f] for f in optional_fields) / len(optional_fields)
-
-                    # Weighted average (critical: 50%, important: 30%, optional: 20%)
-                    overall_completeness = (critical_avg * 0.5) + (important_avg * 0.3) + (optional_avg * 0.2)
-
-                    # Determine quality level
-                    quality_level = self._get_quality_level(overall_completeness, "completeness")
-
-                    # Identify missing critical fields
-                    missing_critical = [f for f in critical_fields if field_completeness[f] < 100]
+            self.rollup.refresh()
+
+            analysis = {}
+            for row in self.rollup.get_field_totals(source=source, days=days):
+                source_name = row["fuente"]
+                total = row["total_records"]
+
+                # Calculate completeness percentages
+                field_completeness = {
+                    "tender_id": self._calculate_percentage(row["with_tender_id"], total),
+                    "title": self._calculate_percentage(row["with_title"], total),
+                    "description": self._calculate_percentage(row["with_description"], total),
+                    "opening_date": self._calculate_percentage(row["with_opening_date"], total),
+                    "catalog_date": self._calculate_percentage(row["with_catalog_date"], total),
+                    "entity": self._calculate_percentage(row["with_entity"], total),
+                    "state": self._calculate_percentage(row["with_state"], total),
+                    "city": self._calculate_percentage(row["with_city"], total),
+                    "estimated_value": self._calculate_percentage(row["with_value"], total),
+                    "tender_type": self._calculate_percentage(row["with_type"], total),
+                    "original_url": self._calculate_percentage(row["with_url"], total),
+                    "semantic_text": self._calculate_percentage(row["with_semantic_text"], total),
+                    "embeddings": self._calculate_percentage(row["with_embeddings"], total)
+                }
 
-                    analysis[source_name] = {
-                        "total_records": total,
-                        "field_completeness": field_completeness,
-                        "overall_completeness": round(overall_completeness, 2),
-                        "quality_level": quality_level,
-                        "missing_critical_fields": missing_critical,
-                        "avg_description_length": round(row[15] or 0, 0),
-                        "avg_semantic_length": round(row[16] or 0, 0),
-                        "recommendations": self._generate_completeness_recommendations(
-                            field_completeness, overall_completeness
-                        )
-                    }
+                # Calculate overall completeness
+                critical_fields = ["tender_id", "title", "description", "semantic_text"]
+                important_fields = ["opening_date", "entity", "tender_type"]
+                optional_fields = ["state", "city", "estimated_value"]
+
+                critical_avg = sum(field_completeness[f] for f in critical_fields) / len(critical_fields)
+                important_avg = sum(field_completeness[f] for f in important_fields) / len(important_fields)
+                optional_avg = sum(field_completeness[f] for f in optional_fields) / len(optional_fields)
+
+                # Weighted average (critical: 50%, important: 30%, optional: 20%)
+                overall_completeness = (critical_avg * 0.5) + (important_avg * 0.3) + (optional_avg * 0.2)
+
+                # Determine quality level
+                quality_level = self._get_quality_level(overall_completeness, "completeness")
+
+                # Identify missing critical fields
+                missing_critical = [f for f in critical_fields if field_completeness[f] < 100]
+
+                analysis[source_name] = {
+                    "total_records": total,
+                    "field_completeness": field_completeness,
+                    "overall_completeness": round(overall_completeness, 2),
+                    "quality_level": quality_level,
+                    "missing_critical_fields": missing_critical,
+                    "avg_description_length": round(row["avg_description_length"] or 0, 0),
+                    "avg_semantic_length": round(row["avg_semantic_length"] or 0, 0),
+                    "recommendations": self._generate_completeness_recommendations(
+                        field_completeness, overall_completeness
+                    )
+                }
 
-                return analysis
+            return analysis
 
         except Exception as e:
             self.logger.error(f"Error analyzing completeness: {e}")
             return {}
 
-    def analyze_duplicates(self, days: int = 30) -> Dict[str, Any]:
-        """Analyze duplicate records in the system"""
+    def analyze_duplicates(self, days: Optional[int] = 30, threshold: float = 0.8,
+                           embedding_threshold: Optional[float] = None) -> Dict[str, Any]:
+        """Analyze duplicate records in the system
+
+        Exact duplicates share a tender_id; near-duplicates are found by a
+        MinHash/LSH pass over titles and descriptions. ``days=None`` audits the
+        whole table, and ``embedding_threshold`` also requires embedding cosine
+        similarity (which loads the embeddings).
+        """
         try:
+            window_clause = f"WHERE fecha_extraccion >= CURRENT_DATE - INTERVAL '{int(days)} days'" if days else ""
+
             with self.db_connection.get_session() as session:
                 # Find exact duplicates by tender_id
                 duplicate_query = f"""
@@ -150,7 +129,7 @@ class DataQualityAnalyzer:
                         MIN(fecha_extraccion) as first_seen,
                         MAX(fecha_extraccion) as last_seen
                     FROM updates
-                    WHERE fecha_extraccion >= CURRENT_DATE - INTERVAL '{days} days'
+                    {window_clause}
                     GROUP BY tender_id
                     HAVING COUNT(*) > 1
                     ORDER BY duplicate_count DESC
@@ -159,49 +138,43 @@ class DataQualityAnalyzer:
 
                 duplicates = session.execute(text(duplicate_query)).fetchall()
 
-                # Find potential duplicates by similar titles
-                similarity_query = f"""
-                    WITH recent_tenders AS (
-                        SELECT DISTINCT tender_id, titulo, fuente
-                        FROM updates
-                        WHERE fecha_extraccion >= CURRENT_DATE - INTERVAL '{days} days'
-                            AND titulo IS NOT NULL
-                    )
-                    SELECT
-                        t1.tender_id as tender1,
-                        t2.tender_id as tender2,
-                        t1.titulo as title1,
-                        t2.titulo as title2,
-                        similarity(t1.titulo, t2.titulo) as similarity_score
-                    FROM recent_tenders t1
-                    JOIN recent_tenders t2 ON t1.tender_id < t2.tender_id
-                    WHERE similarity(t1.titulo, t2.titulo) > 0.8
-                    ORDER BY similarity_score DESC
-                    LIMIT 50
-                """
-
-                try:
-                    potential_duplicates = session.execute(text(similarity_query)).fetchall()
-                except:
-                    # If similarity function not available, skip this analysis
-                    potential_duplicates = []
-
-                # Calculate statistics
-                total_records_query = f"""
-                    SELECT COUNT(DISTINCT tender_id) as unique_count, COUNT(*) as total_count
+                # Find near-duplicates in a single streamed pass, oldest first so
+                # the earliest tender of each cluster becomes canonical
+                embeddings_column = "embeddings" if embedding_threshold is not None else "NULL as embeddings"
+                records_query = text(f"""
+                    SELECT tender_id, titulo, descripcion, fuente, fecha_extraccion, {embeddings_column}
                     FROM updates
-                    WHERE fecha_extraccion >= CURRENT_DATE - INTERVAL '{days} days'
-                """
+                    {window_clause}
+                    ORDER BY fecha_extraccion, id
+                """).execution_options(stream_results=True)
+
+                detector = NearDuplicateDetector(threshold=threshold, embedding_threshold=embedding_threshold)
+                total_count = 0
+                tender_ids = set()
+                for row in session.execute(records_query).mappings():
+                    total_count += 1
+                    tender_ids.add(row["tender_id"])
+                    detector.add(
+                        tender_id=row["tender_id"],
+                        titulo=row["titulo"],
+                        descripcion=row["descripcion"],
+                        source=row["fuente"],
+                        embedding=row["embeddings"],
+                        seen_at=row["fecha_extraccion"]
+                    )
 
-                stats = session.execute(text(total_records_query)).first()
-                unique_count = stats[0] or 0
-                total_count = stats[1] or 0
+                unique_count = len(tender_ids)
+                clusters = detector.get_clusters()
+                near_duplicate_count = sum(cluster["size"] - 1 for cluster in clusters)
 
                 duplicate_rate = 0
+                near_duplicate_rate = 0
                 if total_count > 0:
                     duplicate_rate = ((total_count - unique_count) / total_count) * 100
+                    near_duplicate_rate = (near_duplicate_count / total_count) * 100
 
-                quality_level = self._get_quality_level(duplicate_rate, "duplicates", inverse=True)
+                overall_rate = max(duplicate_rate, near_duplicate_rate)
+                quality_level = self._get_quality_level(overall_rate, "duplicates", inverse=True)
 
                 return {
                     "summary": {
@@ -209,6 +182,9 @@ class DataQualityAnalyzer:
                         "unique_records": unique_count,
                         "duplicate_records": total_count - unique_count,
                         "duplicate_rate": round(duplicate_rate, 2),
+                        "near_duplicate_records": near_duplicate_count,
+                        "near_duplicate_clusters": len(clusters),
+                        "near_duplicate_rate": round(near_duplicate_rate, 2),
                         "quality_level": quality_level
                     },
                     "exact_duplicates": [
@@ -223,13 +199,15 @@ class DataQualityAnalyzer:
                     ],
                     "potential_duplicates": [
                         {
-                            "tender1": pot[0],
-                            "tender2": pot[1],
-                            "similarity": round(pot[4] * 100, 2)
+                            "tender1": match["duplicate_of"],
+                            "tender2": match["tender_id"],
+                            "canonical_tender_id": match["canonical_tender_id"],
+                            "similarity": round(match["similarity"] * 100, 2)
                         }
-                        for pot in potential_duplicates[:10]  # Top 10 potential duplicates
+                        for match in detector.get_matches(limit=10)  # Top 10 potential duplicates
                     ],
-                    "recommendations": self._generate_duplicate_recommendations(duplicate_rate)
+                    "duplicate_clusters": clusters[:20],  # Top 20 clusters
+                    "recommendations": self._generate_duplicate_recommendations(overall_rate)
                 }
 
         except Exception as e:
@@ -239,65 +217,51 @@ class DataQualityAnalyzer:
     def analyze_data_freshness(self) -> Dict[str, Any]:
         """Analyze how fresh/current the data is"""
         try:
-            with self.db_connection.get_session() as session:
-                # Get freshness by source
-                freshness_query = """
-                    SELECT
-                        fuente,
-                        MAX(fecha_extraccion) as last_extraction,
-                        COUNT(CASE WHEN fecha_extraccion >= CURRENT_DATE THEN 1 END) as today_count,
-                        COUNT(CASE WHEN fecha_extraccion >= CURRENT_DATE - INTERVAL '1 day' THEN 1 END) as yesterday_count,
-                        COUNT(CASE WHEN fecha_extraccion >= CURRENT_DATE - INTERVAL '7 days' THEN 1 END) as week_count
-                    FROM updates
-                    GROUP BY fuente
-                    ORDER BY MAX(fecha_extraccion) DESC
-                """
-
-                result = session.execute(text(freshness_query))
+            self.rollup.refresh()
 
-                analysis = {}
-                now = datetime.now()
+            analysis = {}
+            now = datetime.now()
+            last_system_update = None
+            active_sources = 0
 
-                for row in result:
-                    source = row[0]
-                    last_extraction = row[1]
+            for row in self.rollup.get_source_totals():
+                source = row["fuente"]
+                last_extraction = row["last_extraction"]
 
-                    if last_extraction:
-                        hours_since = (now - last_extraction).total_seconds() / 3600
-                        quality_level = self._get_quality_level(hours_since, "freshness", inverse=True)
+                if row["today_count"]:
+                    active_sources += 1
 
-                        analysis[source] = {
-                            "last_extraction": str(last_extraction),
-                            "hours_since_last": round(hours_since, 2),
-                            "quality_level": quality_level,
-                            "today_count": row[2] or 0,
-                            "yesterday_count": row[3] or 0,
-                            "week_count": row[4] or 0,
-                            "status": self._get_freshness_status(hours_since)
-                        }
+                if last_extraction:
+                    if last_system_update is None or last_extraction > last_system_update:
+                        last_system_update = last_extraction
 
-                # Overall system freshness
-                overall_query = """
-                    SELECT
-                        MAX(fecha_extraccion) as last_system_update,
-                        COUNT(DISTINCT fuente) as active_sources_today
-                    FROM updates
-                    WHERE fecha_extraccion >= CURRENT_DATE
-                """
+                    hours_since = (now - last_extraction).total_seconds() / 3600
+                    quality_level = self._get_quality_level(hours_since, "freshness", inverse=True)
 
-                overall = session.execute(text(overall_query)).first()
-                last_system_update = overall[0]
-                active_sources = overall[1] or 0
-
-                return {
-                    "by_source": analysis,
-                    "overall": {
-                        "last_system_update": str(last_system_update) if last_system_update else None,
-                        "active_sources_today": active_sources,
-                        "total_sources": len(analysis),
-                        "recommendations": self._generate_freshness_recommendations(analysis)
+                    analysis[source] = {
+                        "last_extraction": str(last_extraction),
+                        "hours_since_last": round(hours_since, 2),
+                        "quality_level": quality_level,
+                        "today_count": row["today_count"] or 0,
+                        "yesterday_count": (row["today_count"] or 0) + (row["yesterday_count"] or 0),
+                        "week_count": row["week_count"] or 0,
+                        "status": self._get_freshness_status(hours_since)
                     }
+
+            # Overall system freshness: last update among today's extractions
+            if last_system_update is not None and last_system_update.date() != now.date():
+                last_system_update = None
+
+            return {
+                "by_source": analysis,
+                "overall": {
+                    "last_system_update": str(last_system_update) if last_system_update else None,
+                    "active_sources_today": active_sources,
+                    "total_sources": len(analysis),
+                    "rollup_error": self.rollup.last_error,
+                    "recommendations": self._generate_freshness_recommendations(analysis)
                 }
+            }
 
         except Exception as e:
             self.logger.error(f"Error analyzing data freshness: {e}")
@@ -402,6 +366,8 @@ class DataQualityAnalyzer:
             report.append(f"  Total Records: {summary['total_records']:,}")
             report.append(f"  Unique Records: {summary['unique_records']:,}")
             report.append(f"  Duplicate Rate: {summary['duplicate_rate']}%")
+            report.append(f"  Near-Duplicate Rate: {summary['near_duplicate_rate']}% "
+                          f"({summary['near_duplicate_clusters']:,} clusters)")
             report.append(f"  Quality Level: {summary['quality_level']}")
             if duplicates['recommendations']:
                 report.append("  Recommendations:")
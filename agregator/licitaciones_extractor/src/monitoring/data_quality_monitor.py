@@ -12,6 +12,8 @@ import json
 from dataclasses import dataclass, asdict
 from enum import Enum
 
+from ..utils.near_duplicates import NearDuplicateDetector
+
 try:
     from src.utils.logger import get_logger
 except ImportError:
@@ -89,6 +91,7 @@ class DataQualityMonitor:
             'min_reliability': self.config.get('min_reliability', 0.8),
             'min_title_length': self.config.get('min_title_length', 10),
             'max_duplicate_rate': self.config.get('max_duplicate_rate', 0.1),
+            'near_duplicate_similarity': self.config.get('near_duplicate_similarity', 0.8),
             'min_records_per_source': self.config.get('min_records_per_source', 5),
             'max_extraction_time_hours': self.config.get('max_extraction_time_hours', 2)
         }
@@ -567,29 +570,37 @@ class DataQualityMonitor:
         """
         Find potential duplicates across different sources.
 
+        Uses MinHash/LSH over title and description, so near-identical titles
+        (accents, casing, punctuation, small edits) are caught as well.
+
         Args:
             all_records: List of (source, record) tuples
 
         Returns:
             List of duplicate descriptions
         """
-        duplicates = []
-        seen_titles = {}
+        detector = NearDuplicateDetector(threshold=self.thresholds['near_duplicate_similarity'])
+
+        # Keys are scoped by source, so the same tender reported under the same id
+        # by two sources is compared instead of being ignored as already indexed
+        for index, (source, record) in enumerate(all_records):
+            detector.add(
+                tender_id=f"{source}:{record.get('tender_id') or index}",
+                titulo=record.get('titulo') or '',
+                descripcion=record.get('descripcion'),
+                source=source
+            )
 
-        for source, record in all_records:
-            titulo = record.get('titulo', '').strip().lower()
-            if not titulo or len(titulo) < 10:
+        duplicates = []
+        for cluster in detector.get_clusters():
+            if len(cluster['sources']) < 2:
                 continue
-
-            # Normalize title for comparison
-            normalized_title = ' '.join(titulo.split())
-
-            if normalized_title in seen_titles:
-                other_source = seen_titles[normalized_title]
-                if other_source != source:
-                    duplicates.append(f"{titulo[:50]}... (found in {source} and {other_source})")
-            else:
-                seen_titles[normalized_title] = source
+            titulo = (cluster['canonical_title'] or '').strip()
+            canonical_tender_id = cluster['canonical_tender_id'].split(':', 1)[1]
+            duplicates.append(
+                f"{titulo[:50]}... (found in {', '.join(cluster['sources'])}; "
+                f"canonical {canonical_tender_id})"
+            )
 
         return duplicates
 
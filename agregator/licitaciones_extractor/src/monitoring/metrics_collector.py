@@ -13,14 +13,17 @@ from sqlalchemy.orm import Session
 
 from ..database.connection import DatabaseConnection
 from ..utils.logger import get_logger
+from .metrics_rollup import MetricsRollup
 
 
 class MetricsCollector:
     """Collects and stores system metrics for monitoring and analysis"""
 
-    def __init__(self, db_connection: Optional[DatabaseConnection] = None):
+    def __init__(self, db_connection: Optional[DatabaseConnection] = None,
+                 rollup: Optional[MetricsRollup] = None):
         self.db_connection = db_connection or DatabaseConnection()
         self.logger = get_logger(self.__class__.__name__)
+        self.rollup = rollup or MetricsRollup(self.db_connection)
         self.metrics_file = Path("logs/metrics.json")
         self.metrics_file.parent.mkdir(exist_ok=True)
 
@@ -34,75 +37,27 @@ class MetricsCollector:
         }
 
     def collect_extraction_metrics(self, source: str = None) -> Dict[str, Any]:
-        """Collect metrics about extraction operations"""
+        """Collect metrics about extraction operations from the daily rollup"""
         try:
-            with self.db_connection.get_session() as session:
-                # Base query
-                base_query = """
-                    SELECT
-                        fuente,
-                        COUNT(*) as total_records,
-                        COUNT(DISTINCT DATE(fecha_extraccion)) as days_active,
-                        MIN(fecha_extraccion) as first_extraction,
-                        MAX(fecha_extraccion) as last_extraction,
-                        COUNT(CASE WHEN procesado = true THEN 1 END) as processed_count,
-                        COUNT(CASE WHEN embeddings IS NOT NULL THEN 1 END) as with_embeddings
-                    FROM updates
-                """
-
-                # Add source filter if specified
-                if source:
-                    query = base_query + f" WHERE fuente = '{source}' GROUP BY fuente"
-                else:
-                    query = base_query + " GROUP BY fuente"
-
-                result = session.execute(text(query))
-
-                metrics = {}
-                for row in result:
-                    source_metrics = {
-                        "total_records": row[1],
-                        "days_active": row[2],
-                        "first_extraction": str(row[3]) if row[3] else None,
-                        "last_extraction": str(row[4]) if row[4] else None,
-                        "processed_count": row[5],
-                        "with_embeddings": row[6],
-                        "processing_rate": round(row[5] / row[1] * 100, 2) if row[1] > 0 else 0
-                    }
-                    metrics[row[0]] = source_metrics
-
-                # Collect today's metrics
-                today_query = """
-                    SELECT
-                        fuente,
-                        COUNT(*) as today_count
-                    FROM updates
-                    WHERE DATE(fecha_extraccion) = CURRENT_DATE
-                    GROUP BY fuente
-                """
-
-                today_result = session.execute(text(today_query))
-                for row in today_result:
-                    if row[0] in metrics:
-                        metrics[row[0]]["today_count"] = row[1]
-
-                # Collect yesterday's metrics for comparison
-                yesterday_query = """
-                    SELECT
-                        fuente,
-                        COUNT(*) as yesterday_count
-                    FROM updates
-                    WHERE DATE(fecha_extraccion) = CURRENT_DATE - INTERVAL '1 day'
-                    GROUP BY fuente
-                """
-
-                yesterday_result = session.execute(text(yesterday_query))
-                for row in yesterday_result:
-                    if row[0] in metrics:
-                        metrics[row[0]]["yesterday_count"] = row[1]
-
-                self.current_metrics["extraction_metrics"] = metrics
-                return metrics
+            self.rollup.refresh()
+
+            metrics = {}
+            for row in self.rollup.get_source_totals(source):
+                total = row["total_records"] or 0
+                metrics[row["fuente"]] = {
+                    "total_records": total,
+                    "days_active": row["days_active"],
+                    "first_extraction": str(row["first_extraction"]) if row["first_extraction"] else None,
+                    "last_extraction": str(row["last_extraction"]) if row["last_extraction"] else None,
+                    "processed_count": row["processed_count"] or 0,
+                    "with_embeddings": row["with_embeddings"] or 0,
+                    "processing_rate": round((row["processed_count"] or 0) / total * 100, 2) if total > 0 else 0,
+                    "today_count": row["today_count"] or 0,
+                    "yesterday_count": row["yesterday_count"] or 0
+                }
+
+            self.current_metrics["extraction_metrics"] = metrics
+            return metrics
 
         except Exception as e:
             self.logger.error(f"Error collecting extraction metrics: {e}")
@@ -203,49 +158,31 @@ class MetricsCollector:
                 duplicates = session.execute(text(duplicate_query)).scalar()
                 metrics["duplicate_count"] = duplicates or 0
 
-                # Check completeness
-                completeness_query = """
-                    SELECT
-                        COUNT(*) as total,
-                        COUNT(titulo) as with_title,
-                        COUNT(descripcion) as with_description,
-                        COUNT(fecha_apertura) as with_opening_date,
-                        COUNT(entidad) as with_entity,
-                        COUNT(embeddings) as with_embeddings
-                    FROM updates
-                    WHERE fecha_extraccion >= CURRENT_DATE - INTERVAL '7 days'
-                """
-
-                result = session.execute(text(completeness_query)).first()
-                if result and result[0] > 0:
+                # Check completeness and freshness from the daily rollup
+                self.rollup.refresh()
+                totals = self.rollup.get_field_totals(days=7, by_source=False)
+                if totals:
+                    result = totals[0]
+                    total = result["total_records"]
+                    fields = [result["with_title"], result["with_description"], result["with_opening_date"],
+                              result["with_entity"], result["with_embeddings"]]
                     metrics["completeness"] = {
-                        "title_completeness": round(result[1] / result[0] * 100, 2),
-                        "description_completeness": round(result[2] / result[0] * 100, 2),
-                        "opening_date_completeness": round(result[3] / result[0] * 100, 2),
-                        "entity_completeness": round(result[4] / result[0] * 100, 2),
-                        "embeddings_completeness": round(result[5] / result[0] * 100, 2),
-                        "overall_completeness": round(
-                            (result[1] + result[2] + result[3] + result[4] + result[5]) /
-                            (5 * result[0]) * 100, 2
-                        )
+                        "title_completeness": round(fields[0] / total * 100, 2),
+                        "description_completeness": round(fields[1] / total * 100, 2),
+                        "opening_date_completeness": round(fields[2] / total * 100, 2),
+                        "entity_completeness": round(fields[3] / total * 100, 2),
+                        "embeddings_completeness": round(fields[4] / total * 100, 2),
+                        "overall_completeness": round(sum(fields) / (5 * total) * 100, 2)
                     }
 
-                # Check data freshness
-                freshness_query = """
-                    SELECT
-                        MAX(fecha_extraccion) as last_update,
-                        COUNT(CASE WHEN fecha_extraccion >= CURRENT_DATE THEN 1 END) as today_count,
-                        COUNT(CASE WHEN fecha_extraccion >= CURRENT_DATE - INTERVAL '1 day' THEN 1 END) as last_24h_count
-                    FROM updates
-                """
-
-                freshness = session.execute(text(freshness_query)).first()
-                if freshness:
-                    metrics["freshness"] = {
-                        "last_update": str(freshness[0]) if freshness[0] else None,
-                        "today_count": freshness[1] or 0,
-                        "last_24h_count": freshness[2] or 0
-                    }
+                sources = self.rollup.get_source_totals()
+                last_update = max((row["last_extraction"] for row in sources if row["last_extraction"]), default=None)
+                metrics["freshness"] = {
+                    "last_update": str(last_update) if last_update else None,
+                    "today_count": sum(row["today_count"] or 0 for row in sources),
+                    "last_24h_count": sum((row["today_count"] or 0) + (row["yesterday_count"] or 0) for row in sources),
+                    "rollup_error": self.rollup.last_error
+                }
 
                 self.current_metrics["data_quality_metrics"] = metrics
                 return metrics
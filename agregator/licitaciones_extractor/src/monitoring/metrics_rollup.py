@@ -0,0 +1,281 @@
+"""
+Incremental per-(day, source) rollup of the updates table for monitoring reads
+"""
+
+import threading
+import time
+from datetime import date
+from typing import Dict, List, Optional, Any
+
+from sqlalchemy import text
+
+from ..database.connection import DatabaseConnection
+from ..utils.logger import get_logger
+
+
+# Aggregates folded into metrics_daily_rollup, as (rollup column, expression over updates)
+ROLLUP_COLUMNS = [
+    ("total_records", "COUNT(*)"),
+    ("processed_count", "COUNT(CASE WHEN procesado = true THEN 1 END)"),
+    ("with_tender_id", "COUNT(tender_id)"),
+    ("with_title", "COUNT(titulo)"),
+    ("with_description", "COUNT(descripcion)"),
+    ("with_opening_date", "COUNT(fecha_apertura)"),
+    ("with_catalog_date", "COUNT(fecha_catalogacion)"),
+    ("with_entity", "COUNT(entidad)"),
+    ("with_state", "COUNT(estado)"),
+    ("with_city", "COUNT(ciudad)"),
+    ("with_value", "COUNT(valor_estimado)"),
+    ("with_type", "COUNT(tipo_licitacion)"),
+    ("with_url", "COUNT(url_original)"),
+    ("with_semantic_text", "COUNT(texto_semantico)"),
+    ("with_embeddings", "COUNT(CASE WHEN embeddings IS NOT NULL THEN 1 END)"),
+    ("description_length_sum", "SUM(LENGTH(COALESCE(descripcion, '')))"),
+    ("semantic_length_sum", "SUM(LENGTH(COALESCE(texto_semantico, '')))"),
+]
+
+
+class MetricsRollup:
+    """
+    Maintains metrics_daily_rollup from the updates table.
+
+    Each refresh recomputes the per-(day, source) aggregates of the days that
+    have rows with ``id > last_seen_id``, plus a trailing window of recent days,
+    and advances the watermark in metrics_rollup_state, so monitoring reads never
+    scan updates itself. Aggregates are replaced rather than incremented, so a
+    refresh is idempotent: rows that were given a lower id but committed after
+    the previous refresh, or that were marked processed since, are picked up by
+    the trailing window. If older rows are edited or deleted in place,
+    ``rebuild()`` recomputes the whole rollup.
+    """
+
+    STATE_NAME = "updates_daily"
+
+    def __init__(self, db_connection: Optional[DatabaseConnection] = None,
+                 min_refresh_interval: float = 30.0, rescan_days: int = 1):
+        """
+        Initialize the rollup.
+
+        Args:
+            db_connection: Database connection (created if not provided)
+            min_refresh_interval: Seconds during which repeated refreshes from
+                this process are skipped
+            rescan_days: Days before today that every refresh recomputes, to
+                catch rows committed out of id order by concurrent writers
+        """
+        self.db_connection = db_connection or DatabaseConnection()
+        self.logger = get_logger(self.__class__.__name__)
+        self.min_refresh_interval = min_refresh_interval
+        self.rescan_days = rescan_days
+        self.last_seen_id = 0
+        self.last_error: Optional[str] = None
+        self._last_refresh = float("-inf")
+        self._lock = threading.Lock()
+
+    def refresh(self, force: bool = False) -> int:
+        """
+        Recompute the rollup for the days with updates inserted since the last refresh.
+
+        Args:
+            force: Refresh even if the last refresh was within the minimum interval
+
+        Errors are logged and kept in ``last_error`` until a refresh succeeds,
+        so monitoring output can tell a failing rollup from one with no new records.
+
+        Returns:
+            Number of new updates rows folded in
+        """
+        with self._lock:
+            if not force and time.monotonic() - self._last_refresh < self.min_refresh_interval:
+                return 0
+
+            try:
+                with self.db_connection.get_session() as session:
+                    last_seen = self._lock_state(session)
+                    folded, max_id = self._fold(session, last_seen)
+                self.last_seen_id = max_id
+                self.last_error = None
+                self._last_refresh = time.monotonic()
+                if folded:
+                    self.logger.info(f"Metrics rollup refreshed with {folded} new records (last id {max_id})")
+                return folded
+            except Exception as e:
+                self.last_error = str(e)
+                self.logger.error(f"Error refreshing metrics rollup: {e}")
+                return 0
+
+    def rebuild(self) -> int:
+        """
+        Recompute the whole rollup from the updates table.
+
+        Returns:
+            Number of updates rows folded in
+        """
+        with self._lock:
+            with self.db_connection.get_session() as session:
+                self._lock_state(session)
+                session.execute(text("DELETE FROM metrics_daily_rollup"))
+                folded, max_id = self._fold(session, 0)
+            self.last_seen_id = max_id
+            self.last_error = None
+            self._last_refresh = time.monotonic()
+            self.logger.info(f"Metrics rollup rebuilt from {folded} records")
+            return folded
+
+    def get_source_totals(self, source: str = None) -> List[Dict[str, Any]]:
+        """
+        Get all-time totals per source, with today's and yesterday's counts.
+
+        Args:
+            source: Restrict to one source
+
+        Returns:
+            One dictionary per source
+        """
+        where_clause, params = self._where(source=source)
+        query = f"""
+            SELECT
+                fuente,
+                SUM(total_records) as total_records,
+                COUNT(CASE WHEN total_records > 0 THEN 1 END) as days_active,
+                MIN(first_extraction) as first_extraction,
+                MAX(last_extraction) as last_extraction,
+                SUM(processed_count) as processed_count,
+                SUM(with_embeddings) as with_embeddings,
+                SUM(CASE WHEN day = CURRENT_DATE THEN total_records ELSE 0 END) as today_count,
+                SUM(CASE WHEN day = CURRENT_DATE - 1 THEN total_records ELSE 0 END) as yesterday_count,
+                SUM(CASE WHEN day >= CURRENT_DATE - 7 THEN total_records ELSE 0 END) as week_count
+            FROM metrics_daily_rollup
+            {where_clause}
+            GROUP BY fuente
+            ORDER BY MAX(last_extraction) DESC
+        """
+        return self._fetch(query, params)
+
+    def get_field_totals(self, source: str = None, days: int = 7,
+                         by_source: bool = True) -> List[Dict[str, Any]]:
+        """
+        Get field completeness counts for records extracted in the last days.
+
+        Args:
+            source: Restrict to one source
+            days: Window in days, counted back from today
+            by_source: Group by source instead of returning a single total row
+
+        Returns:
+            Rows with total_records, the with_* counts and average text lengths
+        """
+        where_clause, params = self._where(source=source, days=days)
+        sums = ",\n                ".join(
+            f"SUM({column}) as {column}" for column, _ in ROLLUP_COLUMNS if not column.endswith("_sum")
+        )
+        group_column = "fuente" if by_source else "'all' as fuente"
+        group_clause = "GROUP BY fuente ORDER BY fuente" if by_source else ""
+        query = f"""
+            SELECT
+                {group_column},
+                {sums},
+                SUM(description_length_sum) / NULLIF(SUM(total_records), 0) as avg_description_length,
+                SUM(semantic_length_sum) / NULLIF(SUM(total_records), 0) as avg_semantic_length
+            FROM metrics_daily_rollup
+            {where_clause}
+            {group_clause}
+        """
+        return [row for row in self._fetch(query, params) if row["total_records"]]
+
+    def get_daily_counts(self, days: int = 30) -> List[Dict[str, Any]]:
+        """
+        Get records extracted per day and source.
+
+        Args:
+            days: Window in days, counted back from today
+
+        Returns:
+            Rows with day, fuente and count ordered by day
+        """
+        where_clause, params = self._where(days=days)
+        query = f"""
+            SELECT day, fuente, total_records as count
+            FROM metrics_daily_rollup
+            {where_clause}
+            ORDER BY day, fuente
+        """
+        return self._fetch(query, params)
+
+    def _lock_state(self, session) -> int:
+        """Lock the watermark row for this transaction and return it."""
+        session.execute(text("""
+            INSERT INTO metrics_rollup_state (name, last_seen_id)
+            VALUES (:name, 0)
+            ON CONFLICT (name) DO NOTHING
+        """), {"name": self.STATE_NAME})
+        return session.execute(text("""
+            SELECT last_seen_id FROM metrics_rollup_state WHERE name = :name FOR UPDATE
+        """), {"name": self.STATE_NAME}).scalar() or 0
+
+    def _fold(self, session, last_seen: int) -> tuple:
+        """
+        Recompute the rollup for the days of updates past the watermark and the
+        trailing window, then move the watermark to MAX(id).
+        """
+        max_id = session.execute(text("SELECT COALESCE(MAX(id), 0) FROM updates")).scalar() or 0
+        new_records, since = session.execute(text("""
+            SELECT COUNT(*), LEAST(MIN(fecha_extraccion)::date, CURRENT_DATE - :rescan_days)
+            FROM updates
+            WHERE id > :last_seen AND id <= :max_id
+        """), {"last_seen": last_seen, "max_id": max_id, "rescan_days": self.rescan_days}).one()
+
+        columns = [column for column, _ in ROLLUP_COLUMNS]
+        expressions = ",\n                    ".join(f"{expression} as {column}" for column, expression in ROLLUP_COLUMNS)
+        replacements = ",\n                    ".join(f"{column} = EXCLUDED.{column}" for column in columns)
+        session.execute(text(f"""
+            INSERT INTO metrics_daily_rollup (day, fuente, {', '.join(columns)}, first_extraction, last_extraction)
+            SELECT
+                fecha_extraccion::date as day,
+                fuente,
+                {expressions},
+                MIN(fecha_extraccion) as first_extraction,
+                MAX(fecha_extraccion) as last_extraction
+            FROM updates
+            WHERE fecha_extraccion >= :since
+            GROUP BY fecha_extraccion::date, fuente
+            ON CONFLICT (day, fuente) DO UPDATE SET
+                {replacements},
+                first_extraction = EXCLUDED.first_extraction,
+                last_extraction = EXCLUDED.last_extraction
+        """), {"since": since})
+
+        session.execute(text("""
+            UPDATE metrics_rollup_state
+            SET last_seen_id = :max_id, refreshed_at = CURRENT_TIMESTAMP
+            WHERE name = :name
+        """), {"max_id": max_id, "name": self.STATE_NAME})
+        return new_records, max_id
+
+    def _where(self, source: str = None, days: int = None) -> tuple:
+        """Build a WHERE clause with bound parameters for rollup reads."""
+        conditions = []
+        params: Dict[str, Any] = {}
+        if source:
+            conditions.append("fuente = :source")
+            params["source"] = source
+        if days is not None:
+            conditions.append("day >= CURRENT_DATE - :days")
+            params["days"] = int(days)
+        where_clause = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        return where_clause, params
+
+    def _fetch(self, query: str, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Run a rollup read and return plain dictionaries with numeric sums as ints/floats."""
+        with self.db_connection.get_session() as session:
+            result = session.execute(text(query), params)
+            keys = list(result.keys())
+            rows = []
+            for row in result:
+                record = {}
+                for key, value in zip(keys, row):
+                    if value is not None and not isinstance(value, (str, int, float, date)):
+                        value = float(value) if key.startswith("avg_") else int(value)
+                    record[key] = value
+                rows.append(record)
+            return rows
@@ -18,6 +18,9 @@ from src.database.models import Update
 from src.utils.embeddings_generator import EmbeddingsGenerator
 from src.utils.data_normalizer import DataNormalizer
 from src.config.keywords import CORPORATE_KEYWORDS
+from src.scheduler.run_coordinator import RunCoordinator
+from src.monitoring.metrics_rollup import MetricsRollup
+from src.utils.near_duplicates import NearDuplicateDetector
 
 
 class ExtractionOrchestrator:
@@ -29,6 +32,8 @@ class ExtractionOrchestrator:
         self.db_connection = DatabaseConnection()
         self.embeddings_generator = EmbeddingsGenerator()
         self.data_normalizer = DataNormalizer()
+        self.metrics_rollup = MetricsRollup(self.db_connection)
+        self.duplicate_detector = NearDuplicateDetector()
         self.extractors = {}
         self._initialize_extractors()
 
@@ -81,6 +86,9 @@ class ExtractionOrchestrator:
             'success': False
         }
 
+        # Near-duplicates are tracked across all sources of this run
+        self.duplicate_detector.reset()
+
         # Track overall success
         overall_success = True
         total_records = 0
@@ -95,6 +103,10 @@ class ExtractionOrchestrator:
             if not extractor_result.get('success', False):
                 overall_success = False
 
+        # Fold the new records into the monitoring rollup
+        if total_records:
+            self.metrics_rollup.refresh(force=True)
+
         # Final statistics
         extraction_end = datetime.now()
         execution_time = (extraction_end - extraction_start).total_seconds()
@@ -241,6 +253,7 @@ class ExtractionOrchestrator:
             Number of successfully processed records
         """
         processed_count = 0
+        near_duplicates = 0
 
         with self.db_connection.get_session() as session:
             for record in batch:
@@ -254,6 +267,25 @@ class ExtractionOrchestrator:
                     # Generate embeddings
                     embeddings = self.embeddings_generator.generate_embeddings(semantic_text)
 
+                    # Flag near-duplicates of tenders already seen in this run; keys are scoped
+                    # by source so a tender another source reported under the same id is compared
+                    metadata = normalized_data.get('metadata', {})
+                    match = self.duplicate_detector.add(
+                        tender_id=f"{source}:{normalized_data['tender_id']}",
+                        titulo=normalized_data.get('titulo'),
+                        descripcion=normalized_data.get('descripcion'),
+                        source=source,
+                        embedding=embeddings,
+                        seen_at=extraction_date
+                    )
+                    if match:
+                        metadata = {
+                            **metadata,
+                            'near_duplicate_of': match['canonical_tender_id'].split(':', 1)[1],
+                            'near_duplicate_similarity': match['similarity']
+                        }
+                        near_duplicates += 1
+
                     # Create database record
                     db_record = Update(
                         tender_id=normalized_data['tender_id'],
@@ -264,7 +296,7 @@ class ExtractionOrchestrator:
                         titulo=normalized_data.get('titulo'),
                         descripcion=normalized_data.get('descripcion'),
                         texto_semantico=semantic_text,
-                        metadata_json=normalized_data.get('metadata', {}),
+                        metadata_json=metadata,
                         embeddings=embeddings,
                         entidad=normalized_data.get('entidad'),
                         estado=normalized_data.get('estado'),
@@ -285,6 +317,9 @@ class ExtractionOrchestrator:
             # Commit the batch
             session.commit()
 
+        if near_duplicates:
+            self.logger.logger.info(f"Flagged {near_duplicates} near-duplicate records in batch from {source}")
+
         return processed_count
 
     def _generate_semantic_text(self, normalized_data: Dict) -> str:
@@ -435,12 +470,26 @@ class ExtractionOrchestrator:
 class DailyScheduler:
     """Manages daily extraction scheduling."""
 
-    def __init__(self):
-        """Initialize scheduler."""
+    def __init__(self, job_name: str = "daily_extraction"):
+        """
+        Initialize scheduler.
+
+        Args:
+            job_name: Name used to coordinate runs across triggers and replicas
+        """
         self.logger = get_logger("scheduler")
         self.timezone = pytz.timezone(settings.scheduler.timezone)
         self.is_running = False
         self.job_function = None
+        self.job_name = job_name
+        self._coordinator = None
+
+    @property
+    def coordinator(self) -> RunCoordinator:
+        """Run coordinator, created on first use so the scheduler can start without a database."""
+        if self._coordinator is None:
+            self._coordinator = RunCoordinator(self.job_name)
+        return self._coordinator
 
     def set_job_function(self, job_function: Callable):
         """
@@ -460,28 +509,57 @@ class DailyScheduler:
         self.logger.logger.info(f"Scheduling daily extraction at {extraction_time} ({settings.scheduler.timezone})")
 
         # Schedule the job
-        schedule.every().day.at(extraction_time).do(self._run_job_with_monitoring)
+        schedule.every().day.at(extraction_time).do(self._run_job_with_monitoring, "daily")
 
         self.logger.logger.info("Daily extraction scheduled successfully")
 
-    def _run_job_with_monitoring(self):
-        """Run job with error handling and monitoring."""
+    def _run_job_with_monitoring(self, trigger: str = "manual", force: bool = False) -> Dict[str, Any]:
+        """
+        Run job with error handling, monitoring and overlap protection.
+
+        Args:
+            trigger: Name of what fired this run
+            force: Run even within the minimum run interval of the last successful run
+
+        Returns:
+            Run outcome from the coordinator
+        """
         job_start = datetime.now(self.timezone)
-        self.logger.logger.info(f"Starting scheduled job at {job_start}")
+        self.logger.logger.info(f"Starting scheduled job at {job_start} (trigger: {trigger})")
 
         try:
-            self.job_function()
-            job_end = datetime.now(self.timezone)
-            execution_time = (job_end - job_start).total_seconds()
+            outcome = self.coordinator.run(self.job_function, trigger=trigger, force=force)
+        except Exception as e:
+            # Never run without coordination: another replica could be running the job
+            outcome = {'status': 'error', 'trigger': trigger, 'error': f"run coordination unavailable: {e}"}
+
+        job_end = datetime.now(self.timezone)
+        execution_time = (job_end - job_start).total_seconds()
 
+        if outcome['status'] == 'success':
             self.logger.logger.info(f"Scheduled job completed successfully in {execution_time:.2f} seconds")
+        elif outcome['status'] == 'skipped':
+            self.logger.logger.info(f"Scheduled job skipped: {outcome.get('reason')}")
+        else:
+            self.logger.logger.error(f"Scheduled job failed after {execution_time:.2f} seconds: {outcome.get('error')}")
+            # TODO: Add notification system for critical failures
 
-        except Exception as e:
-            job_end = datetime.now(self.timezone)
-            execution_time = (job_end - job_start).total_seconds()
+        return outcome
 
-            self.logger.logger.error(f"Scheduled job failed after {execution_time:.2f} seconds: {e}")
-            # TODO: Add notification system for critical failures
+    def run_now(self, trigger: str = "manual", force: bool = False) -> Dict[str, Any]:
+        """
+        Trigger the job immediately through the run coordinator.
+
+        Args:
+            trigger: Name of what fired this run
+            force: Run even within the minimum run interval of the last successful run
+
+        Returns:
+            Run outcome from the coordinator
+        """
+        if not self.job_function:
+            raise ValueError("No job function set. Use set_job_function() first.")
+        return self._run_job_with_monitoring(trigger, force)
 
     def start_scheduler(self):
         """Start the scheduler loop."""
@@ -0,0 +1,295 @@
+"""
+Run coordination for scheduled jobs.
+
+Guarantees that at most one run of a job is active across triggers and
+replicas, using a lease row in ``run_leases`` that is kept alive by a
+heartbeat. Every trigger is recorded in ``run_ledger`` with its queueing
+delay and duration.
+"""
+
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Any, List, Optional
+
+from sqlalchemy.exc import IntegrityError
+
+from src.config.settings import settings
+from src.utils.logger import get_logger
+from src.database.connection import DatabaseConnection
+from src.database.models import RunLease, RunLedger
+
+
+def job_failed(result: Any) -> bool:
+    """
+    Whether a job result reports a failure.
+
+    Args:
+        result: Value returned by the job function
+
+    Returns:
+        True for False, or a dict with status "error" or success False
+    """
+    if result is False:
+        return True
+    return isinstance(result, dict) and (result.get('status') == 'error' or result.get('success') is False)
+
+
+class RunCoordinator:
+    """Serializes runs of a job with a database lease and keeps a run ledger."""
+
+    def __init__(self, job_name: str, db_connection: DatabaseConnection = None):
+        """
+        Initialize the coordinator.
+
+        Args:
+            job_name: Name of the coordinated job (one lease per job)
+            db_connection: Database connection (created if not provided)
+        """
+        self.logger = get_logger("run_coordinator")
+        self.job_name = job_name
+        self.db_connection = db_connection or DatabaseConnection()
+        self.holder = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+        self.policy = settings.scheduler.overlap_policy
+        self.lease_ttl = settings.scheduler.lease_ttl_seconds
+        self.queue_timeout = settings.scheduler.queue_timeout_seconds
+        self.min_interval = settings.scheduler.min_run_interval_seconds
+        self.poll_interval = 30
+
+        self._local_lock = threading.Lock()
+
+    def try_acquire(self) -> bool:
+        """
+        Try to take the job lease, taking over expired leases from dead holders.
+
+        Returns:
+            True if this holder now owns the lease
+        """
+        try:
+            with self.db_connection.get_session() as session:
+                now = datetime.utcnow()
+                expires_at = now + timedelta(seconds=self.lease_ttl)
+                lease = session.query(RunLease).filter_by(job_name=self.job_name).with_for_update().first()
+
+                if lease is None:
+                    session.add(RunLease(
+                        job_name=self.job_name,
+                        holder=self.holder,
+                        acquired_at=now,
+                        heartbeat_at=now,
+                        expires_at=expires_at
+                    ))
+                elif lease.expires_at < now:
+                    self.logger.logger.warning(f"Taking over stale lease for '{self.job_name}' from {lease.holder}")
+                    session.query(RunLedger).filter_by(
+                        job_name=self.job_name, holder=lease.holder, status='running'
+                    ).update({'status': 'abandoned', 'finished_at': now}, synchronize_session=False)
+                    lease.holder = self.holder
+                    lease.acquired_at = now
+                    lease.heartbeat_at = now
+                    lease.expires_at = expires_at
+                else:
+                    return False
+            return True
+        except IntegrityError:
+            # Another replica inserted the lease concurrently
+            return False
+
+    def heartbeat(self) -> bool:
+        """
+        Extend the lease while the job is still running.
+
+        Returns:
+            True if the lease is still held by this holder
+        """
+        try:
+            with self.db_connection.get_session() as session:
+                now = datetime.utcnow()
+                updated = session.query(RunLease).filter_by(
+                    job_name=self.job_name, holder=self.holder
+                ).update({
+                    'heartbeat_at': now,
+                    'expires_at': now + timedelta(seconds=self.lease_ttl)
+                }, synchronize_session=False)
+            return updated > 0
+        except Exception as e:
+            self.logger.logger.warning(f"Failed to renew lease for '{self.job_name}': {e}")
+            return False
+
+    def release(self):
+        """Release the lease if this holder still owns it."""
+        try:
+            with self.db_connection.get_session() as session:
+                session.query(RunLease).filter_by(
+                    job_name=self.job_name, holder=self.holder
+                ).delete(synchronize_session=False)
+        except Exception as e:
+            self.logger.logger.warning(f"Failed to release lease for '{self.job_name}': {e}")
+
+    def run(self, job_function: Callable[[], Any], trigger: str = "manual", force: bool = False) -> Dict[str, Any]:
+        """
+        Run a job unless another run is active locally or in another replica.
+
+        With the ``skip`` policy an overlapping trigger is dropped; with ``queue``
+        it waits for the lease up to the queue timeout. Triggers arriving within
+        the minimum run interval of the last successful run are skipped as well,
+        unless ``force`` is set; the lease is always respected.
+
+        Args:
+            job_function: Function executing the job
+            trigger: Name of what fired this run (e.g. "daily", "startup")
+            force: Run even within the minimum run interval (explicit operator runs)
+
+        Returns:
+            Dictionary with status, queueing delay, duration and job result
+        """
+        triggered_at = datetime.utcnow()
+        deadline = time.monotonic() + self.queue_timeout
+
+        if self.policy == "queue":
+            acquired_local = self._local_lock.acquire(timeout=self.queue_timeout)
+        else:
+            acquired_local = self._local_lock.acquire(blocking=False)
+        if not acquired_local:
+            return self._skip(trigger, triggered_at, "run in progress in this process")
+
+        try:
+            try:
+                acquired = self._wait_for_lease(deadline)
+            except Exception as e:
+                self.logger.logger.error(f"Failed to acquire lease for '{self.job_name}': {e}")
+                return self._skip(trigger, triggered_at, f"lease unavailable: {e}")
+            if not acquired:
+                return self._skip(trigger, triggered_at, "run in progress in another replica")
+
+            try:
+                try:
+                    last_started = None if force else self._last_success_started_at()
+                except Exception as e:
+                    self.logger.logger.error(f"Failed to read last run of '{self.job_name}': {e}")
+                    return self._skip(trigger, triggered_at, f"run history unavailable: {e}")
+                if last_started and (datetime.utcnow() - last_started).total_seconds() < self.min_interval:
+                    return self._skip(trigger, triggered_at, f"last successful run started at {last_started.isoformat()}")
+
+                return self._run_with_lease(job_function, trigger, triggered_at)
+            finally:
+                self.release()
+        finally:
+            self._local_lock.release()
+
+    def get_recent_runs(self, limit: int = 20) -> List[Dict[str, Any]]:
+        """
+        Get the most recent ledger entries for this job.
+
+        Args:
+            limit: Maximum number of entries
+
+        Returns:
+            List of ledger entries, newest first
+        """
+        with self.db_connection.get_session() as session:
+            runs = session.query(RunLedger).filter_by(job_name=self.job_name) \
+                .order_by(RunLedger.triggered_at.desc()).limit(limit).all()
+            return [run.to_dict() for run in runs]
+
+    def _wait_for_lease(self, deadline: float) -> bool:
+        """Poll for the lease until acquired, or until the deadline with the queue policy."""
+        while True:
+            if self.try_acquire():
+                return True
+            if self.policy != "queue" or time.monotonic() >= deadline:
+                return False
+            time.sleep(min(self.poll_interval, max(deadline - time.monotonic(), 0)))
+
+    def _run_with_lease(self, job_function: Callable[[], Any], trigger: str, triggered_at: datetime) -> Dict[str, Any]:
+        """Execute the job while holding the lease, keeping it alive with a heartbeat."""
+        started_at = datetime.utcnow()
+        queue_delay = (started_at - triggered_at).total_seconds()
+        entry_id = self._record(
+            trigger=trigger,
+            status='running',
+            triggered_at=triggered_at,
+            started_at=started_at,
+            queue_delay_seconds=queue_delay
+        )
+        self.logger.logger.info(f"Run '{trigger}' of '{self.job_name}' started after {queue_delay:.1f}s in queue")
+
+        stop_heartbeat = threading.Event()
+
+        def beat():
+            while not stop_heartbeat.wait(max(self.lease_ttl / 3, 1)):
+                if not self.heartbeat():
+                    self.logger.logger.warning(f"Lease for '{self.job_name}' lost while running")
+
+        heartbeat_thread = threading.Thread(target=beat, name="run-lease-heartbeat", daemon=True)
+        heartbeat_thread.start()
+
+        status, error, result = 'success', None, None
+        try:
+            result = job_function()
+            if job_failed(result):
+                status = 'error'
+        except Exception as e:
+            status, error = 'error', str(e)
+            self.logger.logger.error(f"Run '{trigger}' of '{self.job_name}' failed: {e}")
+        finally:
+            stop_heartbeat.set()
+            heartbeat_thread.join()
+
+        finished_at = datetime.utcnow()
+        duration = (finished_at - started_at).total_seconds()
+        self._finish(entry_id, status=status, finished_at=finished_at, duration_seconds=duration, error=error)
+
+        return {
+            'status': status,
+            'trigger': trigger,
+            'queue_delay_seconds': queue_delay,
+            'duration_seconds': duration,
+            'error': error,
+            'result': result
+        }
+
+    def _skip(self, trigger: str, triggered_at: datetime, reason: str) -> Dict[str, Any]:
+        """Record a skipped trigger."""
+        self.logger.logger.info(f"Trigger '{trigger}' of '{self.job_name}' skipped: {reason}")
+        self._record(
+            trigger=trigger,
+            status='skipped',
+            triggered_at=triggered_at,
+            finished_at=datetime.utcnow(),
+            details={'reason': reason}
+        )
+        return {'status': 'skipped', 'trigger': trigger, 'reason': reason}
+
+    def _last_success_started_at(self) -> Optional[datetime]:
+        """Start time of the last successful run, if any."""
+        with self.db_connection.get_session() as session:
+            last = session.query(RunLedger).filter_by(job_name=self.job_name, status='success') \
+                .order_by(RunLedger.started_at.desc()).first()
+            return last.started_at if last else None
+
+    def _record(self, **fields) -> Optional[int]:
+        """Insert a ledger entry; ledger failures never block the job."""
+        try:
+            with self.db_connection.get_session() as session:
+                entry = RunLedger(job_name=self.job_name, holder=self.holder, **fields)
+                session.add(entry)
+                session.flush()
+                return entry.id
+        except Exception as e:
+            self.logger.logger.warning(f"Failed to record run of '{self.job_name}': {e}")
+            return None
+
+    def _finish(self, entry_id: Optional[int], **fields):
+        """Close a ledger entry."""
+        if entry_id is None:
+            return
+        try:
+            with self.db_connection.get_session() as session:
+                session.query(RunLedger).filter_by(id=entry_id).update(fields, synchronize_session=False)
+        except Exception as e:
+            self.logger.logger.warning(f"Failed to update run {entry_id} of '{self.job_name}': {e}")
@@ -0,0 +1,325 @@
+"""
+Near-duplicate detection for licitaciones using MinHash and locality-sensitive hashing.
+"""
+
+import re
+import unicodedata
+import zlib
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+
+
+class NearDuplicateDetector:
+    """
+    Groups tenders whose title and description are near-identical.
+
+    Each record is reduced to a MinHash signature over character shingles of
+    its normalized title and description. Signatures are split into LSH bands,
+    so only records sharing a band bucket are compared, which keeps detection
+    near-linear in the number of records. Candidates are verified against the
+    estimated Jaccard similarity and, when both records carry embeddings and an
+    embedding threshold is configured, against their cosine similarity.
+
+    The detector is stateful: ``process_batch`` can be called for every
+    ingestion batch, and clusters accumulate until ``reset``. Each cluster's
+    canonical tender is the earliest one seen.
+    """
+
+    def __init__(self, threshold: float = 0.8, num_perm: int = 128, shingle_size: int = 5,
+                 embedding_threshold: Optional[float] = None, description_chars: int = 500,
+                 min_text_length: int = 10, seed: int = 1):
+        """
+        Initialize the detector.
+
+        Args:
+            threshold: Minimum estimated Jaccard similarity for a duplicate
+            num_perm: Number of MinHash permutations
+            shingle_size: Character shingle length
+            embedding_threshold: Minimum embedding cosine similarity (disabled if None)
+            description_chars: Characters of the description included in the signature
+            min_text_length: Records with shorter normalized text are ignored
+            seed: Seed for the MinHash permutations (signatures are stable across runs)
+        """
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.embedding_threshold = embedding_threshold
+        self.description_chars = description_chars
+        self.min_text_length = min_text_length
+        self.bands, self.rows = self._optimal_bands(threshold, num_perm)
+
+        generator = np.random.RandomState(seed)
+        self._perm_a = generator.randint(1, int(_MERSENNE_PRIME), size=num_perm, dtype=np.uint64)
+        self._perm_b = generator.randint(0, int(_MERSENNE_PRIME), size=num_perm, dtype=np.uint64)
+
+        self.reset()
+
+    def reset(self):
+        """Forget all indexed records and clusters."""
+        self._buckets: List[Dict[bytes, List[str]]] = [{} for _ in range(self.bands)]
+        self._signatures: Dict[str, np.ndarray] = {}
+        self._embeddings: Dict[str, np.ndarray] = {}
+        self._records: Dict[str, Dict[str, Any]] = {}
+        self._parent: Dict[str, str] = {}
+        self._matches: List[Dict[str, Any]] = []
+        self._order = 0
+
+    def signature(self, titulo: Optional[str], descripcion: Optional[str] = None) -> Optional[np.ndarray]:
+        """
+        Compute the MinHash signature of a tender's text.
+
+        Args:
+            titulo: Tender title
+            descripcion: Tender description
+
+        Returns:
+            Signature array, or None if the text is too short
+        """
+        text = self._normalize(titulo)
+        if descripcion:
+            text = f"{text} {self._normalize(descripcion[:self.description_chars])}".strip()
+        if len(text) < self.min_text_length:
+            return None
+
+        size = self.shingle_size
+        shingles = {text[i:i + size] for i in range(max(len(text) - size + 1, 1))}
+        hashes = np.fromiter(
+            (zlib.crc32(shingle.encode("utf-8")) for shingle in shingles),
+            dtype=np.uint64,
+            count=len(shingles)
+        )
+        permuted = (np.outer(self._perm_a, hashes) + self._perm_b[:, None]) % _MERSENNE_PRIME
+        return np.bitwise_and(permuted, _MAX_HASH).min(axis=1)
+
+    def add(self, tender_id: str, titulo: Optional[str], descripcion: Optional[str] = None,
+            source: Optional[str] = None, embedding: Optional[List[float]] = None,
+            seen_at: Optional[datetime] = None) -> Optional[Dict[str, Any]]:
+        """
+        Index one tender and link it to its closest near-duplicate, if any.
+
+        Args:
+            tender_id: Tender identifier
+            titulo: Tender title
+            descripcion: Tender description
+            source: Source name
+            embedding: Embedding vector used to refine matches
+            seen_at: Extraction timestamp, used to pick the canonical tender
+
+        Returns:
+            Match dictionary (tender_id, duplicate_of, canonical_tender_id, similarity,
+            sources) or None if the tender is not a near-duplicate
+        """
+        if not tender_id or tender_id in self._signatures:
+            return None
+
+        signature = self.signature(titulo, descripcion)
+        if signature is None:
+            return None
+
+        vector = self._unit_vector(embedding)
+        best_id, best_similarity = None, 0.0
+        for candidate_id in self._candidates(signature):
+            similarity = float(np.mean(self._signatures[candidate_id] == signature))
+            if similarity < self.threshold or similarity <= best_similarity:
+                continue
+            if not self._embeddings_agree(vector, self._embeddings.get(candidate_id)):
+                continue
+            best_id, best_similarity = candidate_id, similarity
+
+        self._index(tender_id, signature, vector, {
+            "tender_id": tender_id,
+            "titulo": titulo,
+            "fuente": source,
+            "seen_at": seen_at,
+            "order": self._order
+        })
+        self._order += 1
+
+        if best_id is None:
+            return None
+
+        self._union(tender_id, best_id)
+        match = {
+            "tender_id": tender_id,
+            "duplicate_of": best_id,
+            "canonical_tender_id": self._find(tender_id),
+            "similarity": round(best_similarity, 4),
+            "sources": sorted({s for s in (source, self._records[best_id]["fuente"]) if s})
+        }
+        self._matches.append(match)
+        return match
+
+    def process_batch(self, records: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Index a batch of records against everything seen so far.
+
+        Args:
+            records: Dictionaries with tender_id, titulo and optionally descripcion,
+                fuente, embeddings and fecha_extraccion
+
+        Returns:
+            Matches found in this batch
+        """
+        matches = []
+        for record in records:
+            match = self.add(
+                tender_id=record.get("tender_id"),
+                titulo=record.get("titulo"),
+                descripcion=record.get("descripcion"),
+                source=record.get("fuente"),
+                embedding=record.get("embeddings"),
+                seen_at=record.get("fecha_extraccion")
+            )
+            if match:
+                matches.append(match)
+        return matches
+
+    def get_matches(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Get verified duplicate pairs, most similar first.
+
+        Args:
+            limit: Maximum number of pairs
+
+        Returns:
+            List of match dictionaries
+        """
+        matches = sorted(self._matches, key=lambda m: m["similarity"], reverse=True)
+        return matches[:limit] if limit else matches
+
+    def get_clusters(self, min_size: int = 2) -> List[Dict[str, Any]]:
+        """
+        Get duplicate clusters with their canonical tender.
+
+        Args:
+            min_size: Minimum number of members
+
+        Returns:
+            Clusters (canonical_tender_id, members, sources, size), largest first
+        """
+        members: Dict[str, List[str]] = {}
+        for tender_id in self._parent:
+            members.setdefault(self._find(tender_id), []).append(tender_id)
+
+        clusters = []
+        for canonical_id, tender_ids in members.items():
+            if len(tender_ids) < min_size:
+                continue
+            tender_ids.sort(key=lambda t: self._records[t]["order"])
+            clusters.append({
+                "canonical_tender_id": canonical_id,
+                "canonical_title": self._records[canonical_id]["titulo"],
+                "members": tender_ids,
+                "sources": sorted({self._records[t]["fuente"] for t in tender_ids if self._records[t]["fuente"]}),
+                "size": len(tender_ids)
+            })
+        clusters.sort(key=lambda c: c["size"], reverse=True)
+        return clusters
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get detector statistics.
+
+        Returns:
+            Indexed record, match and cluster counts plus LSH parameters
+        """
+        clusters = self.get_clusters()
+        return {
+            "indexed_records": len(self._signatures),
+            "duplicate_records": len(self._matches),
+            "clusters": len(clusters),
+            "threshold": self.threshold,
+            "bands": self.bands,
+            "rows_per_band": self.rows
+        }
+
+    def _candidates(self, signature: np.ndarray) -> set:
+        """Records sharing at least one LSH band bucket with the signature."""
+        candidates = set()
+        for band, key in enumerate(self._band_keys(signature)):
+            candidates.update(self._buckets[band].get(key, ()))
+        return candidates
+
+    def _index(self, tender_id: str, signature: np.ndarray, vector: Optional[np.ndarray], record: Dict[str, Any]):
+        """Store a record's signature in the LSH buckets."""
+        for band, key in enumerate(self._band_keys(signature)):
+            self._buckets[band].setdefault(key, []).append(tender_id)
+        self._signatures[tender_id] = signature
+        if vector is not None:
+            self._embeddings[tender_id] = vector
+        self._records[tender_id] = record
+        self._parent[tender_id] = tender_id
+
+    def _band_keys(self, signature: np.ndarray) -> List[bytes]:
+        """Bucket keys of each band of a signature."""
+        return [signature[band * self.rows:(band + 1) * self.rows].tobytes() for band in range(self.bands)]
+
+    def _find(self, tender_id: str) -> str:
+        """Union-find root, which is always the cluster's canonical tender."""
+        root = tender_id
+        while self._parent[root] != root:
+            root = self._parent[root]
+        while self._parent[tender_id] != root:
+            self._parent[tender_id], tender_id = root, self._parent[tender_id]
+        return root
+
+    def _union(self, first_id: str, second_id: str):
+        """Merge two clusters, keeping the earliest tender as canonical."""
+        first_root, second_root = self._find(first_id), self._find(second_id)
+        if first_root == second_root:
+            return
+        if self._canonical_key(second_root) < self._canonical_key(first_root):
+            first_root, second_root = second_root, first_root
+        self._parent[second_root] = first_root
+
+    def _canonical_key(self, tender_id: str) -> Tuple:
+        """Sort key for canonical selection: earliest seen, then insertion order."""
+        record = self._records[tender_id]
+        seen_at = record["seen_at"]
+        return (seen_at is None, seen_at or datetime.min, record["order"])
+
+    def _embeddings_agree(self, first: Optional[np.ndarray], second: Optional[np.ndarray]) -> bool:
+        """Whether embeddings confirm a candidate (always true if refinement is off or data is missing)."""
+        if self.embedding_threshold is None or first is None or second is None:
+            return True
+        return float(np.dot(first, second)) >= self.embedding_threshold
+
+    def _unit_vector(self, embedding: Optional[List[float]]) -> Optional[np.ndarray]:
+        """Normalize an embedding for cosine comparisons."""
+        if self.embedding_threshold is None or not embedding:
+            return None
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else None
+
+    @staticmethod
+    def _normalize(text: Optional[str]) -> str:
+        """Lowercase, strip accents and punctuation, and collapse whitespace."""
+        if not text:
+            return ""
+        text = unicodedata.normalize("NFKD", text.lower())
+        text = "".join(ch for ch in text if not unicodedata.combining(ch))
+        text = re.sub(r"[^\w\s]", " ", text)
+        return " ".join(text.split())
+
+    @staticmethod
+    def _optimal_bands(threshold: float, num_perm: int, min_recall: float = 0.95) -> Tuple[int, int]:
+        """
+        Pick LSH bands and rows: the most rows per band (fewest false candidates)
+        that still make a pair at the threshold a candidate with ``min_recall``
+        probability; verification removes the extra candidates.
+        """
+        best = (num_perm, 1)
+        for rows in range(1, num_perm + 1):
+            bands = num_perm // rows
+            recall = 1 - (1 - threshold ** rows) ** bands
+            if recall < min_recall:
+                break
+            best = (bands, rows)
+        return best
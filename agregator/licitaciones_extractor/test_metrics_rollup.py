@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Tests for the incremental metrics rollup against a fake session that records SQL.
+"""
+
+import sys
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from pathlib import Path
+
+# Add project root to path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from src.monitoring.metrics_rollup import MetricsRollup
+
+
+class FakeResult:
+    def __init__(self, scalar=None, row=None, keys=None, rows=None):
+        self._scalar = scalar
+        self._row = row
+        self._keys = keys or []
+        self._rows = rows or []
+
+    def scalar(self):
+        return self._scalar
+
+    def one(self):
+        return self._row
+
+    def keys(self):
+        return self._keys
+
+    def __iter__(self):
+        return iter(self._rows)
+
+
+class FakeSession:
+    """Answers the rollup queries from an in-memory updates table (id, fecha_extraccion)."""
+
+    def __init__(self, db):
+        self.db = db
+
+    def execute(self, clause, params=None):
+        sql = " ".join(str(clause).split())
+        params = params or {}
+        self.db.statements.append((sql, params))
+
+        if sql.startswith("SELECT last_seen_id FROM metrics_rollup_state"):
+            return FakeResult(scalar=self.db.watermark)
+        if sql.startswith("SELECT COALESCE(MAX(id), 0) FROM updates"):
+            return FakeResult(scalar=max((row_id for row_id, _ in self.db.updates), default=0))
+        if sql.startswith("SELECT COUNT(*), LEAST"):
+            new_rows = [day for row_id, day in self.db.updates if params["last_seen"] < row_id <= params["max_id"]]
+            since = date.today() - timedelta(days=params["rescan_days"])
+            return FakeResult(row=(len(new_rows), min(new_rows + [since])))
+        if sql.startswith("INSERT INTO metrics_daily_rollup"):
+            self.db.recomputed_since.append(params["since"])
+        elif sql.startswith("UPDATE metrics_rollup_state"):
+            self.db.watermark = params["max_id"]
+        elif self.db.read_rows is not None:
+            keys, rows = self.db.read_rows
+            return FakeResult(keys=keys, rows=rows)
+        return FakeResult()
+
+
+class FakeDatabaseConnection:
+    def __init__(self, updates=None, fail_with=None):
+        self.updates = updates or []
+        self.watermark = 0
+        self.statements = []
+        self.recomputed_since = []
+        self.read_rows = None
+        self.fail_with = fail_with
+
+    @contextmanager
+    def get_session(self):
+        if self.fail_with:
+            raise self.fail_with
+        yield FakeSession(self)
+
+
+def test_refresh_advances_the_watermark_to_max_id():
+    today = date.today()
+    db = FakeDatabaseConnection(updates=[(1, today), (2, today), (5, today)])
+    rollup = MetricsRollup(db, min_refresh_interval=0)
+
+    assert rollup.refresh() == 3
+    assert rollup.last_seen_id == 5
+    assert db.watermark == 5
+
+    db.updates.append((7, today))
+    assert rollup.refresh() == 1
+    assert db.watermark == 7
+
+
+def test_rows_committed_late_below_the_watermark_are_recomputed():
+    today = date.today()
+    db = FakeDatabaseConnection(updates=[(1, today), (3, today)])
+    rollup = MetricsRollup(db, min_refresh_interval=0, rescan_days=1)
+    rollup.refresh()
+
+    # Row 2 was given its id before row 3 but committed after the previous refresh
+    db.updates.append((2, today))
+    assert rollup.refresh() == 0
+    assert db.watermark == 3
+
+    # The days of the trailing window are recomputed from updates on every refresh
+    since = db.recomputed_since[-1]
+    assert since == today - timedelta(days=1)
+    insert_sql = next(sql for sql, _ in reversed(db.statements) if sql.startswith("INSERT INTO metrics_daily_rollup"))
+    assert "WHERE fecha_extraccion >= :since" in insert_sql
+    assert "id >" not in insert_sql
+
+
+def test_new_rows_of_older_days_extend_the_recomputed_window():
+    old_day = date.today() - timedelta(days=10)
+    db = FakeDatabaseConnection(updates=[(1, old_day)])
+    rollup = MetricsRollup(db, min_refresh_interval=0)
+
+    rollup.refresh()
+
+    assert db.recomputed_since == [old_day]
+
+
+def test_refresh_is_skipped_within_the_minimum_interval_unless_forced():
+    db = FakeDatabaseConnection(updates=[(1, date.today())])
+    rollup = MetricsRollup(db, min_refresh_interval=3600)
+
+    assert rollup.refresh() == 1
+    statements = len(db.statements)
+
+    db.updates.append((2, date.today()))
+    assert rollup.refresh() == 0
+    assert len(db.statements) == statements
+
+    assert rollup.refresh(force=True) == 1
+    assert rollup.last_seen_id == 2
+
+
+def test_refresh_failures_are_kept_until_a_refresh_succeeds():
+    db = FakeDatabaseConnection(fail_with=RuntimeError("connection refused"))
+    rollup = MetricsRollup(db, min_refresh_interval=0)
+
+    assert rollup.refresh() == 0
+    assert rollup.last_error == "connection refused"
+
+    db.fail_with = None
+    rollup.refresh()
+    assert rollup.last_error is None
+
+
+def test_fetch_converts_decimal_sums_and_averages():
+    db = FakeDatabaseConnection()
+    db.read_rows = (
+        ["fuente", "total_records", "with_title", "avg_description_length", "last_extraction"],
+        [("cdmx", Decimal("12"), Decimal("10"), Decimal("153.5"), datetime(2024, 1, 15, 8, 30))],
+    )
+    rollup = MetricsRollup(db)
+
+    rows = rollup.get_field_totals(source="cdmx", days=7)
+
+    assert rows == [{
+        "fuente": "cdmx",
+        "total_records": 12,
+        "with_title": 10,
+        "avg_description_length": 153.5,
+        "last_extraction": datetime(2024, 1, 15, 8, 30),
+    }]
+    assert type(rows[0]["total_records"]) is int
+    assert type(rows[0]["avg_description_length"]) is float
+    assert db.statements[-1][1] == {"source": "cdmx", "days": 7}
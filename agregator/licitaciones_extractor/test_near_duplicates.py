@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Tests for MinHash/LSH near-duplicate detection.
+"""
+
+import sys
+from datetime import datetime
+from pathlib import Path
+
+# Add project root to path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from src.monitoring.data_quality_monitor import DataQualityMonitor
+from src.utils.near_duplicates import NearDuplicateDetector
+
+TITLE = "Adquisición de medicamentos y material de curación para hospitales generales"
+DESCRIPTION = "Suministro de medicamentos, material de curación y equipo médico para la red estatal de salud"
+
+
+def test_near_identical_titles_are_candidates_and_matched():
+    detector = NearDuplicateDetector()
+    detector.add("cdmx-1", TITLE, DESCRIPTION, source="cdmx")
+
+    # Casing, accents and punctuation are normalized away
+    match = detector.add("comprasmx-1", TITLE.upper().replace("ó", "o") + ".", DESCRIPTION, source="comprasmx")
+
+    assert match["duplicate_of"] == "cdmx-1"
+    assert match["canonical_tender_id"] == "cdmx-1"
+    assert match["similarity"] == 1.0
+    assert match["sources"] == ["cdmx", "comprasmx"]
+
+
+def test_unrelated_tenders_are_not_candidates():
+    detector = NearDuplicateDetector()
+    detector.add("cdmx-1", TITLE, DESCRIPTION, source="cdmx")
+    signature = detector.signature("Construcción de puente vehicular en la carretera federal", "Obra pública")
+
+    assert detector._candidates(signature) == set()
+    assert detector.add("cdmx-2", "Construcción de puente vehicular en la carretera federal", "Obra pública") is None
+
+
+def test_threshold_separates_small_edits_from_different_texts():
+    edited = TITLE.replace("generales", "regionales")
+    first = NearDuplicateDetector()
+    similarity = float((first.signature(TITLE, DESCRIPTION) == first.signature(edited, DESCRIPTION)).mean())
+    assert 0.5 < similarity < 1.0
+
+    below = NearDuplicateDetector(threshold=min(similarity + 0.05, 1.0))
+    below.add("a", TITLE, DESCRIPTION)
+    assert below.add("b", edited, DESCRIPTION) is None
+
+    above = NearDuplicateDetector(threshold=similarity - 0.05)
+    above.add("a", TITLE, DESCRIPTION)
+    assert above.add("b", edited, DESCRIPTION)["duplicate_of"] == "a"
+
+
+def test_bands_give_high_recall_at_threshold():
+    for threshold in (0.5, 0.8, 0.9):
+        detector = NearDuplicateDetector(threshold=threshold)
+        recall = 1 - (1 - threshold ** detector.rows) ** detector.bands
+        assert detector.bands * detector.rows <= detector.num_perm
+        assert recall >= 0.95
+
+
+def test_embedding_threshold_rejects_candidates_with_different_embeddings():
+    detector = NearDuplicateDetector(embedding_threshold=0.9)
+    detector.add("a", TITLE, DESCRIPTION, embedding=[1.0, 0.0])
+
+    assert detector.add("b", TITLE, DESCRIPTION, embedding=[0.0, 1.0]) is None
+    assert detector.add("c", TITLE, DESCRIPTION, embedding=[0.9, 0.1])["duplicate_of"] == "a"
+
+
+def test_clusters_keep_the_earliest_tender_as_canonical():
+    detector = NearDuplicateDetector()
+    detector.process_batch([
+        {"tender_id": "late", "titulo": TITLE, "fuente": "cdmx", "fecha_extraccion": datetime(2025, 5, 2)},
+        {"tender_id": "early", "titulo": TITLE, "fuente": "licita_ya", "fecha_extraccion": datetime(2025, 5, 1)},
+        {"tender_id": "other", "titulo": "Servicio de limpieza de oficinas centrales", "fuente": "cdmx"},
+    ])
+
+    clusters = detector.get_clusters()
+    assert len(clusters) == 1
+    assert clusters[0]["canonical_tender_id"] == "early"
+    assert clusters[0]["members"] == ["late", "early"]
+    assert clusters[0]["sources"] == ["cdmx", "licita_ya"]
+
+
+def test_short_text_is_ignored():
+    detector = NearDuplicateDetector()
+    assert detector.signature("Obra") is None
+    assert detector.add("a", "Obra") is None
+    assert detector.get_stats()["indexed_records"] == 0
+
+
+def test_monitor_reports_cross_source_duplicates():
+    duplicates = DataQualityMonitor()._find_cross_source_duplicates([
+        ("cdmx", {"tender_id": "cdmx-1", "titulo": TITLE, "descripcion": DESCRIPTION}),
+        ("comprasmx", {"tender_id": "comprasmx-1", "titulo": TITLE.lower(), "descripcion": DESCRIPTION}),
+        ("cdmx", {"tender_id": "cdmx-2", "titulo": "Servicio de limpieza de oficinas centrales"}),
+    ])
+
+    assert duplicates == [f"{TITLE[:50]}... (found in cdmx, comprasmx; canonical cdmx-1)"]
+
+
+def test_monitor_reports_sources_sharing_a_tender_id():
+    duplicates = DataQualityMonitor()._find_cross_source_duplicates([
+        ("comprasmx", {"tender_id": "LA-006000998-E1-2025", "titulo": TITLE, "descripcion": DESCRIPTION}),
+        ("licita_ya", {"tender_id": "LA-006000998-E1-2025", "titulo": TITLE, "descripcion": DESCRIPTION}),
+    ])
+
+    assert duplicates == [f"{TITLE[:50]}... (found in comprasmx, licita_ya; canonical LA-006000998-E1-2025)"]
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Tests for the scheduler run coordinator against a temporary SQLite database.
+"""
+
+import sys
+import threading
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pytest
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.ext.compiler import compiles
+
+# Add project root to path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from src.database.connection import Base, DatabaseConnection
+from src.database.models import RunLease, RunLedger
+from src.scheduler.run_coordinator import RunCoordinator
+
+
+@compiles(JSONB, "sqlite")
+def compile_jsonb_for_sqlite(type_, compiler, **kw):
+    return "JSON"
+
+
+@pytest.fixture
+def db_connection(tmp_path):
+    connection = DatabaseConnection(f"sqlite:///{tmp_path / 'runs.db'}")
+    Base.metadata.create_all(bind=connection.engine, tables=[RunLease.__table__, RunLedger.__table__])
+    return connection
+
+
+def coordinator(db_connection, policy="skip"):
+    run_coordinator = RunCoordinator("extraction", db_connection)
+    run_coordinator.policy = policy
+    run_coordinator.lease_ttl = 600
+    run_coordinator.queue_timeout = 60
+    run_coordinator.min_interval = 3600
+    return run_coordinator
+
+
+def ledger(db_connection):
+    with db_connection.get_session() as session:
+        return [(entry.trigger, entry.holder, entry.status) for entry in session.query(RunLedger).order_by(RunLedger.id)]
+
+
+def test_lease_is_exclusive_until_released(db_connection):
+    first = coordinator(db_connection)
+    second = coordinator(db_connection)
+
+    assert first.try_acquire()
+    assert not second.try_acquire()
+    assert first.heartbeat()
+
+    first.release()
+    assert second.try_acquire()
+    assert not first.heartbeat()
+
+
+def test_stale_lease_is_taken_over_and_its_run_abandoned(db_connection):
+    dead = coordinator(db_connection)
+    assert dead.try_acquire()
+    dead._record(trigger="daily", status="running", triggered_at=datetime.utcnow(), started_at=datetime.utcnow())
+
+    with db_connection.get_session() as session:
+        session.query(RunLease).update({"expires_at": datetime.utcnow() - timedelta(seconds=1)})
+
+    alive = coordinator(db_connection)
+    assert alive.try_acquire()
+    assert not dead.heartbeat()
+    assert ledger(db_connection) == [("daily", dead.holder, "abandoned")]
+
+
+def test_skip_policy_drops_trigger_while_lease_is_held(db_connection):
+    holder = coordinator(db_connection)
+    assert holder.try_acquire()
+    calls = []
+
+    outcome = coordinator(db_connection).run(lambda: calls.append(1), trigger="daily")
+
+    assert outcome["status"] == "skipped"
+    assert calls == []
+    assert [status for _, _, status in ledger(db_connection)] == ["skipped"]
+
+
+def test_queue_policy_waits_for_the_lease(db_connection):
+    holder = coordinator(db_connection)
+    assert holder.try_acquire()
+    queued = coordinator(db_connection, policy="queue")
+    queued.poll_interval = 0.05
+
+    timer = threading.Timer(0.3, holder.release)
+    timer.start()
+    outcome = queued.run(lambda: {"success": True}, trigger="daily")
+    timer.join()
+
+    assert outcome["status"] == "success"
+    assert outcome["queue_delay_seconds"] >= 0.3
+    assert ledger(db_connection) == [("daily", queued.holder, "success")]
+
+
+def test_min_interval_skips_recent_runs_unless_forced(db_connection):
+    run_coordinator = coordinator(db_connection)
+
+    assert run_coordinator.run(lambda: True, trigger="cli")["status"] == "success"
+    assert run_coordinator.run(lambda: True, trigger="cli")["status"] == "skipped"
+    assert run_coordinator.run(lambda: True, trigger="cli", force=True)["status"] == "success"
+    assert [status for _, _, status in ledger(db_connection)] == ["success", "skipped", "success"]
+
+
+def test_failed_jobs_are_recorded_as_errors(db_connection):
+    run_coordinator = coordinator(db_connection)
+    run_coordinator.min_interval = 0
+
+    assert run_coordinator.run(lambda: False)["status"] == "error"
+    assert run_coordinator.run(lambda: {"status": "error"})["status"] == "error"
+    assert run_coordinator.run(lambda: {"success": False})["status"] == "error"
+
+    def crash():
+        raise RuntimeError("boom")
+
+    outcome = run_coordinator.run(crash)
+    assert (outcome["status"], outcome["error"]) == ("error", "boom")
+    assert [status for _, _, status in ledger(db_connection)] == ["error"] * 4
+
+
+def test_history_failure_skips_the_run_and_releases_the_lease(db_connection):
+    run_coordinator = coordinator(db_connection)
+    calls = []
+
+    def broken_history():
+        raise RuntimeError("db down")
+
+    run_coordinator._last_success_started_at = broken_history
+    outcome = run_coordinator.run(lambda: calls.append(1), trigger="daily")
+
+    assert outcome["status"] == "skipped"
+    assert calls == []
+    assert coordinator(db_connection).try_acquire()
+
+
+def test_scheduler_does_not_run_the_job_when_coordination_fails():
+    from src.scheduler.daily_job import DailyScheduler
+
+    class BrokenCoordinator:
+        def run(self, job_function, trigger="manual", force=False):
+            raise RuntimeError("db down")
+
+    calls = []
+    scheduler = DailyScheduler()
+    scheduler.set_job_function(lambda: calls.append(1))
+    scheduler._coordinator = BrokenCoordinator()
+
+    outcome = scheduler.run_now(trigger="startup")
+
+    assert outcome["status"] == "error"
+    assert calls == []
@@ -1,11 +1,14 @@
+import asyncio
 import dataclasses
 import io
 import json
 import logging
 import mimetypes
 import os
+import tempfile
 import time
 from collections.abc import AsyncGenerator, Awaitable, Callable
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import Any, cast
 
@@ -16,6 +19,7 @@ from azure.cognitiveservices.speech import (
     SpeechSynthesisResult,
     SpeechSynthesizer,
 )
+from azure.core.exceptions import HttpResponseError
 from azure.identity.aio import (
     AzureDeveloperCliCredential,
     ManagedIdentityCredential,
@@ -57,13 +61,18 @@ from config import (
     CONFIG_CHAT_APPROACH,
     CONFIG_CHAT_HISTORY_BROWSER_ENABLED,
     CONFIG_CHAT_HISTORY_COSMOS_ENABLED,
+    CONFIG_CONTENT_CACHE,
+    CONFIG_CPU_EXECUTOR,
     CONFIG_CREDENTIAL,
     CONFIG_DEFAULT_REASONING_EFFORT,
     CONFIG_GLOBAL_BLOB_MANAGER,
     CONFIG_INGESTER,
+    CONFIG_INGESTION_QUEUE,
     CONFIG_LANGUAGE_PICKER_ENABLED,
+    CONFIG_LATENCY_RECORDER,
     CONFIG_MULTIMODAL_ENABLED,
     CONFIG_OPENAI_CLIENT,
+    CONFIG_QUERY_CACHE,
     CONFIG_QUERY_REWRITING_ENABLED,
     CONFIG_RAG_SEARCH_IMAGE_EMBEDDINGS,
     CONFIG_RAG_SEARCH_TEXT_EMBEDDINGS,
@@ -72,6 +81,8 @@ from config import (
     CONFIG_REASONING_EFFORT_ENABLED,
     CONFIG_SEARCH_CLIENT,
     CONFIG_SEMANTIC_RANKER_DEPLOYED,
+    CONFIG_SPEECH_CACHE,
+    CONFIG_SPEECH_EXECUTOR,
     CONFIG_SPEECH_INPUT_ENABLED,
     CONFIG_SPEECH_OUTPUT_AZURE_ENABLED,
     CONFIG_SPEECH_OUTPUT_BROWSER_ENABLED,
@@ -85,7 +96,18 @@ from config import (
     CONFIG_VECTOR_SEARCH_ENABLED,
 )
 from core.authentication import AuthenticationHelper
+from core.contentcache import CachedContent, ContentCache
+from core.ingestionqueue import IngestionJobStore, IngestionQueue, hash_file_content
+from core.latency import LatencyRecorder, StackSampler, track_request, track_stream
+from core.querycache import (
+    MemoryCacheBackend,
+    QueryCache,
+    QueryCacheBackend,
+    RedisCacheBackend,
+    SimilarQueryIndex,
+)
 from core.sessionhelper import create_session_id
+from core.speechcache import SpeechCache
 from decorators import authenticated, authenticated_path
 from error import error_dict, error_response
 from prepdocs import (
@@ -97,9 +119,9 @@ from prepdocs import (
     setup_search_info,
 )
 from prepdocslib.blobmanager import AdlsBlobManager, BlobManager
+from prepdocslib.cpuexecutor import CpuWorkExecutor
 from prepdocslib.embeddings import ImageEmbeddings
 from prepdocslib.filestrategy import UploadUserFileStrategy
-from prepdocslib.listfilestrategy import File
 
 bp = Blueprint("routes", __name__, static_folder="static")
 # Fix Windows registry issue with mimetypes
@@ -137,7 +159,7 @@ async def content_file(path: str, auth_claims: dict[str, Any]):
     *** NOTE *** if you are using app services authentication, this route will return unauthorized to all users that are not logged in
     if AZURE_ENFORCE_ACCESS_CONTROL is not set or false, logged in users can access all files regardless of access control
     if AZURE_ENFORCE_ACCESS_CONTROL is set to true, logged in users can only access files they have access to
-    This is also slow and memory hungry.
+    Content is streamed from storage, honoring Range and If-None-Match requests, and small files are cached.
     """
     # Remove page number from path, filename-1.txt -> filename.txt
     # This shouldn't typically be necessary as browsers don't send hash fragments to servers
@@ -146,34 +168,79 @@ async def content_file(path: str, auth_claims: dict[str, Any]):
         path = path_parts[0]
     current_app.logger.info("Opening file %s", path)
     blob_manager: BlobManager = current_app.config[CONFIG_GLOBAL_BLOB_MANAGER]
-
-    # Get bytes and properties from the blob manager
-    result = await blob_manager.download_blob(path)
-
-    if result is None:
-        current_app.logger.info("Path not found in general Blob container: %s", path)
-        if current_app.config[CONFIG_USER_UPLOAD_ENABLED]:
-            user_oid = auth_claims["oid"]
-            user_blob_manager: AdlsBlobManager = current_app.config[CONFIG_USER_BLOB_MANAGER]
-            result = await user_blob_manager.download_blob(path, user_oid=user_oid)
-            if result is None:
-                current_app.logger.exception("Path not found in DataLake: %s", path)
-
-    if not result:
-        abort(404)
-
-    content, properties = result
-
-    if not properties or "content_settings" not in properties:
+    content_cache: ContentCache = current_app.config[CONFIG_CONTENT_CACHE]
+    user_upload_enabled = current_app.config[CONFIG_USER_UPLOAD_ENABLED]
+    user_oid = auth_claims.get("oid") if user_upload_enabled else None
+
+    cached = content_cache.get(path)
+    if cached is None and user_oid:
+        cached = content_cache.get(path, user_oid=user_oid)
+    if cached is not None:
+        return await cached_content_response(path, cached)
+
+    # Only a single byte range with a known start is requested from storage, others get the whole file
+    offset, length = None, None
+    if request.range and request.range.units == "bytes" and len(request.range.ranges) == 1:
+        start, stop = request.range.ranges[0]
+        if start >= 0:
+            offset, length = start, (stop - start if stop is not None else None)
+
+    download_user_oid = None
+    try:
+        download = await blob_manager.open_blob(path, offset=offset, length=length)
+        if download is None:
+            current_app.logger.info("Path not found in general Blob container: %s", path)
+            if user_oid:
+                user_blob_manager: AdlsBlobManager = current_app.config[CONFIG_USER_BLOB_MANAGER]
+                download = await user_blob_manager.open_blob(path, user_oid=user_oid, offset=offset, length=length)
+                download_user_oid = user_oid
+                if download is None:
+                    current_app.logger.info("Path not found in DataLake: %s", path)
+    except HttpResponseError as error:
+        if error.status_code == 416:
+            abort(416)
+        raise
+
+    if download is None:
         abort(404)
 
-    mime_type = properties["content_settings"]["content_type"]
+    mime_type = download.content_type
     if mime_type == "application/octet-stream":
         mime_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+    etag = download.etag.strip('"') if download.etag else None
 
-    # Create a BytesIO object from the bytes
-    blob_file = io.BytesIO(content)
-    return await send_file(blob_file, mimetype=mime_type, as_attachment=False, attachment_filename=path)
+    if etag and request.if_none_match.contains(etag):
+        response = current_app.response_class("", status=304)
+        response.set_etag(etag)
+        return response
+
+    # Small files are read whole and cached, larger files and byte ranges are streamed as they are downloaded
+    if offset is None and download.length <= content_cache.max_entry_bytes:
+        content = b"".join([chunk async for chunk in download.chunks])
+        cached = CachedContent(content=content, content_type=mime_type, etag=etag)
+        content_cache.set(path, cached, user_oid=download_user_oid)
+        return await cached_content_response(path, cached)
+
+    response = current_app.response_class(download.chunks, mimetype=mime_type, status=200 if offset is None else 206)
+    response.content_length = download.length
+    response.accept_ranges = "bytes"
+    if offset is not None:
+        size = download.size if download.size is not None else "*"
+        response.headers["Content-Range"] = f"bytes {download.offset}-{download.offset + download.length - 1}/{size}"
+    if etag:
+        response.set_etag(etag)
+    return response
+
+
+async def cached_content_response(path: str, cached: CachedContent):
+    response = await send_file(
+        io.BytesIO(cached.content), mimetype=cached.content_type, as_attachment=False, attachment_filename=path
+    )
+    if cached.etag:
+        response.set_etag(cached.etag)
+    # Answers If-None-Match and Range requests from the cached content
+    await response.make_conditional(request, accept_ranges=True, complete_length=len(cached.content))
+    return response
 
 
 @bp.route("/ask", methods=["POST"])
@@ -186,10 +253,13 @@ async def ask(auth_claims: dict[str, Any]):
     context["auth_claims"] = auth_claims
     try:
         approach: Approach = cast(Approach, current_app.config[CONFIG_ASK_APPROACH])
-        r = await approach.run(
-            request_json["messages"], context=context, session_state=request_json.get("session_state")
-        )
-        return jsonify(r)
+        with track_request(current_app.config[CONFIG_LATENCY_RECORDER], "/ask") as timings:
+            r = await approach.run(
+                request_json["messages"], context=context, session_state=request_json.get("session_state")
+            )
+        response = jsonify(r)
+        response.headers["Server-Timing"] = timings.server_timing()
+        return response
     except Exception as error:
         return error_response(error, "/ask")
 
@@ -197,14 +267,20 @@ async def ask(auth_claims: dict[str, Any]):
 class JSONEncoder(json.JSONEncoder):
     def default(self, o):
         if dataclasses.is_dataclass(o) and not isinstance(o, type):
-            return dataclasses.asdict(o)
+            # Unlike dataclasses.asdict, which copies every nested list and dict such as the sources,
+            # only the fields are listed and the encoder serializes their values in place
+            return {f.name: getattr(o, f.name) for f in dataclasses.fields(o)}
         return super().default(o)
 
 
+# A single encoder is shared by all the events, rather than creating one per event with json.dumps
+ndjson_encoder = JSONEncoder(ensure_ascii=False)
+
+
 async def format_as_ndjson(r: AsyncGenerator[dict, None]) -> AsyncGenerator[str, None]:
     try:
         async for event in r:
-            yield json.dumps(event, ensure_ascii=False, cls=JSONEncoder) + "\n"
+            yield ndjson_encoder.encode(event) + "\n"
     except Exception as error:
         logging.exception("Exception while generating response stream: %s", error)
         yield json.dumps(error_dict(error))
@@ -229,12 +305,15 @@ async def chat(auth_claims: dict[str, Any]):
                 current_app.config[CONFIG_CHAT_HISTORY_COSMOS_ENABLED],
                 current_app.config[CONFIG_CHAT_HISTORY_BROWSER_ENABLED],
             )
-        result = await approach.run(
-            request_json["messages"],
-            context=context,
-            session_state=session_state,
-        )
-        return jsonify(result)
+        with track_request(current_app.config[CONFIG_LATENCY_RECORDER], "/chat") as timings:
+            result = await approach.run(
+                request_json["messages"],
+                context=context,
+                session_state=session_state,
+            )
+        response = jsonify(result)
+        response.headers["Server-Timing"] = timings.server_timing()
+        return response
     except Exception as error:
         return error_response(error, "/chat")
 
@@ -263,7 +342,9 @@ async def chat_stream(auth_claims: dict[str, Any]):
             context=context,
             session_state=session_state,
         )
-        response = await make_response(format_as_ndjson(result))
+        response = await make_response(
+            format_as_ndjson(track_stream(current_app.config[CONFIG_LATENCY_RECORDER], "/chat/stream", result))
+        )
         response.timeout = None  # type: ignore
         response.mimetype = "application/json-lines"
         return response
@@ -271,6 +352,23 @@ async def chat_stream(auth_claims: dict[str, Any]):
         return error_response(error, "/chat")
 
 
+@bp.get("/metrics")
+@authenticated
+async def metrics(auth_claims: dict[str, Any]):
+    """
+    Latency percentiles of the chat and ask requests and of their stages, along with the hit rates of the caches
+    """
+    latency_recorder: LatencyRecorder = current_app.config[CONFIG_LATENCY_RECORDER]
+    query_cache: QueryCache = current_app.config[CONFIG_QUERY_CACHE]
+    auth_helper: AuthenticationHelper = current_app.config[CONFIG_AUTH_CLIENT]
+    return jsonify(
+        {
+            "latency": latency_recorder.summary(),
+            "caches": {"query": query_cache.stats(), "auth": auth_helper.cache_stats()},
+        }
+    )
+
+
 # Send MSAL.js settings to the client UI
 @bp.route("/auth_setup", methods=["GET"])
 def auth_setup():
@@ -310,31 +408,42 @@ async def speech():
     if not request.is_json:
         return jsonify({"error": "request must be json"}), 415
 
-    speech_token = current_app.config.get(CONFIG_SPEECH_SERVICE_TOKEN)
-    if speech_token is None or speech_token.expires_on < time.time() + 60:
-        speech_token = await current_app.config[CONFIG_CREDENTIAL].get_token(
-            "https://cognitiveservices.azure.com/.default"
-        )
-        current_app.config[CONFIG_SPEECH_SERVICE_TOKEN] = speech_token
-
     request_json = await request.get_json()
     text = request_json["text"]
-    try:
+    voice = current_app.config[CONFIG_SPEECH_SERVICE_VOICE]
+    speech_cache: SpeechCache = current_app.config[CONFIG_SPEECH_CACHE]
+    # The audio is identified by its voice and text, so a client replaying an answer can reuse the audio it has
+    audio_key = SpeechCache.key(voice, text)
+    if request.if_none_match.contains(audio_key):
+        response = current_app.response_class("", status=304)
+        response.set_etag(audio_key)
+        return response
+
+    async def synthesize() -> bytes:
+        speech_token = current_app.config.get(CONFIG_SPEECH_SERVICE_TOKEN)
+        if speech_token is None or speech_token.expires_on < time.time() + 60:
+            speech_token = await current_app.config[CONFIG_CREDENTIAL].get_token(
+                "https://cognitiveservices.azure.com/.default"
+            )
+            current_app.config[CONFIG_SPEECH_SERVICE_TOKEN] = speech_token
+
         # Construct a token as described in documentation:
         # https://learn.microsoft.com/azure/ai-services/speech-service/how-to-configure-azure-ad-auth?pivots=programming-language-python
-        auth_token = (
-            "aad#"
-            + current_app.config[CONFIG_SPEECH_SERVICE_ID]
-            + "#"
-            + current_app.config[CONFIG_SPEECH_SERVICE_TOKEN].token
-        )
+        auth_token = "aad#" + current_app.config[CONFIG_SPEECH_SERVICE_ID] + "#" + speech_token.token
         speech_config = SpeechConfig(auth_token=auth_token, region=current_app.config[CONFIG_SPEECH_SERVICE_LOCATION])
-        speech_config.speech_synthesis_voice_name = current_app.config[CONFIG_SPEECH_SERVICE_VOICE]
+        speech_config.speech_synthesis_voice_name = voice
         speech_config.speech_synthesis_output_format = SpeechSynthesisOutputFormat.Audio16Khz32KBitRateMonoMp3
-        synthesizer = SpeechSynthesizer(speech_config=speech_config, audio_config=None)
-        result: SpeechSynthesisResult = synthesizer.speak_text_async(text).get()
+
+        def speak_text() -> SpeechSynthesisResult:
+            synthesizer = SpeechSynthesizer(speech_config=speech_config, audio_config=None)
+            return synthesizer.speak_text_async(text).get()
+
+        # Synthesis blocks until the audio is complete, so it runs on the speech executor instead of the event loop
+        result = await asyncio.get_running_loop().run_in_executor(
+            current_app.config[CONFIG_SPEECH_EXECUTOR], speak_text
+        )
         if result.reason == ResultReason.SynthesizingAudioCompleted:
-            return result.audio_data, 200, {"Content-Type": "audio/mp3"}
+            return result.audio_data
         elif result.reason == ResultReason.Canceled:
             cancellation_details = result.cancellation_details
             current_app.logger.error(
@@ -344,9 +453,15 @@ async def speech():
         else:
             current_app.logger.error("Unexpected result reason: %s", result.reason)
             raise Exception("Speech synthesis failed. Check logs for details.")
+
+    try:
+        audio_data = await speech_cache.get_or_create(audio_key, synthesize)
     except Exception as e:
         current_app.logger.exception("Exception in /speech")
         return jsonify({"error": str(e)}), 500
+    response = current_app.response_class(audio_data, status=200, content_type="audio/mp3")
+    response.set_etag(audio_key)
+    return response
 
 
 @bp.post("/upload")
@@ -359,11 +474,17 @@ async def upload(auth_claims: dict[str, Any]):
     try:
         user_oid = auth_claims["oid"]
         file = request_files.getlist("file")[0]
-        adls_manager: AdlsBlobManager = current_app.config[CONFIG_USER_BLOB_MANAGER]
-        file_url = await adls_manager.upload_blob(file, file.filename, user_oid)
-        ingester: UploadUserFileStrategy = current_app.config[CONFIG_INGESTER]
-        await ingester.add_file(File(content=file, url=file_url, acls={"oids": [user_oid]}), user_oid=user_oid)
-        return jsonify({"message": "File uploaded successfully"}), 200
+        ingestion_queue: IngestionQueue = current_app.config[CONFIG_INGESTION_QUEUE]
+        content_hash = await asyncio.to_thread(hash_file_content, file.stream)
+        # The same content uploaded again as the same file is neither stored nor ingested again
+        job = ingestion_queue.find(user_oid, file.filename, content_hash)
+        if job is None:
+            adls_manager: AdlsBlobManager = current_app.config[CONFIG_USER_BLOB_MANAGER]
+            file_url = await adls_manager.upload_blob(file, file.filename, user_oid)
+            current_app.config[CONFIG_CONTENT_CACHE].invalidate(file.filename, user_oid=user_oid)
+            job = ingestion_queue.submit(user_oid, file.filename, file_url, content_hash)
+        # The file is ingested in the background, its progress is available from /upload_status
+        return jsonify({"message": "File uploaded successfully", "job": job.to_json()}), 202
     except Exception as error:
         current_app.logger.error("Error uploading file: %s", error)
         return jsonify({"message": "Error uploading file, check server logs for details.", "status": "failed"}), 500
@@ -375,13 +496,27 @@ async def delete_uploaded(auth_claims: dict[str, Any]):
     request_json = await request.get_json()
     filename = request_json.get("filename")
     user_oid = auth_claims["oid"]
+    # Cancel the jobs of the file first, so that a job finishing while the file is removed doesn't succeed
+    current_app.config[CONFIG_INGESTION_QUEUE].forget_file(user_oid, filename)
     adls_manager: AdlsBlobManager = current_app.config[CONFIG_USER_BLOB_MANAGER]
     await adls_manager.remove_blob(filename, user_oid)
     ingester: UploadUserFileStrategy = current_app.config[CONFIG_INGESTER]
     await ingester.remove_file(filename, user_oid)
+    current_app.config[CONFIG_CONTENT_CACHE].invalidate(filename, user_oid=user_oid)
+    await current_app.config[CONFIG_QUERY_CACHE].invalidate_results()
     return jsonify({"message": f"File {filename} deleted successfully"}), 200
 
 
+@bp.get("/upload_status/<job_id>")
+@authenticated
+async def upload_status(auth_claims: dict[str, Any], job_id: str):
+    ingestion_queue: IngestionQueue = current_app.config[CONFIG_INGESTION_QUEUE]
+    job = ingestion_queue.get(job_id, user_oid=auth_claims["oid"])
+    if job is None:
+        return jsonify({"message": "Upload job not found"}), 404
+    return jsonify(job.to_json()), 200
+
+
 @bp.get("/list_uploaded")
 @authenticated
 async def list_uploaded(auth_claims: dict[str, Any]):
@@ -521,6 +656,44 @@ async def setup_clients():
         image_container=AZURE_IMAGESTORAGE_CONTAINER,
     )
     current_app.config[CONFIG_GLOBAL_BLOB_MANAGER] = global_blob_manager
+    current_app.config[CONFIG_CONTENT_CACHE] = ContentCache(
+        max_bytes=int(os.getenv("CONTENT_CACHE_MAX_BYTES") or 64 * 1024 * 1024),
+        max_entry_bytes=int(os.getenv("CONTENT_CACHE_MAX_FILE_BYTES") or 8 * 1024 * 1024),
+    )
+
+    # Set up the latency recorder, which also logs the stacks sampled during slow requests when a threshold is set
+    profiler = None
+    PROFILE_SLOW_REQUESTS_MS = os.getenv("PROFILE_SLOW_REQUESTS_MS")
+    if PROFILE_SLOW_REQUESTS_MS:
+        current_app.logger.info("PROFILE_SLOW_REQUESTS_MS is set, sampling stacks to profile slow requests")
+        profiler = StackSampler(interval=float(os.getenv("PROFILE_SAMPLE_INTERVAL_MS") or 5) / 1000)
+        profiler.start()
+    current_app.config[CONFIG_LATENCY_RECORDER] = LatencyRecorder(
+        profiler=profiler, slow_request_ms=float(PROFILE_SLOW_REQUESTS_MS) if PROFILE_SLOW_REQUESTS_MS else None
+    )
+
+    # Set up the cache of query embeddings and search results, shared by the workers when a Redis URL is given
+    query_cache_backend: QueryCacheBackend
+    if QUERY_CACHE_REDIS_URL := os.getenv("QUERY_CACHE_REDIS_URL"):
+        current_app.logger.info("QUERY_CACHE_REDIS_URL is set, caching queries in Redis")
+        query_cache_backend = RedisCacheBackend(QUERY_CACHE_REDIS_URL, prefix=f"querycache:{AZURE_SEARCH_INDEX}")
+    else:
+        query_cache_backend = MemoryCacheBackend(max_entries=int(os.getenv("QUERY_CACHE_MAX_ENTRIES") or 1024))
+    query_cache_rewrite_ttl = float(os.getenv("QUERY_CACHE_REWRITE_TTL") or 3600)
+    # Search queries are also reused for nearly identical questions when a similarity threshold is set
+    similar_rewrites = None
+    if QUERY_CACHE_REWRITE_SIMILARITY := os.getenv("QUERY_CACHE_REWRITE_SIMILARITY"):
+        similar_rewrites = SimilarQueryIndex(
+            threshold=float(QUERY_CACHE_REWRITE_SIMILARITY), ttl=query_cache_rewrite_ttl
+        )
+    query_cache = QueryCache(
+        query_cache_backend,
+        embedding_ttl=float(os.getenv("QUERY_CACHE_EMBEDDING_TTL") or 3600),
+        result_ttl=float(os.getenv("QUERY_CACHE_RESULT_TTL") or 60),
+        rewrite_ttl=query_cache_rewrite_ttl,
+        similar_rewrites=similar_rewrites,
+    )
+    current_app.config[CONFIG_QUERY_CACHE] = query_cache
 
     # Set up authentication helper
     search_index = None
@@ -552,6 +725,14 @@ async def setup_clients():
         current_app.config[CONFIG_SPEECH_SERVICE_ID] = AZURE_SPEECH_SERVICE_ID
         current_app.config[CONFIG_SPEECH_SERVICE_LOCATION] = AZURE_SPEECH_SERVICE_LOCATION
         current_app.config[CONFIG_SPEECH_SERVICE_VOICE] = AZURE_SPEECH_SERVICE_VOICE
+        current_app.config[CONFIG_SPEECH_EXECUTOR] = ThreadPoolExecutor(
+            max_workers=int(os.getenv("AZURE_SPEECH_MAX_CONCURRENCY") or 4), thread_name_prefix="speech"
+        )
+        current_app.config[CONFIG_SPEECH_CACHE] = SpeechCache(
+            directory=os.getenv("SPEECH_CACHE_DIR") or None,
+            max_memory_bytes=int(os.getenv("SPEECH_CACHE_MAX_MEMORY_BYTES") or 16 * 1024 * 1024),
+            max_disk_bytes=int(os.getenv("SPEECH_CACHE_MAX_DISK_BYTES") or 256 * 1024 * 1024),
+        )
         # Wait until token is needed to fetch for the first time
         current_app.config[CONFIG_SPEECH_SERVICE_TOKEN] = None
 
@@ -581,7 +762,10 @@ async def setup_clients():
         )
         current_app.config[CONFIG_USER_BLOB_MANAGER] = user_blob_manager
 
-        # Set up ingester
+        # Set up ingester, parsing and splitting uploaded files in separate processes unless set to 0
+        parser_processes = int(os.getenv("USER_UPLOAD_PARSER_PROCESSES") or 1)
+        cpu_executor = CpuWorkExecutor(max_workers=parser_processes) if parser_processes > 0 else None
+        current_app.config[CONFIG_CPU_EXECUTOR] = cpu_executor
         file_processors = setup_file_processors(
             azure_credential=azure_credential,
             document_intelligence_service=os.getenv("AZURE_DOCUMENTINTELLIGENCE_SERVICE"),
@@ -593,6 +777,7 @@ async def setup_clients():
             openai_client=openai_client,
             openai_model=OPENAI_CHATGPT_MODEL,
             openai_deployment=AZURE_OPENAI_CHATGPT_DEPLOYMENT if OPENAI_HOST == OpenAIHost.AZURE else None,
+            cpu_executor=cpu_executor,
         )
         search_info = await setup_search_info(
             search_service=AZURE_SEARCH_SERVICE, index_name=AZURE_SEARCH_INDEX, azure_credential=azure_credential
@@ -620,6 +805,17 @@ async def setup_clients():
             blob_manager=user_blob_manager,
         )
         current_app.config[CONFIG_INGESTER] = ingester
+        ingestion_queue = IngestionQueue(
+            store=IngestionJobStore(
+                os.getenv("USER_UPLOAD_JOBS_PATH") or os.path.join(tempfile.gettempdir(), "user_upload_jobs.sqlite")
+            ),
+            ingester=ingester,
+            blob_manager=user_blob_manager,
+            max_workers=int(os.getenv("USER_UPLOAD_MAX_WORKERS") or 2),
+            query_cache=query_cache,
+        )
+        ingestion_queue.start()
+        current_app.config[CONFIG_INGESTION_QUEUE] = ingestion_queue
 
     image_embeddings_client = None
     if USE_MULTIMODAL:
@@ -683,6 +879,7 @@ async def setup_clients():
         image_embeddings_client=image_embeddings_client,
         global_blob_manager=global_blob_manager,
         user_blob_manager=user_blob_manager,
+        query_cache=query_cache,
     )
 
     # ChatReadRetrieveReadApproach is used by /chat for multi-turn conversation
@@ -709,16 +906,28 @@ async def setup_clients():
         image_embeddings_client=image_embeddings_client,
         global_blob_manager=global_blob_manager,
         user_blob_manager=user_blob_manager,
+        query_cache=query_cache,
     )
 
 
 @bp.after_app_serving
 async def close_clients():
+    # Stop the ingestion jobs before closing the clients they use, so that they are
+    # left processing and resumed after a restart instead of failing on closed clients
+    if ingestion_queue := current_app.config.get(CONFIG_INGESTION_QUEUE):
+        await ingestion_queue.stop()
+    if cpu_executor := current_app.config.get(CONFIG_CPU_EXECUTOR):
+        await asyncio.to_thread(cpu_executor.shutdown)
+    if speech_executor := current_app.config.get(CONFIG_SPEECH_EXECUTOR):
+        speech_executor.shutdown(wait=False)
     await current_app.config[CONFIG_SEARCH_CLIENT].close()
     await current_app.config[CONFIG_GLOBAL_BLOB_MANAGER].close_clients()
     if user_blob_manager := current_app.config.get(CONFIG_USER_BLOB_MANAGER):
         await user_blob_manager.close_clients()
     await current_app.config[CONFIG_CREDENTIAL].close()
+    await current_app.config[CONFIG_QUERY_CACHE].close()
+    if profiler := current_app.config[CONFIG_LATENCY_RECORDER].profiler:
+        await asyncio.to_thread(profiler.stop)
 
 
 def create_app():
@@ -1,6 +1,8 @@
+import asyncio
 import base64
+import time
 from abc import ABC
-from collections.abc import AsyncGenerator, Awaitable
+from collections.abc import AsyncGenerator, Awaitable, Callable
 from dataclasses import dataclass, field
 from typing import Any, Optional, TypedDict, cast
 
@@ -32,6 +34,8 @@ from openai.types.chat import (
 )
 
 from approaches.promptmanager import PromptManager
+from core.latency import span
+from core.querycache import QueryCache
 from prepdocslib.blobmanager import AdlsBlobManager, BlobManager
 from prepdocslib.embeddings import ImageEmbeddings
 
@@ -79,6 +83,20 @@ class Document:
         }
         return result_dict
 
+    @classmethod
+    def from_serialized(cls, result_dict: dict[str, Any]) -> "Document":
+        """
+        Document from the output of serialize_for_results, such as search results read from the query cache
+        """
+        captions = []
+        for caption_dict in result_dict.get("captions") or []:
+            caption = QueryCaptionResult(additional_properties=caption_dict["additional_properties"])
+            # Text and highlights are read-only properties of search results, so they can't be passed in
+            caption.text = caption_dict["text"]
+            caption.highlights = caption_dict["highlights"]
+            captions.append(caption)
+        return cls(**{**result_dict, "captions": captions or None})
+
 
 @dataclass
 class ThoughtStep:
@@ -146,6 +164,8 @@ class Approach(ABC):
     # Set a higher token limit for GPT reasoning models
     RESPONSE_DEFAULT_TOKEN_LIMIT = 1024
     RESPONSE_REASONING_DEFAULT_TOKEN_LIMIT = 8192
+    # Number of source images downloaded at the same time
+    MAX_CONCURRENT_IMAGE_DOWNLOADS = 4
 
     def __init__(
         self,
@@ -164,6 +184,7 @@ class Approach(ABC):
         image_embeddings_client: Optional[ImageEmbeddings] = None,
         global_blob_manager: Optional[BlobManager] = None,
         user_blob_manager: Optional[AdlsBlobManager] = None,
+        query_cache: Optional[QueryCache] = None,
     ):
         self.search_client = search_client
         self.openai_client = openai_client
@@ -181,6 +202,7 @@ class Approach(ABC):
         self.image_embeddings_client = image_embeddings_client
         self.global_blob_manager = global_blob_manager
         self.user_blob_manager = user_blob_manager
+        self.query_cache = query_cache
 
     def build_filter(self, overrides: dict[str, Any]) -> Optional[str]:
         include_category = overrides.get("include_category")
@@ -209,58 +231,83 @@ class Approach(ABC):
     ) -> list[Document]:
         search_text = query_text if use_text_search else ""
         search_vectors = vectors if use_vector_search else []
-        if use_semantic_ranker:
-            results = await self.search_client.search(
-                search_text=search_text,
-                filter=filter,
-                top=top,
-                query_caption="extractive|highlight-false" if use_semantic_captions else None,
-                query_rewrites="generative" if use_query_rewriting else None,
-                vector_queries=search_vectors,
-                query_type=QueryType.SEMANTIC,
-                query_language=self.query_language,
-                query_speller=self.query_speller,
-                semantic_configuration_name="default",
-                semantic_query=query_text,
-                x_ms_query_source_authorization=access_token,
-            )
-        else:
-            results = await self.search_client.search(
-                search_text=search_text,
-                filter=filter,
-                top=top,
-                vector_queries=search_vectors,
-                x_ms_query_source_authorization=access_token,
+        cache_key = None
+        if self.query_cache:
+            # Vectors are computed from the query text, so the fields they search identify them.
+            # Results depend on the caller's permissions when access control is enforced,
+            # so they are only shared between requests made with the same access token.
+            cache_key = QueryCache.key(
+                top,
+                query_text,
+                filter,
+                [getattr(vector, "fields", None) for vector in search_vectors],
+                use_text_search,
+                use_semantic_ranker,
+                use_semantic_captions,
+                minimum_search_score,
+                minimum_reranker_score,
+                use_query_rewriting,
+                access_token,
             )
+            if (cached := await self.query_cache.get(QueryCache.RESULTS, cache_key)) is not None:
+                return [Document.from_serialized(document) for document in cached]
+        with span("search"):
+            if use_semantic_ranker:
+                results = await self.search_client.search(
+                    search_text=search_text,
+                    filter=filter,
+                    top=top,
+                    query_caption="extractive|highlight-false" if use_semantic_captions else None,
+                    query_rewrites="generative" if use_query_rewriting else None,
+                    vector_queries=search_vectors,
+                    query_type=QueryType.SEMANTIC,
+                    query_language=self.query_language,
+                    query_speller=self.query_speller,
+                    semantic_configuration_name="default",
+                    semantic_query=query_text,
+                    x_ms_query_source_authorization=access_token,
+                )
+            else:
+                results = await self.search_client.search(
+                    search_text=search_text,
+                    filter=filter,
+                    top=top,
+                    vector_queries=search_vectors,
+                    x_ms_query_source_authorization=access_token,
+                )
 
-        documents: list[Document] = []
-        async for page in results.by_page():
-            async for document in page:
-                documents.append(
-                    Document(
-                        id=document.get("id"),
-                        content=document.get("content"),
-                        category=document.get("category"),
-                        sourcepage=document.get("sourcepage"),
-                        sourcefile=document.get("sourcefile"),
-                        oids=document.get("oids"),
-                        groups=document.get("groups"),
-                        captions=cast(list[QueryCaptionResult], document.get("@search.captions")),
-                        score=document.get("@search.score"),
-                        reranker_score=document.get("@search.reranker_score"),
-                        images=document.get("images"),
+            documents: list[Document] = []
+            async for page in results.by_page():
+                async for document in page:
+                    documents.append(
+                        Document(
+                            id=document.get("id"),
+                            content=document.get("content"),
+                            category=document.get("category"),
+                            sourcepage=document.get("sourcepage"),
+                            sourcefile=document.get("sourcefile"),
+                            oids=document.get("oids"),
+                            groups=document.get("groups"),
+                            captions=cast(list[QueryCaptionResult], document.get("@search.captions")),
+                            score=document.get("@search.score"),
+                            reranker_score=document.get("@search.reranker_score"),
+                            images=document.get("images"),
+                        )
                     )
-                )
 
-            qualified_documents = [
-                doc
-                for doc in documents
-                if (
-                    (doc.score or 0) >= (minimum_search_score or 0)
-                    and (doc.reranker_score or 0) >= (minimum_reranker_score or 0)
-                )
-            ]
+                qualified_documents = [
+                    doc
+                    for doc in documents
+                    if (
+                        (doc.score or 0) >= (minimum_search_score or 0)
+                        and (doc.reranker_score or 0) >= (minimum_reranker_score or 0)
+                    )
+                ]
 
+        if self.query_cache and cache_key:
+            await self.query_cache.set(
+                QueryCache.RESULTS, cache_key, [document.serialize_for_results() for document in qualified_documents]
+            )
         return qualified_documents
 
     async def run_agentic_retrieval(
@@ -275,24 +322,25 @@ class Approach(ABC):
         access_token: Optional[str] = None,
     ) -> tuple[KnowledgeAgentRetrievalResponse, list[Document]]:
         # STEP 1: Invoke agentic retrieval
-        response = await agent_client.retrieve(
-            retrieval_request=KnowledgeAgentRetrievalRequest(
-                messages=[
-                    KnowledgeAgentMessage(
-                        role=str(msg["role"]), content=[KnowledgeAgentMessageTextContent(text=str(msg["content"]))]
-                    )
-                    for msg in messages
-                    if msg["role"] != "system"
-                ],
-                knowledge_source_params=[
-                    SearchIndexKnowledgeSourceParams(
-                        knowledge_source_name=search_index_name,
-                        filter_add_on=filter_add_on,
-                    )
-                ],
-            ),
-            x_ms_query_source_authorization=access_token,
-        )
+        with span("agentic_retrieval"):
+            response = await agent_client.retrieve(
+                retrieval_request=KnowledgeAgentRetrievalRequest(
+                    messages=[
+                        KnowledgeAgentMessage(
+                            role=str(msg["role"]), content=[KnowledgeAgentMessageTextContent(text=str(msg["content"]))]
+                        )
+                        for msg in messages
+                        if msg["role"] != "system"
+                    ],
+                    knowledge_source_params=[
+                        SearchIndexKnowledgeSourceParams(
+                            knowledge_source_name=search_index_name,
+                            filter_add_on=filter_add_on,
+                        )
+                    ],
+                ),
+                x_ms_query_source_authorization=access_token,
+            )
 
         # Map activity id -> agent's internal search query
         activities = response.activity
@@ -358,6 +406,8 @@ class Approach(ABC):
         include_text_sources: bool,
         download_image_sources: bool,
         user_oid: Optional[str] = None,
+        on_sources: Optional[Callable[[DataPoints], None]] = None,
+        on_image_source: Optional[Callable[[str], None]] = None,
     ) -> DataPoints:
         """Extract text/image sources & citations from documents.
 
@@ -366,6 +416,8 @@ class Approach(ABC):
             use_semantic_captions: Whether to use semantic captions instead of full content text.
             download_image_sources: Whether to attempt downloading & base64 encoding referenced images.
             user_oid: Optional user object id for per-user storage access (ADLS scenarios).
+            on_sources: Optional callback given the text sources and citations before any image is downloaded.
+            on_image_source: Optional callback given each image source once it and the images before it are downloaded.
 
         Returns:
             DataPoints: with text (list[str]), images (list[str - base64 data URI]), citations (list[str]).
@@ -378,7 +430,7 @@ class Approach(ABC):
 
         citations = []
         text_sources = []
-        image_sources = []
+        image_urls = []
         seen_urls = set()
 
         for doc in results:
@@ -401,10 +453,30 @@ class Approach(ABC):
                     if img["url"] in seen_urls or not img["url"]:
                         continue
                     seen_urls.add(img["url"])
-                    url = await self.download_blob_as_base64(img["url"], user_oid=user_oid)
-                    if url:
-                        image_sources.append(url)
+                    image_urls.append(img["url"])
                     citations.append(self.get_image_citation(doc.sourcepage or "", img["url"]))
+
+        if on_sources:
+            on_sources(DataPoints(text=text_sources, images=[], citations=citations))
+
+        # Download the images a few at a time, keeping them in the order of their citations
+        semaphore = asyncio.Semaphore(self.MAX_CONCURRENT_IMAGE_DOWNLOADS)
+
+        async def download_image(image_url: str) -> Optional[str]:
+            async with semaphore:
+                return await self.download_blob_as_base64(image_url, user_oid=user_oid)
+
+        downloads = [asyncio.create_task(download_image(image_url)) for image_url in image_urls]
+        image_sources = []
+        try:
+            for download in downloads:
+                if image := await download:
+                    image_sources.append(image)
+                    if on_image_source:
+                        on_image_source(image)
+        finally:
+            for download in downloads:
+                download.cancel()
         return DataPoints(text=text_sources, images=image_sources, citations=citations)
 
     def get_citation(self, sourcepage: Optional[str]):
@@ -442,10 +514,11 @@ class Approach(ABC):
 
         # Download the blob using the appropriate client
         result = None
-        if ".dfs.core.windows.net" in blob_url and self.user_blob_manager:
-            result = await self.user_blob_manager.download_blob(blob_path, user_oid=user_oid)
-        elif self.global_blob_manager:
-            result = await self.global_blob_manager.download_blob(blob_path)
+        with span("image_download"):
+            if ".dfs.core.windows.net" in blob_url and self.user_blob_manager:
+                result = await self.user_blob_manager.download_blob(blob_path, user_oid=user_oid)
+            elif self.global_blob_manager:
+                result = await self.global_blob_manager.download_blob(blob_path)
 
         if result:
             content, _ = result  # Unpack the tuple, ignoring properties
@@ -466,13 +539,19 @@ class Approach(ABC):
         dimensions_args: ExtraArgs = (
             {"dimensions": self.embedding_dimensions} if SUPPORTED_DIMENSIONS_MODEL[self.embedding_model] else {}
         )
-        embedding = await self.openai_client.embeddings.create(
-            # Azure OpenAI takes the deployment name as the model name
-            model=self.embedding_deployment if self.embedding_deployment else self.embedding_model,
-            input=q,
-            **dimensions_args,
-        )
-        query_vector = embedding.data[0].embedding
+        cache_key = QueryCache.key(self.embedding_model, dimensions_args.get("dimensions"), q)
+        query_vector = await self.query_cache.get(QueryCache.EMBEDDINGS, cache_key) if self.query_cache else None
+        if query_vector is None:
+            with span("embedding"):
+                embedding = await self.openai_client.embeddings.create(
+                    # Azure OpenAI takes the deployment name as the model name
+                    model=self.embedding_deployment if self.embedding_deployment else self.embedding_model,
+                    input=q,
+                    **dimensions_args,
+                )
+            query_vector = embedding.data[0].embedding
+            if self.query_cache:
+                await self.query_cache.set(QueryCache.EMBEDDINGS, cache_key, query_vector)
         # This performs an oversampling due to how the search index was setup,
         # so we do not need to explicitly pass in an oversampling parameter here
         return VectorizedQuery(vector=query_vector, k_nearest_neighbors=50, fields=self.embedding_field)
@@ -480,9 +559,28 @@ class Approach(ABC):
     async def compute_multimodal_embedding(self, q: str):
         if not self.image_embeddings_client:
             raise ValueError("Approach is missing an image embeddings client for multimodal queries")
-        multimodal_query_vector = await self.image_embeddings_client.create_embedding_for_text(q)
+        cache_key = QueryCache.key("multimodal", q)
+        multimodal_query_vector = (
+            await self.query_cache.get(QueryCache.EMBEDDINGS, cache_key) if self.query_cache else None
+        )
+        if multimodal_query_vector is None:
+            with span("embedding"):
+                multimodal_query_vector = await self.image_embeddings_client.create_embedding_for_text(q)
+            if self.query_cache:
+                await self.query_cache.set(QueryCache.EMBEDDINGS, cache_key, multimodal_query_vector)
         return VectorizedQuery(vector=multimodal_query_vector, k_nearest_neighbors=50, fields="images/embedding")
 
+    async def compute_query_vectors(
+        self, q: str, search_text_embeddings: bool, search_image_embeddings: bool
+    ) -> list[VectorQuery]:
+        """Computes the text and image embeddings of a query at the same time"""
+        embeddings: list[Awaitable[VectorQuery]] = []
+        if search_text_embeddings:
+            embeddings.append(self.compute_text_embedding(q))
+        if search_image_embeddings:
+            embeddings.append(self.compute_multimodal_embedding(q))
+        return list(await asyncio.gather(*embeddings))
+
     def get_system_prompt_variables(self, override_prompt: Optional[str]) -> dict[str, str]:
         # Allows client to replace the entire prompt, or to inject into the existing prompt using >>>
         if override_prompt is None:
@@ -564,6 +662,7 @@ class Approach(ABC):
         deployment: Optional[str],
         usage: Optional[CompletionUsage] = None,
         reasoning_effort: Optional[ChatCompletionReasoningEffort] = None,
+        latency_ms: Optional[float] = None,
     ) -> ThoughtStep:
         properties: dict[str, Any] = {"model": model}
         if deployment:
@@ -575,8 +674,15 @@ class Approach(ABC):
             )
         if usage:
             properties["token_usage"] = TokenUsageProps.from_completion_usage(usage)
+        if latency_ms is not None:
+            properties["latency_ms"] = latency_ms
         return ThoughtStep(title, messages, properties)
 
+    @staticmethod
+    def get_elapsed_ms(start_time: float) -> float:
+        """Milliseconds elapsed since a time.perf_counter() value, as recorded in the latency of thought steps"""
+        return round((time.perf_counter() - start_time) * 1000, 1)
+
     async def run(
         self,
         messages: list[ChatCompletionMessageParam],
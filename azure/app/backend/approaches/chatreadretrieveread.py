@@ -1,6 +1,9 @@
+import asyncio
 import json
+import logging
 import re
-from collections.abc import AsyncGenerator, Awaitable
+import time
+from collections.abc import AsyncGenerator, Awaitable, Callable
 from typing import Any, Optional, cast
 
 from azure.search.documents.agent.aio import KnowledgeAgentRetrievalClient
@@ -16,13 +19,19 @@ from openai.types.chat import (
 
 from approaches.approach import (
     Approach,
+    DataPoints,
+    Document,
     ExtraInfo,
     ThoughtStep,
 )
 from approaches.promptmanager import PromptManager
+from core.latency import span
+from core.querycache import QueryCache
 from prepdocslib.blobmanager import AdlsBlobManager, BlobManager
 from prepdocslib.embeddings import ImageEmbeddings
 
+logger = logging.getLogger("scripts")
+
 
 class ChatReadRetrieveReadApproach(Approach):
     """
@@ -58,6 +67,7 @@ class ChatReadRetrieveReadApproach(Approach):
         image_embeddings_client: Optional[ImageEmbeddings] = None,
         global_blob_manager: Optional[BlobManager] = None,
         user_blob_manager: Optional[AdlsBlobManager] = None,
+        query_cache: Optional[QueryCache] = None,
     ):
         self.search_client = search_client
         self.search_index_name = search_index_name
@@ -85,6 +95,7 @@ class ChatReadRetrieveReadApproach(Approach):
         self.image_embeddings_client = image_embeddings_client
         self.global_blob_manager = global_blob_manager
         self.user_blob_manager = user_blob_manager
+        self.query_cache = query_cache
 
     def get_search_query(self, chat_completion: ChatCompletion, user_query: str):
         response_message = chat_completion.choices[0].message
@@ -104,6 +115,63 @@ class ChatReadRetrieveReadApproach(Approach):
                 return query_text
         return user_query
 
+    def get_search_query_cache_keys(
+        self, user_query: str, past_messages: list[ChatCompletionMessageParam], auth_claims: dict[str, Any]
+    ) -> tuple[str, str]:
+        """
+        Keys of the search query of a question in a conversation, ignoring differences in case, whitespace
+        and trailing punctuation: one for the question itself, and one for the scope in which nearly identical
+        questions are compared. The question itself only gives the same search query to anyone asking it in
+        the same conversation, while nearly identical questions are only compared within the user's conversations.
+        """
+
+        def normalize(content: Any) -> str:
+            text = content if isinstance(content, str) else json.dumps(content, sort_keys=True)
+            return " ".join(text.casefold().split()).rstrip("?!. ")
+
+        conversation = [(message["role"], normalize(message.get("content"))) for message in past_messages]
+        return (
+            QueryCache.key(self.chatgpt_model, conversation, normalize(user_query)),
+            QueryCache.key(self.chatgpt_model, conversation, auth_claims.get("oid")),
+        )
+
+    async def get_cached_search_query(
+        self, user_query: str, past_messages: list[ChatCompletionMessageParam], auth_claims: dict[str, Any]
+    ) -> Optional[str]:
+        if not self.query_cache:
+            return None
+        key, scope = self.get_search_query_cache_keys(user_query, past_messages, auth_claims)
+        if (query_text := await self.query_cache.get(QueryCache.REWRITES, key)) is not None:
+            return query_text
+        if self.query_cache.similar_rewrites:
+            try:
+                query_vector = await self.compute_text_embedding(user_query)
+            except Exception as error:
+                logger.warning("Unable to compute the embedding of the question to find a similar one: %s", error)
+                return None
+            return self.query_cache.similar_rewrites.find(scope, query_vector.vector)
+        return None
+
+    async def cache_search_query(
+        self,
+        user_query: str,
+        past_messages: list[ChatCompletionMessageParam],
+        auth_claims: dict[str, Any],
+        query_text: str,
+    ):
+        if not self.query_cache:
+            return
+        key, scope = self.get_search_query_cache_keys(user_query, past_messages, auth_claims)
+        await self.query_cache.set(QueryCache.REWRITES, key, query_text)
+        if self.query_cache.similar_rewrites:
+            try:
+                # The embedding of the question was computed, and cached, when looking for a similar question
+                query_vector = await self.compute_text_embedding(user_query)
+            except Exception as error:
+                logger.warning("Unable to compute the embedding of the question to cache its search query: %s", error)
+                return
+            self.query_cache.similar_rewrites.add(scope, query_vector.vector, query_text)
+
     def extract_followup_questions(self, content: Optional[str]):
         if content is None:
             return content, []
@@ -119,7 +187,8 @@ class ChatReadRetrieveReadApproach(Approach):
         extra_info, chat_coroutine = await self.run_until_final_call(
             messages, overrides, auth_claims, should_stream=False
         )
-        chat_completion_response: ChatCompletion = await cast(Awaitable[ChatCompletion], chat_coroutine)
+        with span("answer"):
+            chat_completion_response: ChatCompletion = await cast(Awaitable[ChatCompletion], chat_coroutine)
         content = chat_completion_response.choices[0].message.content
         role = chat_completion_response.choices[0].message.role
         if overrides.get("suggest_followup_questions"):
@@ -142,11 +211,41 @@ class ChatReadRetrieveReadApproach(Approach):
         auth_claims: dict[str, Any],
         session_state: Any = None,
     ) -> AsyncGenerator[dict, None]:
-        extra_info, chat_coroutine = await self.run_until_final_call(
-            messages, overrides, auth_claims, should_stream=True
+        # The sources are sent as soon as the search returns, then each image source once it is downloaded,
+        # while the rest of the retrieval runs in a task, so that they don't wait for the prompt to be ready
+        events: asyncio.Queue[Optional[dict[str, Any]]] = asyncio.Queue()
+
+        def send_sources(sources: ExtraInfo):
+            events.put_nowait({"delta": {"role": "assistant"}, "context": sources, "session_state": session_state})
+
+        def send_image_source(image_source: str):
+            events.put_nowait({"delta": {"role": "assistant"}, "context": {"image_source": image_source}})
+
+        final_call = asyncio.create_task(
+            self.run_until_final_call(
+                messages,
+                overrides,
+                auth_claims,
+                should_stream=True,
+                on_sources=send_sources,
+                on_image_source=send_image_source,
+            )
         )
+        final_call.add_done_callback(lambda _: events.put_nowait(None))
+        sources_sent = False
+        try:
+            while (event := await events.get()) is not None:
+                sources_sent = True
+                yield event
+            extra_info, chat_coroutine = await final_call
+        finally:
+            final_call.cancel()
         chat_coroutine = cast(Awaitable[AsyncStream[ChatCompletionChunk]], chat_coroutine)
-        yield {"delta": {"role": "assistant"}, "context": extra_info, "session_state": session_state}
+        if sources_sent:
+            # Later events only contain the parts of the context that changed, such as the thoughts
+            yield {"delta": {"role": "assistant"}, "context": {"thoughts": extra_info.thoughts}}
+        else:
+            yield {"delta": {"role": "assistant"}, "context": extra_info, "session_state": session_state}
 
         followup_questions_started = False
         followup_content = ""
@@ -180,14 +279,11 @@ class ChatReadRetrieveReadApproach(Approach):
                 # https://cookbook.openai.com/examples/how_to_stream_completions#4-how-to-get-token-usage-data-for-streamed-chat-completion-response
                 if event_chunk.usage and extra_info.thoughts and self.include_token_usage:
                     extra_info.thoughts[-1].update_token_usage(event_chunk.usage)
-                    yield {"delta": {"role": "assistant"}, "context": extra_info, "session_state": session_state}
+                    yield {"delta": {"role": "assistant"}, "context": {"thoughts": extra_info.thoughts}}
 
         if followup_content:
             _, followup_questions = self.extract_followup_questions(followup_content)
-            yield {
-                "delta": {"role": "assistant"},
-                "context": {"context": extra_info, "followup_questions": followup_questions},
-            }
+            yield {"delta": {"role": "assistant"}, "context": {"followup_questions": followup_questions}}
 
     async def run(
         self,
@@ -215,6 +311,8 @@ class ChatReadRetrieveReadApproach(Approach):
         overrides: dict[str, Any],
         auth_claims: dict[str, Any],
         should_stream: bool = False,
+        on_sources: Optional[Callable[[ExtraInfo], None]] = None,
+        on_image_source: Optional[Callable[[str], None]] = None,
     ) -> tuple[ExtraInfo, Awaitable[ChatCompletion] | Awaitable[AsyncStream[ChatCompletionChunk]]]:
         use_agentic_retrieval = True if overrides.get("use_agentic_retrieval") else False
         original_user_query = messages[-1]["content"]
@@ -225,22 +323,25 @@ class ChatReadRetrieveReadApproach(Approach):
                 f"{self.chatgpt_model} does not support streaming. Please use a different model or disable streaming."
             )
         if use_agentic_retrieval:
-            extra_info = await self.run_agentic_retrieval_approach(messages, overrides, auth_claims)
+            extra_info = await self.run_agentic_retrieval_approach(
+                messages, overrides, auth_claims, on_sources, on_image_source
+            )
         else:
-            extra_info = await self.run_search_approach(messages, overrides, auth_claims)
-
-        messages = self.prompt_manager.render_prompt(
-            self.answer_prompt,
-            self.get_system_prompt_variables(overrides.get("prompt_template"))
-            | {
-                "include_follow_up_questions": bool(overrides.get("suggest_followup_questions")),
-                "past_messages": messages[:-1],
-                "user_query": original_user_query,
-                "text_sources": extra_info.data_points.text,
-                "image_sources": extra_info.data_points.images,
-                "citations": extra_info.data_points.citations,
-            },
-        )
+            extra_info = await self.run_search_approach(messages, overrides, auth_claims, on_sources, on_image_source)
+
+        with span("prompt_render"):
+            messages = self.prompt_manager.render_prompt(
+                self.answer_prompt,
+                self.get_system_prompt_variables(overrides.get("prompt_template"))
+                | {
+                    "include_follow_up_questions": bool(overrides.get("suggest_followup_questions")),
+                    "past_messages": messages[:-1],
+                    "user_query": original_user_query,
+                    "text_sources": extra_info.data_points.text,
+                    "image_sources": extra_info.data_points.images,
+                    "citations": extra_info.data_points.citations,
+                },
+            )
 
         chat_coroutine = cast(
             Awaitable[ChatCompletion] | Awaitable[AsyncStream[ChatCompletionChunk]],
@@ -266,7 +367,12 @@ class ChatReadRetrieveReadApproach(Approach):
         return (extra_info, chat_coroutine)
 
     async def run_search_approach(
-        self, messages: list[ChatCompletionMessageParam], overrides: dict[str, Any], auth_claims: dict[str, Any]
+        self,
+        messages: list[ChatCompletionMessageParam],
+        overrides: dict[str, Any],
+        auth_claims: dict[str, Any],
+        on_sources: Optional[Callable[[ExtraInfo], None]] = None,
+        on_image_source: Optional[Callable[[str], None]] = None,
     ):
         use_text_search = overrides.get("retrieval_mode") in ["text", "hybrid", None]
         use_vector_search = overrides.get("retrieval_mode") in ["vectors", "hybrid", None]
@@ -284,60 +390,122 @@ class ChatReadRetrieveReadApproach(Approach):
         search_image_embeddings = (
             overrides.get("search_image_embeddings", self.multimodal_enabled) and self.multimodal_enabled
         )
+        use_speculative_search = True if overrides.get("speculative_search") else False
 
         original_user_query = messages[-1]["content"]
         if not isinstance(original_user_query, str):
             raise ValueError("The most recent message content must be a string.")
 
+        async def search_with_query(query_text: str) -> list[Document]:
+            vectors: list[VectorQuery] = []
+            if use_vector_search:
+                vectors = await self.compute_query_vectors(query_text, search_text_embeddings, search_image_embeddings)
+            return await self.search(
+                top,
+                query_text,
+                search_index_filter,
+                vectors,
+                use_text_search,
+                use_vector_search,
+                use_semantic_ranker,
+                use_semantic_captions,
+                minimum_search_score,
+                minimum_reranker_score,
+                use_query_rewriting,
+                access_token,
+            )
+
+        # Optionally search with the user's question while the search query is generated,
+        # those results are used if the generated query turns out to be the question itself
+        speculative_search: Optional[asyncio.Task[list[Document]]] = None
+        if use_speculative_search:
+            speculative_search = asyncio.create_task(search_with_query(original_user_query))
+            # Errors of a speculative search that ends up unused shouldn't be reported as unhandled
+            speculative_search.add_done_callback(lambda task: task.cancelled() or task.exception())
+
         query_messages = self.prompt_manager.render_prompt(
             self.query_rewrite_prompt, {"user_query": original_user_query, "past_messages": messages[:-1]}
         )
         tools: list[ChatCompletionToolParam] = self.query_rewrite_tools
 
-        # STEP 1: Generate an optimized keyword search query based on the chat history and the last question
+        # STEP 1: Generate an optimized keyword search query based on the chat history and the last question,
+        # unless the search query of the same or a nearly identical question in this conversation is cached
+
+        query_start_time = time.perf_counter()
+        chat_completion: Optional[ChatCompletion] = None
+        try:
+            query_text = await self.get_cached_search_query(original_user_query, messages[:-1], auth_claims)
+            if query_text is None:
+                with span("rewrite"):
+                    chat_completion = cast(
+                        ChatCompletion,
+                        await self.create_chat_completion(
+                            self.chatgpt_deployment,
+                            self.chatgpt_model,
+                            messages=query_messages,
+                            overrides=overrides,
+                            response_token_limit=self.get_response_token_limit(
+                                self.chatgpt_model, 100
+                            ),  # Setting too low risks malformed JSON, setting too high may affect performance
+                            temperature=0.0,  # Minimize creativity for search query generation
+                            tools=tools,
+                            reasoning_effort=self.get_lowest_reasoning_effort(self.chatgpt_model),
+                        ),
+                    )
+                query_text = self.get_search_query(chat_completion, original_user_query)
+                await self.cache_search_query(original_user_query, messages[:-1], auth_claims, query_text)
+            query_latency_ms = self.get_elapsed_ms(query_start_time)
 
-        chat_completion = cast(
-            ChatCompletion,
-            await self.create_chat_completion(
-                self.chatgpt_deployment,
-                self.chatgpt_model,
-                messages=query_messages,
-                overrides=overrides,
-                response_token_limit=self.get_response_token_limit(
-                    self.chatgpt_model, 100
-                ),  # Setting too low risks malformed JSON, setting too high may affect performance
-                temperature=0.0,  # Minimize creativity for search query generation
-                tools=tools,
-                reasoning_effort=self.get_lowest_reasoning_effort(self.chatgpt_model),
-            ),
-        )
+            # STEP 2: Retrieve relevant documents from the search index with the GPT optimized query
 
-        query_text = self.get_search_query(chat_completion, original_user_query)
-
-        # STEP 2: Retrieve relevant documents from the search index with the GPT optimized query
-
-        vectors: list[VectorQuery] = []
-        if use_vector_search:
-            if search_text_embeddings:
-                vectors.append(await self.compute_text_embedding(query_text))
-            if search_image_embeddings:
-                vectors.append(await self.compute_multimodal_embedding(query_text))
-
-        results = await self.search(
-            top,
-            query_text,
-            search_index_filter,
-            vectors,
-            use_text_search,
-            use_vector_search,
-            use_semantic_ranker,
-            use_semantic_captions,
-            minimum_search_score,
-            minimum_reranker_score,
-            use_query_rewriting,
-            access_token,
+            search_start_time = time.perf_counter()
+            if speculative_search and query_text == original_user_query:
+                results = await speculative_search
+            else:
+                if speculative_search:
+                    speculative_search.cancel()
+                results = await search_with_query(query_text)
+            search_latency_ms = self.get_elapsed_ms(search_start_time)
+        finally:
+            # Also on cancellation (e.g. the client disconnected), so the speculative search never outlives the request
+            if speculative_search:
+                speculative_search.cancel()
+
+        query_thought = self.format_thought_step_for_chatcompletion(
+            title="Prompt to generate search query",
+            messages=query_messages,
+            overrides=overrides,
+            model=self.chatgpt_model,
+            deployment=self.chatgpt_deployment,
+            usage=chat_completion.usage if chat_completion else None,
+            reasoning_effort=self.get_lowest_reasoning_effort(self.chatgpt_model),
+            latency_ms=query_latency_ms,
         )
-
+        if chat_completion is None and query_thought.props is not None:
+            query_thought.props["cached"] = True
+        thoughts = [
+            query_thought,
+            ThoughtStep(
+                "Search using generated search query",
+                query_text,
+                {
+                    "use_semantic_captions": use_semantic_captions,
+                    "use_semantic_ranker": use_semantic_ranker,
+                    "use_query_rewriting": use_query_rewriting,
+                    "top": top,
+                    "filter": search_index_filter,
+                    "use_vector_search": use_vector_search,
+                    "use_text_search": use_text_search,
+                    "search_text_embeddings": search_text_embeddings,
+                    "search_image_embeddings": search_image_embeddings,
+                    "latency_ms": search_latency_ms,
+                },
+            ),
+            ThoughtStep(
+                "Search results",
+                [result.serialize_for_results() for result in results],
+            ),
+        ]
         # STEP 3: Generate a contextual and content specific answer using the search results and chat history
         data_points = await self.get_sources_content(
             results,
@@ -345,47 +513,18 @@ class ChatReadRetrieveReadApproach(Approach):
             include_text_sources=send_text_sources,
             download_image_sources=send_image_sources,
             user_oid=auth_claims.get("oid"),
+            on_sources=self.sources_callback(thoughts, on_sources),
+            on_image_source=on_image_source,
         )
-        extra_info = ExtraInfo(
-            data_points,
-            thoughts=[
-                self.format_thought_step_for_chatcompletion(
-                    title="Prompt to generate search query",
-                    messages=query_messages,
-                    overrides=overrides,
-                    model=self.chatgpt_model,
-                    deployment=self.chatgpt_deployment,
-                    usage=chat_completion.usage,
-                    reasoning_effort=self.get_lowest_reasoning_effort(self.chatgpt_model),
-                ),
-                ThoughtStep(
-                    "Search using generated search query",
-                    query_text,
-                    {
-                        "use_semantic_captions": use_semantic_captions,
-                        "use_semantic_ranker": use_semantic_ranker,
-                        "use_query_rewriting": use_query_rewriting,
-                        "top": top,
-                        "filter": search_index_filter,
-                        "use_vector_search": use_vector_search,
-                        "use_text_search": use_text_search,
-                        "search_text_embeddings": search_text_embeddings,
-                        "search_image_embeddings": search_image_embeddings,
-                    },
-                ),
-                ThoughtStep(
-                    "Search results",
-                    [result.serialize_for_results() for result in results],
-                ),
-            ],
-        )
-        return extra_info
+        return ExtraInfo(data_points, thoughts=thoughts)
 
     async def run_agentic_retrieval_approach(
         self,
         messages: list[ChatCompletionMessageParam],
         overrides: dict[str, Any],
         auth_claims: dict[str, Any],
+        on_sources: Optional[Callable[[ExtraInfo], None]] = None,
+        on_image_source: Optional[Callable[[str], None]] = None,
     ):
         search_index_filter = self.build_filter(overrides)
         access_token = auth_claims.get("access_token")
@@ -406,36 +545,45 @@ class ChatReadRetrieveReadApproach(Approach):
             access_token=access_token,
         )
 
+        thoughts = [
+            ThoughtStep(
+                "Use agentic retrieval",
+                messages,
+                {
+                    "reranker_threshold": minimum_reranker_score,
+                    "results_merge_strategy": results_merge_strategy,
+                    "filter": search_index_filter,
+                },
+            ),
+            ThoughtStep(
+                f"Agentic retrieval results (top {top})",
+                [result.serialize_for_results() for result in results],
+                {
+                    "query_plan": (
+                        [activity.as_dict() for activity in response.activity] if response.activity else None
+                    ),
+                    "model": self.agent_model,
+                    "deployment": self.agent_deployment,
+                },
+            ),
+        ]
         data_points = await self.get_sources_content(
             results,
             use_semantic_captions=False,
             include_text_sources=send_text_sources,
             download_image_sources=send_image_sources,
             user_oid=auth_claims.get("oid"),
+            on_sources=self.sources_callback(thoughts, on_sources),
+            on_image_source=on_image_source,
         )
-        extra_info = ExtraInfo(
-            data_points,
-            thoughts=[
-                ThoughtStep(
-                    "Use agentic retrieval",
-                    messages,
-                    {
-                        "reranker_threshold": minimum_reranker_score,
-                        "results_merge_strategy": results_merge_strategy,
-                        "filter": search_index_filter,
-                    },
-                ),
-                ThoughtStep(
-                    f"Agentic retrieval results (top {top})",
-                    [result.serialize_for_results() for result in results],
-                    {
-                        "query_plan": (
-                            [activity.as_dict() for activity in response.activity] if response.activity else None
-                        ),
-                        "model": self.agent_model,
-                        "deployment": self.agent_deployment,
-                    },
-                ),
-            ],
-        )
-        return extra_info
+        return ExtraInfo(data_points, thoughts=thoughts)
+
+    def sources_callback(
+        self, thoughts: list[ThoughtStep], on_sources: Optional[Callable[[ExtraInfo], None]]
+    ) -> Optional[Callable[[DataPoints], None]]:
+        """
+        Callback giving the sources along with the thoughts so far, before the images are downloaded
+        """
+        if on_sources is None:
+            return None
+        return lambda data_points: on_sources(ExtraInfo(data_points, thoughts=list(thoughts)))
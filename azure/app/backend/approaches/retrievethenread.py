@@ -1,3 +1,4 @@
+import time
 from typing import Any, Optional, cast
 
 from azure.search.documents.agent.aio import KnowledgeAgentRetrievalClient
@@ -12,6 +13,8 @@ from approaches.approach import (
     ThoughtStep,
 )
 from approaches.promptmanager import PromptManager
+from core.latency import span
+from core.querycache import QueryCache
 from prepdocslib.blobmanager import AdlsBlobManager, BlobManager
 from prepdocslib.embeddings import ImageEmbeddings
 
@@ -48,6 +51,7 @@ class RetrieveThenReadApproach(Approach):
         image_embeddings_client: Optional[ImageEmbeddings] = None,
         global_blob_manager: Optional[BlobManager] = None,
         user_blob_manager: Optional[AdlsBlobManager] = None,
+        query_cache: Optional[QueryCache] = None,
     ):
         self.search_client = search_client
         self.search_index_name = search_index_name
@@ -74,6 +78,7 @@ class RetrieveThenReadApproach(Approach):
         self.image_embeddings_client = image_embeddings_client
         self.global_blob_manager = global_blob_manager
         self.user_blob_manager = user_blob_manager
+        self.query_cache = query_cache
 
     async def run(
         self,
@@ -94,27 +99,29 @@ class RetrieveThenReadApproach(Approach):
             extra_info = await self.run_search_approach(messages, overrides, auth_claims)
 
         # Process results
-        messages = self.prompt_manager.render_prompt(
-            self.answer_prompt,
-            self.get_system_prompt_variables(overrides.get("prompt_template"))
-            | {
-                "user_query": q,
-                "text_sources": extra_info.data_points.text,
-                "image_sources": extra_info.data_points.images or [],
-                "citations": extra_info.data_points.citations,
-            },
-        )
+        with span("prompt_render"):
+            messages = self.prompt_manager.render_prompt(
+                self.answer_prompt,
+                self.get_system_prompt_variables(overrides.get("prompt_template"))
+                | {
+                    "user_query": q,
+                    "text_sources": extra_info.data_points.text,
+                    "image_sources": extra_info.data_points.images or [],
+                    "citations": extra_info.data_points.citations,
+                },
+            )
 
-        chat_completion = cast(
-            ChatCompletion,
-            await self.create_chat_completion(
-                self.chatgpt_deployment,
-                self.chatgpt_model,
-                messages=messages,
-                overrides=overrides,
-                response_token_limit=self.get_response_token_limit(self.chatgpt_model, 1024),
-            ),
-        )
+        with span("answer"):
+            chat_completion = cast(
+                ChatCompletion,
+                await self.create_chat_completion(
+                    self.chatgpt_deployment,
+                    self.chatgpt_model,
+                    messages=messages,
+                    overrides=overrides,
+                    response_token_limit=self.get_response_token_limit(self.chatgpt_model, 1024),
+                ),
+            )
         extra_info.thoughts.append(
             self.format_thought_step_for_chatcompletion(
                 title="Prompt to generate answer",
@@ -162,12 +169,10 @@ class RetrieveThenReadApproach(Approach):
             overrides.get("search_image_embeddings", self.multimodal_enabled) and self.multimodal_enabled
         )
 
+        search_start_time = time.perf_counter()
         vectors: list[VectorQuery] = []
         if use_vector_search:
-            if search_text_embeddings:
-                vectors.append(await self.compute_text_embedding(q))
-            if search_image_embeddings:
-                vectors.append(await self.compute_multimodal_embedding(q))
+            vectors = await self.compute_query_vectors(q, search_text_embeddings, search_image_embeddings)
 
         results = await self.search(
             top,
@@ -183,6 +188,7 @@ class RetrieveThenReadApproach(Approach):
             use_query_rewriting,
             access_token,
         )
+        search_latency_ms = self.get_elapsed_ms(search_start_time)
 
         data_points = await self.get_sources_content(
             results,
@@ -208,6 +214,7 @@ class RetrieveThenReadApproach(Approach):
                         "use_text_search": use_text_search,
                         "search_text_embeddings": search_text_embeddings,
                         "search_image_embeddings": search_image_embeddings,
+                        "latency_ms": search_latency_ms,
                     },
                 ),
                 ThoughtStep(
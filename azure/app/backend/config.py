@@ -3,6 +3,10 @@ CONFIG_CREDENTIAL = "azure_credential"
 CONFIG_ASK_APPROACH = "ask_approach"
 CONFIG_CHAT_APPROACH = "chat_approach"
 CONFIG_GLOBAL_BLOB_MANAGER = "global_blob_manager"
+CONFIG_CONTENT_CACHE = "content_cache"
+CONFIG_QUERY_CACHE = "query_cache"
+CONFIG_LATENCY_RECORDER = "latency_recorder"
+CONFIG_CPU_EXECUTOR = "cpu_executor"
 CONFIG_USER_BLOB_MANAGER = "user_blob_manager"
 CONFIG_USER_UPLOAD_ENABLED = "user_upload_enabled"
 CONFIG_AUTH_CLIENT = "auth_client"
@@ -15,6 +19,7 @@ CONFIG_SEARCH_CLIENT = "search_client"
 CONFIG_OPENAI_CLIENT = "openai_client"
 CONFIG_AGENT_CLIENT = "agent_client"
 CONFIG_INGESTER = "ingester"
+CONFIG_INGESTION_QUEUE = "ingestion_queue"
 CONFIG_LANGUAGE_PICKER_ENABLED = "language_picker_enabled"
 CONFIG_SPEECH_INPUT_ENABLED = "speech_input_enabled"
 CONFIG_SPEECH_OUTPUT_BROWSER_ENABLED = "speech_output_browser_enabled"
@@ -23,6 +28,8 @@ CONFIG_SPEECH_SERVICE_ID = "speech_service_id"
 CONFIG_SPEECH_SERVICE_LOCATION = "speech_service_location"
 CONFIG_SPEECH_SERVICE_TOKEN = "speech_service_token"
 CONFIG_SPEECH_SERVICE_VOICE = "speech_service_voice"
+CONFIG_SPEECH_EXECUTOR = "speech_executor"
+CONFIG_SPEECH_CACHE = "speech_cache"
 CONFIG_STREAMING_ENABLED = "streaming_enabled"
 CONFIG_CHAT_HISTORY_BROWSER_ENABLED = "chat_history_browser_enabled"
 CONFIG_CHAT_HISTORY_COSMOS_ENABLED = "chat_history_cosmos_enabled"
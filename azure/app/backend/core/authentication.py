@@ -1,8 +1,11 @@
 # Refactored from https://github.com/Azure-Samples/ms-identity-python-on-behalf-of
 
+import asyncio
 import base64
+import hashlib
 import json
 import logging
+import time
 from typing import Any, Optional
 
 import aiohttp
@@ -20,6 +23,8 @@ from tenacity import (
     wait_random_exponential,
 )
 
+from core.ttlcache import TTLCache
+
 
 # AuthError is raised when the authentication token sent by the client UI cannot be parsed or there is an authentication error accessing the graph API
 class AuthError(Exception):
@@ -44,6 +49,9 @@ class AuthenticationHelper:
         tenant_id: Optional[str],
         enforce_access_control: bool = False,
         enable_unauthenticated_access: bool = False,
+        jwks_refresh_interval: float = 3600,
+        token_claims_ttl: float = 300,
+        path_auth_ttl: float = 60,
     ):
         self.use_authentication = use_authentication
         self.server_app_id = server_app_id
@@ -60,6 +68,19 @@ class AuthenticationHelper:
         self.valid_audiences = [f"api://{server_app_id}", str(server_app_id)]
         # See https://learn.microsoft.com/entra/identity-platform/access-tokens#validate-the-issuer for more information on token validation
         self.key_url = f"{self.authority}/discovery/v2.0/keys"
+        # Signing keys are refreshed in the background once they are older than the refresh interval,
+        # and immediately when a token is signed with a key that isn't known yet, as Entra rotates its keys
+        self.jwks: Optional[dict[str, Any]] = None
+        self.jwks_fetched_at = 0.0
+        self.jwks_refresh_interval = jwks_refresh_interval
+        self.jwks_min_refresh_interval = min(30.0, jwks_refresh_interval)
+        self.jwks_hits = 0
+        self.jwks_misses = 0
+        self._jwks_lock = asyncio.Lock()
+        self._jwks_refresh_task: Optional[asyncio.Task] = None
+        # Claims of validated tokens, keyed by a hash of the token, and whether users may access a path
+        self.token_claims_cache: TTLCache[str, dict[str, Any]] = TTLCache(ttl=token_claims_ttl)
+        self.path_auth_cache: TTLCache[tuple[str, str], bool] = TTLCache(ttl=path_auth_ttl, max_entries=4096)
 
         if self.use_authentication:
             field_names = [field.name for field in search_index.fields] if search_index else []
@@ -143,8 +164,13 @@ class AuthenticationHelper:
             # The scope is set to Azure Search for authentication
             # https://learn.microsoft.com/entra/identity-platform/v2-oauth2-on-behalf-of-flow
             auth_token = AuthenticationHelper.get_token_auth_header(headers)
+            token_hash = hashlib.sha256(auth_token.encode()).hexdigest()
+            cached_claims = self.token_claims_cache.get(token_hash)
+            if cached_claims is not None:
+                return dict(cached_claims)
+
             # Validate the token before use
-            await self.validate_access_token(auth_token)
+            token_claims = await self.validate_access_token(auth_token)
 
             # Use the on-behalf-of-flow to acquire another token for use with Azure Search
             # See https://learn.microsoft.com/entra/identity-platform/v2-oauth2-on-behalf-of-flow for more information
@@ -161,6 +187,14 @@ class AuthenticationHelper:
             if self.enforce_access_control:
                 access_token = search_resource_access_token["access_token"]
                 auth_claims["access_token"] = access_token
+
+            # Claims are only reused while both the user's token and the token for Azure Search are valid
+            expires_in = [self.token_claims_cache.ttl]
+            if "exp" in token_claims:
+                expires_in.append(token_claims["exp"] - time.time())
+            if "expires_in" in search_resource_access_token:
+                expires_in.append(search_resource_access_token["expires_in"] - 60)
+            self.token_claims_cache.set(token_hash, dict(auth_claims), ttl=min(expires_in))
             return auth_claims
         except AuthError as e:
             logging.exception("Exception getting authorization information - " + json.dumps(e.error))
@@ -183,6 +217,12 @@ class AuthenticationHelper:
         if fragment_index != -1:
             path = path[:fragment_index]
 
+        oid = auth_claims.get("oid")
+        if oid:
+            cached_allowed = self.path_auth_cache.get((oid, path))
+            if cached_allowed is not None:
+                return cached_allowed
+
         # Filter down to only chunks that are from the specific source file
         # Sourcepage is used for GPT-4V
         # Replace ' with '' to escape the single quote for the filter
@@ -200,31 +240,57 @@ class AuthenticationHelper:
             allowed = True
             break
 
+        if oid:
+            self.path_auth_cache.set((oid, path), allowed)
         return allowed
 
-    async def create_pem_format(self, jwks, token):
-        unverified_header = jwt.get_unverified_header(token)
-        for key in jwks["keys"]:
-            if key["kid"] == unverified_header["kid"]:
-                # Construct the RSA public key
-                public_numbers = rsa.RSAPublicNumbers(
-                    e=int.from_bytes(base64.urlsafe_b64decode(key["e"] + "=="), byteorder="big"),
-                    n=int.from_bytes(base64.urlsafe_b64decode(key["n"] + "=="), byteorder="big"),
-                )
-                public_key = public_numbers.public_key()
+    def cache_stats(self) -> dict[str, dict[str, Any]]:
+        """
+        Hits and misses of the signing keys, token claims and path authorization caches
+        """
+        return {
+            "jwks": {"hits": self.jwks_hits, "misses": self.jwks_misses, "age": self._jwks_age()},
+            "token_claims": self.token_claims_cache.stats(),
+            "path_auth": self.path_auth_cache.stats(),
+        }
 
-                # Convert to PEM format
-                pem_key = public_key.public_bytes(
-                    encoding=serialization.Encoding.PEM, format=serialization.PublicFormat.SubjectPublicKeyInfo
-                )
-                rsa_key = pem_key
-                return rsa_key
+    def _jwks_age(self) -> Optional[float]:
+        return time.monotonic() - self.jwks_fetched_at if self.jwks is not None else None
 
-    # See https://github.com/Azure-Samples/ms-identity-python-on-behalf-of/blob/939be02b11f1604814532fdacc2c2eccd198b755/FlaskAPI/helpers/authorization.py#L44
-    async def validate_access_token(self, token: str):
+    async def get_jwks(self, refresh: bool = False) -> dict[str, Any]:
         """
-        Validate an access token is issued by Entra
+        Get the signing keys of Entra, fetching them when they aren't cached yet or a refresh is required,
+        and refreshing them in the background once they are older than the refresh interval
         """
+        if self.jwks is None or refresh:
+            self.jwks_misses += 1
+            return await self.refresh_jwks(min_age=self.jwks_min_refresh_interval if refresh else 0)
+
+        self.jwks_hits += 1
+        age = self._jwks_age()
+        if age is not None and age > self.jwks_refresh_interval:
+            if self._jwks_refresh_task is None or self._jwks_refresh_task.done():
+                self._jwks_refresh_task = asyncio.create_task(self._refresh_jwks_in_background())
+        return self.jwks
+
+    async def _refresh_jwks_in_background(self):
+        try:
+            await self.refresh_jwks(min_age=self.jwks_refresh_interval)
+        except Exception:
+            # The cached keys keep being used until a refresh succeeds
+            logging.exception("Exception refreshing the keys to validate auth tokens")
+
+    async def refresh_jwks(self, min_age: float = 0) -> dict[str, Any]:
+        # Only one request fetches the keys, the others wait for it and use its result
+        async with self._jwks_lock:
+            age = self._jwks_age()
+            if self.jwks is not None and age is not None and age < min_age:
+                return self.jwks
+            self.jwks = await self.fetch_jwks()
+            self.jwks_fetched_at = time.monotonic()
+            return self.jwks
+
+    async def fetch_jwks(self) -> dict[str, Any]:
         jwks = None
         async for attempt in AsyncRetrying(
             retry=retry_if_exception_type(AuthError),
@@ -243,6 +309,32 @@ class AuthenticationHelper:
 
         if not jwks or "keys" not in jwks:
             raise AuthError("Unable to get keys to validate auth token.", 401)
+        return jwks
+
+    async def create_pem_format(self, jwks, token):
+        unverified_header = jwt.get_unverified_header(token)
+        for key in jwks["keys"]:
+            if key["kid"] == unverified_header["kid"]:
+                # Construct the RSA public key
+                public_numbers = rsa.RSAPublicNumbers(
+                    e=int.from_bytes(base64.urlsafe_b64decode(key["e"] + "=="), byteorder="big"),
+                    n=int.from_bytes(base64.urlsafe_b64decode(key["n"] + "=="), byteorder="big"),
+                )
+                public_key = public_numbers.public_key()
+
+                # Convert to PEM format
+                pem_key = public_key.public_bytes(
+                    encoding=serialization.Encoding.PEM, format=serialization.PublicFormat.SubjectPublicKeyInfo
+                )
+                rsa_key = pem_key
+                return rsa_key
+
+    # See https://github.com/Azure-Samples/ms-identity-python-on-behalf-of/blob/939be02b11f1604814532fdacc2c2eccd198b755/FlaskAPI/helpers/authorization.py#L44
+    async def validate_access_token(self, token: str) -> dict[str, Any]:
+        """
+        Validate an access token is issued by Entra, and return its claims
+        """
+        jwks = await self.get_jwks()
 
         rsa_key = None
         issuer = None
@@ -252,6 +344,9 @@ class AuthenticationHelper:
             issuer = unverified_claims.get("iss")
             audience = unverified_claims.get("aud")
             rsa_key = await self.create_pem_format(jwks, token)
+            if not rsa_key:
+                # The token may be signed with a key that was rotated in since the keys were fetched
+                rsa_key = await self.create_pem_format(await self.get_jwks(refresh=True), token)
         except jwt.PyJWTError as exc:
             raise AuthError("Unable to parse authorization token.", 401) from exc
         if not rsa_key:
@@ -267,7 +362,7 @@ class AuthenticationHelper:
             )
 
         try:
-            jwt.decode(token, rsa_key, algorithms=["RS256"], audience=audience, issuer=issuer)
+            return jwt.decode(token, rsa_key, algorithms=["RS256"], audience=audience, issuer=issuer)
         except jwt.ExpiredSignatureError as jwt_expired_exc:
             raise AuthError("Token is expired", 401) from jwt_expired_exc
         except (jwt.InvalidAudienceError, jwt.InvalidIssuerError) as jwt_claims_exc:
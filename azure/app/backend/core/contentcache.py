@@ -0,0 +1,53 @@
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Optional
+
+
+@dataclass
+class CachedContent:
+    content: bytes
+    content_type: str
+    etag: Optional[str]
+    cached_at: float = field(default_factory=time.monotonic)
+
+
+class ContentCache:
+    """
+    Least-recently-used cache of small content files and their properties, bounded by their total size,
+    so that citations opened repeatedly are served without downloading them from storage again.
+    Entries expire after a while, so that files replaced in storage are eventually served again.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, max_entry_bytes: int = 8 * 1024 * 1024, ttl: float = 300):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = min(max_entry_bytes, max_bytes)
+        self.ttl = ttl
+        self.size = 0
+        self._entries: OrderedDict[tuple[str, str], CachedContent] = OrderedDict()
+
+    def get(self, path: str, user_oid: Optional[str] = None) -> Optional[CachedContent]:
+        key = (user_oid or "", path)
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if time.monotonic() - entry.cached_at > self.ttl:
+            self.invalidate(path, user_oid)
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def set(self, path: str, entry: CachedContent, user_oid: Optional[str] = None):
+        if len(entry.content) > self.max_entry_bytes:
+            return
+        self.invalidate(path, user_oid)
+        self._entries[(user_oid or "", path)] = entry
+        self.size += len(entry.content)
+        while self.size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.size -= len(evicted.content)
+
+    def invalidate(self, path: str, user_oid: Optional[str] = None):
+        entry = self._entries.pop((user_oid or "", path), None)
+        if entry is not None:
+            self.size -= len(entry.content)
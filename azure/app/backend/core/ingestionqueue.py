@@ -0,0 +1,366 @@
+import asyncio
+import hashlib
+import io
+import logging
+import sqlite3
+import time
+import uuid
+from dataclasses import asdict, dataclass
+from typing import IO, Any, Optional
+
+from core.querycache import QueryCache
+from prepdocslib.blobmanager import AdlsBlobManager
+from prepdocslib.filestrategy import UploadUserFileStrategy
+from prepdocslib.listfilestrategy import File
+
+logger = logging.getLogger("scripts")
+
+
+def hash_file_content(stream: IO[bytes]) -> str:
+    """
+    Hash the content of an uploaded file, leaving the stream at its start for storing it
+    """
+    digest = hashlib.sha256()
+    stream.seek(0)
+    while chunk := stream.read(1024 * 1024):
+        digest.update(chunk)
+    stream.seek(0)
+    return digest.hexdigest()
+
+
+class JobStatus:
+    QUEUED = "queued"
+    PROCESSING = "processing"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+    # Replaced by a later upload of the same file before it was processed
+    SUPERSEDED = "superseded"
+    # The file was deleted while it was being processed
+    CANCELLED = "cancelled"
+
+
+@dataclass
+class IngestionJob:
+    id: str
+    user_oid: str
+    filename: str
+    file_url: str
+    content_hash: str
+    status: str
+    progress: Optional[str]
+    error: Optional[str]
+    created_at: float
+    updated_at: float
+
+    def to_json(self) -> dict[str, Any]:
+        return {key: value for key, value in asdict(self).items() if key not in ("user_oid", "file_url")}
+
+
+class IngestionJobStore:
+    """
+    Ingestion jobs of uploaded files, kept in a SQLite file so that they survive a restart of the app
+    and can be shared by the worker processes of the app.
+    """
+
+    COLUMNS = "id, user_oid, filename, file_url, content_hash, status, progress, error, created_at, updated_at"
+
+    def __init__(self, path: str):
+        self.path = path
+        self.connection = sqlite3.connect(self.path, timeout=30)
+        if self.path != ":memory:":
+            self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, user_oid TEXT NOT NULL, filename TEXT NOT NULL, "
+            "file_url TEXT NOT NULL, content_hash TEXT NOT NULL, status TEXT NOT NULL, progress TEXT, error TEXT, "
+            "created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS jobs_file ON jobs (user_oid, filename)")
+        self.connection.commit()
+
+    def _select(self, where: str, parameters: tuple) -> list[IngestionJob]:
+        rows = self.connection.execute(f"SELECT {self.COLUMNS} FROM jobs WHERE {where}", parameters)
+        return [IngestionJob(*row) for row in rows]
+
+    def get(self, job_id: str) -> Optional[IngestionJob]:
+        jobs = self._select("id = ?", (job_id,))
+        return jobs[0] if jobs else None
+
+    def find_for_content(self, user_oid: str, filename: str, content_hash: str) -> Optional[IngestionJob]:
+        """
+        Find the latest job of the file if it is for the same content and is not failed.
+        Jobs of earlier uploads are ignored, as a later upload of other content replaced their content.
+        """
+        jobs = self._select("user_oid = ? AND filename = ? ORDER BY created_at DESC LIMIT 1", (user_oid, filename))
+        if not jobs or jobs[0].content_hash != content_hash:
+            return None
+        if jobs[0].status not in (JobStatus.QUEUED, JobStatus.PROCESSING, JobStatus.SUCCEEDED):
+            return None
+        return jobs[0]
+
+    def add(self, user_oid: str, filename: str, file_url: str, content_hash: str) -> IngestionJob:
+        now = time.time()
+        job = IngestionJob(
+            id=uuid.uuid4().hex,
+            user_oid=user_oid,
+            filename=filename,
+            file_url=file_url,
+            content_hash=content_hash,
+            status=JobStatus.QUEUED,
+            progress=None,
+            error=None,
+            created_at=now,
+            updated_at=now,
+        )
+        with self.connection:
+            # Jobs of earlier uploads of the file that haven't started would ingest the new content anyway
+            self.connection.execute(
+                "UPDATE jobs SET status = ?, updated_at = ? WHERE user_oid = ? AND filename = ? AND status = ?",
+                (JobStatus.SUPERSEDED, now, user_oid, filename, JobStatus.QUEUED),
+            )
+            self.connection.execute(
+                f"INSERT INTO jobs ({self.COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                tuple(asdict(job).values()),
+            )
+        return job
+
+    def claim(self, job_id: str) -> bool:
+        """
+        Mark a queued job as being processed, returning False if it was already claimed by another worker
+        """
+        with self.connection:
+            cursor = self.connection.execute(
+                "UPDATE jobs SET status = ?, updated_at = ? WHERE id = ? AND status = ?",
+                (JobStatus.PROCESSING, time.time(), job_id, JobStatus.QUEUED),
+            )
+        return cursor.rowcount == 1
+
+    def set_progress(self, job_id: str, progress: str) -> bool:
+        """
+        Record the progress of a job being processed, returning False if it was cancelled
+        """
+        with self.connection:
+            cursor = self.connection.execute(
+                "UPDATE jobs SET progress = ?, updated_at = ? WHERE id = ? AND status = ?",
+                (progress, time.time(), job_id, JobStatus.PROCESSING),
+            )
+        return cursor.rowcount == 1
+
+    def finish(self, job_id: str, status: str, error: Optional[str] = None) -> bool:
+        """
+        Record the outcome of a job being processed, returning False if it was cancelled in the meantime
+        """
+        with self.connection:
+            cursor = self.connection.execute(
+                "UPDATE jobs SET status = ?, progress = NULL, error = ?, updated_at = ? WHERE id = ? AND status = ?",
+                (status, error, time.time(), job_id, JobStatus.PROCESSING),
+            )
+        return cursor.rowcount == 1
+
+    def remove_for_file(self, user_oid: str, filename: str):
+        """
+        Remove the jobs of a deleted file, cancelling the jobs being processed so that they remove
+        whatever they index instead of succeeding
+        """
+        with self.connection:
+            self.connection.execute(
+                "UPDATE jobs SET status = ?, updated_at = ? WHERE user_oid = ? AND filename = ? AND status = ?",
+                (JobStatus.CANCELLED, time.time(), user_oid, filename, JobStatus.PROCESSING),
+            )
+            self.connection.execute(
+                "DELETE FROM jobs WHERE user_oid = ? AND filename = ? AND status != ?",
+                (user_oid, filename, JobStatus.CANCELLED),
+            )
+
+    def heartbeat(self, job_ids: list[str]):
+        """
+        Record that jobs are still being processed, so that they aren't considered stale
+        """
+        if not job_ids:
+            return
+        with self.connection:
+            self.connection.execute(
+                f"UPDATE jobs SET updated_at = ? WHERE status = ? AND id IN ({', '.join('?' * len(job_ids))})",
+                (time.time(), JobStatus.PROCESSING, *job_ids),
+            )
+
+    def requeue_stale(self, stale_after: float) -> list[IngestionJob]:
+        """
+        Queue again the jobs whose processing stopped, as the process processing them was stopped
+        and no longer records heartbeats for them, and return them
+        """
+        now = time.time()
+        requeued = []
+        with self.connection:
+            for job in self._select("status = ? AND updated_at < ?", (JobStatus.PROCESSING, now - stale_after)):
+                # Another process may have queued the job again in the meantime
+                cursor = self.connection.execute(
+                    "UPDATE jobs SET status = ?, progress = NULL, updated_at = ? "
+                    "WHERE id = ? AND status = ? AND updated_at = ?",
+                    (JobStatus.QUEUED, now, job.id, JobStatus.PROCESSING, job.updated_at),
+                )
+                if cursor.rowcount == 1:
+                    requeued.append(job)
+        return requeued
+
+    def queued(self) -> list[IngestionJob]:
+        return self._select("status = ? ORDER BY created_at", (JobStatus.QUEUED,))
+
+    def close(self):
+        self.connection.close()
+
+
+class IngestionQueue:
+    """
+    Ingests uploaded files in the background with a bounded number of workers, so that uploads return
+    as soon as the file is stored. Files are ingested from the user's storage, so queued jobs only need
+    to be recorded in the job store to survive a restart.
+    """
+
+    def __init__(
+        self,
+        store: IngestionJobStore,
+        ingester: UploadUserFileStrategy,
+        blob_manager: AdlsBlobManager,
+        max_workers: int = 2,
+        heartbeat_interval: float = 15,
+        stale_after: float = 60,
+        query_cache: Optional[QueryCache] = None,
+    ):
+        self.store = store
+        self.ingester = ingester
+        self.blob_manager = blob_manager
+        self.max_workers = max_workers
+        # Jobs being processed are kept alive every heartbeat_interval seconds, and jobs without a heartbeat
+        # for stale_after seconds were interrupted by a restart, so they are queued again
+        self.heartbeat_interval = heartbeat_interval
+        self.stale_after = stale_after
+        self.query_cache = query_cache
+        self.queue: asyncio.Queue[str] = asyncio.Queue()
+        self.workers: list[asyncio.Task] = []
+        self.processing: set[str] = set()
+        # Jobs of the same file are processed one at a time, in the order they were submitted
+        self.file_locks: dict[tuple[str, str], asyncio.Lock] = {}
+        self.file_lock_users: dict[tuple[str, str], int] = {}
+
+    def start(self):
+        self.store.requeue_stale(self.stale_after)
+        for job in self.store.queued():
+            self.queue.put_nowait(job.id)
+        self.workers = [asyncio.create_task(self.work()) for _ in range(self.max_workers)]
+        self.workers.append(asyncio.create_task(self.monitor()))
+
+    async def stop(self):
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+        self.store.close()
+
+    def find(self, user_oid: str, filename: str, content_hash: str) -> Optional[IngestionJob]:
+        return self.store.find_for_content(user_oid, filename, content_hash)
+
+    def submit(self, user_oid: str, filename: str, file_url: str, content_hash: str) -> IngestionJob:
+        """
+        Queue the ingestion of a stored file, unless the same content is already queued or ingested
+        """
+        if existing_job := self.find(user_oid, filename, content_hash):
+            return existing_job
+        job = self.store.add(user_oid, filename, file_url, content_hash)
+        self.queue.put_nowait(job.id)
+        return job
+
+    def get(self, job_id: str, user_oid: str) -> Optional[IngestionJob]:
+        job = self.store.get(job_id)
+        if job is None or job.user_oid != user_oid:
+            return None
+        return job
+
+    def forget_file(self, user_oid: str, filename: str):
+        self.store.remove_for_file(user_oid, filename)
+
+    async def monitor(self):
+        """
+        Record heartbeats for the jobs processed by this process, and queue again the jobs of processes
+        that were stopped while processing them, such as the previous process after a quick restart
+        """
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            try:
+                self.store.heartbeat(list(self.processing))
+                for job in self.store.requeue_stale(self.stale_after):
+                    logger.info("Resuming interrupted ingestion of uploaded file %s in job %s", job.filename, job.id)
+                    self.queue.put_nowait(job.id)
+            except Exception:
+                logger.exception("Unexpected error monitoring ingestion jobs")
+
+    async def work(self):
+        while True:
+            job_id = await self.queue.get()
+            try:
+                await self.process(job_id)
+            except Exception:
+                logger.exception("Unexpected error processing ingestion job %s", job_id)
+            finally:
+                self.queue.task_done()
+
+    async def process(self, job_id: str):
+        job = self.store.get(job_id)
+        if job is None or not self.store.claim(job_id):
+            return
+        self.processing.add(job_id)
+        file_key = (job.user_oid, job.filename)
+        lock = self.file_locks.setdefault(file_key, asyncio.Lock())
+        self.file_lock_users[file_key] = self.file_lock_users.get(file_key, 0) + 1
+        try:
+            async with lock:
+                await self.ingest(job)
+        finally:
+            self.processing.discard(job_id)
+            self.file_lock_users[file_key] -= 1
+            if self.file_lock_users[file_key] == 0:
+                del self.file_lock_users[file_key]
+                del self.file_locks[file_key]
+
+    async def ingest(self, job: IngestionJob):
+        try:
+            if not self.store.set_progress(job.id, "downloading"):
+                logger.info("Skipping ingestion of deleted file %s in job %s", job.filename, job.id)
+                return
+            result = await self.blob_manager.download_blob(job.filename, user_oid=job.user_oid)
+            if result is None:
+                raise FileNotFoundError(f"Uploaded file {job.filename} was not found")
+            content = io.BytesIO(result[0])
+            content.name = job.filename
+
+            def on_progress(progress: str):
+                self.store.set_progress(job.id, progress)
+
+            await self.ingester.add_file(
+                File(content=content, url=job.file_url, acls={"oids": [job.user_oid]}),
+                user_oid=job.user_oid,
+                on_progress=on_progress,
+            )
+            if not self.store.finish(job.id, JobStatus.SUCCEEDED):
+                await self.remove_cancelled(job)
+                return
+            if self.query_cache:
+                await self.query_cache.invalidate_results()
+            logger.info("Ingested uploaded file %s in job %s", job.filename, job.id)
+        except Exception:
+            logger.exception("Error ingesting uploaded file %s in job %s", job.filename, job.id)
+            if not self.store.finish(
+                job.id, JobStatus.FAILED, error="Error ingesting file, check server logs for details."
+            ):
+                await self.remove_cancelled(job)
+
+    async def remove_cancelled(self, job: IngestionJob):
+        """
+        Remove the sections a job indexed for a file that was deleted while the job was processing it
+        """
+        try:
+            await self.ingester.remove_file(job.filename, job.user_oid)
+            if self.query_cache:
+                await self.query_cache.invalidate_results()
+            logger.info("Removed the ingested content of deleted file %s in job %s", job.filename, job.id)
+        except Exception:
+            logger.exception("Error removing the ingested content of deleted file %s in job %s", job.filename, job.id)
@@ -0,0 +1,203 @@
+import logging
+import sys
+import threading
+import time
+from collections import Counter, deque
+from collections.abc import AsyncGenerator, Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Optional
+
+logger = logging.getLogger("scripts")
+
+
+class LatencyHistogram:
+    """
+    Latencies of the most recent samples, summarized as percentiles
+    """
+
+    def __init__(self, max_samples: int = 2048):
+        self.count = 0
+        self.samples: deque[float] = deque(maxlen=max_samples)
+
+    def add(self, latency_ms: float):
+        self.count += 1
+        self.samples.append(latency_ms)
+
+    def summary(self) -> dict[str, Any]:
+        samples = sorted(self.samples)
+
+        def percentile(fraction: float) -> float:
+            # Nearest-rank percentile of the recent samples
+            return round(samples[min(len(samples) - 1, int(fraction * len(samples)))], 1)
+
+        return {
+            "count": self.count,
+            "p50": percentile(0.5),
+            "p95": percentile(0.95),
+            "p99": percentile(0.99),
+            "max": round(samples[-1], 1),
+        }
+
+
+class StackSampler:
+    """
+    Samples the stack of the thread running the event loop from a background thread, so that the code that ran
+    during slow requests can be reported. As requests are interleaved on the event loop, the samples taken
+    during a request include the work of other requests, which is how code blocking the event loop shows up.
+    """
+
+    def __init__(self, interval: float = 0.005, max_samples: int = 20000, max_depth: int = 16):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.samples: deque[tuple[float, tuple[str, ...]]] = deque(maxlen=max_samples)
+        self._thread_id: Optional[int] = None
+        self._stopped = threading.Event()
+        self._sampler: Optional[threading.Thread] = None
+
+    def start(self):
+        self._thread_id = threading.get_ident()
+        self._stopped.clear()
+        self._sampler = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._sampler.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._sampler:
+            self._sampler.join()
+            self._sampler = None
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self._thread_id or 0)
+            stack: list[str] = []
+            while frame is not None and len(stack) < self.max_depth:
+                stack.append(f"{frame.f_code.co_name} ({frame.f_code.co_filename}:{frame.f_lineno})")
+                frame = frame.f_back
+            self.samples.append((time.perf_counter(), tuple(reversed(stack))))
+
+    def top_stacks(self, since: float, limit: int = 5) -> list[tuple[str, int]]:
+        """
+        Most frequently sampled stacks since a time.perf_counter() value, outermost frame first
+        """
+        stacks = Counter(";".join(stack) for sampled_at, stack in list(self.samples) if sampled_at >= since)
+        return stacks.most_common(limit)
+
+
+class LatencyRecorder:
+    """
+    Aggregates the latency of requests and of the stages of answering them, such as searching the index,
+    so that their percentiles can be monitored. When a profiler is given, the stacks sampled during requests
+    slower than a threshold are logged.
+    """
+
+    def __init__(
+        self,
+        max_samples: int = 2048,
+        profiler: Optional[StackSampler] = None,
+        slow_request_ms: Optional[float] = None,
+    ):
+        self.max_samples = max_samples
+        self.profiler = profiler
+        self.slow_request_ms = slow_request_ms
+        self.requests: dict[str, LatencyHistogram] = {}
+        self.stages: dict[str, LatencyHistogram] = {}
+
+    def record_request(self, route: str, latency_ms: float):
+        self.requests.setdefault(route, LatencyHistogram(self.max_samples)).add(latency_ms)
+
+    def record_stage(self, stage: str, latency_ms: float):
+        self.stages.setdefault(stage, LatencyHistogram(self.max_samples)).add(latency_ms)
+
+    def summary(self) -> dict[str, dict[str, Any]]:
+        return {
+            "requests": {route: histogram.summary() for route, histogram in self.requests.items()},
+            "stages": {stage: histogram.summary() for stage, histogram in self.stages.items()},
+        }
+
+
+class RequestTimings:
+    """
+    Time spent in each stage of a request, summed over the spans of the stage
+    """
+
+    def __init__(self, recorder: LatencyRecorder, route: str):
+        self.recorder = recorder
+        self.route = route
+        self.started_at = time.perf_counter()
+        self.stages: dict[str, float] = {}
+
+    def add(self, stage: str, latency_ms: float):
+        self.stages[stage] = self.stages.get(stage, 0) + latency_ms
+        self.recorder.record_stage(stage, latency_ms)
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self.started_at) * 1000
+
+    def server_timing(self) -> str:
+        """
+        Value of a Server-Timing header, which browser developer tools and load tests can break down
+        """
+        return ", ".join(f"{stage};dur={latency_ms:.1f}" for stage, latency_ms in self.stages.items())
+
+    def finish(self):
+        latency_ms = self.elapsed_ms()
+        self.recorder.record_request(self.route, latency_ms)
+        profiler = self.recorder.profiler
+        if profiler and self.recorder.slow_request_ms is not None and latency_ms >= self.recorder.slow_request_ms:
+            stacks = "\n".join(f"{count} {stack}" for stack, count in profiler.top_stacks(since=self.started_at))
+            logger.warning(
+                "Slow request to %s took %.0f ms, stages: %s, most sampled stacks:\n%s",
+                self.route,
+                latency_ms,
+                self.server_timing(),
+                stacks,
+            )
+
+
+current_request_timings: ContextVar[Optional[RequestTimings]] = ContextVar("current_request_timings", default=None)
+
+
+@contextmanager
+def span(stage: str) -> Iterator[None]:
+    """
+    Record the time spent in a stage of the current request, if any.
+    Tasks created during the request, such as concurrent searches, record their stages in the same request.
+    """
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        if (timings := current_request_timings.get()) is not None:
+            timings.add(stage, (time.perf_counter() - start_time) * 1000)
+
+
+@contextmanager
+def track_request(recorder: LatencyRecorder, route: str) -> Iterator[RequestTimings]:
+    timings = RequestTimings(recorder, route)
+    token = current_request_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        current_request_timings.reset(token)
+        timings.finish()
+
+
+async def track_stream(
+    recorder: LatencyRecorder, route: str, events: AsyncGenerator[dict, None]
+) -> AsyncGenerator[dict, None]:
+    """
+    Track a streamed response, whose stages run as its events are generated, along with the time to its first token
+    """
+    timings = RequestTimings(recorder, route)
+    # The events are generated by the task sending the response, which ends with it
+    current_request_timings.set(timings)
+    first_token = False
+    try:
+        async for event in events:
+            if not first_token and (event.get("delta") or {}).get("content"):
+                first_token = True
+                timings.add("first_token", timings.elapsed_ms())
+            yield event
+    finally:
+        timings.finish()
@@ -0,0 +1,242 @@
+import hashlib
+import json
+import logging
+import math
+import operator
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Optional
+
+from core.ttlcache import TTLCache
+
+logger = logging.getLogger("scripts")
+
+
+class QueryCacheBackend(ABC):
+    """
+    Storage of query cache entries, holding JSON-serializable values under namespaced keys
+    """
+
+    @abstractmethod
+    async def get(self, namespace: str, key: str) -> Optional[Any]:
+        pass
+
+    @abstractmethod
+    async def set(self, namespace: str, key: str, value: Any, ttl: float):
+        pass
+
+    @abstractmethod
+    async def clear(self, namespace: str):
+        pass
+
+    def size(self, namespace: str) -> Optional[int]:
+        return None
+
+    async def close(self):
+        pass
+
+
+class MemoryCacheBackend(QueryCacheBackend):
+    """
+    Keeps entries in the memory of the process, each namespace bounded by its number of entries
+    with the least recently used entries evicted first
+    """
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._caches: dict[str, TTLCache[str, Any]] = {}
+
+    def _cache(self, namespace: str) -> TTLCache[str, Any]:
+        if namespace not in self._caches:
+            self._caches[namespace] = TTLCache(ttl=float("inf"), max_entries=self.max_entries)
+        return self._caches[namespace]
+
+    async def get(self, namespace: str, key: str) -> Optional[Any]:
+        return self._cache(namespace).get(key)
+
+    async def set(self, namespace: str, key: str, value: Any, ttl: float):
+        self._cache(namespace).set(key, value, ttl=ttl)
+
+    async def clear(self, namespace: str):
+        self._cache(namespace).clear()
+
+    def size(self, namespace: str) -> Optional[int]:
+        return self._cache(namespace).stats()["size"]
+
+
+class RedisCacheBackend(QueryCacheBackend):
+    """
+    Keeps entries in a Redis-compatible server, such as a local Redis or Valkey, so that they are shared
+    by the workers of the app and can be invalidated by other processes, such as prepdocs.
+    The server is expected to evict entries itself, for example with an allkeys-lru maxmemory policy.
+    Requires the optional redis package.
+    """
+
+    def __init__(self, url: str, prefix: str = "querycache", client: Optional[Any] = None):
+        if client is None:
+            try:
+                from redis.asyncio import Redis
+            except ImportError as error:
+                raise ValueError("The redis package is required to use a Redis query cache") from error
+            client = Redis.from_url(url)
+        self.client = client
+        self.prefix = prefix
+
+    def _key(self, namespace: str, key: str) -> str:
+        return f"{self.prefix}:{namespace}:{key}"
+
+    async def get(self, namespace: str, key: str) -> Optional[Any]:
+        value = await self.client.get(self._key(namespace, key))
+        return None if value is None else json.loads(value)
+
+    async def set(self, namespace: str, key: str, value: Any, ttl: float):
+        await self.client.set(self._key(namespace, key), json.dumps(value), px=max(int(ttl * 1000), 1))
+
+    async def clear(self, namespace: str):
+        keys = [key async for key in self.client.scan_iter(match=self._key(namespace, "*"), count=500)]
+        # Stay below the number of arguments that servers accept in one command
+        for start in range(0, len(keys), 500):
+            await self.client.delete(*keys[start : start + 500])
+
+    async def close(self):
+        await self.client.aclose()
+
+
+def unit_vector(vector: list[float]) -> list[float]:
+    norm = math.sqrt(sum(value * value for value in vector))
+    return [value / norm for value in vector] if norm else vector
+
+
+class SimilarQueryIndex:
+    """
+    In-memory index of the embeddings of recent questions, to find the value cached for a question
+    that is nearly identical to an earlier one, such as the search query it was rewritten to.
+    Questions are only compared within a scope, such as a user and the conversation so far.
+    """
+
+    def __init__(
+        self, threshold: float = 0.97, ttl: float = 3600, max_scopes: int = 1024, max_entries_per_scope: int = 32
+    ):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries_per_scope = max_entries_per_scope
+        self.hits = 0
+        self.misses = 0
+        self._scopes: TTLCache[str, list[tuple[float, list[float], Any]]] = TTLCache(ttl=ttl, max_entries=max_scopes)
+
+    def _entries(self, scope: str) -> list[tuple[float, list[float], Any]]:
+        now = time.monotonic()
+        return [entry for entry in self._scopes.get(scope) or [] if entry[0] > now]
+
+    def find(self, scope: str, vector: list[float]) -> Optional[Any]:
+        vector = unit_vector(vector)
+        found, best_similarity = None, self.threshold
+        for _, entry_vector, value in self._entries(scope):
+            # Cosine similarity, as both vectors have a length of 1
+            similarity = sum(map(operator.mul, vector, entry_vector))
+            if similarity >= best_similarity:
+                found, best_similarity = value, similarity
+        if found is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return found
+
+    def add(self, scope: str, vector: list[float], value: Any):
+        entries = self._entries(scope)
+        entries.append((time.monotonic() + self.ttl, unit_vector(vector), value))
+        self._scopes.set(scope, entries[-self.max_entries_per_scope :])
+
+    def stats(self) -> dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else None,
+            "size": self._scopes.stats()["size"],
+        }
+
+
+class QueryCache:
+    """
+    Cache of query embeddings, search results and rewritten search queries, so that repeated questions
+    don't compute the embedding of the query, search the index or ask the chat model for a search query again.
+    Entries expire after a time-to-live per kind, a time-to-live of 0 disables caching that kind.
+    Search results are invalidated when the index is updated.
+    Errors of the backend are logged and treated as misses, so that an unavailable cache doesn't fail requests.
+    """
+
+    EMBEDDINGS = "embeddings"
+    RESULTS = "results"
+    REWRITES = "rewrites"
+
+    def __init__(
+        self,
+        backend: QueryCacheBackend,
+        embedding_ttl: float = 3600,
+        result_ttl: float = 60,
+        rewrite_ttl: float = 3600,
+        similar_rewrites: Optional[SimilarQueryIndex] = None,
+    ):
+        self.backend = backend
+        self.ttls = {self.EMBEDDINGS: embedding_ttl, self.RESULTS: result_ttl, self.REWRITES: rewrite_ttl}
+        # Search queries of nearly identical questions, looked up when a question isn't cached as is
+        self.similar_rewrites = similar_rewrites if rewrite_ttl > 0 else None
+        self.hits = {namespace: 0 for namespace in self.ttls}
+        self.misses = {namespace: 0 for namespace in self.ttls}
+
+    @staticmethod
+    def key(*parts: Any) -> str:
+        """
+        Hash of the parts, so that keys have a bounded length and don't hold secrets such as access tokens
+        """
+        return hashlib.sha256(json.dumps(parts, default=str).encode()).hexdigest()
+
+    async def get(self, namespace: str, key: str) -> Optional[Any]:
+        if self.ttls[namespace] <= 0:
+            return None
+        try:
+            value = await self.backend.get(namespace, key)
+        except Exception as error:
+            logger.warning("Unable to read from the query cache: %s", error)
+            value = None
+        if value is None:
+            self.misses[namespace] += 1
+        else:
+            self.hits[namespace] += 1
+        return value
+
+    async def set(self, namespace: str, key: str, value: Any):
+        if self.ttls[namespace] <= 0:
+            return
+        try:
+            await self.backend.set(namespace, key, value, self.ttls[namespace])
+        except Exception as error:
+            logger.warning("Unable to write to the query cache: %s", error)
+
+    async def invalidate_results(self):
+        """
+        Forget the cached search results, to be called when documents are added to or removed from the index.
+        Embeddings only depend on the query, so they stay cached.
+        """
+        try:
+            await self.backend.clear(self.RESULTS)
+        except Exception as error:
+            logger.warning("Unable to clear the search results of the query cache: %s", error)
+
+    def stats(self) -> dict[str, dict[str, Any]]:
+        stats = {}
+        for namespace in self.ttls:
+            lookups = self.hits[namespace] + self.misses[namespace]
+            stats[namespace] = {
+                "hits": self.hits[namespace],
+                "misses": self.misses[namespace],
+                "hit_rate": self.hits[namespace] / lookups if lookups else None,
+                "size": self.backend.size(namespace),
+            }
+        if self.similar_rewrites:
+            stats["similar_rewrites"] = self.similar_rewrites.stats()
+        return stats
+
+    async def close(self):
+        await self.backend.close()
@@ -0,0 +1,150 @@
+import asyncio
+import hashlib
+import logging
+import os
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable
+from typing import Optional
+
+logger = logging.getLogger("scripts")
+
+
+class SpeechCache:
+    """
+    Content-addressed cache of synthesized speech, keyed by a hash of the voice and the text,
+    so that replaying an answer doesn't synthesize it again.
+    Audio is kept in memory and, when a directory is given, on disk, each bounded by its total size
+    with the least recently used audio evicted first.
+    """
+
+    def __init__(
+        self,
+        directory: Optional[str] = None,
+        max_memory_bytes: int = 16 * 1024 * 1024,
+        max_disk_bytes: int = 256 * 1024 * 1024,
+    ):
+        self.directory = directory
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.memory_size = 0
+        self.disk_size = 0
+        self._memory: OrderedDict[str, bytes] = OrderedDict()
+        self._disk: OrderedDict[str, int] = OrderedDict()
+        # Audio being synthesized, so that concurrent requests for the same audio share the synthesis
+        self._pending: dict[str, asyncio.Future[bytes]] = {}
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+            self._load_disk_entries()
+
+    @staticmethod
+    def key(voice: str, text: str) -> str:
+        return hashlib.sha256(f"{voice}\n{text}".encode()).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory or "", f"{key}.mp3")
+
+    def _load_disk_entries(self):
+        entries = []
+        with os.scandir(self.directory) as scan:
+            for entry in scan:
+                if entry.is_file() and entry.name.endswith(".mp3"):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, entry.name.removesuffix(".mp3"), stat.st_size))
+        for _, key, size in sorted(entries):
+            self._disk[key] = size
+            self.disk_size += size
+        self._evict_disk()
+
+    async def get(self, key: str) -> Optional[bytes]:
+        if (audio := self._memory.get(key)) is not None:
+            self._memory.move_to_end(key)
+            return audio
+        if key not in self._disk:
+            return None
+        try:
+            audio = await asyncio.to_thread(self._read_file, key)
+        except FileNotFoundError:
+            self.disk_size -= self._disk.pop(key, 0)
+            return None
+        self._disk.move_to_end(key)
+        self._set_in_memory(key, audio)
+        return audio
+
+    async def get_or_create(self, key: str, create: Callable[[], Awaitable[bytes]]) -> bytes:
+        """
+        Get the cached audio, or create and cache it, waiting for the audio already being created if any.
+        If the request creating the audio is cancelled, one of the waiting requests creates it instead.
+        """
+        while True:
+            if (audio := await self.get(key)) is not None:
+                return audio
+            if (pending := self._pending.get(key)) is None:
+                break
+            # Unlike awaiting the future, waiting for it doesn't raise if it was cancelled
+            await asyncio.wait({pending})
+            if not pending.cancelled():
+                return pending.result()
+        future: asyncio.Future[bytes] = asyncio.get_running_loop().create_future()
+        self._pending[key] = future
+        try:
+            audio = await create()
+            await self.set(key, audio)
+            future.set_result(audio)
+            return audio
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as error:
+            future.set_exception(error)
+            # The error is raised here, waiting requests get it from the future
+            future.exception()
+            raise
+        finally:
+            del self._pending[key]
+
+    async def set(self, key: str, audio: bytes):
+        self._set_in_memory(key, audio)
+        if self.directory and len(audio) <= self.max_disk_bytes and key not in self._disk:
+            try:
+                await asyncio.to_thread(self._write_file, key, audio)
+            except OSError:
+                logger.warning("Unable to write synthesized speech to the cache directory %s", self.directory)
+                return
+            self._disk[key] = len(audio)
+            self.disk_size += len(audio)
+            self._evict_disk()
+
+    def _set_in_memory(self, key: str, audio: bytes):
+        if len(audio) > self.max_memory_bytes:
+            return
+        if (previous := self._memory.pop(key, None)) is not None:
+            self.memory_size -= len(previous)
+        self._memory[key] = audio
+        self.memory_size += len(audio)
+        while self.memory_size > self.max_memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self.memory_size -= len(evicted)
+
+    def _evict_disk(self):
+        while self.disk_size > self.max_disk_bytes:
+            key, size = self._disk.popitem(last=False)
+            self.disk_size -= size
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+
+    def _read_file(self, key: str) -> bytes:
+        path = self._path(key)
+        with open(path, "rb") as file:
+            audio = file.read()
+        # The modification time orders the audio by its last use when the cache is loaded again
+        os.utime(path)
+        return audio
+
+    def _write_file(self, key: str, audio: bytes):
+        path = self._path(key)
+        temporary_path = f"{path}.{os.getpid()}.tmp"
+        with open(temporary_path, "wb") as file:
+            file.write(audio)
+        os.replace(temporary_path, path)
@@ -13,13 +13,21 @@ from azure.identity.aio import AzureDeveloperCliCredential, get_bearer_token_pro
 from openai import AsyncOpenAI
 from rich.logging import RichHandler
 
+from core.querycache import QueryCache, RedisCacheBackend
 from load_azd_env import load_azd_env
 from prepdocslib.blobmanager import BlobManager
+from prepdocslib.cpuexecutor import CpuWorkExecutor
 from prepdocslib.csvparser import CsvParser
-from prepdocslib.embeddings import ImageEmbeddings, OpenAIEmbeddings
+from prepdocslib.embeddingcache import EmbeddingCache
+from prepdocslib.embeddings import (
+    EmbeddingRateLimiter,
+    ImageEmbeddings,
+    OpenAIEmbeddings,
+)
 from prepdocslib.fileprocessor import FileProcessor
 from prepdocslib.filestrategy import FileStrategy
 from prepdocslib.htmlparser import LocalHTMLParser
+from prepdocslib.ingestionpipeline import IngestionConcurrency
 from prepdocslib.integratedvectorizerstrategy import (
     IntegratedVectorizerStrategy,
 )
@@ -165,6 +173,10 @@ def setup_embeddings_service(
     azure_openai_endpoint: str | None,
     disable_vectors: bool = False,
     disable_batch_vectors: bool = False,
+    max_concurrent_requests: int = 4,
+    tokens_per_minute: Optional[int] = None,
+    requests_per_minute: Optional[int] = None,
+    cache_path: Optional[str] = None,
 ):
     if disable_vectors:
         logger.info("Not setting up embeddings service")
@@ -183,6 +195,13 @@ def setup_embeddings_service(
         disable_batch=disable_batch_vectors,
         azure_deployment_name=azure_openai_deployment,
         azure_endpoint=azure_openai_endpoint,
+        max_concurrent_requests=max_concurrent_requests,
+        rate_limiter=(
+            EmbeddingRateLimiter(tokens_per_minute=tokens_per_minute, requests_per_minute=requests_per_minute)
+            if tokens_per_minute or requests_per_minute
+            else None
+        ),
+        cache=EmbeddingCache(cache_path) if cache_path else None,
     )
 
 
@@ -255,6 +274,9 @@ def setup_file_processors(
     openai_model: Optional[str] = None,
     openai_deployment: Optional[str] = None,
     content_understanding_endpoint: Optional[str] = None,
+    cpu_executor: Optional[CpuWorkExecutor] = None,
+    records_per_page: int = 1,
+    max_tokens_per_record_page: Optional[int] = None,
 ):
     sentence_text_splitter = SentenceTextSplitter()
 
@@ -284,7 +306,7 @@ def setup_file_processors(
 
     pdf_parser: Optional[Parser] = None
     if local_pdf_parser or document_intelligence_service is None:
-        pdf_parser = LocalPdfParser()
+        pdf_parser = LocalPdfParser(executor=cpu_executor)
     elif document_intelligence_service is not None:
         pdf_parser = doc_int_parser
     else:
@@ -292,7 +314,7 @@ def setup_file_processors(
 
     html_parser: Optional[Parser] = None
     if local_html_parser or document_intelligence_service is None:
-        html_parser = LocalHTMLParser()
+        html_parser = LocalHTMLParser(executor=cpu_executor)
     elif document_intelligence_service is not None:
         html_parser = doc_int_parser
     else:
@@ -300,29 +322,37 @@ def setup_file_processors(
 
     # These file formats can always be parsed:
     file_processors = {
-        ".json": FileProcessor(JsonParser(), SimpleTextSplitter()),
-        ".md": FileProcessor(TextParser(), sentence_text_splitter),
-        ".txt": FileProcessor(TextParser(), sentence_text_splitter),
-        ".csv": FileProcessor(CsvParser(), sentence_text_splitter),
+        ".json": FileProcessor(
+            JsonParser(objects_per_page=records_per_page, max_tokens_per_page=max_tokens_per_record_page),
+            SimpleTextSplitter(),
+            executor=cpu_executor,
+        ),
+        ".md": FileProcessor(TextParser(), sentence_text_splitter, executor=cpu_executor),
+        ".txt": FileProcessor(TextParser(), sentence_text_splitter, executor=cpu_executor),
+        ".csv": FileProcessor(
+            CsvParser(rows_per_page=records_per_page, max_tokens_per_page=max_tokens_per_record_page),
+            sentence_text_splitter,
+            executor=cpu_executor,
+        ),
     }
     # These require either a Python package or Document Intelligence
     if pdf_parser is not None:
-        file_processors.update({".pdf": FileProcessor(pdf_parser, sentence_text_splitter)})
+        file_processors.update({".pdf": FileProcessor(pdf_parser, sentence_text_splitter, executor=cpu_executor)})
     if html_parser is not None:
-        file_processors.update({".html": FileProcessor(html_parser, sentence_text_splitter)})
+        file_processors.update({".html": FileProcessor(html_parser, sentence_text_splitter, executor=cpu_executor)})
     # These file formats require Document Intelligence
     if doc_int_parser is not None:
         file_processors.update(
             {
-                ".docx": FileProcessor(doc_int_parser, sentence_text_splitter),
-                ".pptx": FileProcessor(doc_int_parser, sentence_text_splitter),
-                ".xlsx": FileProcessor(doc_int_parser, sentence_text_splitter),
-                ".png": FileProcessor(doc_int_parser, sentence_text_splitter),
-                ".jpg": FileProcessor(doc_int_parser, sentence_text_splitter),
-                ".jpeg": FileProcessor(doc_int_parser, sentence_text_splitter),
-                ".tiff": FileProcessor(doc_int_parser, sentence_text_splitter),
-                ".bmp": FileProcessor(doc_int_parser, sentence_text_splitter),
-                ".heic": FileProcessor(doc_int_parser, sentence_text_splitter),
+                ".docx": FileProcessor(doc_int_parser, sentence_text_splitter, executor=cpu_executor),
+                ".pptx": FileProcessor(doc_int_parser, sentence_text_splitter, executor=cpu_executor),
+                ".xlsx": FileProcessor(doc_int_parser, sentence_text_splitter, executor=cpu_executor),
+                ".png": FileProcessor(doc_int_parser, sentence_text_splitter, executor=cpu_executor),
+                ".jpg": FileProcessor(doc_int_parser, sentence_text_splitter, executor=cpu_executor),
+                ".jpeg": FileProcessor(doc_int_parser, sentence_text_splitter, executor=cpu_executor),
+                ".tiff": FileProcessor(doc_int_parser, sentence_text_splitter, executor=cpu_executor),
+                ".bmp": FileProcessor(doc_int_parser, sentence_text_splitter, executor=cpu_executor),
+                ".heic": FileProcessor(doc_int_parser, sentence_text_splitter, executor=cpu_executor),
             }
         )
     return file_processors
@@ -342,11 +372,15 @@ def setup_image_embeddings_service(
     return image_embeddings_service
 
 
-async def main(strategy: Strategy, setup_index: bool = True):
+async def main(strategy: Strategy, setup_index: bool = True, query_cache: Optional[QueryCache] = None):
     if setup_index:
         await strategy.setup()
 
     await strategy.run()
+    if query_cache:
+        # The app may have cached search results from before the index was updated
+        await query_cache.invalidate_results()
+        await query_cache.close()
 
 
 if __name__ == "__main__":  # pragma: no cover
@@ -364,6 +398,64 @@ if __name__ == "__main__":  # pragma: no cover
     parser.add_argument(
         "--disablebatchvectors", action="store_true", help="Don't compute embeddings in batch for the sections"
     )
+    parser.add_argument(
+        "--concurrent",
+        action="store_true",
+        help="Ingest files concurrently: parse, embed and upload several files at once",
+    )
+    parser.add_argument(
+        "--parseworkers", type=int, default=4, help="With --concurrent, number of files parsed at the same time"
+    )
+    parser.add_argument(
+        "--parserprocesses",
+        type=int,
+        required=False,
+        help="Number of processes parsing and splitting files with local parsers, 0 to parse in the main process (defaults to the number of CPUs, up to 4)",
+    )
+    parser.add_argument(
+        "--recordsperpage",
+        type=int,
+        default=1,
+        help="Number of CSV rows or JSON array objects grouped into each page of a file",
+    )
+    parser.add_argument(
+        "--recordtokensperpage",
+        type=int,
+        required=False,
+        help="Group CSV rows or JSON array objects into pages of up to this many tokens (defaults to no budget)",
+    )
+    parser.add_argument(
+        "--embedworkers", type=int, default=2, help="With --concurrent, number of files embedded at the same time"
+    )
+    parser.add_argument(
+        "--uploadbatchsize",
+        type=int,
+        default=500,
+        help="With --concurrent, number of sections sent to the search index per upload",
+    )
+    parser.add_argument(
+        "--embeddingconcurrency",
+        type=int,
+        default=4,
+        help="Number of embedding requests sent to the embeddings API at the same time",
+    )
+    parser.add_argument(
+        "--embeddingtpm",
+        type=int,
+        required=False,
+        help="Tokens per minute shared by all embedding requests (defaults to no budget)",
+    )
+    parser.add_argument(
+        "--embeddingrpm",
+        type=int,
+        required=False,
+        help="Requests per minute shared by all embedding requests (defaults to no budget)",
+    )
+    parser.add_argument(
+        "--embeddingcache",
+        required=False,
+        help="Optional. Path of a local file caching computed embeddings, so unchanged text isn't embedded again",
+    )
     parser.add_argument(
         "--remove",
         action="store_true",
@@ -439,6 +531,7 @@ if __name__ == "__main__":  # pragma: no cover
 
     loop = asyncio.new_event_loop()
     asyncio.set_event_loop(loop)
+    cpu_executor: Optional[CpuWorkExecutor] = None
 
     OPENAI_HOST = OpenAIHost(os.environ["OPENAI_HOST"])
     # Check for incompatibility
@@ -519,6 +612,10 @@ if __name__ == "__main__":  # pragma: no cover
         azure_openai_endpoint=azure_openai_endpoint,
         disable_vectors=dont_use_vectors,
         disable_batch_vectors=args.disablebatchvectors,
+        max_concurrent_requests=args.embeddingconcurrency,
+        tokens_per_minute=args.embeddingtpm,
+        requests_per_minute=args.embeddingrpm,
+        cache_path=args.embeddingcache,
     )
 
     ingestion_strategy: Strategy
@@ -541,6 +638,8 @@ if __name__ == "__main__":  # pragma: no cover
             enforce_access_control=enforce_access_control,
         )
     else:
+        if args.parserprocesses != 0:
+            cpu_executor = CpuWorkExecutor(max_workers=args.parserprocesses)
         file_processors = setup_file_processors(
             azure_credential=azd_credential,
             document_intelligence_service=os.getenv("AZURE_DOCUMENTINTELLIGENCE_SERVICE"),
@@ -553,6 +652,9 @@ if __name__ == "__main__":  # pragma: no cover
             openai_client=openai_client,
             openai_model=os.getenv("AZURE_OPENAI_CHATGPT_MODEL"),
             openai_deployment=os.getenv("AZURE_OPENAI_CHATGPT_DEPLOYMENT") if OPENAI_HOST == OpenAIHost.AZURE else None,
+            cpu_executor=cpu_executor,
+            records_per_page=args.recordsperpage,
+            max_tokens_per_record_page=args.recordtokensperpage,
         )
 
         image_embeddings_service = setup_image_embeddings_service(
@@ -577,10 +679,32 @@ if __name__ == "__main__":  # pragma: no cover
             use_content_understanding=use_content_understanding,
             content_understanding_endpoint=os.getenv("AZURE_CONTENTUNDERSTANDING_ENDPOINT"),
             enforce_access_control=enforce_access_control,
+            concurrency=(
+                IngestionConcurrency(
+                    parse_workers=args.parseworkers,
+                    embed_workers=args.embedworkers,
+                    upload_batch_size=args.uploadbatchsize,
+                )
+                if args.concurrent
+                else None
+            ),
+        )
+
+    # Search results cached by the app in a shared Redis cache are invalidated once the index is updated
+    query_cache = None
+    if query_cache_redis_url := os.getenv("QUERY_CACHE_REDIS_URL"):
+        query_cache = QueryCache(
+            RedisCacheBackend(query_cache_redis_url, prefix=f"querycache:{os.environ['AZURE_SEARCH_INDEX']}")
         )
 
     try:
-        loop.run_until_complete(main(ingestion_strategy, setup_index=not args.remove and not args.removeall))
+        loop.run_until_complete(
+            main(
+                ingestion_strategy,
+                setup_index=not args.remove and not args.removeall,
+                query_cache=query_cache,
+            )
+        )
     finally:
         # Gracefully close any async clients/credentials to avoid noisy destructor warnings
         try:
@@ -589,4 +713,6 @@ if __name__ == "__main__":  # pragma: no cover
             loop.run_until_complete(azd_credential.close())
         except Exception as e:
             logger.debug(f"Failed to close async clients cleanly: {e}")
+        if cpu_executor is not None:
+            cpu_executor.shutdown()
         loop.close()
@@ -2,6 +2,8 @@ import io
 import logging
 import os
 import re
+from collections.abc import AsyncIterator
+from dataclasses import dataclass
 from pathlib import Path
 from typing import IO, Any, Optional, TypedDict
 from urllib.parse import unquote
@@ -26,6 +28,30 @@ class BlobProperties(TypedDict, total=False):
     content_settings: dict[str, Any]
 
 
+@dataclass
+class BlobDownload:
+    """
+    A blob being downloaded, or a byte range of it, whose content is streamed in chunks
+    """
+
+    chunks: AsyncIterator[bytes]
+    content_type: str
+    etag: Optional[str]
+    # Position and number of the downloaded bytes within the blob
+    offset: int
+    length: int
+    # Size of the whole blob, if the storage service reported it
+    size: Optional[int]
+
+
+def parse_content_range_size(content_range: Optional[str]) -> Optional[int]:
+    """Get the size of the whole blob from a Content-Range header like 'bytes 0-1023/4096'"""
+    if not content_range or "/" not in content_range:
+        return None
+    size = content_range.rsplit("/", 1)[1]
+    return int(size) if size.isdigit() else None
+
+
 class BaseBlobManager:
     """
     Base class for Azure Storage operations, providing common file naming and path utilities
@@ -118,6 +144,32 @@ class BaseBlobManager:
         """
         raise NotImplementedError("Subclasses must implement this method")
 
+    async def open_blob(
+        self,
+        blob_path: str,
+        user_oid: Optional[str] = None,
+        offset: Optional[int] = None,
+        length: Optional[int] = None,
+    ) -> Optional[BlobDownload]:
+        """
+        Starts downloading a blob, or a byte range of it, without reading its whole content into memory.
+
+        Args:
+            blob_path: The path to the blob in the storage
+            user_oid: The user's object ID (optional)
+            offset: The position of the first byte to download (optional)
+            length: The number of bytes to download, to the end of the blob if not provided
+
+        Returns:
+            Optional[BlobDownload]:
+                - The download, whose content is streamed from the storage service as its chunks are consumed
+                - None if blob not found or access denied
+
+        Raises:
+            HttpResponseError: with status code 416 if the offset is beyond the end of the blob
+        """
+        raise NotImplementedError("Subclasses must implement this method")
+
 
 class AdlsBlobManager(BaseBlobManager):
     """
@@ -272,23 +324,10 @@ class AdlsBlobManager(BaseBlobManager):
         if user_oid is None:
             logger.warning("user_oid must be provided for Data Lake Storage operations.")
             return None
-
-        # Get the directory path and file name from the blob path
-        path_parts = blob_path.split("/")
-        if len(path_parts) < 2:
-            # If no slashes in path, we assume it's a file in the user's root directory
-            filename = blob_path
-            directory_path = user_oid
-        else:
-            # First verify that the root directory matches the user_oid
-            root_dir = path_parts[0]
-            if root_dir != user_oid:
-                logger.warning(f"User {user_oid} does not have permission to access {blob_path}")
-                return None
-
-            # Get the directory client for the full path except the filename
-            directory_path = "/".join(path_parts[:-1])
-            filename = path_parts[-1]
+        user_path = self._user_file_path(blob_path, user_oid)
+        if user_path is None:
+            return None
+        directory_path, filename = user_path
 
         try:
             user_directory_client = await self._ensure_directory(directory_path=directory_path, user_oid=user_oid)
@@ -311,6 +350,56 @@ class AdlsBlobManager(BaseBlobManager):
             logging.error(f"Error accessing directory {directory_path}: {str(e)}")
             return None
 
+    async def open_blob(
+        self,
+        blob_path: str,
+        user_oid: Optional[str] = None,
+        offset: Optional[int] = None,
+        length: Optional[int] = None,
+    ) -> Optional[BlobDownload]:
+        if user_oid is None:
+            logger.warning("user_oid must be provided for Data Lake Storage operations.")
+            return None
+        user_path = self._user_file_path(blob_path, user_oid)
+        if user_path is None:
+            return None
+        directory_path, filename = user_path
+
+        try:
+            user_directory_client = await self._ensure_directory(directory_path=directory_path, user_oid=user_oid)
+            file_client = user_directory_client.get_file_client(filename)
+            downloader = await file_client.download_file(offset=offset, length=length)
+        except ResourceNotFoundError:
+            logger.warning(f"Directory or file not found: {directory_path}/{filename}")
+            return None
+        content_settings = downloader.properties.content_settings
+        return BlobDownload(
+            chunks=downloader.chunks(),
+            content_type=(content_settings and content_settings.content_type) or "application/octet-stream",
+            etag=downloader.properties.etag,
+            offset=offset or 0,
+            length=downloader.size,
+            # Data Lake downloads don't report the size of the whole file for byte ranges
+            size=downloader.size if offset is None and length is None else None,
+        )
+
+    def _user_file_path(self, blob_path: str, user_oid: str) -> Optional[tuple[str, str]]:
+        """
+        Get the directory path and file name of a file in the user's directory,
+        or None if the path is in another user's directory
+        """
+        path_parts = blob_path.split("/")
+        if len(path_parts) < 2:
+            # If no slashes in path, we assume it's a file in the user's root directory
+            return user_oid, blob_path
+        # First verify that the root directory matches the user_oid
+        root_dir = path_parts[0]
+        if root_dir != user_oid:
+            logger.warning(f"User {user_oid} does not have permission to access {blob_path}")
+            return None
+        # Get the directory client for the full path except the filename
+        return "/".join(path_parts[:-1]), path_parts[-1]
+
     async def remove_blob(self, filename: str, user_oid: str) -> None:
         """
         Deletes a file from the user's directory in ADLS and any associated image directories.
@@ -406,8 +495,13 @@ class BlobManager(BaseBlobManager):
         self.resource_group = resource_group
         self.subscription_id = subscription_id
         self.image_container = image_container
+        # Downloads fetch at most 4MB per request, so that content can be streamed without buffering whole blobs
         self.blob_service_client = BlobServiceClient(
-            account_url=self.endpoint, credential=self.credential, max_single_put_size=4 * 1024 * 1024
+            account_url=self.endpoint,
+            credential=self.credential,
+            max_single_put_size=4 * 1024 * 1024,
+            max_single_get_size=4 * 1024 * 1024,
+            max_chunk_get_size=4 * 1024 * 1024,
         )
 
     async def close_clients(self):
@@ -480,13 +574,12 @@ class BlobManager(BaseBlobManager):
             raise ValueError(
                 "user_oid is not supported for BlobManager. Use AdlsBlobManager for user-specific operations."
             )
-        container_client = self.blob_service_client.get_container_client(self.container)
-        if not await container_client.exists():
-            return None
         if len(blob_path) == 0:
             logger.warning("Blob path is empty")
             return None
 
+        # A missing container is reported by the download itself, which saves checking that it exists first
+        container_client = self.blob_service_client.get_container_client(self.container)
         blob_client = container_client.get_blob_client(blob_path)
         try:
             download_response = await blob_client.download_blob()
@@ -517,6 +610,41 @@ class BlobManager(BaseBlobManager):
             logger.warning("Blob not found: %s", blob_path)
             return None
 
+    async def open_blob(
+        self,
+        blob_path: str,
+        user_oid: Optional[str] = None,
+        offset: Optional[int] = None,
+        length: Optional[int] = None,
+    ) -> Optional[BlobDownload]:
+        if user_oid is not None:
+            raise ValueError(
+                "user_oid is not supported for BlobManager. Use AdlsBlobManager for user-specific operations."
+            )
+        if len(blob_path) == 0:
+            logger.warning("Blob path is empty")
+            return None
+
+        container_client = self.blob_service_client.get_container_client(self.container)
+        blob_client = container_client.get_blob_client(blob_path)
+        try:
+            downloader = await blob_client.download_blob(offset=offset, length=length)
+        except ResourceNotFoundError:
+            logger.warning("Blob not found: %s", blob_path)
+            return None
+        content_settings = downloader.properties.content_settings
+        size = parse_content_range_size(downloader.properties.content_range)
+        if size is None and offset is None and length is None:
+            size = downloader.size
+        return BlobDownload(
+            chunks=downloader.chunks(),
+            content_type=(content_settings and content_settings.content_type) or "application/octet-stream",
+            etag=downloader.properties.etag,
+            offset=offset or 0,
+            length=downloader.size,
+            size=size,
+        )
+
     async def remove_blob(self, path: Optional[str] = None):
         container_client = self.blob_service_client.get_container_client(self.container)
         if not await container_client.exists():
@@ -0,0 +1,92 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import shutil
+import tempfile
+from collections import deque
+from collections.abc import AsyncGenerator, Callable, Iterable
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import IO, Any, Optional, TypeVar
+
+logger = logging.getLogger("scripts")
+
+T = TypeVar("T")
+
+
+class CpuWorkExecutor:
+    """
+    Runs CPU-bound parsing and splitting work in a pool of worker processes, so that it neither blocks
+    the event loop nor holds the GIL while other files are being embedded or other requests served.
+    The processes are started on first use. Functions and arguments must be picklable,
+    so functions are defined at module level and file content is passed as a path or bytes.
+    """
+
+    def __init__(self, max_workers: Optional[int] = None):
+        self.max_workers = max_workers or min(os.cpu_count() or 1, 4)
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    @property
+    def pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            logger.info("Starting %d processes for parsing and splitting files", self.max_workers)
+            # Forking a process with running threads and an event loop isn't safe, so workers are spawned
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.max_workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._pool
+
+    async def run(self, func: Callable[..., T], *args: Any) -> T:
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.pool, func, *args)
+        except BrokenProcessPool:
+            # A worker died, for example out of memory on a huge file, so the next call starts a new pool
+            self.shutdown(wait=False)
+            raise
+
+    async def run_in_order(
+        self, func: Callable[..., T], argument_batches: Iterable[tuple], max_pending: Optional[int] = None
+    ) -> AsyncGenerator[T, None]:
+        """
+        Run a function on each batch of arguments, several batches at a time,
+        yielding each result in order as soon as it and the results before it are ready
+        """
+        max_pending = max_pending or self.max_workers * 2
+        pending: deque[asyncio.Task[T]] = deque()
+        batches = iter(argument_batches)
+        try:
+            while True:
+                while len(pending) < max_pending and (args := next(batches, None)) is not None:
+                    pending.append(asyncio.create_task(self.run(func, *args)))
+                if not pending:
+                    return
+                yield await pending.popleft()
+        finally:
+            # The consumer stopped early or a batch failed, so the batches not yet yielded are abandoned
+            for task in pending:
+                task.cancel()
+
+    def shutdown(self, wait: bool = True):
+        if self._pool is not None:
+            self._pool.shutdown(wait=wait, cancel_futures=True)
+            self._pool = None
+
+
+async def run_cpu_bound(executor: Optional[CpuWorkExecutor], func: Callable[..., T], *args: Any) -> T:
+    """
+    Run CPU-bound work in the executor's processes, or in the calling thread when there is no executor
+    """
+    if executor is None:
+        return func(*args)
+    return await executor.run(func, *args)
+
+
+def spool_to_temporary_file(content: IO, suffix: str = "") -> str:
+    """
+    Copy file content to a temporary file that worker processes can read, returning its path
+    """
+    content.seek(0)
+    with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as file:
+        shutil.copyfileobj(content, file)
+    return file.name
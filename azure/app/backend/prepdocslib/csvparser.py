@@ -1,32 +1,29 @@
 import csv
 from collections.abc import AsyncGenerator
-from typing import IO
+from typing import IO, Optional
 
 from .page import Page
 from .parser import Parser
+from .recordgrouper import RecordGrouper, text_stream
 
 
 class CsvParser(Parser):
     """
-    Concrete parser that can parse CSV into Page objects. Each row becomes a Page object.
+    Concrete parser that can parse CSV into Page objects. Rows are read as the file is decoded,
+    and each row becomes a Page object unless rows are grouped by number or by tokens.
     """
 
-    async def parse(self, content: IO) -> AsyncGenerator[Page, None]:
-        # Check if content is in bytes (binary file) and decode to string
-        content_str: str
-        if isinstance(content, (bytes, bytearray)):
-            content_str = content.decode("utf-8")
-        elif hasattr(content, "read"):  # Handle BufferedReader
-            content_str = content.read().decode("utf-8")
-
-        # Create a CSV reader from the text content
-        reader = csv.reader(content_str.splitlines())
-        offset = 0
+    def __init__(self, rows_per_page: int = 1, max_tokens_per_page: Optional[int] = None):
+        self.grouper = RecordGrouper(records_per_page=rows_per_page, max_tokens_per_page=max_tokens_per_page)
 
-        # Skip the header row
-        next(reader, None)
-
-        for i, row in enumerate(reader):
-            page_text = ",".join(row)
-            yield Page(i, offset, page_text)
-            offset += len(page_text) + 1  # Account for newline character
+    async def parse(self, content: IO) -> AsyncGenerator[Page, None]:
+        stream, wrapper = text_stream(content)
+        try:
+            reader = csv.reader(stream)
+            # Skip the header row
+            next(reader, None)
+            for page in self.grouper.group(",".join(row) for row in reader):
+                yield page
+        finally:
+            if wrapper is not None:
+                wrapper.detach()
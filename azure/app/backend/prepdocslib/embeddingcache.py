@@ -0,0 +1,44 @@
+import hashlib
+import json
+import sqlite3
+from typing import Optional
+
+
+class EmbeddingCache:
+    """
+    Content-addressed store of computed embeddings, keyed by a hash of the model, dimensions and text,
+    so that re-ingesting unchanged text doesn't call the embeddings API again.
+    Embeddings are kept in a SQLite file when a path is given, otherwise only in memory.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or ":memory:"
+        self.connection = sqlite3.connect(self.path)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, embedding TEXT NOT NULL)")
+        self.connection.commit()
+
+    @staticmethod
+    def key(model: str, dimensions: Optional[int], text: str) -> str:
+        return hashlib.sha256(f"{model}\n{dimensions or ''}\n{text}".encode()).hexdigest()
+
+    def get_many(self, keys: list[str]) -> dict[str, list[float]]:
+        embeddings: dict[str, list[float]] = {}
+        unique_keys = list(dict.fromkeys(keys))
+        # Stay below SQLite's limit on the number of query parameters
+        for start in range(0, len(unique_keys), 500):
+            chunk = unique_keys[start : start + 500]
+            rows = self.connection.execute(
+                f"SELECT key, embedding FROM embeddings WHERE key IN ({','.join('?' * len(chunk))})", chunk
+            )
+            embeddings.update((key, json.loads(embedding)) for key, embedding in rows)
+        return embeddings
+
+    def set_many(self, embeddings: dict[str, list[float]]):
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO embeddings (key, embedding) VALUES (?, ?)",
+            [(key, json.dumps(embedding)) for key, embedding in embeddings.items()],
+        )
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
@@ -1,10 +1,13 @@
+import asyncio
 import logging
+import re
+import time
 from abc import ABC
-from collections.abc import Awaitable, Callable
+from collections.abc import Awaitable, Callable, Coroutine, Mapping
+from typing import Any, Optional, TypeVar
 from urllib.parse import urljoin
 
 import aiohttp
-import tiktoken
 from openai import AsyncOpenAI, RateLimitError
 from tenacity import (
     AsyncRetrying,
@@ -14,8 +17,27 @@ from tenacity import (
 )
 from typing_extensions import TypedDict
 
+from .embeddingcache import EmbeddingCache
+from .tokenizer import get_encoding
+
 logger = logging.getLogger("scripts")
 
+T = TypeVar("T")
+
+
+async def gather_or_cancel(*coroutines: Coroutine[Any, Any, T]) -> list[T]:
+    """
+    Like asyncio.gather, but cancels the other coroutines as soon as one of them fails,
+    so that no more requests are sent for a file that already failed
+    """
+    tasks = [asyncio.create_task(coroutine) for coroutine in coroutines]
+    try:
+        return list(await asyncio.gather(*tasks))
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
 
 class EmbeddingBatch:
     """Represents a batch of text that is going to be embedded."""
@@ -29,6 +51,106 @@ class ExtraArgs(TypedDict, total=False):
     dimensions: int
 
 
+class TokenBudget:
+    """
+    Token bucket shared by concurrent calls, refilled continuously up to a per-minute budget
+    """
+
+    def __init__(self, tokens_per_minute: int):
+        self.capacity = tokens_per_minute
+        self.tokens = float(tokens_per_minute)
+        self.refill_per_second = tokens_per_minute / 60
+        self.updated_at = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.refill_per_second)
+        self.updated_at = now
+
+    def limit_to(self, tokens: float):
+        """Lower the available tokens, e.g. to what the service reports as remaining"""
+        self._refill()
+        self.tokens = min(self.tokens, tokens)
+
+    async def acquire(self, tokens: int) -> float:
+        """Wait until the budget allows spending the given tokens, returning the seconds waited"""
+        # A request larger than the whole budget waits for a full bucket instead of forever
+        tokens = min(tokens, self.capacity)
+        waited = 0.0
+        async with self.lock:
+            while True:
+                self._refill()
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return waited
+                delay = (tokens - self.tokens) / self.refill_per_second
+                waited += delay
+                await asyncio.sleep(delay)
+
+
+class EmbeddingRateLimiter:
+    """
+    Tokens-per-minute and requests-per-minute budget shared by all requests of an embeddings client.
+    The budget is kept in sync with the rate-limit headers of the responses: remaining tokens and requests
+    lower the local budget, and retry-after or an exhausted limit pauses every request until the reset.
+    """
+
+    def __init__(self, tokens_per_minute: Optional[int] = None, requests_per_minute: Optional[int] = None):
+        self.token_budget = TokenBudget(tokens_per_minute) if tokens_per_minute else None
+        self.request_budget = TokenBudget(requests_per_minute) if requests_per_minute else None
+        self.paused_until = 0.0
+        self.waited_seconds = 0.0
+
+    async def acquire(self, tokens: int) -> float:
+        """Wait until a request with the given tokens is within budget, returning the seconds waited"""
+        waited = 0.0
+        while (delay := self.paused_until - time.monotonic()) > 0:
+            await asyncio.sleep(delay)
+            waited += delay
+        if self.request_budget:
+            waited += await self.request_budget.acquire(1)
+        if self.token_budget:
+            waited += await self.token_budget.acquire(tokens)
+        self.waited_seconds += waited
+        return waited
+
+    def update_from_headers(self, headers: Mapping[str, str]):
+        for budget, name in ((self.token_budget, "tokens"), (self.request_budget, "requests")):
+            remaining = _parse_number(headers.get(f"x-ratelimit-remaining-{name}"))
+            if remaining is None:
+                continue
+            if budget:
+                budget.limit_to(remaining)
+            if remaining <= 0:
+                self.pause(_parse_duration(headers.get(f"x-ratelimit-reset-{name}")) or 1.0)
+        retry_after_ms = _parse_number(headers.get("retry-after-ms"))
+        retry_after = retry_after_ms / 1000 if retry_after_ms is not None else _parse_number(headers.get("retry-after"))
+        if retry_after:
+            self.pause(retry_after)
+
+    def pause(self, seconds: float):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+def _parse_number(value: Optional[str]) -> Optional[float]:
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def _parse_duration(value: Optional[str]) -> Optional[float]:
+    """Parse reset durations such as '6m0s', '1.5s' or '20ms' into seconds"""
+    if not value:
+        return None
+    if (seconds := _parse_number(value)) is not None:
+        return seconds
+    units = {"h": 3600, "m": 60, "s": 1, "ms": 0.001}
+    parts = re.findall(r"(\d+(?:\.\d+)?)(ms|h|m|s)", value)
+    return sum(float(amount) * units[unit] for amount, unit in parts) if parts else None
+
+
 class OpenAIEmbeddings(ABC):
     """Client wrapper that handles batching, retries, and token accounting."""
 
@@ -52,6 +174,9 @@ class OpenAIEmbeddings(ABC):
         disable_batch: bool = False,
         azure_deployment_name: str | None = None,
         azure_endpoint: str | None = None,
+        max_concurrent_requests: int = 4,
+        rate_limiter: Optional[EmbeddingRateLimiter] = None,
+        cache: Optional[EmbeddingCache] = None,
     ):
         self.open_ai_client = open_ai_client
         self.open_ai_model_name = open_ai_model_name
@@ -59,6 +184,10 @@ class OpenAIEmbeddings(ABC):
         self.disable_batch = disable_batch
         self.azure_deployment_name = azure_deployment_name
         self.azure_endpoint = azure_endpoint.rstrip("/") if azure_endpoint else None
+        self.max_concurrent_requests = max_concurrent_requests
+        self.rate_limiter = rate_limiter
+        self.cache = cache
+        self._request_semaphore = asyncio.Semaphore(max_concurrent_requests)
 
     @property
     def _api_model(self) -> str:
@@ -68,8 +197,7 @@ class OpenAIEmbeddings(ABC):
         logger.info("Rate limited on the OpenAI embeddings API, sleeping before retrying...")
 
     def calculate_token_length(self, text: str):
-        encoding = tiktoken.encoding_for_model(self.open_ai_model_name)
-        return len(encoding.encode(text))
+        return len(get_encoding(self.open_ai_model_name).encode(text))
 
     def split_text_into_batches(self, texts: list[str]) -> list[EmbeddingBatch]:
         batch_info = OpenAIEmbeddings.SUPPORTED_BATCH_MODEL.get(self.open_ai_model_name)
@@ -104,8 +232,27 @@ class OpenAIEmbeddings(ABC):
 
     async def create_embedding_batch(self, texts: list[str], dimensions_args: ExtraArgs) -> list[list[float]]:
         batches = self.split_text_into_batches(texts)
-        embeddings = []
-        for batch in batches:
+        # Batches are sent concurrently (bounded by max_concurrent_requests), gather keeps them in order
+        batch_embeddings = await gather_or_cancel(*(self._embed_batch(batch, dimensions_args) for batch in batches))
+        return [embedding for embeddings in batch_embeddings for embedding in embeddings]
+
+    async def _embed_batch(self, batch: EmbeddingBatch, dimensions_args: ExtraArgs) -> list[list[float]]:
+        emb_response = await self._request_embeddings(batch.texts, batch.token_length, dimensions_args)
+        logger.info(
+            "Computed embeddings in batch. Batch size: %d, Token count: %d",
+            len(batch.texts),
+            batch.token_length,
+        )
+        return [data.embedding for data in emb_response.data]
+
+    async def create_embedding_single(self, text: str, dimensions_args: ExtraArgs) -> list[float]:
+        token_length = self.calculate_token_length(text) if self.rate_limiter else 0
+        emb_response = await self._request_embeddings(text, token_length, dimensions_args)
+        logger.info("Computed embedding for text section. Character count: %d", len(text))
+        return emb_response.data[0].embedding
+
+    async def _request_embeddings(self, input: str | list[str], token_length: int, dimensions_args: ExtraArgs):
+        async with self._request_semaphore:
             async for attempt in AsyncRetrying(
                 retry=retry_if_exception_type(RateLimitError),
                 wait=wait_random_exponential(min=15, max=60),
@@ -113,32 +260,27 @@ class OpenAIEmbeddings(ABC):
                 before_sleep=self.before_retry_sleep,
             ):
                 with attempt:
-                    emb_response = await self.open_ai_client.embeddings.create(
-                        model=self._api_model, input=batch.texts, **dimensions_args
-                    )
-                    embeddings.extend([data.embedding for data in emb_response.data])
-                    logger.info(
-                        "Computed embeddings in batch. Batch size: %d, Token count: %d",
-                        len(batch.texts),
-                        batch.token_length,
-                    )
-
-        return embeddings
-
-    async def create_embedding_single(self, text: str, dimensions_args: ExtraArgs) -> list[float]:
-        async for attempt in AsyncRetrying(
-            retry=retry_if_exception_type(RateLimitError),
-            wait=wait_random_exponential(min=15, max=60),
-            stop=stop_after_attempt(15),
-            before_sleep=self.before_retry_sleep,
-        ):
-            with attempt:
-                emb_response = await self.open_ai_client.embeddings.create(
-                    model=self._api_model, input=text, **dimensions_args
+                    if self.rate_limiter:
+                        await self.rate_limiter.acquire(token_length)
+                    return await self._send_request(input, dimensions_args)
+        raise RuntimeError("Failed to compute embeddings after multiple retries.")
+
+    async def _send_request(self, input: str | list[str], dimensions_args: ExtraArgs):
+        if self.rate_limiter is None:
+            return await self.open_ai_client.embeddings.create(model=self._api_model, input=input, **dimensions_args)
+        # The raw response exposes the rate-limit headers, clients without it are only budgeted locally
+        raw_embeddings = getattr(self.open_ai_client.embeddings, "with_raw_response", None)
+        try:
+            if raw_embeddings is None:
+                return await self.open_ai_client.embeddings.create(
+                    model=self._api_model, input=input, **dimensions_args
                 )
-                logger.info("Computed embedding for text section. Character count: %d", len(text))
-
-        return emb_response.data[0].embedding
+            raw_response = await raw_embeddings.create(model=self._api_model, input=input, **dimensions_args)
+        except RateLimitError as e:
+            self.rate_limiter.update_from_headers(e.response.headers)
+            raise
+        self.rate_limiter.update_from_headers(raw_response.headers)
+        return raw_response.parse()
 
     async def create_embeddings(self, texts: list[str]) -> list[list[float]]:
 
@@ -148,10 +290,26 @@ class OpenAIEmbeddings(ABC):
             else {}
         )
 
+        if self.cache is None:
+            return await self._compute_embeddings(texts, dimensions_args)
+
+        # Only embed texts that aren't cached yet, each distinct text once
+        dimensions = dimensions_args.get("dimensions")
+        keys = [EmbeddingCache.key(self.open_ai_model_name, dimensions, text) for text in texts]
+        embeddings = self.cache.get_many(keys)
+        missing = {key: text for key, text in zip(keys, texts) if key not in embeddings}
+        if missing:
+            computed = dict(zip(missing, await self._compute_embeddings(list(missing.values()), dimensions_args)))
+            self.cache.set_many(computed)
+            embeddings.update(computed)
+        logger.info("Embedding cache: %d of %d texts already embedded", len(texts) - len(missing), len(texts))
+        return [embeddings[key] for key in keys]
+
+    async def _compute_embeddings(self, texts: list[str], dimensions_args: ExtraArgs) -> list[list[float]]:
         if not self.disable_batch and self.open_ai_model_name in OpenAIEmbeddings.SUPPORTED_BATCH_MODEL:
             return await self.create_embedding_batch(texts, dimensions_args)
 
-        return [await self.create_embedding_single(text, dimensions_args) for text in texts]
+        return await gather_or_cancel(*(self.create_embedding_single(text, dimensions_args) for text in texts))
 
 
 class ImageEmbeddings:
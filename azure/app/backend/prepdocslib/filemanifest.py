@@ -0,0 +1,50 @@
+import sqlite3
+from dataclasses import dataclass
+from typing import Optional
+
+
+@dataclass(frozen=True)
+class FileState:
+    path: str
+    size: int
+    mtime_ns: int
+    md5: str
+
+
+class FileManifest:
+    """
+    Size, modification time and MD5 hash of each local file listed for ingestion, keyed by path,
+    so that unchanged files can be recognized without reading them again.
+    States are kept in a SQLite file when a path is given, otherwise only in memory.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or ":memory:"
+        self.connection = sqlite3.connect(self.path)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS files "
+            "(path TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, md5 TEXT NOT NULL)"
+        )
+        self.connection.commit()
+
+    def get_many(self, paths: list[str]) -> dict[str, FileState]:
+        states: dict[str, FileState] = {}
+        unique_paths = list(dict.fromkeys(paths))
+        # Stay below SQLite's limit on the number of query parameters
+        for start in range(0, len(unique_paths), 500):
+            chunk = unique_paths[start : start + 500]
+            rows = self.connection.execute(
+                f"SELECT path, size, mtime_ns, md5 FROM files WHERE path IN ({','.join('?' * len(chunk))})", chunk
+            )
+            states.update((row[0], FileState(*row)) for row in rows)
+        return states
+
+    def set_many(self, states: list[FileState]):
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO files (path, size, mtime_ns, md5) VALUES (?, ?, ?, ?)",
+            [(state.path, state.size, state.mtime_ns, state.md5) for state in states],
+        )
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
@@ -1,5 +1,7 @@
 from dataclasses import dataclass
+from typing import Optional
 
+from .cpuexecutor import CpuWorkExecutor
 from .parser import Parser
 from .textsplitter import TextSplitter
 
@@ -8,3 +10,5 @@ from .textsplitter import TextSplitter
 class FileProcessor:
     parser: Parser
     splitter: TextSplitter
+    # Splits the parsed pages in worker processes when set, rather than on the event loop
+    executor: Optional[CpuWorkExecutor] = None
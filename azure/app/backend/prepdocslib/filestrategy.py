@@ -1,19 +1,47 @@
+import asyncio
 import logging
+from collections.abc import Callable
 from typing import Optional
 
 from azure.core.credentials import AzureKeyCredential
 
 from .blobmanager import AdlsBlobManager, BaseBlobManager, BlobManager
+from .cpuexecutor import run_cpu_bound
 from .embeddings import ImageEmbeddings, OpenAIEmbeddings
 from .fileprocessor import FileProcessor
+from .ingestionpipeline import (
+    ConcurrentIngestionPipeline,
+    IngestionConcurrency,
+    IngestionReport,
+)
 from .listfilestrategy import File, ListFileStrategy
 from .mediadescriber import ContentUnderstandingDescriber
+from .page import ImageOnPage, Page
 from .searchmanager import SearchManager, Section
 from .strategy import DocumentAction, SearchInfo, Strategy
+from .textsplitter import split_pages
 
 logger = logging.getLogger("scripts")
 
 
+async def process_image(
+    file: File,
+    image: ImageOnPage,
+    blob_manager: BaseBlobManager,
+    image_embeddings_client: Optional[ImageEmbeddings],
+    user_oid: Optional[str] = None,
+):
+    """
+    Uploads an image of a file and then embeds it, unless no image embeddings client is given
+    """
+    if image.url is None:
+        image.url = await blob_manager.upload_document_image(
+            file.filename(), image.bytes, image.filename, image.page_num, user_oid=user_oid
+        )
+    if image_embeddings_client:
+        image.embedding = await image_embeddings_client.create_embedding_for_image(image.bytes)
+
+
 async def parse_file(
     file: File,
     file_processors: dict[str, FileProcessor],
@@ -21,26 +49,49 @@ async def parse_file(
     blob_manager: Optional[BaseBlobManager] = None,
     image_embeddings_client: Optional[ImageEmbeddings] = None,
     user_oid: Optional[str] = None,
+    max_concurrent_images: int = 4,
+    embed_images: bool = True,
 ) -> list[Section]:
+    """
+    Parses a file into sections, uploading the images of its pages as they are parsed.
+    With embed_images=False the images are only uploaded, so that the search manager can
+    embed just the images of the sections that are new or changed since the file was last indexed.
+    """
     key = file.file_extension().lower()
     processor = file_processors.get(key)
     if processor is None:
         logger.info("Skipping '%s', no parser found.", file.filename())
         return []
     logger.info("Ingesting '%s'", file.filename())
-    pages = [page async for page in processor.parser.parse(content=file.content)]
-    for page in pages:
-        for image in page.images:
+    semaphore = asyncio.Semaphore(max_concurrent_images)
+
+    async def process_image_limited(image: ImageOnPage, blob_manager: BaseBlobManager):
+        async with semaphore:
+            await process_image(file, image, blob_manager, image_embeddings_client if embed_images else None, user_oid)
+
+    pages: list[Page] = []
+    image_tasks: list[asyncio.Task[None]] = []
+    try:
+        async for page in processor.parser.parse(content=file.content):
+            pages.append(page)
+            if not page.images:
+                continue
             if not blob_manager or not image_embeddings_client:
                 raise ValueError("BlobManager and ImageEmbeddingsClient must be provided to parse images in the file.")
-            if image.url is None:
-                image.url = await blob_manager.upload_document_image(
-                    file.filename(), image.bytes, image.filename, image.page_num, user_oid=user_oid
-                )
-            if image_embeddings_client:
-                image.embedding = await image_embeddings_client.create_embedding_for_image(image.bytes)
+            # Upload (and embed) the images of each page as soon as it is parsed,
+            # while the figures of later pages are still being described
+            image_tasks.extend(asyncio.create_task(process_image_limited(image, blob_manager)) for image in page.images)
+        await asyncio.gather(*image_tasks)
+    finally:
+        # Don't leave images being uploaded if parsing or another image failed
+        for task in image_tasks:
+            task.cancel()
+        await asyncio.gather(*image_tasks, return_exceptions=True)
     logger.info("Splitting '%s' into sections", file.filename())
-    sections = [Section(chunk, content=file, category=category) for chunk in processor.splitter.split_pages(pages)]
+    # Images aren't needed for splitting, so they aren't copied to the worker processes
+    text_pages = [Page(page.page_num, page.offset, page.text) for page in pages]
+    chunks = await run_cpu_bound(processor.executor, split_pages, processor.splitter, text_pages)
+    sections = [Section(chunk, content=file, category=category) for chunk in chunks]
     # For now, add the images back to each split chunk based off chunk.page_num
     for section in sections:
         section.chunk.images = [
@@ -70,6 +121,7 @@ class FileStrategy(Strategy):
         use_content_understanding: bool = False,
         content_understanding_endpoint: Optional[str] = None,
         enforce_access_control: bool = False,
+        concurrency: Optional[IngestionConcurrency] = None,
     ):
         self.list_file_strategy = list_file_strategy
         self.blob_manager = blob_manager
@@ -85,6 +137,8 @@ class FileStrategy(Strategy):
         self.use_content_understanding = use_content_understanding
         self.content_understanding_endpoint = content_understanding_endpoint
         self.enforce_access_control = enforce_access_control
+        self.concurrency = concurrency
+        self.last_report: Optional[IngestionReport] = None
 
     def setup_search_manager(self):
         self.search_manager = SearchManager(
@@ -96,6 +150,7 @@ class FileStrategy(Strategy):
             field_name_embedding=self.search_field_name_embedding,
             search_images=self.image_embeddings is not None,
             enforce_access_control=self.enforce_access_control,
+            image_embeddings=self.image_embeddings,
         )
 
     async def setup(self):
@@ -114,19 +169,43 @@ class FileStrategy(Strategy):
 
     async def run(self):
         self.setup_search_manager()
-        if self.document_action == DocumentAction.Add:
+        if self.document_action == DocumentAction.Add and self.concurrency:
+            pipeline = ConcurrentIngestionPipeline(
+                list_file_strategy=self.list_file_strategy,
+                blob_manager=self.blob_manager,
+                search_manager=self.search_manager,
+                parse=lambda file: parse_file(
+                    file,
+                    self.file_processors,
+                    self.category,
+                    self.blob_manager,
+                    self.image_embeddings,
+                    embed_images=False,
+                ),
+                concurrency=self.concurrency,
+            )
+            self.last_report = await pipeline.run()
+        elif self.document_action == DocumentAction.Add:
+            added = kept = removed = 0
             files = self.list_file_strategy.list()
             async for file in files:
                 try:
                     await self.blob_manager.upload_blob(file)
                     sections = await parse_file(
-                        file, self.file_processors, self.category, self.blob_manager, self.image_embeddings
+                        file,
+                        self.file_processors,
+                        self.category,
+                        self.blob_manager,
+                        self.image_embeddings,
+                        embed_images=False,
                     )
                     if sections:
-                        await self.search_manager.update_content(sections, url=file.url)
+                        update = await self.search_manager.update_content(sections, url=file.url)
+                        added, kept, removed = added + update.added, kept + update.kept, removed + update.removed
                 finally:
                     if file:
                         file.close()
+            logger.info("Ingestion finished: %d sections added, %d kept, %d removed", added, kept, removed)
         elif self.document_action == DocumentAction.Remove:
             paths = self.list_file_strategy.list_paths()
             async for path in paths:
@@ -166,14 +245,25 @@ class UploadUserFileStrategy:
             field_name_embedding=search_field_name_embedding,
             search_images=False,
             enforce_access_control=enforce_access_control,
+            image_embeddings=self.image_embeddings,
         )
         self.search_field_name_embedding = search_field_name_embedding
 
-    async def add_file(self, file: File, user_oid: str):
+    async def add_file(self, file: File, user_oid: str, on_progress: Optional[Callable[[str], None]] = None):
+        if on_progress:
+            on_progress("parsing")
         sections = await parse_file(
-            file, self.file_processors, None, self.blob_manager, self.image_embeddings, user_oid=user_oid
+            file,
+            self.file_processors,
+            None,
+            self.blob_manager,
+            self.image_embeddings,
+            user_oid=user_oid,
+            embed_images=False,
         )
         if sections:
+            if on_progress:
+                on_progress("indexing")
             await self.search_manager.update_content(sections, url=file.url)
 
     async def remove_file(self, filename: str, oid: str):
@@ -1,10 +1,11 @@
 import logging
 import re
 from collections.abc import AsyncGenerator
-from typing import IO
+from typing import IO, Optional
 
 from bs4 import BeautifulSoup
 
+from .cpuexecutor import CpuWorkExecutor, run_cpu_bound
 from .page import Page
 from .parser import Parser
 
@@ -28,9 +29,18 @@ def cleanup_data(data: str) -> str:
     return output.strip()
 
 
+def extract_html_text(data: bytes | str) -> str:
+    soup = BeautifulSoup(data, "html.parser")
+    # Get text only from html file
+    return cleanup_data(soup.get_text())
+
+
 class LocalHTMLParser(Parser):
     """Parses HTML text into Page objects."""
 
+    def __init__(self, executor: Optional[CpuWorkExecutor] = None):
+        self.executor = executor
+
     async def parse(self, content: IO) -> AsyncGenerator[Page, None]:
         """Parses the given content.
         To learn more, please visit https://pypi.org/project/beautifulsoup4/
@@ -42,9 +52,5 @@ class LocalHTMLParser(Parser):
         logger.info("Extracting text from '%s' using local HTML parser (BeautifulSoup)", content.name)
 
         data = content.read()
-        soup = BeautifulSoup(data, "html.parser")
-
-        # Get text only from html file
-        result = soup.get_text()
-
-        yield Page(0, 0, text=cleanup_data(result))
+        text = await run_cpu_bound(self.executor, extract_html_text, data)
+        yield Page(0, 0, text=text)
@@ -0,0 +1,170 @@
+import asyncio
+import json
+import logging
+import time
+from collections.abc import Awaitable, Callable
+from typing import Any
+
+from azure.search.documents.aio import SearchClient
+
+logger = logging.getLogger("scripts")
+
+# Azure AI Search rejects requests over 16 MB, so batches stay well below that
+DEFAULT_MAX_BATCH_BYTES = 8 * 1024 * 1024
+# Azure AI Search accepts up to 32000 documents per request, fewer is friendlier to indexing
+DEFAULT_MAX_BATCH_DOCUMENTS = 1000
+# Statuses of documents that may be indexed when sent again, see
+# https://learn.microsoft.com/rest/api/searchservice/addupdate-or-delete-documents#response
+RETRIABLE_STATUS_CODES = {409, 422, 429, 500, 503}
+
+
+class IndexingError(Exception):
+    """
+    Raised when some documents of a batch could not be indexed or deleted
+    """
+
+    def __init__(self, message: str, failed_keys: list[str]):
+        super().__init__(message)
+        self.failed_keys = failed_keys
+
+
+def document_size(document: dict) -> int:
+    return len(json.dumps(document, default=str).encode("utf-8"))
+
+
+async def index_with_retries(
+    send: Callable[[list[dict]], Awaitable[Any]],
+    documents: list[dict],
+    max_attempts: int = 3,
+    retry_delay: float = 1.0,
+) -> int:
+    """
+    Send a batch of documents to the index, then send again only the documents that failed with a retriable status,
+    backing off between attempts. Returns the number of documents that were sent again.
+    """
+    retried = 0
+    pending = documents
+    for attempt in range(max_attempts):
+        results = await send(pending)
+        failed = {result.key: result for result in results or [] if not result.succeeded}
+        if not failed:
+            return retried
+        not_retriable = [key for key, result in failed.items() if result.status_code not in RETRIABLE_STATUS_CODES]
+        if not_retriable or attempt == max_attempts - 1:
+            failed_keys = not_retriable or list(failed)
+            first_error = failed[failed_keys[0]].error_message
+            raise IndexingError(f"{len(failed_keys)} documents could not be indexed: {first_error}", failed_keys)
+        logger.info("Retrying %d of %d documents that the index couldn't process", len(failed), len(pending))
+        pending = [document for document in pending if document["id"] in failed]
+        retried += len(pending)
+        await asyncio.sleep(retry_delay * 2**attempt)
+    return retried
+
+
+class SearchIndexWriter:
+    """
+    Writes documents to a search index in batches sized by their payload.
+    Uploads run in the background, so the caller can prepare the next documents, such as computing their embeddings,
+    while earlier batches are being uploaded. Deletes by id are sent in parallel batches.
+    Only the documents that fail in a batch are retried.
+    """
+
+    def __init__(
+        self,
+        search_client: SearchClient,
+        max_batch_bytes: int = DEFAULT_MAX_BATCH_BYTES,
+        max_batch_documents: int = DEFAULT_MAX_BATCH_DOCUMENTS,
+        max_concurrent_requests: int = 2,
+        max_attempts: int = 3,
+        retry_delay: float = 1.0,
+    ):
+        self.search_client = search_client
+        self.max_batch_bytes = max_batch_bytes
+        self.max_batch_documents = max_batch_documents
+        self.max_concurrent_requests = max_concurrent_requests
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.documents_uploaded = 0
+        self.documents_deleted = 0
+        self.documents_retried = 0
+        self.started_at = time.monotonic()
+        self._batch: list[dict] = []
+        self._batch_bytes = 0
+        self._uploads: set[asyncio.Task] = set()
+
+    async def add(self, documents: list[dict]):
+        """
+        Add documents to upload, starting the upload of each batch as soon as it is full
+        """
+        for document in documents:
+            size = document_size(document)
+            if self._batch and (
+                self._batch_bytes + size > self.max_batch_bytes or len(self._batch) >= self.max_batch_documents
+            ):
+                await self._start_upload(self._batch)
+                self._batch, self._batch_bytes = [], 0
+            self._batch.append(document)
+            self._batch_bytes += size
+
+    async def flush(self):
+        """
+        Upload the remaining documents and wait for all uploads to finish, raising the first upload error
+        """
+        if self._batch:
+            await self._start_upload(self._batch)
+            self._batch, self._batch_bytes = [], 0
+        uploads, self._uploads = self._uploads, set()
+        if uploads:
+            await self._wait(uploads, return_when=asyncio.ALL_COMPLETED)
+
+    async def cancel(self):
+        uploads, self._uploads = self._uploads, set()
+        for upload in uploads:
+            upload.cancel()
+        await asyncio.gather(*uploads, return_exceptions=True)
+        self._batch, self._batch_bytes = [], 0
+
+    async def delete(self, ids: list[str]):
+        semaphore = asyncio.Semaphore(self.max_concurrent_requests)
+
+        async def delete_batch(batch: list[str]):
+            async with semaphore:
+                await index_with_retries(
+                    self.search_client.delete_documents,
+                    [{"id": document_id} for document_id in batch],
+                    self.max_attempts,
+                    self.retry_delay,
+                )
+            self.documents_deleted += len(batch)
+
+        batches = [
+            ids[start : start + self.max_batch_documents] for start in range(0, len(ids), self.max_batch_documents)
+        ]
+        await asyncio.gather(*(delete_batch(batch) for batch in batches))
+
+    def documents_per_second(self) -> float:
+        elapsed = max(time.monotonic() - self.started_at, 1e-9)
+        return (self.documents_uploaded + self.documents_deleted) / elapsed
+
+    async def _start_upload(self, batch: list[dict]):
+        # Bound the batches in flight, which also bounds the memory held by documents waiting to be uploaded
+        while len(self._uploads) >= self.max_concurrent_requests:
+            self._uploads = await self._wait(self._uploads, return_when=asyncio.FIRST_COMPLETED)
+        self._uploads.add(asyncio.create_task(self._upload(batch)))
+
+    async def _upload(self, batch: list[dict]):
+        logger.info("Uploading batch of %d sections to search index", len(batch))
+        self.documents_retried += await index_with_retries(
+            self.search_client.upload_documents, batch, self.max_attempts, self.retry_delay
+        )
+        self.documents_uploaded += len(batch)
+
+    async def _wait(self, uploads: set[asyncio.Task], return_when: str) -> set[asyncio.Task]:
+        done, pending = await asyncio.wait(uploads, return_when=return_when)
+        for upload in done:
+            if (error := upload.exception()) is not None:
+                for other in pending:
+                    other.cancel()
+                await asyncio.gather(*pending, return_exceptions=True)
+                raise error
+        return pending
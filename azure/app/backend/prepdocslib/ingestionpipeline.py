@@ -0,0 +1,321 @@
+import asyncio
+import logging
+import time
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass, field
+from typing import Any, Optional
+
+from azure.search.documents.aio import SearchClient
+
+from .blobmanager import BlobManager
+from .indexwriter import SearchIndexWriter
+from .listfilestrategy import File, ListFileStrategy
+from .searchmanager import IndexUpdate, SearchManager, Section
+
+logger = logging.getLogger("scripts")
+
+
+@dataclass
+class IngestionConcurrency:
+    """
+    Per-stage concurrency settings for the concurrent ingestion pipeline
+    """
+
+    # Files being uploaded to blob storage and parsed at the same time
+    parse_workers: int = 4
+    # Files whose sections are being embedded at the same time
+    embed_workers: int = 2
+    # Documents sent to the search index per upload call
+    upload_batch_size: int = 500
+    # Seconds a partially filled upload batch may wait before it is sent anyway
+    upload_flush_interval: float = 5.0
+    # Parsed or listed files allowed to wait between stages, which bounds memory use
+    max_pending_files: int = 8
+    # Seconds between progress log lines
+    progress_interval: float = 30.0
+
+
+@dataclass
+class FileFailure:
+    filename: str
+    stage: str
+    error: str
+
+
+@dataclass
+class IngestionReport:
+    """
+    Progress and throughput of a concurrent ingestion run
+    """
+
+    files_listed: int = 0
+    files_parsed: int = 0
+    files_embedded: int = 0
+    files_indexed: int = 0
+    files_skipped: int = 0
+    sections_embedded: int = 0
+    sections_kept: int = 0
+    sections_removed: int = 0
+    documents_uploaded: int = 0
+    embedding_wait_seconds: float = 0.0
+    failures: list[FileFailure] = field(default_factory=list)
+    started_at: float = field(default_factory=time.monotonic)
+    finished_at: Optional[float] = None
+
+    @property
+    def elapsed_seconds(self) -> float:
+        return (self.finished_at or time.monotonic()) - self.started_at
+
+    def to_dict(self) -> dict[str, Any]:
+        elapsed = max(self.elapsed_seconds, 1e-9)
+        return {
+            "files_listed": self.files_listed,
+            "files_parsed": self.files_parsed,
+            "files_embedded": self.files_embedded,
+            "files_indexed": self.files_indexed,
+            "files_skipped": self.files_skipped,
+            "files_failed": len({failure.filename for failure in self.failures}),
+            "sections_embedded": self.sections_embedded,
+            "sections_kept": self.sections_kept,
+            "sections_removed": self.sections_removed,
+            "documents_uploaded": self.documents_uploaded,
+            "embedding_wait_seconds": round(self.embedding_wait_seconds, 2),
+            "elapsed_seconds": round(self.elapsed_seconds, 2),
+            "files_per_minute": round(self.files_indexed / elapsed * 60, 2),
+            "documents_per_second": round(self.documents_uploaded / elapsed, 2),
+            "failures": [
+                {"filename": failure.filename, "stage": failure.stage, "error": failure.error}
+                for failure in self.failures
+            ],
+        }
+
+    def summary(self) -> str:
+        stats = self.to_dict()
+        return (
+            f"{stats['files_indexed']}/{stats['files_listed']} files indexed "
+            f"({stats['files_parsed']} parsed, {stats['files_skipped']} skipped, {stats['files_failed']} failed), "
+            f"{stats['documents_uploaded']} sections added, {stats['sections_kept']} kept, "
+            f"{stats['sections_removed']} removed in {stats['elapsed_seconds']}s "
+            f"({stats['files_per_minute']} files/min, {stats['documents_per_second']} documents/s)"
+        )
+
+
+@dataclass
+class _PendingUpload:
+    file: File
+    update: IndexUpdate
+
+
+class ConcurrentIngestionPipeline:
+    """
+    Ingests files through three overlapping stages connected by bounded queues:
+    blob upload + parsing (several files at once), embedding of new or changed sections
+    and batched uploads to the search index, followed by deletion of stale sections.
+    A failure only affects the file it happened in.
+    """
+
+    def __init__(
+        self,
+        list_file_strategy: ListFileStrategy,
+        blob_manager: BlobManager,
+        search_manager: SearchManager,
+        parse: Callable[[File], Awaitable[list[Section]]],
+        concurrency: IngestionConcurrency,
+    ):
+        self.list_file_strategy = list_file_strategy
+        self.blob_manager = blob_manager
+        self.search_manager = search_manager
+        self.parse = parse
+        self.concurrency = concurrency
+        self.report = IngestionReport()
+        # Documents of each file still waiting to be uploaded, to know when a file is fully indexed
+        self._remaining_documents: dict[str, int] = {}
+        # Ids of each file's stale sections, deleted once the file's new sections are uploaded
+        self._stale_ids: dict[str, list[str]] = {}
+
+    async def run(self) -> IngestionReport:
+        self.report = IngestionReport()
+        rate_limiter = self.search_manager.embeddings.rate_limiter if self.search_manager.embeddings else None
+        waited_before = rate_limiter.waited_seconds if rate_limiter else 0.0
+        self._remaining_documents = {}
+        self._stale_ids = {}
+        parse_queue: asyncio.Queue[Optional[File]] = asyncio.Queue(maxsize=self.concurrency.max_pending_files)
+        embed_queue: asyncio.Queue[Optional[tuple[File, list[Section]]]] = asyncio.Queue(
+            maxsize=self.concurrency.max_pending_files
+        )
+        upload_queue: asyncio.Queue[Optional[_PendingUpload]] = asyncio.Queue(
+            maxsize=max(self.concurrency.embed_workers * 2, 1)
+        )
+
+        progress_task = asyncio.create_task(self._report_progress())
+        parse_tasks = [
+            asyncio.create_task(self._parse_worker(parse_queue, embed_queue))
+            for _ in range(self.concurrency.parse_workers)
+        ]
+        search_client = self.search_manager.search_info.create_search_client()
+        embed_tasks = [
+            asyncio.create_task(self._embed_worker(search_client, embed_queue, upload_queue))
+            for _ in range(self.concurrency.embed_workers)
+        ]
+        upload_task = asyncio.create_task(self._upload_worker(search_client, upload_queue))
+
+        async def drain_stages():
+            await self._list_files(parse_queue)
+            await asyncio.gather(*parse_tasks)
+            for _ in embed_tasks:
+                await embed_queue.put(None)
+            await asyncio.gather(*embed_tasks)
+            await upload_queue.put(None)
+
+        drain_task = asyncio.create_task(drain_stages())
+        try:
+            # If the uploader dies (e.g. the search service is unreachable), stop instead of blocking on a full queue
+            await asyncio.wait([drain_task, upload_task], return_when=asyncio.FIRST_EXCEPTION)
+            if upload_task.done() and not upload_task.cancelled() and (error := upload_task.exception()):
+                raise error
+            await drain_task
+            await upload_task
+        finally:
+            for task in [drain_task, *parse_tasks, *embed_tasks, upload_task, progress_task]:
+                task.cancel()
+            await search_client.close()
+            self.report.finished_at = time.monotonic()
+            if rate_limiter:
+                self.report.embedding_wait_seconds = rate_limiter.waited_seconds - waited_before
+
+        logger.info("Ingestion finished: %s", self.report.summary())
+        for failure in self.report.failures:
+            logger.warning("Failed to ingest '%s' during %s: %s", failure.filename, failure.stage, failure.error)
+        return self.report
+
+    async def _list_files(self, parse_queue: asyncio.Queue):
+        try:
+            async for file in self.list_file_strategy.list():
+                self.report.files_listed += 1
+                await parse_queue.put(file)
+        except Exception as e:
+            logger.error("Listing files failed, ingesting the files listed so far: %s", e)
+            self.report.failures.append(FileFailure(filename="<listing>", stage="list", error=str(e)))
+        finally:
+            for _ in range(self.concurrency.parse_workers):
+                await parse_queue.put(None)
+
+    async def _parse_worker(self, parse_queue: asyncio.Queue, embed_queue: asyncio.Queue):
+        while (file := await parse_queue.get()) is not None:
+            try:
+                await self.blob_manager.upload_blob(file)
+                sections = await self.parse(file)
+            except Exception as e:
+                self._fail(file, "parse", e)
+                file.close()
+                continue
+            self.report.files_parsed += 1
+            if not sections:
+                self.report.files_skipped += 1
+                file.close()
+                continue
+            await embed_queue.put((file, sections))
+
+    async def _embed_worker(self, search_client: SearchClient, embed_queue: asyncio.Queue, upload_queue: asyncio.Queue):
+        while (item := await embed_queue.get()) is not None:
+            file, sections = item
+            try:
+                update = await self.search_manager.prepare_update(search_client, sections, url=file.url)
+            except Exception as e:
+                self._fail(file, "embed", e)
+                continue
+            finally:
+                file.close()
+            self.report.files_embedded += 1
+            self.report.sections_embedded += update.added
+            self.report.sections_kept += update.kept
+            await upload_queue.put(_PendingUpload(file=file, update=update))
+
+    async def _upload_worker(self, search_client: SearchClient, upload_queue: asyncio.Queue):
+        batch_size = self.concurrency.upload_batch_size
+        batch: list[tuple[File, dict]] = []
+        flush_at: Optional[float] = None
+        while True:
+            timeout = None if flush_at is None else max(flush_at - time.monotonic(), 0)
+            try:
+                pending = await asyncio.wait_for(upload_queue.get(), timeout=timeout)
+            except asyncio.TimeoutError:
+                # Don't hold a partial batch back while the earlier stages are slow
+                for start in range(0, len(batch), batch_size):
+                    await self._upload_batch(search_client, batch[start : start + batch_size])
+                batch, flush_at = [], None
+                continue
+            if pending is None:
+                break
+            filename = pending.file.filename()
+            self._stale_ids[filename] = pending.update.stale_ids
+            if not pending.update.documents:
+                # Nothing changed but maybe removed sections, so the file is done already
+                await self._finish_file(search_client, pending.file)
+                continue
+            self._remaining_documents[filename] = len(pending.update.documents)
+            batch.extend((pending.file, document) for document in pending.update.documents)
+            if flush_at is None:
+                flush_at = time.monotonic() + self.concurrency.upload_flush_interval
+            while len(batch) >= batch_size:
+                await self._upload_batch(search_client, batch[:batch_size])
+                batch = batch[batch_size:]
+            if not batch:
+                flush_at = None
+        for start in range(0, len(batch), batch_size):
+            await self._upload_batch(search_client, batch[start : start + batch_size])
+
+    async def _upload_batch(self, search_client, batch: list[tuple[File, dict]]):
+        # Skip the rest of the sections of files that failed in an earlier batch, so no more of them are indexed
+        batch = [(file, document) for file, document in batch if file.filename() in self._remaining_documents]
+        if not batch:
+            return
+        files = {file.filename(): file for file, _ in batch}
+        logger.info(
+            "Uploading batch with %d sections from %d files to search index '%s'",
+            len(batch),
+            len(files),
+            self.search_manager.search_info.index_name,
+        )
+        try:
+            # Batches over the request payload limit are split, and documents the index fails to process are retried
+            writer = SearchIndexWriter(search_client)
+            await writer.add([document for _, document in batch])
+            await writer.flush()
+        except Exception as e:
+            for file in files.values():
+                self._stale_ids.pop(file.filename(), None)
+                if self._remaining_documents.pop(file.filename(), None) is not None:
+                    self._fail(file, "upload", e)
+            return
+        self.report.documents_uploaded += len(batch)
+        for file, _ in batch:
+            filename = file.filename()
+            self._remaining_documents[filename] -= 1
+            if self._remaining_documents[filename] == 0:
+                del self._remaining_documents[filename]
+                await self._finish_file(search_client, file)
+
+    async def _finish_file(self, search_client: SearchClient, file: File):
+        """Delete the stale sections of a file whose new sections are all uploaded"""
+        stale_ids = self._stale_ids.pop(file.filename(), [])
+        try:
+            await self.search_manager.delete_documents(search_client, stale_ids)
+        except Exception as e:
+            self._fail(file, "delete", e)
+            return
+        self.report.sections_removed += len(stale_ids)
+        self.report.files_indexed += 1
+
+    async def _report_progress(self):
+        while True:
+            await asyncio.sleep(self.concurrency.progress_interval)
+            logger.info("Ingestion progress: %s", self.report.summary())
+
+    def _fail(self, file: File, stage: str, error: Exception):
+        try:
+            filename = file.filename()
+        except ValueError:
+            filename = "<unknown>"
+        logger.error("Error ingesting '%s' during %s: %s", filename, stage, error)
+        self.report.failures.append(FileFailure(filename=filename, stage=stage, error=str(error)))
@@ -1,24 +1,96 @@
 import json
-from collections.abc import AsyncGenerator
-from typing import IO
+from collections.abc import AsyncGenerator, Generator
+from typing import IO, Any, Optional
 
 from .page import Page
 from .parser import Parser
+from .recordgrouper import RecordGrouper, text_stream
+
+# Characters of the file read at a time while looking for the next value of a top-level array
+READ_SIZE = 64 * 1024
+NUMBER_CHARACTERS = "0123456789+-.eE"
+
+
+def iter_json_array(stream: IO[str], buffer: str = "", read_size: Optional[int] = None) -> Generator[Any, None, None]:
+    """
+    Yield the values of a JSON array as they are read from the stream, keeping only the value being read in memory.
+    The array starts at the beginning of the buffer already read from the stream, or else of the stream.
+    """
+    read_size = read_size or READ_SIZE
+    decoder = json.JSONDecoder()
+    buffer = (buffer or stream.read(read_size)).lstrip()
+    if not buffer.startswith("["):
+        raise ValueError("Expected a JSON array")
+    position = 1
+    eof = False
+    expect_value = True
+    values_read = 0
+    while True:
+        # Skip whitespace and the comma between values
+        while True:
+            while position < len(buffer) and buffer[position].isspace():
+                position += 1
+            if position < len(buffer) or eof:
+                break
+            buffer, position = stream.read(read_size), 0
+            eof = not buffer
+        if position >= len(buffer):
+            raise ValueError("Unterminated JSON array")
+        if buffer[position] == "]":
+            if expect_value and values_read:
+                raise ValueError("Unexpected ']' after ',' in JSON array")
+            return
+        if not expect_value:
+            if buffer[position] != ",":
+                raise ValueError(f"Expected ',' or ']' in JSON array, found {buffer[position]!r}")
+            position += 1
+            expect_value = True
+            continue
+        try:
+            value, end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            # The value continues past the buffer, so read more of it and decode it again
+            more = stream.read(max(read_size, len(buffer) - position))
+            eof = not more
+            buffer, position = buffer[position:] + more, 0
+            continue
+        # A number may continue past the buffer, so it is only complete when followed by a character that ends it
+        if not eof and isinstance(value, (int, float)) and (end == len(buffer) or buffer[end] in NUMBER_CHARACTERS):
+            more = stream.read(read_size)
+            eof = not more
+            buffer, position = buffer[position:] + more, 0
+            continue
+        yield value
+        values_read += 1
+        expect_value = False
+        position = end
 
 
 class JsonParser(Parser):
     """
-    Concrete parser that can parse JSON into Page objects. A top-level object becomes a single Page, while a top-level array becomes multiple Page objects.
+    Concrete parser that can parse JSON into Page objects. A top-level object becomes a single Page,
+    while the objects of a top-level array are read one at a time and each becomes a Page object,
+    unless objects are grouped by number or by tokens.
     """
 
+    def __init__(self, objects_per_page: int = 1, max_tokens_per_page: Optional[int] = None):
+        self.grouper = RecordGrouper(records_per_page=objects_per_page, max_tokens_per_page=max_tokens_per_page)
+
     async def parse(self, content: IO) -> AsyncGenerator[Page, None]:
-        offset = 0
-        data = json.loads(content.read())
-        if isinstance(data, list):
-            for i, obj in enumerate(data):
-                offset += 1  # For opening bracket or comma before object
-                page_text = json.dumps(obj)
-                yield Page(i, offset, page_text)
-                offset += len(page_text)
-        elif isinstance(data, dict):
-            yield Page(0, 0, json.dumps(data))
+        stream, wrapper = text_stream(content)
+        try:
+            buffer = stream.read(READ_SIZE).lstrip()
+            if buffer.startswith("["):
+                objects = iter_json_array(stream, buffer)
+                # Offsets count the opening bracket, and the comma before each later object
+                for page in self.grouper.group((json.dumps(obj) for obj in objects), offset=1):
+                    yield page
+            else:
+                data = json.loads(buffer + stream.read())
+                if isinstance(data, dict):
+                    yield Page(0, 0, json.dumps(data))
+        finally:
+            if wrapper is not None:
+                wrapper.detach()
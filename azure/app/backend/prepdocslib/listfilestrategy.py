@@ -1,3 +1,4 @@
+import asyncio
 import base64
 import hashlib
 import logging
@@ -6,7 +7,7 @@ import re
 import tempfile
 from abc import ABC
 from collections.abc import AsyncGenerator
-from glob import glob
+from glob import glob, has_magic
 from typing import IO, Optional
 
 from azure.core.credentials_async import AsyncTokenCredential
@@ -14,6 +15,8 @@ from azure.storage.filedatalake.aio import (
     DataLakeServiceClient,
 )
 
+from .filemanifest import FileManifest, FileState
+
 logger = logging.getLogger("scripts")
 
 
@@ -88,11 +91,34 @@ class ListFileStrategy(ABC):
 class LocalListFileStrategy(ListFileStrategy):
     """
     Concrete strategy for listing files that are located in a local filesystem
+    Files that haven't changed since they were last listed are skipped, based on a manifest of their sizes,
+    modification times and hashes that is stored next to the files
     """
 
-    def __init__(self, path_pattern: str, enable_global_documents: bool = False):
+    MANIFEST_FILENAME = ".prepdocs_manifest.sqlite"
+    # Files checked for changes at once, each on a worker thread
+    SCAN_BATCH_SIZE = 256
+    HASH_BLOCK_SIZE = 1024 * 1024
+
+    def __init__(self, path_pattern: str, enable_global_documents: bool = False, manifest_path: Optional[str] = None):
         self.path_pattern = path_pattern
         self.enable_global_documents = enable_global_documents
+        self.manifest_path = manifest_path or os.path.join(
+            LocalListFileStrategy.base_directory(path_pattern), self.MANIFEST_FILENAME
+        )
+
+    @staticmethod
+    def base_directory(path_pattern: str) -> str:
+        """Get the deepest directory that contains every path matching the pattern"""
+        parts = []
+        for part in path_pattern.split(os.sep):
+            if has_magic(part):
+                break
+            parts.append(part)
+        else:
+            if not os.path.isdir(path_pattern):
+                parts = parts[:-1]
+        return os.sep.join(parts) or ("/" if path_pattern.startswith(os.sep) else ".")
 
     async def list_paths(self) -> AsyncGenerator[str, None]:
         async for p in self._list_paths(self.path_pattern):
@@ -107,35 +133,78 @@ class LocalListFileStrategy(ListFileStrategy):
                 # Only list files, not directories
                 yield path
 
-    async def list(self) -> AsyncGenerator[File, None]:
-        acls = {"oids": ["all"], "groups": ["all"]} if self.enable_global_documents else {}
-        async for path in self.list_paths():
-            if not self.check_md5(path):
-                yield File(content=open(path, mode="rb"), acls=acls, url=path)
+    # Defined before list(), which shadows the builtin list in the annotations of later methods
+    async def check_changed(self, manifest: FileManifest, paths: list[str]) -> list[str]:
+        """
+        Get the paths that changed since they were last listed, and record their current state in the manifest.
+        Files whose size and modification time are unchanged aren't read, others are hashed on worker threads.
+        """
+        paths = [path for path in paths if not self._is_bookkeeping_file(path)]
+        known_states = manifest.get_many(paths)
+        # Stat the whole batch on one thread, and only hash the files that were modified
+        stats = await asyncio.to_thread(lambda: [os.stat(path) for path in paths])
+        modified = [
+            (path, stat)
+            for path, stat in zip(paths, stats)
+            if not self._is_unmodified(known_states.get(path), stat.st_size, stat.st_mtime_ns)
+        ]
+        hashes = await asyncio.gather(*(asyncio.to_thread(self._hash_file, path) for path, _ in modified))
+        changed_paths = []
+        new_states = []
+        for (path, stat), md5 in zip(modified, hashes):
+            known_state = known_states.get(path)
+            # Respect the hash of a .md5 file written by earlier versions, so existing files aren't ingested again
+            previous_md5: Optional[str]
+            if known_state:
+                previous_md5 = known_state.md5
+            else:
+                previous_md5 = await asyncio.to_thread(self._read_md5_file, path)
+            new_states.append(FileState(path=path, size=stat.st_size, mtime_ns=stat.st_mtime_ns, md5=md5))
+            if previous_md5 == md5:
+                logger.debug("Skipping '%s', no changes detected.", path)
+            else:
+                changed_paths.append(path)
+        manifest.set_many(new_states)
+        if skipped := len(paths) - len(changed_paths):
+            logger.info("Skipping %d files, no changes detected.", skipped)
+        return changed_paths
 
-    def check_md5(self, path: str) -> bool:
-        # if filename ends in .md5 skip
-        if path.endswith(".md5"):
-            return True
+    def _is_bookkeeping_file(self, path: str) -> bool:
+        # .md5 files were written next to each file before the manifest existed
+        return path.endswith(".md5") or os.path.basename(path).startswith(self.MANIFEST_FILENAME)
 
-        # if there is a file called .md5 in this directory, see if its updated
-        stored_hash = None
-        with open(path, "rb") as file:
-            existing_hash = hashlib.md5(file.read()).hexdigest()
-        hash_path = f"{path}.md5"
-        if os.path.exists(hash_path):
-            with open(hash_path, encoding="utf-8") as md5_f:
-                stored_hash = md5_f.read()
+    def _is_unmodified(self, known_state: Optional[FileState], size: int, mtime_ns: int) -> bool:
+        return known_state is not None and known_state.size == size and known_state.mtime_ns == mtime_ns
 
-        if stored_hash and stored_hash.strip() == existing_hash.strip():
-            logger.info("Skipping '%s', no changes detected.", path)
-            return True
+    def _hash_file(self, path: str) -> str:
+        md5 = hashlib.md5()
+        with open(path, "rb") as file:
+            while block := file.read(self.HASH_BLOCK_SIZE):
+                md5.update(block)
+        return md5.hexdigest()
 
-        # Write the hash
-        with open(hash_path, "w", encoding="utf-8") as md5_f:
-            md5_f.write(existing_hash)
+    def _read_md5_file(self, path: str) -> Optional[str]:
+        if not os.path.exists(f"{path}.md5"):
+            return None
+        with open(f"{path}.md5", encoding="utf-8") as md5_f:
+            return md5_f.read().strip()
 
-        return False
+    async def list(self) -> AsyncGenerator[File, None]:
+        acls = {"oids": ["all"], "groups": ["all"]} if self.enable_global_documents else {}
+        manifest = FileManifest(self.manifest_path)
+        try:
+            paths: list[str] = []
+            async for path in self.list_paths():
+                paths.append(path)
+                if len(paths) < self.SCAN_BATCH_SIZE:
+                    continue
+                for changed_path in await self.check_changed(manifest, paths):
+                    yield File(content=open(changed_path, mode="rb"), acls=acls, url=changed_path)
+                paths = []
+            for changed_path in await self.check_changed(manifest, paths):
+                yield File(content=open(changed_path, mode="rb"), acls=acls, url=changed_path)
+        finally:
+            manifest.close()
 
 
 class ADLSGen2ListFileStrategy(ListFileStrategy):
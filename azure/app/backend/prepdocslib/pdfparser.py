@@ -1,6 +1,8 @@
+import asyncio
 import html
 import io
 import logging
+import os
 import uuid
 from collections.abc import AsyncGenerator
 from enum import Enum
@@ -13,6 +15,7 @@ from azure.ai.documentintelligence.models import (
     AnalyzeResult,
     DocumentFigure,
     DocumentTable,
+    DocumentTableCell,
 )
 from azure.core.credentials import AzureKeyCredential
 from azure.core.credentials_async import AsyncTokenCredential
@@ -21,6 +24,7 @@ from openai import AsyncOpenAI
 from PIL import Image
 from pypdf import PdfReader
 
+from .cpuexecutor import CpuWorkExecutor, spool_to_temporary_file
 from .mediadescriber import (
     ContentUnderstandingDescriber,
     MediaDescriber,
@@ -32,22 +36,60 @@ from .parser import Parser
 logger = logging.getLogger("scripts")
 
 
+def count_pdf_pages(path: str) -> int:
+    return len(PdfReader(path).pages)
+
+
+def extract_pdf_text(path: str, start: int, stop: int) -> list[str]:
+    """
+    Extract the text of a range of pages of a PDF, in a worker process when parsing with a CpuWorkExecutor
+    """
+    reader = PdfReader(path)
+    return [reader.pages[page_num].extract_text() for page_num in range(start, stop)]
+
+
 class LocalPdfParser(Parser):
     """
     Concrete parser backed by PyPDF that can parse PDFs into pages
     To learn more, please visit https://pypi.org/project/pypdf/
     """
 
+    # Pages extracted together by a worker process, each batch reading the PDF again
+    PAGES_PER_BATCH = 16
+
+    def __init__(self, executor: Optional[CpuWorkExecutor] = None):
+        self.executor = executor
+
     async def parse(self, content: IO) -> AsyncGenerator[Page, None]:
         logger.info("Extracting text from '%s' using local PDF parser (pypdf)", content.name)
 
-        reader = PdfReader(content)
-        pages = reader.pages
-        offset = 0
-        for page_num, p in enumerate(pages):
-            page_text = p.extract_text()
-            yield Page(page_num=page_num, offset=offset, text=page_text)
-            offset += len(page_text)
+        if self.executor is None:
+            reader = PdfReader(content)
+            offset = 0
+            for page_num, p in enumerate(reader.pages):
+                page_text = p.extract_text()
+                yield Page(page_num=page_num, offset=offset, text=page_text)
+                offset += len(page_text)
+            return
+
+        # Worker processes read the PDF from a file rather than each receiving a copy of its content
+        path = await asyncio.to_thread(spool_to_temporary_file, content, ".pdf")
+        try:
+            page_count = await self.executor.run(count_pdf_pages, path)
+            batches = [
+                (path, start, min(start + self.PAGES_PER_BATCH, page_count))
+                for start in range(0, page_count, self.PAGES_PER_BATCH)
+            ]
+            page_num = 0
+            offset = 0
+            # Pages are yielded as soon as their batch is extracted, while the next batches are extracted
+            async for page_texts in self.executor.run_in_order(extract_pdf_text, batches):
+                for page_text in page_texts:
+                    yield Page(page_num=page_num, offset=offset, text=page_text)
+                    page_num += 1
+                    offset += len(page_text)
+        finally:
+            await asyncio.to_thread(os.remove, path)
 
 
 class MediaDescriptionStrategy(Enum):
@@ -56,6 +98,12 @@ class MediaDescriptionStrategy(Enum):
     CONTENTUNDERSTANDING = "content_understanding"
 
 
+class ObjectType(Enum):
+    NONE = -1
+    TABLE = 0
+    FIGURE = 1
+
+
 class DocumentAnalysisParser(Parser):
     """
     Concrete parser backed by Azure AI Document Intelligence that can parse many document formats into pages
@@ -74,9 +122,12 @@ class DocumentAnalysisParser(Parser):
         openai_deployment: Optional[str] = None,
         # If using Content Understanding, this is the endpoint for the service
         content_understanding_endpoint: Optional[str] = None,
+        # Number of figures being cropped and described at the same time
+        max_concurrent_figures: int = 4,
         # should this take the blob storage info too?
     ):
         self.model_id = model_id
+        self.max_concurrent_figures = max_concurrent_figures
         self.endpoint = endpoint
         self.credential = credential
         self.media_description_strategy = media_description_strategy
@@ -147,81 +198,133 @@ class DocumentAnalysisParser(Parser):
                 )
             analyze_result: AnalyzeResult = await poller.result()
 
-            offset = 0
+            tables_by_page: dict[int, list[DocumentTable]] = {}
+            for table in analyze_result.tables or []:
+                if table.bounding_regions:
+                    tables_by_page.setdefault(table.bounding_regions[0].page_number, []).append(table)
+            figures_by_page: dict[int, list[DocumentFigure]] = {}
+            if self.media_description_strategy != MediaDescriptionStrategy.NONE:
+                for figure in analyze_result.figures or []:
+                    if figure.bounding_regions:
+                        figures_by_page.setdefault(figure.bounding_regions[0].page_number, []).append(figure)
 
+            page_layouts = []
             for page in analyze_result.pages:
-                tables_on_page = [
-                    table
-                    for table in (analyze_result.tables or [])
-                    if table.bounding_regions and table.bounding_regions[0].page_number == page.page_number
-                ]
-                figures_on_page = []
-                if self.media_description_strategy != MediaDescriptionStrategy.NONE:
-                    figures_on_page = [
-                        figure
-                        for figure in (analyze_result.figures or [])
-                        if figure.bounding_regions and figure.bounding_regions[0].page_number == page.page_number
-                    ]
-                page_images: list[ImageOnPage] = []
-
-                class ObjectType(Enum):
-                    NONE = -1
-                    TABLE = 0
-                    FIGURE = 1
-
-                MaskEntry = tuple[ObjectType, Optional[int]]
-
-                page_offset = page.spans[0].offset
-                page_length = page.spans[0].length
-                mask_chars: list[MaskEntry] = [(ObjectType.NONE, None)] * page_length
-                # mark all positions of the table spans in the page
-                for table_idx, table in enumerate(tables_on_page):
-                    for span in table.spans:
-                        # replace all table spans with "table_id" in table_chars array
-                        for i in range(span.length):
-                            idx = span.offset - page_offset + i
-                            if idx >= 0 and idx < page_length:
-                                mask_chars[idx] = (ObjectType.TABLE, table_idx)
-                # mark all positions of the figure spans in the page
-                for figure_idx, figure in enumerate(figures_on_page):
-                    for span in figure.spans:
-                        # replace all figure spans with "figure_id" in figure_chars array
-                        for i in range(span.length):
-                            idx = span.offset - page_offset + i
-                            if idx >= 0 and idx < page_length:
-                                mask_chars[idx] = (ObjectType.FIGURE, figure_idx)
-
-                # build page text by replacing characters in table spans with table html
-                page_text = ""
-                added_objects: set[MaskEntry] = set()
-                for idx, mask_char in enumerate(mask_chars):
-                    object_type, object_idx = mask_char
-                    if object_type == ObjectType.NONE:
-                        page_text += analyze_result.content[page_offset + idx]
-                    elif object_type == ObjectType.TABLE:
-                        if object_idx is None:
-                            raise ValueError("Expected object_idx to be set")
-                        if mask_char not in added_objects:
-                            page_text += DocumentAnalysisParser.table_to_html(tables_on_page[object_idx])
-                            added_objects.add(mask_char)
-                    elif object_type == ObjectType.FIGURE:
-                        if media_describer is None:
-                            raise ValueError("media_describer should not be None, unable to describe figure")
-                        if object_idx is None:
-                            raise ValueError("Expected object_idx to be set")
-                        if mask_char not in added_objects:
-                            image_on_page = await DocumentAnalysisParser.process_figure(
-                                doc_for_pymupdf, figures_on_page[object_idx], media_describer
-                            )
+                tables_on_page = tables_by_page.get(page.page_number, [])
+                figures_on_page = figures_by_page.get(page.page_number, [])
+                segments = DocumentAnalysisParser.page_segments(
+                    page.spans[0].offset, page.spans[0].length, tables_on_page, figures_on_page
+                )
+                page_layouts.append((page, tables_on_page, figures_on_page, segments))
+
+            # Describe every figure of the document concurrently (bounded by the semaphore),
+            # while pages are assembled in order as their figures complete
+            figure_semaphore = asyncio.Semaphore(self.max_concurrent_figures)
+            figure_tasks: dict[tuple[int, int], asyncio.Task[ImageOnPage]] = {}
+            for page, _, figures_on_page, segments in page_layouts:
+                for object_type, object_idx, _, _ in segments:
+                    if object_type != ObjectType.FIGURE or (page.page_number, object_idx) in figure_tasks:
+                        continue
+                    if media_describer is None:
+                        raise ValueError("media_describer should not be None, unable to describe figure")
+                    figure_tasks[(page.page_number, object_idx)] = asyncio.create_task(
+                        DocumentAnalysisParser.process_figure_limited(
+                            figure_semaphore, doc_for_pymupdf, figures_on_page[object_idx], media_describer
+                        )
+                    )
+
+            try:
+                offset = 0
+                for page, tables_on_page, _, segments in page_layouts:
+                    page_images: list[ImageOnPage] = []
+                    page_offset = page.spans[0].offset
+                    # build page text from the content between objects, replacing each table with its html
+                    # and each figure with its description where the object first appears on the page
+                    page_parts: list[str] = []
+                    added_objects: set[tuple[ObjectType, int]] = set()
+                    for object_type, object_idx, start, end in segments:
+                        if object_type == ObjectType.NONE:
+                            page_parts.append(analyze_result.content[page_offset + start : page_offset + end])
+                            continue
+                        if (object_type, object_idx) in added_objects:
+                            continue
+                        added_objects.add((object_type, object_idx))
+                        if object_type == ObjectType.TABLE:
+                            page_parts.append(DocumentAnalysisParser.table_to_html(tables_on_page[object_idx]))
+                        elif object_type == ObjectType.FIGURE:
+                            image_on_page = await figure_tasks[(page.page_number, object_idx)]
                             page_images.append(image_on_page)
-                            page_text += image_on_page.description
-                            added_objects.add(mask_char)
-                # We remove these comments since they are not needed and skew the page numbers
-                page_text = page_text.replace("<!-- PageBreak -->", "")
-                # We remove excess newlines at the beginning and end of the page
-                page_text = page_text.strip()
-                yield Page(page_num=page.page_number - 1, offset=offset, text=page_text, images=page_images)
-                offset += len(page_text)
+                            page_parts.append(image_on_page.description)
+                    page_text = "".join(page_parts)
+                    # We remove these comments since they are not needed and skew the page numbers
+                    page_text = page_text.replace("<!-- PageBreak -->", "")
+                    # We remove excess newlines at the beginning and end of the page
+                    page_text = page_text.strip()
+                    yield Page(page_num=page.page_number - 1, offset=offset, text=page_text, images=page_images)
+                    offset += len(page_text)
+            finally:
+                # Don't leave figures being described if parsing failed or the caller stopped early
+                for task in figure_tasks.values():
+                    task.cancel()
+                await asyncio.gather(*figure_tasks.values(), return_exceptions=True)
+
+    @staticmethod
+    def page_segments(
+        page_offset: int,
+        page_length: int,
+        tables: list[DocumentTable],
+        figures: list[DocumentFigure],
+    ) -> list[tuple[ObjectType, int, int, int]]:
+        """
+        Splits a page into consecutive (object_type, object_idx, start, end) segments, with start and end
+        relative to the page offset. Segments covered by no table or figure span have type NONE.
+        Where spans overlap, figures win over tables and later objects win over earlier ones.
+        """
+        # (position, is_start, (object type, object index)) events for every span clipped to the page
+        events: list[tuple[int, bool, tuple[int, int]]] = []
+        object_spans = [(ObjectType.TABLE, idx, table.spans) for idx, table in enumerate(tables)] + [
+            (ObjectType.FIGURE, idx, figure.spans) for idx, figure in enumerate(figures)
+        ]
+        for object_type, object_idx, spans in object_spans:
+            for span in spans or []:
+                start = max(span.offset - page_offset, 0)
+                end = min(span.offset - page_offset + span.length, page_length)
+                if start < end:
+                    events.append((start, True, (object_type.value, object_idx)))
+                    events.append((end, False, (object_type.value, object_idx)))
+        events.sort(key=lambda event: event[0])
+
+        segments: list[tuple[ObjectType, int, int, int]] = []
+        # number of spans of each object covering the current position
+        active: dict[tuple[int, int], int] = {}
+        position = 0
+        event_idx = 0
+        while position < page_length:
+            while event_idx < len(events) and events[event_idx][0] == position:
+                _, is_start, key = events[event_idx]
+                active[key] = active.get(key, 0) + (1 if is_start else -1)
+                if not active[key]:
+                    del active[key]
+                event_idx += 1
+            next_position = events[event_idx][0] if event_idx < len(events) else page_length
+            if active:
+                type_value, object_idx = max(active)
+                segment = (ObjectType(type_value), object_idx)
+            else:
+                segment = (ObjectType.NONE, -1)
+            if segments and segments[-1][:2] == segment:
+                segments[-1] = (*segment, segments[-1][2], next_position)
+            else:
+                segments.append((*segment, position, next_position))
+            position = next_position
+        return segments
+
+    @staticmethod
+    async def process_figure_limited(
+        semaphore: asyncio.Semaphore, doc: pymupdf.Document, figure: DocumentFigure, media_describer: MediaDescriber
+    ) -> ImageOnPage:
+        async with semaphore:
+            return await DocumentAnalysisParser.process_figure(doc, figure, media_describer)
 
     @staticmethod
     async def process_figure(
@@ -267,24 +370,24 @@ class DocumentAnalysisParser(Parser):
 
     @staticmethod
     def table_to_html(table: DocumentTable):
-        table_html = "<figure><table>"
-        rows = [
-            sorted([cell for cell in table.cells if cell.row_index == i], key=lambda cell: cell.column_index)
-            for i in range(table.row_count)
-        ]
+        rows: list[list[DocumentTableCell]] = [[] for _ in range(table.row_count)]
+        for cell in table.cells:
+            if 0 <= cell.row_index < table.row_count:
+                rows[cell.row_index].append(cell)
+        table_html = ["<figure><table>"]
         for row_cells in rows:
-            table_html += "<tr>"
-            for cell in row_cells:
+            table_html.append("<tr>")
+            for cell in sorted(row_cells, key=lambda cell: cell.column_index):
                 tag = "th" if (cell.kind == "columnHeader" or cell.kind == "rowHeader") else "td"
                 cell_spans = ""
                 if cell.column_span is not None and cell.column_span > 1:
                     cell_spans += f" colSpan={cell.column_span}"
                 if cell.row_span is not None and cell.row_span > 1:
                     cell_spans += f" rowSpan={cell.row_span}"
-                table_html += f"<{tag}{cell_spans}>{html.escape(cell.content)}</{tag}>"
-            table_html += "</tr>"
-        table_html += "</table></figure>"
-        return table_html
+                table_html.append(f"<{tag}{cell_spans}>{html.escape(cell.content)}</{tag}>")
+            table_html.append("</tr>")
+        table_html.append("</table></figure>")
+        return "".join(table_html)
 
     @staticmethod
     def crop_image_from_pdf_page(
@@ -0,0 +1,60 @@
+import io
+from collections.abc import Generator, Iterable
+from typing import IO, Optional
+
+from .page import Page
+from .textsplitter import ENCODING_MODEL
+from .tokenizer import TokenCounter
+
+
+class RecordGrouper:
+    """
+    Groups records of a file, such as CSV rows or JSON objects, into pages of a number of records,
+    or of as many records as fit in a token budget, so that large files don't become one page per record.
+    A record larger than the token budget gets a page of its own.
+    """
+
+    def __init__(self, records_per_page: int = 1, max_tokens_per_page: Optional[int] = None):
+        if records_per_page < 1:
+            raise ValueError("records_per_page must be at least 1")
+        self.records_per_page = records_per_page
+        self.max_tokens_per_page = max_tokens_per_page
+        self.token_counter = TokenCounter(ENCODING_MODEL) if max_tokens_per_page else None
+
+    def group(self, records: Iterable[str], offset: int = 0, separator_length: int = 1) -> Generator[Page, None, None]:
+        """
+        Yield pages of records joined by newlines, as records are read.
+        The offset of each page counts a separator of the given length before the next page.
+        """
+        page_num = 0
+        texts: list[str] = []
+        tokens = 0
+        for text in records:
+            record_tokens = self.token_counter.count(text) if self.token_counter else 0
+            if texts and (
+                len(texts) >= self.records_per_page
+                or (self.max_tokens_per_page and tokens + record_tokens > self.max_tokens_per_page)
+            ):
+                page_text = "\n".join(texts)
+                yield Page(page_num, offset, page_text)
+                page_num += 1
+                offset += len(page_text) + separator_length
+                texts, tokens = [], 0
+            texts.append(text)
+            tokens += record_tokens
+        if texts:
+            yield Page(page_num, offset, "\n".join(texts))
+
+
+def text_stream(content: IO) -> tuple[IO[str], Optional[io.TextIOWrapper]]:
+    """
+    Get a text stream decoding the content as it is read, along with the wrapper to detach
+    once reading is done, so that closing the wrapper doesn't close the content
+    """
+    if isinstance(content, (bytes, bytearray)):
+        content = io.BytesIO(content)
+    if isinstance(content, io.TextIOBase):
+        return content, None
+    # utf-8-sig skips the byte order mark that some editors write at the start of the file
+    wrapper = io.TextIOWrapper(content, encoding="utf-8-sig", newline="")
+    return wrapper, wrapper
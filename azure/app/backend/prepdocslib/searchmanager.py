@@ -1,8 +1,13 @@
 import asyncio
+import hashlib
+import json
 import logging
 import os
+from dataclasses import dataclass, field
 from typing import Optional
 
+from azure.core.exceptions import HttpResponseError
+from azure.search.documents.aio import SearchClient
 from azure.search.documents.indexes.models import (
     AIServicesVisionParameters,
     AIServicesVisionVectorizer,
@@ -38,8 +43,10 @@ from azure.search.documents.indexes.models import (
 )
 
 from .blobmanager import BlobManager
-from .embeddings import OpenAIEmbeddings
+from .embeddings import ImageEmbeddings, OpenAIEmbeddings, gather_or_cancel
+from .indexwriter import SearchIndexWriter
 from .listfilestrategy import File
+from .page import ImageOnPage
 from .strategy import SearchInfo
 from .textsplitter import Chunk
 
@@ -58,12 +65,35 @@ class Section:
         # this also needs images which will become the images field
 
 
+@dataclass
+class IndexUpdate:
+    """
+    Changes that bring the sections of a file in a search index up to date:
+    new or changed sections to upload, and ids of indexed sections that no longer exist
+    """
+
+    documents: list[dict] = field(default_factory=list)
+    stale_ids: list[str] = field(default_factory=list)
+    kept: int = 0
+
+    @property
+    def added(self) -> int:
+        return len(self.documents)
+
+    @property
+    def removed(self) -> int:
+        return len(self.stale_ids)
+
+
 class SearchManager:
     """
     Class to manage a search service. It can create indexes, and update or remove sections stored in these indexes
     To learn more, please visit https://learn.microsoft.com/azure/search/search-what-is-azure-search
     """
 
+    # New sections embedded at a time, while the previously embedded sections are being uploaded
+    EMBEDDING_BATCH_SIZE = 500
+
     def __init__(
         self,
         search_info: SearchInfo,
@@ -74,6 +104,8 @@ class SearchManager:
         field_name_embedding: Optional[str] = None,
         search_images: bool = False,
         enforce_access_control: bool = False,
+        image_embeddings: Optional[ImageEmbeddings] = None,
+        max_concurrent_images: int = 4,
     ):
         self.search_info = search_info
         self.search_analyzer_name = search_analyzer_name
@@ -84,6 +116,10 @@ class SearchManager:
         self.field_name_embedding = field_name_embedding
         self.search_images = search_images
         self.enforce_access_control = enforce_access_control
+        self.image_embeddings = image_embeddings
+        self.max_concurrent_images = max_concurrent_images
+        # Indexes created before the id field was sortable and filterable are paged with skip instead
+        self.page_by_id = True
 
     async def create_index(self):
         logger.info("Checking whether search index %s exists...", self.search_info.index_name)
@@ -234,7 +270,8 @@ class SearchManager:
                 logger.info("Creating new search index %s", self.search_info.index_name)
                 fields = [
                     (
-                        SimpleField(name="id", type="Edm.String", key=True)
+                        # Sortable and filterable so sections can be paged by key
+                        SimpleField(name="id", type="Edm.String", key=True, sortable=True, filterable=True)
                         if not self.use_int_vectorization
                         else SearchField(
                             name="id",
@@ -522,88 +559,275 @@ class SearchManager:
 
             logger.info("Agent %s created successfully", self.search_info.agent_name)
 
-    async def update_content(self, sections: list[Section], url: Optional[str] = None):
-        MAX_BATCH_SIZE = 1000
-        section_batches = [sections[i : i + MAX_BATCH_SIZE] for i in range(0, len(sections), MAX_BATCH_SIZE)]
-
+    async def update_content(self, sections: list[Section], url: Optional[str] = None) -> IndexUpdate:
         async with self.search_info.create_search_client() as search_client:
-            for batch_index, batch in enumerate(section_batches):
-                documents = []
-                for section_index, section in enumerate(batch):
-                    image_fields = {}
-                    if self.search_images:
-                        image_fields = {
-                            "images": [
-                                {
-                                    "url": image.url,
-                                    "description": image.description,
-                                    "boundingbox": image.bbox,
-                                    "embedding": image.embedding,
-                                }
-                                for image in section.chunk.images
-                            ]
-                        }
-                    document = {
-                        "id": f"{section.content.filename_to_id()}-page-{section_index + batch_index * MAX_BATCH_SIZE}",
-                        "content": section.chunk.text,
-                        "category": section.category,
-                        "sourcepage": BlobManager.sourcepage_from_file_page(
-                            filename=section.content.filename(), page=section.chunk.page_num
-                        ),
-                        "sourcefile": section.content.filename(),
-                        **image_fields,
-                        **section.content.acls,
-                    }
-                    documents.append(document)
-                if url:
-                    for document in documents:
-                        document["storageUrl"] = url
-                if self.embeddings:
-                    if self.field_name_embedding is None:
-                        raise ValueError("Embedding field name must be set")
-                    embeddings = await self.embeddings.create_embeddings(
-                        texts=[section.chunk.text for section in batch]
-                    )
-                    for i, document in enumerate(documents):
-                        document[self.field_name_embedding] = embeddings[i]
-                logger.info(
-                    "Uploading batch %d with %d sections to search index '%s'",
-                    batch_index + 1,
-                    len(documents),
+            update = await self.prepare_update(search_client, sections, url=url, embed=False)
+            writer = SearchIndexWriter(search_client)
+            try:
+                for start in range(0, len(update.documents), self.EMBEDDING_BATCH_SIZE):
+                    batch = update.documents[start : start + self.EMBEDDING_BATCH_SIZE]
+                    # The previous batch is being uploaded while this one is embedded
+                    await self.add_embeddings(batch)
+                    await writer.add(batch)
+                await writer.flush()
+            except BaseException:
+                await writer.cancel()
+                raise
+            # Stale sections are only removed once their replacements are searchable
+            await writer.delete(update.stale_ids)
+        logger.info(
+            "Updated search index '%s': %d sections added, %d kept, %d removed (%.1f docs/sec)",
+            self.search_info.index_name,
+            update.added,
+            update.kept,
+            update.removed,
+            writer.documents_per_second(),
+        )
+        return update
+
+    async def prepare_update(
+        self, search_client: SearchClient, sections: list[Section], url: Optional[str] = None, embed: bool = True
+    ) -> IndexUpdate:
+        """
+        Diff the sections of a file against the sections of that file already in the index.
+        Only new or changed sections are embedded, unless the caller embeds their text itself,
+        and indexed sections that no longer exist are marked as stale.
+        The images of new sections are always embedded here, since that needs the image bytes of the sections.
+        """
+        documents = self.build_documents(sections, url=url)
+        indexed_ids: set[str] = set()
+        for file in {section.content.filename_to_id(): section.content for section in sections}.values():
+            indexed_ids |= await self.get_indexed_ids(search_client, file)
+        new_pairs = [
+            (section, document) for section, document in zip(sections, documents) if document["id"] not in indexed_ids
+        ]
+        await self.add_image_embeddings(new_pairs)
+        new_documents = [document for _, document in new_pairs]
+        if embed:
+            await self.add_embeddings(new_documents)
+        current_ids = {document["id"] for document in documents}
+        return IndexUpdate(
+            documents=new_documents,
+            stale_ids=sorted(indexed_ids - current_ids),
+            kept=len(documents) - len(new_documents),
+        )
+
+    async def get_indexed_ids(self, search_client: SearchClient, file: File) -> set[str]:
+        """
+        Get the ids of the sections of a file that are in the index, which serve as the manifest of the file.
+        Sections of a file with the same name but other ACLs, e.g. uploaded by another user, are left out.
+        """
+        # Replace ' with '' to escape the single quote for the filter
+        filename_for_filter = file.filename().replace("'", "''")
+        file_filter = f"sourcefile eq '{filename_for_filter}'"
+        id_prefix = f"{file.filename_to_id()}-"
+        if not self.page_by_id:
+            return await self.get_indexed_ids_with_skip(search_client, file_filter, id_prefix)
+        # Search only returns 50 results by default, so page through all the sections of the file ordered by id,
+        # starting each page after the last id of the previous one: unlike skip, this is stable and unbounded
+        max_results = 1000
+        indexed_ids: set[str] = set()
+        last_id: Optional[str] = None
+        while True:
+            page_filter = file_filter
+            if last_id is not None:
+                last_id_for_filter = last_id.replace("'", "''")
+                page_filter += f" and id gt '{last_id_for_filter}'"
+            try:
+                results = await search_client.search(
+                    search_text="", filter=page_filter, select=["id"], order_by=["id asc"], top=max_results
+                )
+                page_ids = [document["id"] async for document in results]
+            except HttpResponseError as error:
+                if last_id is not None:
+                    raise
+                logger.warning(
+                    "Search index '%s' can't sort or filter by id, paging through sections with skip: %s",
                     self.search_info.index_name,
+                    error.message,
                 )
-                await search_client.upload_documents(documents)
+                self.page_by_id = False
+                return await self.get_indexed_ids_with_skip(search_client, file_filter, id_prefix)
+            indexed_ids.update(document_id for document_id in page_ids if document_id.startswith(id_prefix))
+            if len(page_ids) < max_results:
+                return indexed_ids
+            last_id = page_ids[-1]
+
+    async def get_indexed_ids_with_skip(
+        self, search_client: SearchClient, file_filter: str, id_prefix: str
+    ) -> set[str]:
+        max_results = 1000
+        indexed_ids: set[str] = set()
+        skip = 0
+        while True:
+            results = await search_client.search(
+                search_text="", filter=file_filter, select=["id"], top=max_results, skip=skip
+            )
+            page_ids = [document["id"] async for document in results]
+            indexed_ids.update(document_id for document_id in page_ids if document_id.startswith(id_prefix))
+            if len(page_ids) < max_results:
+                return indexed_ids
+            skip += max_results
+
+    async def delete_documents(self, search_client: SearchClient, ids: list[str]):
+        if not ids:
+            return
+        writer = SearchIndexWriter(search_client)
+        await writer.delete(ids)
+        logger.info(
+            "Removed %d stale sections from search index '%s' (%.1f docs/sec)",
+            len(ids),
+            self.search_info.index_name,
+            writer.documents_per_second(),
+        )
+
+    async def create_documents(self, sections: list[Section], url: Optional[str] = None) -> list[dict]:
+        """
+        Build the search documents for a list of sections, including their text embeddings.
+        """
+        documents = self.build_documents(sections, url=url)
+        await self.add_embeddings(documents)
+        return documents
+
+    def build_documents(self, sections: list[Section], url: Optional[str] = None) -> list[dict]:
+        """
+        Build the search documents for a list of sections, without embeddings.
+        Document ids are derived from the content of each section, so unchanged sections keep their id across runs.
+        """
+        documents = []
+        id_counts: dict[str, int] = {}
+        for section in sections:
+            image_fields = {}
+            if self.search_images:
+                image_fields = {
+                    "images": [
+                        {
+                            "url": image.url,
+                            "description": image.description,
+                            "boundingbox": image.bbox,
+                            "embedding": image.embedding,
+                        }
+                        for image in section.chunk.images
+                    ]
+                }
+            document = {
+                "content": section.chunk.text,
+                "category": section.category,
+                "sourcepage": BlobManager.sourcepage_from_file_page(
+                    filename=section.content.filename(), page=section.chunk.page_num
+                ),
+                "sourcefile": section.content.filename(),
+                **image_fields,
+                **section.content.acls,
+            }
+            if url:
+                document["storageUrl"] = url
+            document_id = f"{section.content.filename_to_id()}-chunk-{self.section_hash(document)}"
+            # Identical sections within a file are told apart by their occurrence
+            id_counts[document_id] = id_counts.get(document_id, 0) + 1
+            if id_counts[document_id] > 1:
+                document_id = f"{document_id}-{id_counts[document_id]}"
+            documents.append({"id": document_id, **document})
+        return documents
+
+    @staticmethod
+    def section_hash(document: dict) -> str:
+        # Image embeddings are left out since they can vary slightly between calls for the same image
+        hashed_fields = {
+            **document,
+            "images": [
+                {key: value for key, value in image.items() if key != "embedding"}
+                for image in document.get("images", [])
+            ],
+        }
+        return hashlib.sha256(json.dumps(hashed_fields, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:32]
+
+    async def add_image_embeddings(self, sections_and_documents: list[tuple[Section, dict]]):
+        """
+        Embed the images of new sections that weren't embedded while parsing, and copy the embeddings to their documents.
+        An image of a page is shared by all the sections of that page, so it is only embedded once.
+        """
+        if not self.image_embeddings or not self.search_images:
+            return
+        images = {
+            id(image): image
+            for section, _ in sections_and_documents
+            for image in section.chunk.images
+            if image.embedding is None
+        }
+        if not images:
+            return
+        image_embeddings = self.image_embeddings
+        semaphore = asyncio.Semaphore(self.max_concurrent_images)
+
+        async def embed(image: ImageOnPage):
+            async with semaphore:
+                image.embedding = await image_embeddings.create_embedding_for_image(image.bytes)
+
+        await gather_or_cancel(*(embed(image) for image in images.values()))
+        for section, document in sections_and_documents:
+            for image, image_field in zip(section.chunk.images, document.get("images", [])):
+                image_field["embedding"] = image.embedding
+
+    async def add_embeddings(self, documents: list[dict]):
+        if not self.embeddings or not documents:
+            return
+        if self.field_name_embedding is None:
+            raise ValueError("Embedding field name must be set")
+        embeddings = await self.embeddings.create_embeddings(texts=[document["content"] for document in documents])
+        for document, embedding in zip(documents, embeddings):
+            document[self.field_name_embedding] = embedding
 
     async def remove_content(self, path: Optional[str] = None, only_oid: Optional[str] = None):
         logger.info(
             "Removing sections from '{%s or '<all>'}' from search index '%s'", path, self.search_info.index_name
         )
+        filter = None
+        if path is not None:
+            # Replace ' with '' to escape the single quote for the filter
+            # https://learn.microsoft.com/azure/search/query-odata-filter-orderby-syntax#escaping-special-characters-in-string-constants
+            path_for_filter = os.path.basename(path).replace("'", "''")
+            filter = f"sourcefile eq '{path_for_filter}'"
+        if only_oid is not None:
+            # Only remove sections that have only this oid, so other users' sections never fill the result pages
+            oid_for_filter = only_oid.replace("'", "''")
+            oid_filter = f"oids/any(oid: oid eq '{oid_for_filter}') and oids/all(oid: oid eq '{oid_for_filter}')"
+            filter = f"{filter} and {oid_filter}" if filter else oid_filter
         async with self.search_info.create_search_client() as search_client:
+            writer = SearchIndexWriter(search_client)
+            deleted_ids: set[str] = set()
+            max_results = 1000
+            delay = 0.5
             while True:
-                filter = None
-                if path is not None:
-                    # Replace ' with '' to escape the single quote for the filter
-                    # https://learn.microsoft.com/azure/search/query-odata-filter-orderby-syntax#escaping-special-characters-in-string-constants
-                    path_for_filter = os.path.basename(path).replace("'", "''")
-                    filter = f"sourcefile eq '{path_for_filter}'"
-                max_results = 1000
-                result = await search_client.search(
-                    search_text="", filter=filter, top=max_results, include_total_count=True
+                results = await search_client.search(
+                    search_text="", filter=filter, select=["id", "oids"], top=max_results, include_total_count=True
                 )
-                result_count = await result.get_count()
-                if result_count == 0:
+                if await results.get_count() == 0:
                     break
-                documents_to_remove = []
-                async for document in result:
-                    # If only_oid is set, only remove documents that have only this oid
-                    if not only_oid or document.get("oids") == [only_oid]:
-                        documents_to_remove.append({"id": document["id"]})
-                if len(documents_to_remove) == 0:
-                    if result_count < max_results:
-                        break
-                    else:
-                        continue
-                removed_docs = await search_client.delete_documents(documents_to_remove)
-                logger.info("Removed %d sections from index", len(removed_docs))
-                # It can take a few seconds for search results to reflect changes, so wait a bit
-                await asyncio.sleep(2)
+                documents = [document async for document in results]
+                ids_to_remove = [
+                    document["id"]
+                    for document in documents
+                    if document["id"] not in deleted_ids and (not only_oid or document.get("oids") == [only_oid])
+                ]
+                if ids_to_remove:
+                    await writer.delete(ids_to_remove)
+                    deleted_ids.update(ids_to_remove)
+                    delay = 0.5
+                    continue
+                if not any(document["id"] in deleted_ids for document in documents):
+                    break
+                # Deleted sections are returned until the index refreshes, so back off before searching again
+                if delay > 8:
+                    logger.warning(
+                        "Deleted sections are still returned by search index '%s'", self.search_info.index_name
+                    )
+                    break
+                await asyncio.sleep(delay)
+                delay *= 2
+        logger.info(
+            "Removed %d sections from search index '%s' (%.1f docs/sec)",
+            len(deleted_ids),
+            self.search_info.index_name,
+            writer.documents_per_second(),
+        )
@@ -5,9 +5,8 @@ from collections.abc import Generator
 from dataclasses import dataclass, field
 from typing import Optional
 
-import tiktoken
-
 from .page import Chunk, Page
+from .tokenizer import TokenCounter, get_encoding
 
 logger = logging.getLogger("scripts")
 
@@ -24,6 +23,13 @@ class TextSplitter(ABC):
             yield
 
 
+def split_pages(splitter: TextSplitter, pages: list[Page]) -> list[Chunk]:
+    """
+    Split pages into chunks all at once, in a worker process when splitting with a CpuWorkExecutor
+    """
+    return list(splitter.split_pages(pages))
+
+
 ENCODING_MODEL = "text-embedding-ada-002"
 
 STANDARD_WORD_BREAKS = [",", ";", ":", " ", "(", ")", "[", "]", "{", "}", "\t", "\n"]
@@ -79,7 +85,7 @@ STANDARD_SENTENCE_ENDINGS = [".", "!", "?"]
 CJK_SENTENCE_ENDINGS = ["。", "！", "？", "‼", "⁇", "⁈", "⁉"]
 
 # NB: text-embedding-3-XX is the same BPE as text-embedding-ada-002
-bpe = tiktoken.encoding_for_model(ENCODING_MODEL)
+bpe = get_encoding(ENCODING_MODEL)
 
 DEFAULT_OVERLAP_PERCENT = 10  # See semantic search article for 10% overlap performance
 DEFAULT_SECTION_LENGTH = 1000  # Roughly 400-500 tokens for English
@@ -149,24 +155,25 @@ class _ChunkBuilder:
     max_tokens: int
     parts: list[str] = field(default_factory=list)
     token_len: int = 0
+    char_len: int = 0
 
     def can_fit(self, text: str, token_count: int) -> bool:
         if not self.parts:  # always allow first span
             return token_count <= self.max_tokens and len(text) <= self.max_chars
         # Character + token constraints
-        return (len("".join(self.parts)) + len(text) <= self.max_chars) and (
-            self.token_len + token_count <= self.max_tokens
-        )
+        return (self.char_len + len(text) <= self.max_chars) and (self.token_len + token_count <= self.max_tokens)
 
     def add(self, text: str, token_count: int) -> bool:
         if not self.can_fit(text, token_count):
             return False
         self.parts.append(text)
         self.token_len += token_count
+        self.char_len += len(text)
         return True
 
     def force_append(self, text: str):
         self.parts.append(text)
+        self.char_len += len(text)
 
     def flush_into(self, out: list[Chunk]):
         if self.parts:
@@ -175,6 +182,7 @@ class _ChunkBuilder:
                 out.append(Chunk(page_num=self.page_num, text=chunk))
         self.parts.clear()
         self.token_len = 0
+        self.char_len = 0
 
     # Convenience helpers for readability at call sites
     def has_content(self) -> bool:
@@ -202,6 +210,15 @@ class SentenceTextSplitter(TextSplitter):
         # - Between chunks on the same page.
         # - Across page boundary ONLY if semantic continuation heuristics pass.
         self.semantic_overlap_percent = 10
+        self.token_counter = TokenCounter(ENCODING_MODEL)
+        sentence_ending_chars = "".join(re.escape(ch) for ch in self.sentence_endings)
+        word_break_chars = "".join(re.escape(ch) for ch in self.word_breaks)
+        self.sentence_ending_regex = re.compile(f"[{sentence_ending_chars}]")
+        self.word_break_regex = re.compile(f"[{word_break_chars}]")
+        # A sentence-like span runs up to and including the next sentence ending, or to the end of the text
+        self.span_regex = re.compile(
+            f"[^{sentence_ending_chars}]*[{sentence_ending_chars}]|[^{sentence_ending_chars}]+"
+        )
 
     def _find_split_pos(self, text: str) -> tuple[int, bool]:
         """Find a good split position near midpoint.
@@ -218,42 +235,41 @@ class SentenceTextSplitter(TextSplitter):
             return -1, True
         mid = length // 2
         window_limit = length // 3  # defines central region scan boundary
-
-        # 1. Sentence endings
-        pos = 0
-        while mid - pos > window_limit:
-            left = mid - pos
-            right = mid + pos
-            if left >= 0 and text[left] in self.sentence_endings:
-                return left, False
-            if right < length and text[right] in self.sentence_endings:
-                return right, False
-            pos += 1
-
-        # 2. Word breaks
-        pos = 0
-        while mid - pos > window_limit:
-            left = mid - pos
-            right = mid + pos
-            if left >= 0 and text[left] in self.word_breaks:
-                return left, False
-            if right < length and text[right] in self.word_breaks:
-                return right, False
-            pos += 1
+        if mid <= window_limit:
+            return -1, True
+        # Positions are scanned outward from the midpoint, left before right at equal distance
+        left_window = text[window_limit + 1 : mid + 1][::-1]
+        right_end = min(mid + (mid - window_limit), length)
+
+        for boundary_regex in (self.sentence_ending_regex, self.word_break_regex):  # 1. Sentence endings 2. Word breaks
+            left = boundary_regex.search(left_window)
+            right = boundary_regex.search(text, mid, right_end)
+            if left and (not right or left.start() <= right.start() - mid):
+                return mid - left.start(), False
+            if right:
+                return right.start(), False
 
         # 3. Fallback
         return -1, True
 
-    def split_page_by_max_tokens(self, page_num: int, text: str) -> Generator[Chunk, None, None]:
+    def split_page_by_max_tokens(
+        self, page_num: int, text: str, token_count: Optional[int] = None
+    ) -> Generator[Chunk, None, None]:
         """Recursively split plain text by token count.
 
         Boundary preference order when an oversized span is encountered:
         1. Sentence-ending punctuation near midpoint.
         2. Word-break character near midpoint (space/punctuation) to avoid mid-word cuts.
         3. Midpoint split with symmetric overlap (DEFAULT_OVERLAP_PERCENT).
+
+        token_count is the already known token count of text, if any. Each level of the recursion
+        encodes its halves again, in one batch, because BPE counts of substrings are not additive at
+        the cut points. A text never has more tokens than UTF-8 bytes, so halves whose byte length is
+        within the limit become chunks without being encoded.
         """
-        tokens = bpe.encode(text)
-        if len(tokens) <= self.max_tokens_per_section:
+        if token_count is None:
+            token_count = self.token_counter.count(text)
+        if token_count <= self.max_tokens_per_section:
             yield Chunk(page_num=page_num, text=text)
             return
 
@@ -267,8 +283,11 @@ class SentenceTextSplitter(TextSplitter):
             first_half = text[: middle + overlap]
             second_half = text[middle - overlap :]
 
-        yield from self.split_page_by_max_tokens(page_num, first_half)
-        yield from self.split_page_by_max_tokens(page_num, second_half)
+        halves = [first_half, second_half]
+        oversized = [half for half in halves if len(half.encode("utf-8")) > self.max_tokens_per_section]
+        half_tokens = dict(zip(oversized, self.token_counter.count_batch(oversized))) if oversized else {}
+        for half in halves:
+            yield from self.split_page_by_max_tokens(page_num, half, half_tokens.get(half, 0))
 
     def _is_heading_like(self, line: str) -> bool:
         """Heuristic heading detector used to suppress cross-page semantic overlap when a new section starts."""
@@ -357,12 +376,12 @@ class SentenceTextSplitter(TextSplitter):
 
         candidate = prev_chunk.text + prefix
         max_chars = int(self.max_section_length * 1.2)
-        if len(candidate) > max_chars or len(bpe.encode(candidate)) > self.max_tokens_per_section:
+        if len(candidate) > max_chars or self.token_counter.count(candidate) > self.max_tokens_per_section:
             # Attempt to shrink prefix at word / sentence boundaries from its start
             shrink = prefix
             while shrink and (
                 len(prev_chunk.text + shrink) > max_chars
-                or len(bpe.encode(prev_chunk.text + shrink)) > self.max_tokens_per_section
+                or self.token_counter.count(prev_chunk.text + shrink) > self.max_tokens_per_section
             ):
                 cut_index = 1
                 for i, ch in enumerate(shrink):
@@ -373,10 +392,14 @@ class SentenceTextSplitter(TextSplitter):
             if not shrink:
                 return prev_chunk
             candidate = prev_chunk.text + shrink
-            if len(candidate) > max_chars or len(bpe.encode(candidate)) > self.max_tokens_per_section:
+            if len(candidate) > max_chars or self.token_counter.count(candidate) > self.max_tokens_per_section:
                 return prev_chunk
         return Chunk(page_num=prev_chunk.page_num, text=candidate)
 
+    def _text_block(self, text: str) -> tuple[str, str, list[str]]:
+        """Text block with its sentence-like spans, each ending with a sentence ending (except possibly the last)."""
+        return ("text", text, self.span_regex.findall(text))
+
     def split_pages(self, pages: list[Page]) -> Generator[Chunk, None, None]:
         """Split each page into semantic chunks using token-aware accumulation with atomic figures.
 
@@ -394,22 +417,29 @@ class SentenceTextSplitter(TextSplitter):
         figure_regex = re.compile(r"<figure.*?</figure>", re.IGNORECASE | re.DOTALL)
         previous_chunk: Optional[Chunk] = None
 
+        # Build the ordered blocks of every page first: (type, text, sentence-like spans of text blocks),
+        # so the token counts of all spans of the document can be computed in one batch
+        page_blocks: list[tuple[Page, list[tuple[str, str, list[str]]]]] = []
+        all_spans: list[str] = []
         for page in pages:
             raw = page.text or ""
             if not raw.strip():
                 continue
 
-            # Build ordered list of blocks: (type, text)
-            blocks: list[tuple[str, str]] = []
+            blocks: list[tuple[str, str, list[str]]] = []
             last = 0
             for m in figure_regex.finditer(raw):
                 if m.start() > last:
-                    blocks.append(("text", raw[last : m.start()]))
-                blocks.append(("figure", m.group()))
+                    blocks.append(self._text_block(raw[last : m.start()]))
+                blocks.append(("figure", m.group(), []))
                 last = m.end()
             if last < len(raw):
-                blocks.append(("text", raw[last:]))
+                blocks.append(self._text_block(raw[last:]))
+            page_blocks.append((page, blocks))
+            all_spans.extend(span for _, _, spans in blocks for span in spans)
+        span_token_counts = iter(self.token_counter.count_batch(all_spans))
 
+        for page, blocks in page_blocks:
             page_chunks: list[Chunk] = []
             builder = _ChunkBuilder(
                 page_num=page.page_num,
@@ -417,7 +447,7 @@ class SentenceTextSplitter(TextSplitter):
                 max_tokens=self.max_tokens_per_section,
             )
 
-            for btype, btext in blocks:
+            for btype, btext, spans in blocks:
                 if btype == "figure":
                     if builder.has_content():
                         # Append figure to existing text (allow overflow) and flush
@@ -428,23 +458,13 @@ class SentenceTextSplitter(TextSplitter):
                             page_chunks.append(Chunk(page_num=page.page_num, text=btext))
                     continue
 
-                # Process text block: split into sentence-like spans
-                spans: list[str] = []
-                current_chars: list[str] = []
-                for ch in btext:
-                    current_chars.append(ch)
-                    if ch in self.sentence_endings:
-                        spans.append("".join(current_chars))
-                        current_chars = []
-                if current_chars:  # remaining tail
-                    spans.append("".join(current_chars))
-
+                # Process text block span by span
                 for span in spans:
-                    span_tokens = len(bpe.encode(span))
+                    span_tokens = next(span_token_counts)
                     # If a single span itself exceeds token limit (rare, very long sentence), split it directly
                     if span_tokens > self.max_tokens_per_section:
                         builder.flush_into(page_chunks)
-                        for chunk in self.split_page_by_max_tokens(page.page_num, span):
+                        for chunk in self.split_page_by_max_tokens(page.page_num, span, span_tokens):
                             page_chunks.append(chunk)
                         continue
                     if not builder.add(span, span_tokens):
@@ -472,9 +492,9 @@ class SentenceTextSplitter(TextSplitter):
                 ):
                     combined_text = _safe_concat(previous_chunk.text, first_new.text)
                     # Only merge if token limit respected (figures already handled earlier)
-                    if len(bpe.encode(combined_text)) <= self.max_tokens_per_section and len(combined_text) <= int(
-                        self.max_section_length * 1.2
-                    ):
+                    if self.token_counter.count(combined_text) <= self.max_tokens_per_section and len(
+                        combined_text
+                    ) <= int(self.max_section_length * 1.2):
                         previous_chunk = Chunk(page_num=previous_chunk.page_num, text=combined_text)
                         page_chunks = page_chunks[1:]
                     else:
@@ -496,7 +516,7 @@ class SentenceTextSplitter(TextSplitter):
                                 combined = candidate + first_new_text
                                 if len(combined) > max_chars:
                                     return False
-                                if len(bpe.encode(combined)) > self.max_tokens_per_section:
+                                if self.token_counter.count(combined) > self.max_tokens_per_section:
                                     return False
                                 return True
 
@@ -509,7 +529,8 @@ class SentenceTextSplitter(TextSplitter):
                                 move_fragment = move_fragment[:remaining_chars]
                                 while (
                                     move_fragment
-                                    and len(bpe.encode(move_fragment + first_new_text)) > self.max_tokens_per_section
+                                    and self.token_counter.count(move_fragment + first_new_text)
+                                    > self.max_tokens_per_section
                                 ):
                                     move_fragment = (
                                         move_fragment[:-50] if len(move_fragment) > 50 else move_fragment[:-1]
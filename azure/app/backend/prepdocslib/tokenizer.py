@@ -0,0 +1,63 @@
+import functools
+import os
+from collections import OrderedDict
+from collections.abc import Sequence
+from typing import Optional
+
+import tiktoken
+
+
+@functools.cache
+def get_encoding(model_name: str) -> tiktoken.Encoding:
+    """Returns the tiktoken encoding for a model, loading it only once per process"""
+    return tiktoken.encoding_for_model(model_name)
+
+
+class TokenCounter:
+    """
+    Counts tokens for a model with a shared encoding.
+    Counts of recently seen texts are cached, and batches of uncached texts are encoded on several threads.
+    """
+
+    # Below this many uncached texts, encoding them one by one is cheaper than starting the encoding threads
+    MIN_PARALLEL_BATCH = 32
+
+    def __init__(self, model_name: str, cache_size: int = 10000, num_threads: Optional[int] = None):
+        self.encoding = get_encoding(model_name)
+        self.cache_size = cache_size
+        # Threads only help when there are several cores to encode on
+        self.num_threads = num_threads or min(os.cpu_count() or 1, 8)
+        self._counts: OrderedDict[str, int] = OrderedDict()
+
+    def __getstate__(self):
+        # Counters are copied to worker processes to split text there, without their cached counts
+        state = self.__dict__.copy()
+        state["_counts"] = OrderedDict()
+        return state
+
+    def count(self, text: str) -> int:
+        token_count = self._counts.get(text)
+        if token_count is None:
+            token_count = len(self.encoding.encode(text))
+            self._remember(text, token_count)
+        else:
+            self._counts.move_to_end(text)
+        return token_count
+
+    def count_batch(self, texts: Sequence[str]) -> list[int]:
+        uncached = list({text: None for text in texts if text not in self._counts})
+        if self.num_threads > 1 and len(uncached) >= self.MIN_PARALLEL_BATCH:
+            encoded = self.encoding.encode_batch(uncached, num_threads=self.num_threads)
+            new_counts = {text: len(tokens) for text, tokens in zip(uncached, encoded)}
+        else:
+            new_counts = {text: len(self.encoding.encode(text)) for text in uncached}
+        # Counts are taken before caching so a batch larger than the cache is still fully counted
+        counts = [new_counts[text] if text in new_counts else self.count(text) for text in texts]
+        for text, token_count in new_counts.items():
+            self._remember(text, token_count)
+        return counts
+
+    def _remember(self, text: str, token_count: int):
+        self._counts[text] = token_count
+        if len(self._counts) > self.cache_size:
+            self._counts.popitem(last=False)
@@ -1,6 +1,16 @@
 const BACKEND_URI = "";
 
-import { ChatAppResponse, ChatAppResponseOrError, ChatAppRequest, Config, SimpleAPIResponse, HistoryListApiResponse, HistoryApiResponse } from "./models";
+import {
+    ChatAppResponse,
+    ChatAppResponseOrError,
+    ChatAppRequest,
+    Config,
+    SimpleAPIResponse,
+    HistoryListApiResponse,
+    HistoryApiResponse,
+    UploadFileResponse,
+    UploadJob
+} from "./models";
 import { useLogin, getToken, isUsingAppServicesLogin } from "../authConfig";
 
 export async function getHeaders(idToken: string | undefined): Promise<Record<string, string>> {
@@ -84,7 +94,7 @@ export function getCitationFilePath(citation: string): string {
     return `${BACKEND_URI}/content/${cleanedCitation}`;
 }
 
-export async function uploadFileApi(request: FormData, idToken: string): Promise<SimpleAPIResponse> {
+export async function uploadFileApi(request: FormData, idToken: string): Promise<UploadFileResponse> {
     const response = await fetch("/upload", {
         method: "POST",
         headers: await getHeaders(idToken),
@@ -95,7 +105,21 @@ export async function uploadFileApi(request: FormData, idToken: string): Promise
         throw new Error(`Uploading files failed: ${response.statusText}`);
     }
 
-    const dataResponse: SimpleAPIResponse = await response.json();
+    const dataResponse: UploadFileResponse = await response.json();
+    return dataResponse;
+}
+
+export async function getUploadStatusApi(jobId: string, idToken: string): Promise<UploadJob> {
+    const response = await fetch(`/upload_status/${encodeURIComponent(jobId)}`, {
+        method: "GET",
+        headers: await getHeaders(idToken)
+    });
+
+    if (!response.ok) {
+        throw new Error(`Getting upload status failed: ${response.statusText}`);
+    }
+
+    const dataResponse: UploadJob = await response.json();
     return dataResponse;
 }
 
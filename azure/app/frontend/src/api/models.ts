@@ -9,6 +9,7 @@ export type ChatAppRequestOverrides = {
     semantic_ranker?: boolean;
     semantic_captions?: boolean;
     query_rewriting?: boolean;
+    speculative_search?: boolean;
     reasoning_effort?: string;
     include_category?: string;
     exclude_category?: string;
@@ -104,6 +105,18 @@ export type SimpleAPIResponse = {
     message?: string;
 };
 
+export type UploadJob = {
+    id: string;
+    filename: string;
+    status: "queued" | "processing" | "succeeded" | "failed" | "superseded" | "cancelled";
+    progress?: string | null;
+    error?: string | null;
+};
+
+export type UploadFileResponse = SimpleAPIResponse & {
+    job: UploadJob;
+};
+
 export interface SpeechConfig {
     speechUrls: (string | null)[];
     setSpeechUrls: (urls: (string | null)[]) => void;
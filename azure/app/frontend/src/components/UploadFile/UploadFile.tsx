@@ -5,10 +5,12 @@ import { Add24Regular, Delete24Regular } from "@fluentui/react-icons";
 import { useMsal } from "@azure/msal-react";
 import { useTranslation } from "react-i18next";
 
-import { SimpleAPIResponse, uploadFileApi, deleteUploadedFileApi, listUploadedFilesApi } from "../../api";
+import { SimpleAPIResponse, uploadFileApi, deleteUploadedFileApi, listUploadedFilesApi, getUploadStatusApi, UploadJob } from "../../api";
 import { useLogin, getToken } from "../../authConfig";
 import styles from "./UploadFile.module.css";
 
+const UPLOAD_STATUS_POLL_INTERVAL_MS = 2000;
+
 interface Props {
     className?: string;
     disabled?: boolean;
@@ -75,6 +77,15 @@ export const UploadFile: React.FC<Props> = ({ className, disabled }: Props) => {
     };
 
     // Handler for the form submission (file upload)
+    // Files are ingested in the background after they are uploaded, so wait until they are searchable
+    const waitForUploadJob = async (job: UploadJob, idToken: string): Promise<UploadJob> => {
+        while (job.status === "queued" || job.status === "processing") {
+            await new Promise(resolve => setTimeout(resolve, UPLOAD_STATUS_POLL_INTERVAL_MS));
+            job = await getUploadStatusApi(job.id, idToken);
+        }
+        return job;
+    };
+
     const handleUploadFile = async (e: ChangeEvent<HTMLInputElement>) => {
         e.preventDefault();
         if (!e.target.files || e.target.files.length === 0) {
@@ -90,10 +101,20 @@ export const UploadFile: React.FC<Props> = ({ className, disabled }: Props) => {
             if (!idToken) {
                 throw new Error("No authentication token available");
             }
-            const response: SimpleAPIResponse = await uploadFileApi(formData, idToken);
-            setUploadedFile(response);
+            const response = await uploadFileApi(formData, idToken);
+            const job = await waitForUploadJob(response.job, idToken);
+            if (job.status === "failed") {
+                throw new Error(job.error ?? "Ingesting the uploaded file failed");
+            }
+            if (job.status === "superseded" || job.status === "cancelled") {
+                // The file was uploaded again or deleted before this upload was ingested
+                setUploadedFile(undefined);
+                setUploadedFileError(t(job.status === "superseded" ? "upload.uploadSuperseded" : "upload.uploadCancelled"));
+            } else {
+                setUploadedFile(response);
+                setUploadedFileError(undefined);
+            }
             setIsUploading(false);
-            setUploadedFileError(undefined);
             listUploadedFiles(idToken);
         } catch (error) {
             console.error(error);
@@ -159,6 +159,10 @@ const Chat = () => {
                 } else if (event["delta"] && event["delta"]["content"]) {
                     setIsLoading(false);
                     await updateState(event["delta"]["content"]);
+                } else if (event["context"] && event["context"]["image_source"]) {
+                    // Image sources are sent one at a time, once they are downloaded
+                    const dataPoints = askResponse.context.data_points;
+                    askResponse.context.data_points = { ...dataPoints, images: [...(dataPoints.images ?? []), event["context"]["image_source"]] };
                 } else if (event["context"]) {
                     // Update context with new keys from latest event
                     askResponse.context = { ...askResponse.context, ...event["context"] };
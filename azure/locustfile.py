@@ -7,6 +7,20 @@ from locust import HttpUser, between, task
 class ChatUser(HttpUser):
     wait_time = between(5, 20)
 
+    def report_stages(self, response, name):
+        # Report the stages of the Server-Timing header, such as search and answer, as their own entries
+        for entry in response.headers.get("Server-Timing", "").split(","):
+            stage, _, duration = entry.strip().partition(";dur=")
+            if stage and duration:
+                self.environment.events.request.fire(
+                    request_type="STAGE",
+                    name=f"{name}: {stage}",
+                    response_time=float(duration),
+                    response_length=0,
+                    exception=None,
+                    context={},
+                )
+
     @task
     def ask_question(self):
         self.client.get(
@@ -44,12 +58,13 @@ class ChatUser(HttpUser):
                 },
             },
         )
+        self.report_stages(response, "initial chat")
         time.sleep(self.wait_time())
         # use one of the follow up questions.
         follow_up_question = random.choice(response.json()["context"]["followup_questions"])
         result_message = response.json()["message"]["content"]
 
-        self.client.post(
+        response = self.client.post(
             "/chat",
             name="follow up chat",
             json={
@@ -72,3 +87,4 @@ class ChatUser(HttpUser):
                 },
             },
         )
+        self.report_stages(response, "follow up chat")
@@ -0,0 +1,503 @@
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from collections.abc import Awaitable, Callable
+from dataclasses import asdict, dataclass, field
+from multiprocessing.connection import Connection
+from multiprocessing.process import BaseProcess
+from typing import Any, Optional
+
+import aiohttp
+import psutil
+
+from standin_services import StandInConfig, StandInServices
+
+logger = logging.getLogger("scripts")
+
+APP_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "app", "backend")
+
+QUESTIONS = [
+    "What is included in my Northwind Health Plus plan that is not in standard?",
+    "What does a Product Manager do?",
+    "What happens in a performance review?",
+    "Whats your whistleblower policy?",
+]
+
+
+def app_environment(standin_url: str, standins: StandInConfig) -> dict[str, str]:
+    """
+    Environment of the app workers, pointing the OpenAI client at the stand-in services.
+    Other settings of the app, such as the query cache, are taken from the environment of the benchmark.
+    """
+    environment = {
+        "AZURE_STORAGE_ACCOUNT": "benchmarkaccount",
+        "AZURE_STORAGE_CONTAINER": "content",
+        "AZURE_SEARCH_SERVICE": "benchmark",
+        "AZURE_SEARCH_INDEX": "gptkbindex",
+        "OPENAI_HOST": "local",
+        "OPENAI_BASE_URL": f"{standin_url}/openai/v1",
+        "AZURE_OPENAI_CHATGPT_MODEL": "gpt-4.1-mini",
+        "AZURE_OPENAI_EMB_MODEL_NAME": "text-embedding-3-large",
+        "AZURE_OPENAI_EMB_DIMENSIONS": str(standins.embedding_dimensions),
+        "AZURE_USE_AUTHENTICATION": "false",
+        "USE_USER_UPLOAD": "false",
+        "USE_SPEECH_OUTPUT_AZURE": "false",
+        "USE_AGENTIC_RETRIEVAL": "false",
+        "USE_MULTIMODAL": "false",
+        "APPLICATIONINSIGHTS_CONNECTION_STRING": "",
+        "APP_LOG_LEVEL": os.getenv("APP_LOG_LEVEL") or "WARNING",
+    }
+    return environment
+
+
+def run_standins(config: StandInConfig, connection: Connection):
+    """
+    Serve the stand-in services until the process is terminated
+    """
+
+    async def serve():
+        services = StandInServices(config)
+        connection.send(await services.start())
+        await asyncio.Event().wait()
+
+    asyncio.run(serve())
+
+
+def run_app_worker(environment: dict[str, str], standin_url: str, connection: Connection):
+    """
+    Serve the app with uvicorn, with its Search and Blob storage clients replaced by clients of the stand-in services,
+    as those are always created with Azure credentials that require HTTPS endpoints
+    """
+    os.environ.update(environment)
+    sys.path.insert(0, APP_DIRECTORY)
+    import socket
+
+    import uvicorn
+    from azure.core.credentials import AzureKeyCredential
+    from azure.search.documents.aio import SearchClient
+    from quart import current_app
+
+    from app import create_app  # type: ignore[import-not-found]
+    from config import (  # type: ignore[import-not-found]
+        CONFIG_ASK_APPROACH,
+        CONFIG_CHAT_APPROACH,
+        CONFIG_GLOBAL_BLOB_MANAGER,
+        CONFIG_SEARCH_CLIENT,
+    )
+    from prepdocslib.blobmanager import BlobManager  # type: ignore[import-not-found]
+
+    app = create_app()
+
+    @app.before_serving
+    async def use_standins():
+        search_client = SearchClient(
+            endpoint=standin_url,
+            index_name=os.environ["AZURE_SEARCH_INDEX"],
+            credential=AzureKeyCredential("benchmark"),
+        )
+        blob_manager = BlobManager(
+            endpoint=f"{standin_url}/{os.environ['AZURE_STORAGE_ACCOUNT']}",
+            container=os.environ["AZURE_STORAGE_CONTAINER"],
+            credential=None,  # type: ignore[arg-type]
+        )
+        await current_app.config[CONFIG_SEARCH_CLIENT].close()
+        await current_app.config[CONFIG_GLOBAL_BLOB_MANAGER].close_clients()
+        current_app.config[CONFIG_SEARCH_CLIENT] = search_client
+        current_app.config[CONFIG_GLOBAL_BLOB_MANAGER] = blob_manager
+        for approach_key in (CONFIG_ASK_APPROACH, CONFIG_CHAT_APPROACH):
+            current_app.config[approach_key].search_client = search_client
+            current_app.config[approach_key].global_blob_manager = blob_manager
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(("127.0.0.1", 0))
+    connection.send(f"http://127.0.0.1:{sock.getsockname()[1]}")
+    server = uvicorn.Server(uvicorn.Config(app, log_level="warning", access_log=False, lifespan="on"))
+    server.run(sockets=[sock])
+
+
+def chat_request(question: str) -> dict[str, Any]:
+    return {
+        "messages": [{"content": question, "role": "user"}],
+        "context": {
+            "overrides": {
+                "retrieval_mode": "hybrid",
+                "semantic_ranker": True,
+                "semantic_captions": False,
+                "top": 3,
+                "suggest_followup_questions": False,
+            }
+        },
+    }
+
+
+async def post_json(session: aiohttp.ClientSession, url: str, question: str) -> Optional[float]:
+    async with session.post(url, json=chat_request(question)) as response:
+        response.raise_for_status()
+        await response.read()
+    return None
+
+
+async def post_stream(session: aiohttp.ClientSession, url: str, question: str) -> Optional[float]:
+    """
+    Read a streamed chat response, returning the time to its first answer token
+    """
+    start_time = time.perf_counter()
+    first_token_ms = None
+    async with session.post(url, json=chat_request(question)) as response:
+        response.raise_for_status()
+        async for line in response.content:
+            if not line.strip():
+                continue
+            event = json.loads(line)
+            if "error" in event:
+                raise ValueError(event["error"])
+            if first_token_ms is None and (event.get("delta") or {}).get("content"):
+                first_token_ms = (time.perf_counter() - start_time) * 1000
+    return first_token_ms
+
+
+async def get_content(session: aiohttp.ClientSession, url: str, _: str) -> Optional[float]:
+    async with session.get(url) as response:
+        response.raise_for_status()
+        async for _chunk in response.content.iter_chunked(64 * 1024):
+            pass
+    return None
+
+
+@dataclass
+class Scenario:
+    path: Callable[[int], str]
+    send: Callable[[aiohttp.ClientSession, str, str], Awaitable[Optional[float]]]
+
+
+SCENARIOS = {
+    "ask": Scenario(lambda _: "/ask", post_json),
+    "chat": Scenario(lambda _: "/chat", post_json),
+    "chat-stream": Scenario(lambda _: "/chat/stream", post_stream),
+    "content": Scenario(lambda i: f"/content/Benefit_Options-{i % 3}.pdf", get_content),
+}
+
+
+@dataclass
+class BenchmarkConfig:
+    """
+    Settings of a benchmark run: how many app workers to start, how hard to drive them and how the
+    stand-in services behave
+    """
+
+    scenarios: list[str] = field(default_factory=lambda: list(SCENARIOS))
+    workers: int = 1
+    concurrency: int = 8
+    requests: int = 200
+    warmup_requests: int = 10
+    repeat_questions: bool = False
+    standins: StandInConfig = field(default_factory=StandInConfig)
+
+
+def summarize(latencies: list[float]) -> Optional[dict[str, float]]:
+    if not latencies:
+        return None
+    samples = sorted(latencies)
+
+    def percentile(fraction: float) -> float:
+        # Nearest-rank percentile
+        return round(samples[min(len(samples) - 1, int(fraction * len(samples)))], 1)
+
+    return {"p50": percentile(0.5), "p95": percentile(0.95), "p99": percentile(0.99), "max": round(samples[-1], 1)}
+
+
+class MemorySampler:
+    """
+    Samples the resident memory of the app workers, to report the peak of each worker during a scenario
+    """
+
+    def __init__(self, pids: list[int], interval: float = 0.1):
+        self.processes = [psutil.Process(pid) for pid in pids]
+        self.interval = interval
+        self.peaks = [0] * len(pids)
+
+    def sample(self) -> list[int]:
+        rss = [process.memory_info().rss for process in self.processes]
+        self.peaks = [max(peak, size) for peak, size in zip(self.peaks, rss)]
+        return rss
+
+    async def run(self):
+        while True:
+            self.sample()
+            await asyncio.sleep(self.interval)
+
+
+async def run_scenario(
+    session: aiohttp.ClientSession,
+    worker_urls: list[str],
+    scenario: Scenario,
+    requests: int,
+    concurrency: int,
+    repeat_questions: bool,
+    first_request: int = 0,
+) -> dict[str, Any]:
+    """
+    Send a number of requests with a fixed number of concurrent users, spreading them over the workers
+    """
+    latencies: list[float] = []
+    first_tokens: list[float] = []
+    errors: list[str] = []
+    request_numbers = iter(range(first_request, first_request + requests))
+
+    async def user():
+        for i in request_numbers:
+            url = worker_urls[i % len(worker_urls)] + scenario.path(i)
+            question = QUESTIONS[i % len(QUESTIONS)]
+            if not repeat_questions:
+                # Every request asks a different question, so that none of them is answered from the query cache
+                question = f"{question} (request {i})"
+            start_time = time.perf_counter()
+            try:
+                first_token_ms = await scenario.send(session, url, question)
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as error:
+                errors.append(str(error))
+                continue
+            latencies.append((time.perf_counter() - start_time) * 1000)
+            if first_token_ms is not None:
+                first_tokens.append(first_token_ms)
+
+    start_time = time.perf_counter()
+    await asyncio.gather(*(user() for _ in range(concurrency)))
+    duration = time.perf_counter() - start_time
+    if errors:
+        logger.warning("%d requests failed, first error: %s", len(errors), errors[0])
+    result: dict[str, Any] = {
+        "requests": requests,
+        "errors": len(errors),
+        "duration_s": round(duration, 2),
+        "throughput_rps": round(len(latencies) / duration, 1),
+        "latency_ms": summarize(latencies),
+    }
+    if first_tokens:
+        result["first_token_ms"] = summarize(first_tokens)
+    return result
+
+
+async def wait_until_ready(session: aiohttp.ClientSession, url: str, timeout: float = 120):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            async with session.get(f"{url}/config") as response:
+                if response.status == 200:
+                    return
+        except aiohttp.ClientError:
+            pass
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"App worker at {url} did not start within {timeout} seconds")
+        await asyncio.sleep(0.2)
+
+
+async def receive_url(process: BaseProcess, receiver: Connection, timeout: float = 120) -> str:
+    """
+    Wait for a stand-in or app worker process to send the URL it serves on, failing if it exits first
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        if receiver.poll():
+            try:
+                return receiver.recv()
+            except EOFError:
+                pass
+        if not process.is_alive():
+            raise RuntimeError(f"{process.name} exited with code {process.exitcode} before it started serving")
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"{process.name} did not start within {timeout} seconds")
+        await asyncio.sleep(0.1)
+
+
+async def run_benchmark(config: BenchmarkConfig) -> dict[str, Any]:
+    """
+    Start the stand-in services and the app workers in their own processes, then drive each scenario in turn
+    """
+    context = multiprocessing.get_context("spawn")
+    processes = []
+    try:
+        receiver, sender = context.Pipe(duplex=False)
+        standins = context.Process(target=run_standins, args=(config.standins, sender), name="standins", daemon=True)
+        standins.start()
+        processes.append(standins)
+        # Only the child holds the sending end, so the receiver sees EOF if it dies
+        sender.close()
+        standin_url = await receive_url(standins, receiver)
+
+        environment = app_environment(standin_url, config.standins)
+        worker_urls = []
+        for index in range(config.workers):
+            receiver, sender = context.Pipe(duplex=False)
+            worker = context.Process(
+                target=run_app_worker,
+                args=(environment, standin_url, sender),
+                name=f"app-worker-{index}",
+                daemon=True,
+            )
+            worker.start()
+            processes.append(worker)
+            sender.close()
+            worker_urls.append(await receive_url(worker, receiver))
+
+        connector = aiohttp.TCPConnector(limit=config.concurrency)
+        async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=300)) as session:
+            for url in worker_urls:
+                await wait_until_ready(session, url)
+            memory = MemorySampler([process.pid for process in processes[1:] if process.pid])
+            results: dict[str, Any] = {
+                "config": asdict(config),
+                "workers": {"idle_rss_mb": [round(rss / 2**20, 1) for rss in memory.sample()]},
+                "scenarios": {},
+            }
+            first_request = 0
+            for name in config.scenarios:
+                scenario = SCENARIOS[name]
+                if config.warmup_requests:
+                    await run_scenario(
+                        session,
+                        worker_urls,
+                        scenario,
+                        config.warmup_requests,
+                        config.concurrency,
+                        config.repeat_questions,
+                        first_request,
+                    )
+                    first_request += config.warmup_requests
+                memory.peaks = [0] * len(memory.processes)
+                sampler = asyncio.create_task(memory.run())
+                try:
+                    result = await run_scenario(
+                        session,
+                        worker_urls,
+                        scenario,
+                        config.requests,
+                        config.concurrency,
+                        config.repeat_questions,
+                        first_request,
+                    )
+                finally:
+                    sampler.cancel()
+                first_request += config.requests
+                result["peak_rss_mb"] = [round(peak / 2**20, 1) for peak in memory.peaks]
+                results["scenarios"][name] = result
+            return results
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.join(timeout=10)
+
+
+def find_regressions(results: dict[str, Any], baseline: dict[str, Any], max_regression: float) -> list[str]:
+    """
+    Compare the throughput, tail latency and peak memory of each scenario with an earlier run,
+    returning a description of each metric that got worse by more than the given fraction
+    """
+    regressions = []
+    for name, result in results["scenarios"].items():
+        if (previous := baseline.get("scenarios", {}).get(name)) is None:
+            continue
+        if result["throughput_rps"] < previous["throughput_rps"] * (1 - max_regression):
+            regressions.append(
+                f"{name}: throughput dropped from {previous['throughput_rps']} to {result['throughput_rps']} requests/s"
+            )
+        for metric in ("latency_ms", "first_token_ms"):
+            for percentile in ("p95", "p99"):
+                current_value = (result.get(metric) or {}).get(percentile)
+                previous_value = (previous.get(metric) or {}).get(percentile)
+                if current_value and previous_value and current_value > previous_value * (1 + max_regression):
+                    regressions.append(f"{name}: {metric} {percentile} rose from {previous_value} to {current_value}")
+        if max(result["peak_rss_mb"]) > max(previous["peak_rss_mb"]) * (1 + max_regression):
+            regressions.append(
+                f"{name}: peak memory per worker rose from {max(previous['peak_rss_mb'])} "
+                f"to {max(result['peak_rss_mb'])} MB"
+            )
+    return regressions
+
+
+def print_results(results: dict[str, Any]):
+    print(f"Idle memory per worker (MB): {results['workers']['idle_rss_mb']}")
+    print(
+        f"{'scenario':<12} {'requests':>8} {'errors':>6} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+        f"{'max ms':>8} {'ttft p95':>9} {'peak MB':>8}"
+    )
+    for name, result in results["scenarios"].items():
+        latency = result["latency_ms"] or {"p50": 0, "p95": 0, "p99": 0, "max": 0}
+        first_token = (result.get("first_token_ms") or {}).get("p95", "")
+        print(
+            f"{name:<12} {result['requests']:>8} {result['errors']:>6} {result['throughput_rps']:>8} "
+            f"{latency['p50']:>8} {latency['p95']:>8} {latency['p99']:>8} {latency['max']:>8} "
+            f"{first_token:>9} {max(result['peak_rss_mb']):>8}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark the app against local stand-ins of Azure AI Search, OpenAI and Blob storage",
+        epilog="Example: benchmark.py --workers 2 --concurrency 16 --output results.json",
+    )
+    parser.add_argument(
+        "--scenarios",
+        default=",".join(SCENARIOS),
+        help=f"Optional. Comma-separated scenarios to run, out of {', '.join(SCENARIOS)}",
+    )
+    parser.add_argument("--workers", type=int, default=1, help="Optional. Number of app worker processes")
+    parser.add_argument("--concurrency", type=int, default=8, help="Optional. Number of concurrent users")
+    parser.add_argument("--requests", type=int, default=200, help="Optional. Number of requests per scenario")
+    parser.add_argument("--warmup-requests", type=int, default=10, help="Optional. Unmeasured requests per scenario")
+    parser.add_argument(
+        "--repeat-questions",
+        action="store_true",
+        help="Optional. Ask the same few questions repeatedly, so that they can be answered from the query cache",
+    )
+    defaults = StandInConfig()
+    for name, value in asdict(defaults).items():
+        parser.add_argument(
+            f"--{name.replace('_', '-')}",
+            type=type(value),
+            default=value,
+            help=f"Optional. {name.replace('_', ' ').capitalize()} of the stand-in services, {value} by default",
+        )
+    parser.add_argument("--output", required=False, help="Optional. Write the results to this JSON file")
+    parser.add_argument("--baseline", required=False, help="Optional. JSON results of an earlier run to compare with")
+    parser.add_argument(
+        "--max-regression",
+        type=float,
+        default=0.2,
+        help="Optional. Fraction by which a metric can get worse than the baseline before failing, 0.2 by default",
+    )
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING, format="%(message)s")
+
+    unknown_scenarios = [name for name in args.scenarios.split(",") if name not in SCENARIOS]
+    if unknown_scenarios:
+        print(f"Unknown scenarios: {', '.join(unknown_scenarios)}")
+        exit(1)
+    benchmark_config = BenchmarkConfig(
+        scenarios=args.scenarios.split(","),
+        workers=args.workers,
+        concurrency=args.concurrency,
+        requests=args.requests,
+        warmup_requests=args.warmup_requests,
+        repeat_questions=args.repeat_questions,
+        standins=StandInConfig(**{name: getattr(args, name) for name in asdict(defaults)}),
+    )
+    benchmark_results = asyncio.run(run_benchmark(benchmark_config))
+    print_results(benchmark_results)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(benchmark_results, output_file, indent=2)
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            found_regressions = find_regressions(benchmark_results, json.load(baseline_file), args.max_regression)
+        for regression in found_regressions:
+            print(f"Regression: {regression}")
+        if found_regressions:
+            exit(1)
@@ -0,0 +1,225 @@
+import asyncio
+import base64
+import hashlib
+import json
+import mimetypes
+import re
+import socket
+import struct
+import time
+from dataclasses import dataclass
+from email.utils import formatdate
+from typing import Any, Optional
+
+from aiohttp import web
+
+
+@dataclass
+class StandInConfig:
+    """
+    Latency and payload size of the stand-in services, so that the app can be benchmarked without Azure
+    """
+
+    search_latency_ms: float = 50
+    search_results: int = 3
+    result_bytes: int = 2000
+    embedding_latency_ms: float = 20
+    embedding_dimensions: int = 1536
+    completion_latency_ms: float = 200
+    answer_tokens: int = 100
+    token_interval_ms: float = 5
+    blob_latency_ms: float = 20
+    blob_bytes: int = 100_000
+
+
+WORDS = "the plan covers preventive care visits with no copay and includes dental vision and mental health".split()
+
+
+def filler(size: int) -> str:
+    """
+    Text of about the given number of bytes, made of words so that it is tokenized like prose
+    """
+    text = ""
+    while len(text) < size:
+        text += " ".join(WORDS) + ". "
+    return text[:size]
+
+
+class StandInServices:
+    """
+    Local HTTP servers standing in for Azure AI Search, OpenAI and Blob storage, answering the requests
+    that the app sends to them with generated payloads after a configurable latency.
+    Search is served at the root, OpenAI under /openai/v1 and storage under /{account}/{container}/{blob}.
+    """
+
+    def __init__(self, config: Optional[StandInConfig] = None):
+        self.config = config or StandInConfig()
+        self.requests: dict[str, int] = {"search": 0, "embeddings": 0, "chat": 0, "blob": 0}
+        self.app = web.Application(client_max_size=16 * 1024 * 1024)
+        self.app.router.add_post("/openai/v1/chat/completions", self.chat_completions)
+        self.app.router.add_post("/openai/v1/embeddings", self.embeddings)
+        self.app.router.add_post(r"/indexes('{index}')/docs/search.post.search", self.search)
+        self.app.router.add_route("*", "/{account}/{container}/{blob:.+}", self.blob)
+        self._runner: Optional[web.AppRunner] = None
+        self.url = ""
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((host, port))
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        await web.SockSite(self._runner, sock).start()
+        self.url = f"http://{host}:{sock.getsockname()[1]}"
+        return self.url
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def search(self, request: web.Request) -> web.Response:
+        self.requests["search"] += 1
+        body = await request.json()
+        await asyncio.sleep(self.config.search_latency_ms / 1000)
+        top = min(body.get("top") or self.config.search_results, self.config.search_results)
+        query = body.get("search") or body.get("semanticQuery") or ""
+        content = filler(self.config.result_bytes)
+        results = []
+        for i in range(top):
+            result: dict[str, Any] = {
+                "@search.score": 0.03 - i * 0.001,
+                "@search.rerankerScore": 3.0 - i * 0.1,
+                "id": f"file{i}-page-0",
+                "content": content,
+                "category": None,
+                "sourcepage": f"Benefit_Options-{i}.pdf#page={i + 1}",
+                "sourcefile": f"Benefit_Options-{i}.pdf",
+                "oids": [],
+                "groups": [],
+            }
+            if body.get("captions"):
+                result["@search.captions"] = [{"text": f"{query}: {content[:200]}", "highlights": None}]
+            results.append(result)
+        return web.json_response({"value": results})
+
+    async def embeddings(self, request: web.Request) -> web.Response:
+        self.requests["embeddings"] += 1
+        body = await request.json()
+        await asyncio.sleep(self.config.embedding_latency_ms / 1000)
+        inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        dimensions = body.get("dimensions") or self.config.embedding_dimensions
+        data = []
+        for i, text in enumerate(inputs):
+            # Vectors are derived from the text so that identical inputs get identical embeddings
+            seed = hashlib.sha256(str(text).encode()).digest()
+            vector = [(seed[j % len(seed)] - 128) / 128 for j in range(dimensions)]
+            embedding: Any = vector
+            if body.get("encoding_format") == "base64":
+                embedding = base64.b64encode(struct.pack(f"<{dimensions}f", *vector)).decode()
+            data.append({"object": "embedding", "index": i, "embedding": embedding})
+        return web.json_response(
+            {
+                "object": "list",
+                "data": data,
+                "model": body["model"],
+                "usage": {"prompt_tokens": 8 * len(inputs), "total_tokens": 8 * len(inputs)},
+            }
+        )
+
+    async def chat_completions(self, request: web.Request) -> web.StreamResponse:
+        self.requests["chat"] += 1
+        body = await request.json()
+        await asyncio.sleep(self.config.completion_latency_ms / 1000)
+        completion: dict[str, Any] = {
+            "id": "chatcmpl-standin",
+            "created": int(time.time()),
+            "model": body["model"],
+            "system_fingerprint": None,
+        }
+        usage = {"completion_tokens": self.config.answer_tokens, "prompt_tokens": 1000, "total_tokens": 1100}
+        question = next((message["content"] for message in reversed(body["messages"]) if message["role"] == "user"), "")
+        if body.get("tools"):
+            # Query rewriting, which is answered with a call to the search tool
+            message: dict[str, Any] = {
+                "role": "assistant",
+                "content": None,
+                "tool_calls": [
+                    {
+                        "id": "call_standin",
+                        "type": "function",
+                        "function": {
+                            "name": body["tools"][0]["function"]["name"],
+                            "arguments": json.dumps({"search_query": str(question)[:100]}),
+                        },
+                    }
+                ],
+            }
+            return web.json_response(
+                {
+                    **completion,
+                    "object": "chat.completion",
+                    "choices": [{"index": 0, "finish_reason": "tool_calls", "message": message, "logprobs": None}],
+                    "usage": usage,
+                }
+            )
+
+        tokens = [f" {WORDS[i % len(WORDS)]}" for i in range(self.config.answer_tokens)] + [" [Benefit_Options-0.pdf]."]
+        if not body.get("stream"):
+            await asyncio.sleep(self.config.token_interval_ms * len(tokens) / 1000)
+            message = {"role": "assistant", "content": "".join(tokens).strip()}
+            return web.json_response(
+                {
+                    **completion,
+                    "object": "chat.completion",
+                    "choices": [{"index": 0, "finish_reason": "stop", "message": message, "logprobs": None}],
+                    "usage": usage,
+                }
+            )
+
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+
+        async def send(choices: list, **extra):
+            chunk = {**completion, "object": "chat.completion.chunk", "choices": choices, **extra}
+            await response.write(f"data: {json.dumps(chunk)}\n\n".encode())
+
+        await send([{"index": 0, "delta": {"role": "assistant", "content": ""}, "finish_reason": None}])
+        for token in tokens:
+            await asyncio.sleep(self.config.token_interval_ms / 1000)
+            await send([{"index": 0, "delta": {"content": token}, "finish_reason": None}])
+        await send([{"index": 0, "delta": {}, "finish_reason": "stop"}])
+        if (body.get("stream_options") or {}).get("include_usage"):
+            await send([], usage=usage)
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+    async def blob(self, request: web.Request) -> web.Response:
+        self.requests["blob"] += 1
+        await asyncio.sleep(self.config.blob_latency_ms / 1000)
+        name = request.match_info["blob"]
+        size = self.config.blob_bytes
+        headers = {
+            "Content-Type": mimetypes.guess_type(name)[0] or "application/octet-stream",
+            "ETag": f'"0x{hashlib.sha256(name.encode()).hexdigest()[:16].upper()}"',
+            "Last-Modified": formatdate(0, usegmt=True),
+            "x-ms-blob-type": "BlockBlob",
+            "x-ms-creation-time": formatdate(0, usegmt=True),
+            "Accept-Ranges": "bytes",
+        }
+        if request.method == "HEAD":
+            return web.Response(headers={**headers, "Content-Length": str(size)})
+        if request.method != "GET":
+            return web.Response(status=405)
+
+        content = filler(size).encode()
+        range_header = request.headers.get("x-ms-range") or request.headers.get("Range")
+        if range_header and (match := re.fullmatch(r"bytes=(\d+)-(\d*)", range_header)):
+            start = int(match.group(1))
+            end = min(int(match.group(2)) if match.group(2) else size - 1, size - 1)
+            if start >= size:
+                return web.Response(status=416, headers={"Content-Range": f"bytes */{size}"})
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+            return web.Response(status=206, body=content[start : end + 1], headers=headers)
+        return web.Response(body=content, headers=headers)
@@ -31,6 +31,7 @@ from openai.types.create_embedding_response import Usage
 
 import app
 import core
+from approaches.approach import Approach
 from approaches.chatreadretrieveread import ChatReadRetrieveReadApproach
 from approaches.promptmanager import PromptyManager
 from core.authentication import AuthenticationHelper
@@ -113,6 +114,18 @@ def create_mock_retrieve(response_type="default"):
     return mock_retrieve_parameterized
 
 
+@pytest.fixture(autouse=True)
+def mock_elapsed_ms(monkeypatch):
+    # Latencies recorded in thought steps vary between runs, so they are fixed for snapshots
+    monkeypatch.setattr(Approach, "get_elapsed_ms", staticmethod(lambda start_time: 0.0))
+
+
+@pytest.fixture(autouse=True)
+def mock_upload_jobs_path(monkeypatch, tmp_path):
+    # Each test gets its own ingestion job store, so that jobs of earlier tests are neither resumed nor deduplicated
+    monkeypatch.setenv("USER_UPLOAD_JOBS_PATH", str(tmp_path / "user_upload_jobs.sqlite"))
+
+
 @pytest.fixture
 def mock_azurehttp_calls(monkeypatch):
     def mock_post(*args, **kwargs):
@@ -877,7 +890,7 @@ async def vision_auth_client(
 @pytest.fixture
 def mock_validate_token_success(monkeypatch):
     async def mock_validate_access_token(self, token):
-        pass
+        return {}
 
     monkeypatch.setattr(core.authentication.AuthenticationHelper, "validate_access_token", mock_validate_access_token)
 
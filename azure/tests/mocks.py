@@ -68,9 +68,14 @@ class MockBlob:
             name="Financial Market Analysis Report 2023-7.png", content_settings={"content_type": "image/png"}
         )
 
+        self.size = len(TEST_PNG_BYTES)
+
     async def readall(self):
         return TEST_PNG_BYTES
 
+    async def chunks(self):
+        yield TEST_PNG_BYTES
+
     async def readinto(self, buffer: BytesIO):
         buffer.write(b"test")
 
@@ -133,6 +138,18 @@ class MockAsyncPageIterator:
         return self.data.pop(0)  # This should be a list of dictionaries.
 
 
+class MockIndexingResult:
+    def __init__(self, key: str, succeeded: bool = True, status_code: int = 200, error_message=None):
+        self.key = key
+        self.succeeded = succeeded
+        self.status_code = status_code
+        self.error_message = error_message
+
+
+def mock_indexing_results(documents: list[dict]) -> list[MockIndexingResult]:
+    return [MockIndexingResult(document["id"]) for document in documents]
+
+
 class MockCaption:
     def __init__(self, text, highlights=None, additional_properties=None):
         self.text = text
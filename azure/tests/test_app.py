@@ -2,6 +2,7 @@ import json
 import os
 from unittest import mock
 
+import azure.cognitiveservices.speech
 import pytest
 import quart.testing.app
 from httpx import Request, Response
@@ -9,6 +10,8 @@ from openai import BadRequestError
 
 import app
 
+from .mocks import mock_speak_text_success
+
 
 def fake_response(http_code):
     return Response(http_code, request=Request(method="get", url="https://foo.bar/"))
@@ -450,6 +453,35 @@ async def test_speech(client, mock_speech_success):
     assert await response.get_data() == b"mock_audio_data"
 
 
+@pytest.mark.asyncio
+async def test_speech_cached(client, monkeypatch):
+    spoken_texts = []
+
+    def mock_speak_text(self, text):
+        spoken_texts.append(text)
+        return mock_speak_text_success(self, text)
+
+    monkeypatch.setattr(azure.cognitiveservices.speech.SpeechSynthesizer, "speak_text_async", mock_speak_text)
+
+    response = await client.post("/speech", json={"text": "test"})
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+
+    # Replaying the same text is answered from the cache
+    response = await client.post("/speech", json={"text": "test"})
+    assert response.status_code == 200
+    assert response.headers["ETag"] == etag
+    assert await response.get_data() == b"mock_audio_data"
+    response = await client.post("/speech", json={"text": "test"}, headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert spoken_texts == ["test"]
+
+    response = await client.post("/speech", json={"text": "other test"}, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    assert spoken_texts == ["test", "other test"]
+
+
 @pytest.mark.asyncio
 async def test_speech_token_refresh(client_with_expiring_token, mock_speech_success):
     # First time should create a brand new token
@@ -534,6 +566,47 @@ async def test_chat_text(client, snapshot):
     snapshot.assert_match(json.dumps(result, indent=4), "result.json")
 
 
+@pytest.mark.asyncio
+async def test_chat_server_timing(client):
+    response = await client.post(
+        "/chat",
+        json={
+            "messages": [{"content": "What is the capital of France?", "role": "user"}],
+            "context": {
+                "overrides": {"retrieval_mode": "hybrid"},
+            },
+        },
+    )
+    assert response.status_code == 200
+    stages = [entry.split(";")[0] for entry in response.headers["Server-Timing"].split(", ")]
+    assert stages == ["rewrite", "embedding", "search", "prompt_render", "answer"]
+
+
+@pytest.mark.asyncio
+async def test_metrics(client):
+    for _ in range(2):
+        response = await client.post(
+            "/chat/stream",
+            json={
+                "messages": [{"content": "What is the capital of France?", "role": "user"}],
+                "context": {
+                    "overrides": {"retrieval_mode": "text"},
+                },
+            },
+        )
+        assert response.status_code == 200
+        await response.get_data()
+
+    response = await client.get("/metrics")
+    assert response.status_code == 200
+    result = await response.get_json()
+    assert result["latency"]["requests"]["/chat/stream"]["count"] == 2
+    assert set(result["latency"]["stages"]) == {"rewrite", "search", "prompt_render", "first_token"}
+    assert result["latency"]["stages"]["search"]["count"] == 1
+    assert result["caches"]["query"]["rewrites"] == {"hits": 1, "misses": 1, "hit_rate": 0.5, "size": 1}
+    assert "token_claims" in result["caches"]["auth"]
+
+
 @pytest.mark.asyncio
 async def test_chat_text_agent(agent_client, snapshot):
     response = await agent_client.post(
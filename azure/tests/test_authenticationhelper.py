@@ -439,3 +439,103 @@ async def test_validate_access_token(monkeypatch, mock_confidential_client_succe
 
     helper = create_authentication_helper()
     await helper.validate_access_token(mock_token)
+
+
+def create_mock_jwk(public_key, kid="mock_kid"):
+    def encode(number: int) -> str:
+        return (
+            base64.urlsafe_b64encode(number.to_bytes((number.bit_length() + 7) // 8, byteorder="big"))
+            .decode()
+            .rstrip("=")
+        )
+
+    numbers = public_key.public_numbers()
+    return {"kty": "RSA", "kid": kid, "use": "sig", "n": encode(numbers.n), "e": encode(numbers.e)}
+
+
+@pytest.mark.asyncio
+async def test_validate_access_token_caches_keys(monkeypatch, mock_confidential_client_success):
+    mock_token, public_key, payload = create_mock_jwt(kid="new_kid", oid="OID_X")
+    _, old_public_key, _ = create_mock_jwt(kid="old_kid")
+    # The token is signed with a key that only appears in the keys once they are rotated
+    responses = [
+        {"keys": [create_mock_jwk(old_public_key, kid="old_kid")]},
+        {"keys": [create_mock_jwk(old_public_key, kid="old_kid"), create_mock_jwk(public_key, kid="new_kid")]},
+    ]
+    fetches = 0
+
+    def mock_get(*args, **kwargs):
+        nonlocal fetches
+        jwks = responses[min(fetches, len(responses) - 1)]
+        fetches += 1
+        return MockResponse(status=200, text=json.dumps(jwks))
+
+    monkeypatch.setattr(aiohttp.ClientSession, "get", mock_get)
+
+    helper = create_authentication_helper()
+    helper.jwks_min_refresh_interval = 0
+    claims = await helper.validate_access_token(mock_token)
+    assert claims["oid"] == "OID_X"
+    assert fetches == 2
+
+    await helper.validate_access_token(mock_token)
+    assert fetches == 2
+    assert (helper.jwks_hits, helper.jwks_misses) == (1, 2)
+
+    # Old keys keep being used while they are refreshed in the background
+    helper.jwks_fetched_at -= helper.jwks_refresh_interval + 1
+    await helper.validate_access_token(mock_token)
+    assert helper._jwks_refresh_task is not None
+    await helper._jwks_refresh_task
+    assert fetches == 3
+    assert helper.cache_stats()["jwks"]["age"] < helper.jwks_refresh_interval
+
+
+@pytest.mark.asyncio
+async def test_get_auth_claims_cached(monkeypatch, mock_confidential_client_success):
+    validated_tokens = []
+
+    async def mock_validate_access_token(self, token):
+        validated_tokens.append(token)
+        return {"exp": int((datetime.now(timezone.utc) + timedelta(hours=1)).timestamp())}
+
+    monkeypatch.setattr(AuthenticationHelper, "validate_access_token", mock_validate_access_token)
+
+    helper = create_authentication_helper(enforce_access_control=True)
+    for _ in range(2):
+        auth_claims = await helper.get_auth_claims_if_enabled(headers={"Authorization": "Bearer Token"})
+        assert auth_claims == {"oid": "OID_X", "access_token": "MockToken"}
+    await helper.get_auth_claims_if_enabled(headers={"Authorization": "Bearer OtherToken"})
+
+    assert validated_tokens == ["Token", "OtherToken"]
+    assert helper.cache_stats()["token_claims"] == {"hits": 1, "misses": 2, "size": 2}
+
+
+@pytest.mark.asyncio
+async def test_check_path_auth_cached(monkeypatch, mock_confidential_client_success, mock_validate_token_success):
+    auth_helper_enforce_access_control = create_authentication_helper(enforce_access_control=True)
+    searches = 0
+
+    async def mock_search(self, *args, **kwargs):
+        nonlocal searches
+        searches += 1
+        return MockAsyncPageIterator(data=[{"sourcefile": "Benefit_Options.pdf"}])
+
+    monkeypatch.setattr(SearchClient, "search", mock_search)
+
+    for path in ["Benefit_Options.pdf", "Benefit_Options.pdf#page=2", "Benefit_Options.pdf"]:
+        assert await auth_helper_enforce_access_control.check_path_auth(
+            path=path,
+            auth_claims={"oid": "OID_X", "access_token": "MockToken"},
+            search_client=create_search_client(),
+        )
+    assert searches == 1
+
+    # Authorization is cached per user
+    await auth_helper_enforce_access_control.check_path_auth(
+        path="Benefit_Options.pdf",
+        auth_claims={"oid": "OID_Y", "access_token": "MockToken"},
+        search_client=create_search_client(),
+    )
+    assert searches == 2
+    assert auth_helper_enforce_access_control.cache_stats()["path_auth"] == {"hits": 2, "misses": 2, "size": 2}
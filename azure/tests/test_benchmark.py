@@ -0,0 +1,138 @@
+import asyncio
+import multiprocessing
+import sys
+
+import pytest
+from azure.core.credentials import AzureKeyCredential
+from azure.search.documents.aio import SearchClient
+from azure.search.documents.models import QueryType
+from openai import AsyncOpenAI
+
+from prepdocslib.blobmanager import BlobManager
+
+from scripts.benchmark import (
+    BenchmarkConfig,
+    find_regressions,
+    receive_url,
+    run_benchmark,
+)
+from scripts.standin_services import StandInConfig, StandInServices
+
+NO_LATENCY = StandInConfig(
+    search_latency_ms=0,
+    embedding_latency_ms=0,
+    completion_latency_ms=0,
+    token_interval_ms=0,
+    blob_latency_ms=0,
+    answer_tokens=3,
+    blob_bytes=10,
+)
+
+
+@pytest.mark.asyncio
+async def test_standin_services_answer_sdk_clients():
+    services = StandInServices(NO_LATENCY)
+    url = await services.start()
+    try:
+        search_client = SearchClient(endpoint=url, index_name="gptkbindex", credential=AzureKeyCredential("key"))
+        results = await search_client.search(
+            search_text="dental plan",
+            top=2,
+            query_type=QueryType.SEMANTIC,
+            semantic_configuration_name="default",
+            query_caption="extractive|highlight-false",
+        )
+        documents = [document async for document in results]
+        await search_client.close()
+        assert [document["sourcepage"] for document in documents] == [
+            "Benefit_Options-0.pdf#page=1",
+            "Benefit_Options-1.pdf#page=2",
+        ]
+        assert documents[0]["@search.captions"][0].text.startswith("dental plan: ")
+
+        openai_client = AsyncOpenAI(base_url=f"{url}/openai/v1", api_key="no-key-required")
+        embedding = await openai_client.embeddings.create(model="embedding", input="dental plan", dimensions=4)
+        assert len(embedding.data[0].embedding) == 4
+        rewrite = await openai_client.chat.completions.create(
+            model="chat",
+            messages=[{"role": "user", "content": "What does my dental plan cover?"}],
+            tools=[{"type": "function", "function": {"name": "search_sources", "parameters": {}}}],
+        )
+        assert rewrite.choices[0].message.tool_calls[0].function.arguments == (
+            '{"search_query": "What does my dental plan cover?"}'
+        )
+        stream = await openai_client.chat.completions.create(
+            model="chat",
+            messages=[{"role": "user", "content": "What does my dental plan cover?"}],
+            stream=True,
+            stream_options={"include_usage": True},
+        )
+        chunks = [chunk async for chunk in stream]
+        await openai_client.close()
+        assert "".join(chunk.choices[0].delta.content or "" for chunk in chunks if chunk.choices) == (
+            " the plan covers [Benefit_Options-0.pdf]."
+        )
+        assert chunks[-1].usage.total_tokens == 1100
+
+        blob_manager = BlobManager(endpoint=f"{url}/account", container="content", credential=None)
+        download = await blob_manager.open_blob("Benefit_Options-0.pdf", offset=4, length=3)
+        assert (download.content_type, download.offset, download.length, download.size) == (
+            "application/pdf",
+            4,
+            3,
+            10,
+        )
+        assert b"".join([chunk async for chunk in download.chunks]) == b"pla"
+        await blob_manager.close_clients()
+    finally:
+        await services.stop()
+    assert services.requests == {"search": 1, "embeddings": 1, "chat": 2, "blob": 1}
+
+
+@pytest.mark.asyncio
+async def test_run_benchmark():
+    results = await asyncio.wait_for(
+        run_benchmark(BenchmarkConfig(workers=1, concurrency=2, requests=4, warmup_requests=0, standins=NO_LATENCY)),
+        timeout=300,
+    )
+    assert list(results["scenarios"]) == ["ask", "chat", "chat-stream", "content"]
+    for result in results["scenarios"].values():
+        assert result["errors"] == 0
+        assert result["throughput_rps"] > 0
+        assert set(result["latency_ms"]) == {"p50", "p95", "p99", "max"}
+        assert len(result["peak_rss_mb"]) == 1
+    assert "first_token_ms" in results["scenarios"]["chat-stream"]
+    assert results["workers"]["idle_rss_mb"][0] > 0
+
+
+@pytest.mark.asyncio
+async def test_receive_url_reports_exited_process():
+    context = multiprocessing.get_context("spawn")
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=sys.exit, args=(3,), name="app-worker-0")
+    process.start()
+    sender.close()
+    with pytest.raises(RuntimeError, match="app-worker-0 exited with code 3"):
+        await asyncio.wait_for(receive_url(process, receiver), timeout=60)
+
+
+def test_find_regressions():
+    def results(throughput_rps, p95, peak_rss_mb):
+        return {
+            "scenarios": {
+                "chat": {
+                    "throughput_rps": throughput_rps,
+                    "latency_ms": {"p50": 100, "p95": p95, "p99": p95, "max": p95},
+                    "peak_rss_mb": [peak_rss_mb],
+                }
+            }
+        }
+
+    baseline = results(throughput_rps=10, p95=500, peak_rss_mb=200)
+    assert find_regressions(results(9, 550, 210), baseline, max_regression=0.2) == []
+    assert find_regressions(results(7, 700, 300), baseline, max_regression=0.2) == [
+        "chat: throughput dropped from 10 to 7 requests/s",
+        "chat: latency_ms p95 rose from 500 to 700",
+        "chat: latency_ms p99 rose from 500 to 700",
+        "chat: peak memory per worker rose from 200 to 300 MB",
+    ]
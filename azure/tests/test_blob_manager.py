@@ -8,7 +8,11 @@ import azure.storage.filedatalake.aio
 import pytest
 
 # The pythonpath is configured in pyproject.toml to include app/backend
-from prepdocslib.blobmanager import AdlsBlobManager, BlobManager
+from prepdocslib.blobmanager import (
+    AdlsBlobManager,
+    BlobManager,
+    parse_content_range_size,
+)
 from prepdocslib.listfilestrategy import File
 
 from .mocks import MockAzureCredential
@@ -344,14 +348,65 @@ async def test_download_blob_not_found(monkeypatch, mock_env, mock_blob_containe
 
 
 @pytest.mark.asyncio
-async def test_download_blob_container_not_exist(
-    monkeypatch, mock_env, mock_blob_container_client_does_not_exist, blob_manager
-):
+async def test_download_blob_container_not_exist(monkeypatch, mock_env, blob_manager):
+    # The container isn't checked before downloading, the download itself reports that it doesn't exist
+    async def mock_download_blob(*args, **kwargs):
+        from azure.core.exceptions import ResourceNotFoundError
+
+        raise ResourceNotFoundError("The specified container does not exist.")
+
+    monkeypatch.setattr("azure.storage.blob.aio.BlobClient.download_blob", mock_download_blob)
+
     result = await blob_manager.download_blob("test_document.pdf")
 
     assert result is None
 
 
+@pytest.mark.asyncio
+async def test_open_blob_range(monkeypatch, mock_env, blob_manager):
+    test_content = b"test content bytes"
+    download_args = {}
+
+    class MockDownloader:
+        def __init__(self, offset, length):
+            self.size = length
+
+            class ContentSettings:
+                content_type = "application/pdf"
+
+            class Properties:
+                content_settings = ContentSettings()
+                etag = '"0x8DC"'
+                content_range = f"bytes {offset}-{offset + length - 1}/{len(test_content)}"
+
+            self.properties = Properties()
+            self.content = test_content[offset : offset + length]
+
+        async def chunks(self):
+            yield self.content
+
+    async def mock_download_blob(*args, offset=None, length=None, **kwargs):
+        download_args.update(offset=offset, length=length)
+        return MockDownloader(offset, length)
+
+    monkeypatch.setattr("azure.storage.blob.aio.BlobClient.download_blob", mock_download_blob)
+
+    download = await blob_manager.open_blob("test_document.pdf", offset=5, length=7)
+
+    assert download_args == {"offset": 5, "length": 7}
+    assert download is not None
+    assert download.content_type == "application/pdf"
+    assert download.etag == '"0x8DC"'
+    assert (download.offset, download.length, download.size) == (5, 7, len(test_content))
+    assert b"".join([chunk async for chunk in download.chunks]) == b"content"
+
+
+def test_parse_content_range_size():
+    assert parse_content_range_size("bytes 0-27/28") == 28
+    assert parse_content_range_size("bytes 0-27/*") is None
+    assert parse_content_range_size(None) is None
+
+
 @pytest.mark.asyncio
 async def test_download_blob_empty_path(monkeypatch, mock_env, mock_blob_container_client_exists, blob_manager):
     result = await blob_manager.download_blob("")
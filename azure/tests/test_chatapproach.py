@@ -1,3 +1,4 @@
+import asyncio
 import json
 
 import pytest
@@ -304,3 +305,164 @@ async def test_chat_prompt_render_with_image_directive(chat_approach):
     assert "Diagram that shows the architecture of Fabric Activator." in combined
     # Original unescaped sequence should be gone
     assert ":::image" not in combined
+
+
+def create_query_rewrite_completion(content: str) -> ChatCompletion:
+    return ChatCompletion.model_validate(
+        {
+            "id": "chatcmpl-query-rewrite",
+            "object": "chat.completion",
+            "created": 1695324963,
+            "model": "gpt-4.1-mini",
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+        }
+    )
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "rewritten_query, expected_searches",
+    [
+        # The speculative search with the user's question is used when the rewrite doesn't change it
+        ("0", ["What is the capital of France?"]),
+        ("capital of France", ["What is the capital of France?", "capital of France"]),
+    ],
+)
+async def test_run_search_approach_speculative_search(chat_approach, monkeypatch, rewritten_query, expected_searches):
+    searches = []
+
+    async def mock_create_chat_completion(*args, **kwargs):
+        # Gives the speculative search a chance to start while the query is rewritten
+        await asyncio.sleep(0)
+        return create_query_rewrite_completion(rewritten_query)
+
+    async def record_and_mock_search(*args, **kwargs):
+        searches.append(kwargs.get("search_text"))
+        return await mock_search(*args, **kwargs)
+
+    monkeypatch.setattr(chat_approach, "create_chat_completion", mock_create_chat_completion)
+    monkeypatch.setattr(SearchClient, "search", record_and_mock_search)
+
+    extra_info = await chat_approach.run_search_approach(
+        [{"role": "user", "content": "What is the capital of France?"}],
+        {"retrieval_mode": "text", "speculative_search": True},
+        {},
+    )
+
+    assert searches == expected_searches
+    assert extra_info.thoughts[1].description == expected_searches[-1]
+    assert extra_info.thoughts[0].props["latency_ms"] == 0.0
+    assert extra_info.thoughts[1].props["latency_ms"] == 0.0
+    assert len(extra_info.thoughts[2].description) == 1
+
+
+@pytest.mark.asyncio
+async def test_run_search_approach_cancels_speculative_search_when_cancelled(chat_approach, monkeypatch):
+    search_started = asyncio.Event()
+    search_cancelled = asyncio.Event()
+
+    async def mock_create_chat_completion(*args, **kwargs):
+        await asyncio.Event().wait()
+
+    async def hanging_search(*args, **kwargs):
+        search_started.set()
+        try:
+            await asyncio.Event().wait()
+        except asyncio.CancelledError:
+            search_cancelled.set()
+            raise
+
+    monkeypatch.setattr(chat_approach, "create_chat_completion", mock_create_chat_completion)
+    monkeypatch.setattr(SearchClient, "search", hanging_search)
+
+    request = asyncio.create_task(
+        chat_approach.run_search_approach(
+            [{"role": "user", "content": "What is the capital of France?"}],
+            {"retrieval_mode": "text", "speculative_search": True},
+            {},
+        )
+    )
+    await asyncio.wait_for(search_started.wait(), timeout=5)
+    request.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await request
+
+    await asyncio.wait_for(search_cancelled.wait(), timeout=5)
+
+
+@pytest.mark.asyncio
+async def test_get_sources_content_downloads_images_concurrently(chat_approach, monkeypatch):
+    downloading = 0
+    max_downloading = 0
+
+    async def mock_download_blob_as_base64(blob_url, user_oid=None):
+        nonlocal downloading, max_downloading
+        downloading += 1
+        max_downloading = max(max_downloading, downloading)
+        await asyncio.sleep(0.01)
+        downloading -= 1
+        return None if blob_url.endswith("missing.png") else f"data:image/png;base64,{blob_url}"
+
+    monkeypatch.setattr(chat_approach, "download_blob_as_base64", mock_download_blob_as_base64)
+
+    image_urls = [f"https://sticygqdubf4x6w.blob.core.windows.net/images/figure{i}.png" for i in range(6)]
+    image_urls.insert(2, "https://sticygqdubf4x6w.blob.core.windows.net/images/missing.png")
+    documents = [
+        Document(
+            id=f"doc{i}",
+            content="content",
+            sourcepage=f"Benefit_Options-{i}.pdf",
+            images=[{"url": url} for url in image_urls[i * 2 : i * 2 + 2]],
+        )
+        for i in range(4)
+    ]
+    data_points = await chat_approach.get_sources_content(
+        documents, use_semantic_captions=False, include_text_sources=False, download_image_sources=True
+    )
+
+    assert data_points.images == [f"data:image/png;base64,{url}" for url in image_urls if "missing" not in url]
+    assert data_points.citations[:3] == [
+        "Benefit_Options-0.pdf",
+        "Benefit_Options-0.pdf(figure0.png)",
+        "Benefit_Options-0.pdf(figure1.png)",
+    ]
+    assert max_downloading == chat_approach.MAX_CONCURRENT_IMAGE_DOWNLOADS
+
+
+@pytest.mark.asyncio
+async def test_get_sources_content_reports_sources_before_images(chat_approach, monkeypatch):
+    reported = []
+
+    async def mock_download_blob_as_base64(blob_url, user_oid=None):
+        # The first image is the slowest, but images are still reported in the order of their citations
+        await asyncio.sleep(0.02 if blob_url.endswith("figure0.png") else 0)
+        reported.append(("downloaded", blob_url))
+        return f"data:image/png;base64,{blob_url}"
+
+    monkeypatch.setattr(chat_approach, "download_blob_as_base64", mock_download_blob_as_base64)
+
+    image_urls = [f"https://sticygqdubf4x6w.blob.core.windows.net/images/figure{i}.png" for i in range(2)]
+    documents = [
+        Document(
+            id="doc0",
+            content="content",
+            sourcepage="Benefit_Options-0.pdf",
+            images=[{"url": url} for url in image_urls],
+        )
+    ]
+    data_points = await chat_approach.get_sources_content(
+        documents,
+        use_semantic_captions=False,
+        include_text_sources=True,
+        download_image_sources=True,
+        on_sources=lambda sources: reported.append(("sources", sources.citations, sources.images)),
+        on_image_source=lambda image: reported.append(("image", image)),
+    )
+
+    assert reported == [
+        ("sources", data_points.citations, []),
+        ("downloaded", image_urls[1]),
+        ("downloaded", image_urls[0]),
+        ("image", f"data:image/png;base64,{image_urls[0]}"),
+        ("image", f"data:image/png;base64,{image_urls[1]}"),
+    ]
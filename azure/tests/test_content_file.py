@@ -12,6 +12,7 @@ from azure.core.pipeline.transport import (
 from azure.storage.blob.aio import BlobServiceClient
 
 import app
+from core.contentcache import CachedContent, ContentCache
 
 from .mocks import (
     MockAiohttpClientResponse,
@@ -86,7 +87,7 @@ async def test_content_file_useruploaded_found(
 ):
     # We need to mock our the global blob and container client since the /content path checks that first!
     class MockBlobClient:
-        async def download_blob(self):
+        async def download_blob(self, **kwargs):
             raise ResourceNotFoundError(MockAiohttpClientResponse404("userdoc.pdf", b""))
 
     monkeypatch.setattr(
@@ -114,7 +115,7 @@ async def test_content_file_useruploaded_found(
         def __init__(self, path_name):
             self.path_name = path_name
 
-        async def download_file(self):
+        async def download_file(self, **kwargs):
             downloaded_files.append(self.path_name)
             return MockBlob()
 
@@ -136,7 +137,7 @@ async def test_content_file_useruploaded_notfound(
 ):
 
     class MockBlobClient:
-        async def download_blob(self):
+        async def download_blob(self, **kwargs):
             raise ResourceNotFoundError(MockAiohttpClientResponse404("userdoc.pdf", b""))
 
     monkeypatch.setattr(
@@ -161,7 +162,7 @@ async def test_content_file_useruploaded_notfound(
         def __init__(self, path_name):
             self.path_name = path_name
 
-        async def download_file(self):
+        async def download_file(self, **kwargs):
             # Simulate file not found error
             raise ResourceNotFoundError(MockAiohttpClientResponse404(self.path_name, b""))
 
@@ -174,3 +175,95 @@ async def test_content_file_useruploaded_notfound(
 
     response = await auth_client.get("/content/userdoc.pdf", headers={"Authorization": "Bearer test"})
     assert response.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_content_file_range_etag_and_cache(monkeypatch, mock_env, mock_acs_search):
+    test_content = b"test content bytes"
+    downloads = []
+
+    class MockDownloader:
+        def __init__(self, offset, length):
+            offset = offset or 0
+            self.content = test_content[offset : offset + length if length is not None else None]
+            self.size = len(self.content)
+
+            class ContentSettings:
+                content_type = "application/octet-stream"
+
+            class Properties:
+                content_settings = ContentSettings()
+                etag = '"0x8DC"'
+                content_range = f"bytes {offset}-{offset + self.size - 1}/{len(test_content)}"
+
+            self.properties = Properties()
+
+        async def chunks(self):
+            yield self.content
+
+    class MockBlobClient:
+        async def download_blob(self, offset=None, length=None):
+            downloads.append((offset, length))
+            return MockDownloader(offset, length)
+
+    monkeypatch.setattr(
+        azure.storage.blob.aio.ContainerClient, "get_blob_client", lambda *args, **kwargs: MockBlobClient()
+    )
+
+    quart_app = app.create_app()
+    async with quart_app.test_app() as test_app:
+        client = test_app.test_client()
+
+        response = await client.get("/content/role_library.pdf")
+        assert response.status_code == 200
+        assert response.headers["Content-Type"] == "application/pdf"
+        assert response.headers["ETag"] == '"0x8DC"'
+        assert await response.get_data() == test_content
+        assert downloads == [(None, None)]
+
+        # Served from the content cache without downloading the file again
+        response = await client.get("/content/role_library.pdf")
+        assert await response.get_data() == test_content
+        response = await client.get("/content/role_library.pdf", headers={"If-None-Match": '"0x8DC"'})
+        assert response.status_code == 304
+        response = await client.get("/content/role_library.pdf", headers={"Range": "bytes=5-11"})
+        assert response.status_code == 206
+        assert await response.get_data() == b"content"
+        assert downloads == [(None, None)]
+
+        # Without the cache, byte ranges are requested from storage and streamed
+        test_app.app.config[app.CONFIG_CONTENT_CACHE] = ContentCache(max_entry_bytes=0)
+        response = await client.get("/content/role_library.pdf", headers={"Range": "bytes=5-11"})
+        assert response.status_code == 206
+        assert response.headers["Content-Range"] == "bytes 5-11/18"
+        assert response.headers["Content-Length"] == "7"
+        assert await response.get_data() == b"content"
+        assert downloads[-1] == (5, 7)
+
+        response = await client.get("/content/role_library.pdf", headers={"If-None-Match": '"0x8DC"'})
+        assert response.status_code == 304
+        assert await response.get_data() == b""
+
+
+def test_content_cache_evicts_least_recently_used(monkeypatch):
+    cache = ContentCache(max_bytes=10, max_entry_bytes=6, ttl=60)
+    cache.set("a.txt", CachedContent(b"aaaa", "text/plain", None))
+    cache.set("b.txt", CachedContent(b"bbbb", "text/plain", None), user_oid="OID_X")
+    cache.set("too_big.txt", CachedContent(b"x" * 7, "text/plain", None))
+    assert cache.get("too_big.txt") is None
+    assert cache.get("b.txt") is None
+    assert cache.get("a.txt") is not None
+
+    # b.txt was the least recently used entry, so it's evicted first
+    cache.set("c.txt", CachedContent(b"cccc", "text/plain", None))
+    assert cache.get("b.txt", user_oid="OID_X") is None
+    assert cache.get("a.txt") is not None
+    assert cache.size == 8
+
+    cache.invalidate("a.txt")
+    assert cache.get("a.txt") is None
+    assert cache.size == 4
+
+    monkeypatch.setattr("core.contentcache.time.monotonic", lambda: float("inf"))
+    assert cache.get("c.txt") is None
+    assert cache.size == 0
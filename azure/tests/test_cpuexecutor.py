@@ -0,0 +1,86 @@
+import io
+import os
+
+import pytest
+
+import prepdocslib.pdfparser
+from prepdocslib.cpuexecutor import (
+    CpuWorkExecutor,
+    run_cpu_bound,
+    spool_to_temporary_file,
+)
+from prepdocslib.fileprocessor import FileProcessor
+from prepdocslib.filestrategy import parse_file
+from prepdocslib.htmlparser import LocalHTMLParser
+from prepdocslib.listfilestrategy import File
+from prepdocslib.pdfparser import LocalPdfParser
+from prepdocslib.textsplitter import SentenceTextSplitter
+
+
+def square(value: int) -> int:
+    return value * value
+
+
+@pytest.fixture(scope="module")
+def cpu_executor():
+    executor = CpuWorkExecutor(max_workers=2)
+    yield executor
+    executor.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_run_cpu_bound(cpu_executor):
+    assert await run_cpu_bound(cpu_executor, square, 3) == 9
+    assert await run_cpu_bound(None, square, 4) == 16
+
+
+@pytest.mark.asyncio
+async def test_run_in_order(cpu_executor):
+    results = [result async for result in cpu_executor.run_in_order(square, [(value,) for value in range(10)])]
+    assert results == [value * value for value in range(10)]
+
+
+@pytest.mark.asyncio
+async def test_local_pdf_parser_in_processes(cpu_executor, monkeypatch):
+    # Small batches so that the pages of the document are extracted by several processes
+    monkeypatch.setattr(LocalPdfParser, "PAGES_PER_BATCH", 3)
+    spooled_paths = []
+
+    def spool(content, suffix=""):
+        spooled_paths.append(spool_to_temporary_file(content, suffix))
+        return spooled_paths[-1]
+
+    monkeypatch.setattr(prepdocslib.pdfparser, "spool_to_temporary_file", spool)
+
+    with open("data/employee_handbook.pdf", "rb") as file:
+        inline_pages = [page async for page in LocalPdfParser().parse(file)]
+        pages = [page async for page in LocalPdfParser(executor=cpu_executor).parse(file)]
+
+    assert len(pages) == 11
+    assert pages == inline_pages
+    assert len(spooled_paths) == 1
+    assert not os.path.exists(spooled_paths[0])
+
+
+@pytest.mark.asyncio
+async def test_local_html_parser_in_processes(cpu_executor):
+    file = io.StringIO("<p>              Test multiple white spaces                   </p>")
+    file.name = "test.html"
+    pages = [page async for page in LocalHTMLParser(executor=cpu_executor).parse(file)]
+    assert len(pages) == 1
+    assert pages[0].text == "Test multiple white spaces"
+
+
+@pytest.mark.asyncio
+async def test_parse_file_splits_in_processes(cpu_executor):
+    with open("data/PerksPlus.pdf", "rb") as content:
+        sections = await parse_file(
+            File(content), {".pdf": FileProcessor(LocalPdfParser(), SentenceTextSplitter(), executor=cpu_executor)}
+        )
+        content.seek(0)
+        inline_sections = await parse_file(
+            File(content), {".pdf": FileProcessor(LocalPdfParser(), SentenceTextSplitter())}
+        )
+
+    assert sections
+    assert [section.chunk for section in sections] == [section.chunk for section in inline_sections]
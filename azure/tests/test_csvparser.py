@@ -55,3 +55,51 @@ async def test_csvparser_empty_file():
 
     # Assertions
     assert len(pages) == 0  # No rows should be parsed from an empty file
+
+
+@pytest.mark.asyncio
+async def test_csvparser_quoted_newlines():
+    file = io.BytesIO(b'col1,col2\n"multi\nline",value2\nvalue3,value4\n')
+    file.name = "test.csv"
+    csvparser = CsvParser()
+
+    pages = [page async for page in csvparser.parse(file)]
+
+    assert [page.text for page in pages] == ["multi\nline,value2", "value3,value4"]
+    # The file is left open for its caller
+    assert not file.closed
+
+
+@pytest.mark.asyncio
+async def test_csvparser_rows_per_page():
+    file = io.BytesIO(b"col1,col2\n" + b"".join(f"value{i},other{i}\n".encode() for i in range(5)))
+    file.name = "test.csv"
+    csvparser = CsvParser(rows_per_page=2)
+
+    pages = [page async for page in csvparser.parse(file)]
+
+    assert [page.text for page in pages] == [
+        "value0,other0\nvalue1,other1",
+        "value2,other2\nvalue3,other3",
+        "value4,other4",
+    ]
+    assert [page.page_num for page in pages] == [0, 1, 2]
+    assert pages[1].offset == len(pages[0].text) + 1
+    assert pages[2].offset == len(pages[0].text) + len(pages[1].text) + 2
+
+
+@pytest.mark.asyncio
+async def test_csvparser_max_tokens_per_page():
+    file = io.BytesIO(b"col1\n" + b"".join(b"one two three four\n" for _ in range(10)))
+    file.name = "test.csv"
+    # Each row is 4 tokens, so 3 rows fit in a page
+    csvparser = CsvParser(rows_per_page=100, max_tokens_per_page=12)
+
+    pages = [page async for page in csvparser.parse(file)]
+
+    assert [len(page.text.split("\n")) for page in pages] == [3, 3, 3, 1]
+
+
+def test_csvparser_invalid_rows_per_page():
+    with pytest.raises(ValueError):
+        CsvParser(rows_per_page=0)
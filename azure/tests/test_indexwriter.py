@@ -0,0 +1,129 @@
+import asyncio
+from typing import Optional
+
+import pytest
+
+from prepdocslib.indexwriter import IndexingError, SearchIndexWriter, document_size
+
+from .mocks import MockIndexingResult
+
+
+class MockSearchClient:
+    def __init__(self, failures: Optional[dict[str, list[int]]] = None):
+        # Status codes returned for a document on each attempt, before it succeeds
+        self.failures = failures or {}
+        self.uploaded_batches: list[list[str]] = []
+        self.deleted_batches: list[list[str]] = []
+        self.release = asyncio.Event()
+        self.release.set()
+        self.running = 0
+        self.max_running = 0
+
+    async def _index(self, documents, batches):
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        try:
+            await self.release.wait()
+            batches.append([document["id"] for document in documents])
+            results = []
+            for document in documents:
+                statuses = self.failures.get(document["id"], [])
+                if statuses:
+                    results.append(MockIndexingResult(document["id"], False, statuses.pop(0), "Failed"))
+                else:
+                    results.append(MockIndexingResult(document["id"]))
+            return results
+        finally:
+            self.running -= 1
+
+    async def upload_documents(self, documents):
+        return await self._index(documents, self.uploaded_batches)
+
+    async def delete_documents(self, documents):
+        return await self._index(documents, self.deleted_batches)
+
+
+def documents(count: int, text: str = "text") -> list[dict]:
+    return [{"id": f"doc-{i}", "content": text} for i in range(count)]
+
+
+@pytest.mark.asyncio
+async def test_writer_batches_by_payload_size():
+    search_client = MockSearchClient()
+    batch = documents(10)
+    writer = SearchIndexWriter(search_client, max_batch_bytes=document_size(batch[0]) * 3)
+    await writer.add(batch)
+    await writer.flush()
+    assert [len(uploaded) for uploaded in search_client.uploaded_batches] == [3, 3, 3, 1]
+    assert writer.documents_uploaded == 10
+
+
+@pytest.mark.asyncio
+async def test_writer_batches_by_document_count():
+    search_client = MockSearchClient()
+    writer = SearchIndexWriter(search_client, max_batch_documents=4)
+    await writer.add(documents(10))
+    await writer.flush()
+    assert [len(uploaded) for uploaded in search_client.uploaded_batches] == [4, 4, 2]
+
+
+@pytest.mark.asyncio
+async def test_writer_uploads_in_background():
+    search_client = MockSearchClient()
+    search_client.release.clear()
+    writer = SearchIndexWriter(search_client, max_batch_documents=2, max_concurrent_requests=2)
+    # Both full batches are being uploaded, and adding returns so that the next documents can be prepared
+    await asyncio.wait_for(writer.add(documents(5)), timeout=1)
+    await asyncio.sleep(0)
+    assert search_client.running == 2
+    search_client.release.set()
+    await writer.flush()
+    assert search_client.max_running == 2
+    assert writer.documents_uploaded == 5
+
+
+@pytest.mark.asyncio
+async def test_writer_retries_only_failed_documents():
+    search_client = MockSearchClient(failures={"doc-1": [503], "doc-3": [409, 503]})
+    writer = SearchIndexWriter(search_client, retry_delay=0)
+    await writer.add(documents(4))
+    await writer.flush()
+    assert search_client.uploaded_batches == [["doc-0", "doc-1", "doc-2", "doc-3"], ["doc-1", "doc-3"], ["doc-3"]]
+    assert writer.documents_retried == 3
+    assert writer.documents_uploaded == 4
+
+
+@pytest.mark.asyncio
+async def test_writer_raises_not_retriable_failures():
+    search_client = MockSearchClient(failures={"doc-1": [400]})
+    writer = SearchIndexWriter(search_client, retry_delay=0)
+    await writer.add(documents(3))
+    with pytest.raises(IndexingError) as error:
+        await writer.flush()
+    assert error.value.failed_keys == ["doc-1"]
+    assert len(search_client.uploaded_batches) == 1
+
+
+@pytest.mark.asyncio
+async def test_writer_raises_after_max_attempts():
+    search_client = MockSearchClient(failures={"doc-0": [503, 503, 503]})
+    writer = SearchIndexWriter(search_client, max_attempts=3, retry_delay=0)
+    await writer.add(documents(1))
+    with pytest.raises(IndexingError):
+        await writer.flush()
+    assert len(search_client.uploaded_batches) == 3
+
+
+@pytest.mark.asyncio
+async def test_writer_deletes_in_parallel_batches():
+    search_client = MockSearchClient()
+    search_client.release.clear()
+    writer = SearchIndexWriter(search_client, max_batch_documents=3, max_concurrent_requests=2)
+    delete = asyncio.create_task(writer.delete([f"doc-{i}" for i in range(8)]))
+    await asyncio.sleep(0.01)
+    assert search_client.running == 2
+    search_client.release.set()
+    await delete
+    assert sorted(len(batch) for batch in search_client.deleted_batches) == [2, 3, 3]
+    assert search_client.max_running == 2
+    assert writer.documents_deleted == 8
@@ -0,0 +1,287 @@
+import asyncio
+from io import BytesIO
+
+import pytest
+
+from core.ingestionqueue import (
+    IngestionJobStore,
+    IngestionQueue,
+    JobStatus,
+    hash_file_content,
+)
+
+
+class MockBlobManager:
+    def __init__(self, files: dict[str, bytes]):
+        self.files = files
+
+    async def download_blob(self, blob_path, user_oid=None):
+        if blob_path not in self.files:
+            return None
+        return self.files[blob_path], {"content_settings": {"content_type": "text/plain"}}
+
+
+class MockIngester:
+    def __init__(self):
+        self.ingested: list[tuple[str, bytes, str]] = []
+        self.removed: list[tuple[str, str]] = []
+        self.release = asyncio.Event()
+        self.release.set()
+        self.running = 0
+        self.max_running = 0
+
+    async def add_file(self, file, user_oid, on_progress=None):
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        try:
+            if on_progress:
+                on_progress("parsing")
+            await self.release.wait()
+            self.ingested.append((file.filename(), file.content.read(), user_oid))
+        finally:
+            self.running -= 1
+
+    async def remove_file(self, filename, oid):
+        self.removed.append((filename, oid))
+
+
+def test_hash_file_content():
+    stream = BytesIO(b"foo;bar")
+    stream.read()
+    content_hash = hash_file_content(stream)
+    assert content_hash == hash_file_content(BytesIO(b"foo;bar"))
+    assert content_hash != hash_file_content(BytesIO(b"foo;baz"))
+    assert stream.tell() == 0
+
+
+@pytest.mark.asyncio
+async def test_queue_ingests_file(tmp_path):
+    ingester = MockIngester()
+    queue = IngestionQueue(
+        IngestionJobStore(str(tmp_path / "jobs.sqlite")), ingester, MockBlobManager({"a.txt": b"foo;bar"})
+    )
+    queue.start()
+    job = queue.submit("OID_X", "a.txt", "https://test/a.txt", "hash-a")
+    assert job.status == JobStatus.QUEUED
+    await queue.queue.join()
+    assert ingester.ingested == [("a.txt", b"foo;bar", "OID_X")]
+    assert queue.get(job.id, user_oid="OID_X").status == JobStatus.SUCCEEDED
+    assert queue.get(job.id, user_oid="OID_Y") is None
+    assert queue.get(job.id, user_oid="OID_X").to_json().keys() == {
+        "id",
+        "filename",
+        "content_hash",
+        "status",
+        "progress",
+        "error",
+        "created_at",
+        "updated_at",
+    }
+    await queue.stop()
+
+
+@pytest.mark.asyncio
+async def test_queue_deduplicates_content(tmp_path):
+    ingester = MockIngester()
+    queue = IngestionQueue(
+        IngestionJobStore(str(tmp_path / "jobs.sqlite")), ingester, MockBlobManager({"a.txt": b"foo;bar"})
+    )
+    queue.start()
+    job = queue.submit("OID_X", "a.txt", "https://test/a.txt", "hash-a")
+    assert queue.submit("OID_X", "a.txt", "https://test/a.txt", "hash-a").id == job.id
+    await queue.queue.join()
+    assert queue.submit("OID_X", "a.txt", "https://test/a.txt", "hash-a").id == job.id
+    assert queue.find("OID_Y", "a.txt", "hash-a") is None
+    assert len(ingester.ingested) == 1
+    await queue.stop()
+
+
+@pytest.mark.asyncio
+async def test_queue_ingests_reverted_content(tmp_path):
+    ingester = MockIngester()
+    files = {"a.txt": b"foo;bar"}
+    queue = IngestionQueue(IngestionJobStore(str(tmp_path / "jobs.sqlite")), ingester, MockBlobManager(files))
+    queue.start()
+    first_job = queue.submit("OID_X", "a.txt", "https://test/a.txt", "hash-a")
+    await queue.queue.join()
+    files["a.txt"] = b"foo;baz"
+    queue.submit("OID_X", "a.txt", "https://test/a.txt", "hash-b")
+    await queue.queue.join()
+
+    # Uploading the first content again replaces the second content, so it is ingested again
+    assert queue.find("OID_X", "a.txt", "hash-a") is None
+    files["a.txt"] = b"foo;bar"
+    reverted_job = queue.submit("OID_X", "a.txt", "https://test/a.txt", "hash-a")
+    assert reverted_job.id != first_job.id
+    await queue.queue.join()
+    assert [content for _, content, _ in ingester.ingested] == [b"foo;bar", b"foo;baz", b"foo;bar"]
+    await queue.stop()
+
+
+@pytest.mark.asyncio
+async def test_queue_supersedes_queued_jobs_of_file(tmp_path):
+    ingester = MockIngester()
+    queue = IngestionQueue(
+        IngestionJobStore(str(tmp_path / "jobs.sqlite")), ingester, MockBlobManager({"a.txt": b"foo;baz"})
+    )
+    # Jobs are submitted before the workers start, so the first one is still queued
+    first_job = queue.submit("OID_X", "a.txt", "https://test/a.txt", "hash-a")
+    second_job = queue.submit("OID_X", "a.txt", "https://test/a.txt", "hash-b")
+    queue.start()
+    await queue.queue.join()
+    assert queue.get(first_job.id, user_oid="OID_X").status == JobStatus.SUPERSEDED
+    assert queue.get(second_job.id, user_oid="OID_X").status == JobStatus.SUCCEEDED
+    assert ingester.ingested == [("a.txt", b"foo;baz", "OID_X")]
+    await queue.stop()
+
+
+@pytest.mark.asyncio
+async def test_queue_bounds_workers(tmp_path):
+    ingester = MockIngester()
+    ingester.release.clear()
+    files = {f"{name}.txt": b"foo;bar" for name in "abcde"}
+    queue = IngestionQueue(
+        IngestionJobStore(str(tmp_path / "jobs.sqlite")), ingester, MockBlobManager(files), max_workers=2
+    )
+    queue.start()
+    for filename in files:
+        queue.submit("OID_X", filename, f"https://test/{filename}", f"hash-{filename}")
+    await asyncio.sleep(0.05)
+    assert ingester.running == 2
+    ingester.release.set()
+    await queue.queue.join()
+    assert ingester.max_running == 2
+    assert len(ingester.ingested) == 5
+    await queue.stop()
+
+
+@pytest.mark.asyncio
+async def test_queue_records_failure(tmp_path):
+    ingester = MockIngester()
+    queue = IngestionQueue(IngestionJobStore(str(tmp_path / "jobs.sqlite")), ingester, MockBlobManager({}))
+    queue.start()
+    job = queue.submit("OID_X", "missing.txt", "https://test/missing.txt", "hash-a")
+    await queue.queue.join()
+    failed_job = queue.get(job.id, user_oid="OID_X")
+    assert failed_job.status == JobStatus.FAILED
+    assert failed_job.error == "Error ingesting file, check server logs for details."
+    # A failed job doesn't prevent uploading the same content again
+    assert queue.find("OID_X", "missing.txt", "hash-a") is None
+    await queue.stop()
+
+
+async def wait_for_status(queue: IngestionQueue, job_id: str, status: str):
+    async def poll():
+        while queue.get(job_id, user_oid="OID_X").status != status:
+            await asyncio.sleep(0.01)
+
+    await asyncio.wait_for(poll(), timeout=2)
+
+
+@pytest.mark.asyncio
+async def test_queue_resumes_jobs_after_restart(tmp_path):
+    path = str(tmp_path / "jobs.sqlite")
+    store = IngestionJobStore(path)
+    queued_job = store.add("OID_X", "a.txt", "https://test/a.txt", "hash-a")
+    interrupted_job = store.add("OID_X", "b.txt", "https://test/b.txt", "hash-b")
+    assert store.claim(interrupted_job.id)
+    assert not store.claim(interrupted_job.id)
+    store.close()
+
+    # The app restarts right away, so the interrupted job is only resumed once it misses its heartbeats
+    ingester = MockIngester()
+    queue = IngestionQueue(
+        IngestionJobStore(path),
+        ingester,
+        MockBlobManager({"a.txt": b"foo", "b.txt": b"bar"}),
+        heartbeat_interval=0.05,
+        stale_after=0.2,
+    )
+    queue.start()
+    await queue.queue.join()
+    assert queue.get(queued_job.id, user_oid="OID_X").status == JobStatus.SUCCEEDED
+    assert queue.get(interrupted_job.id, user_oid="OID_X").status == JobStatus.PROCESSING
+    await wait_for_status(queue, interrupted_job.id, JobStatus.SUCCEEDED)
+    assert sorted(ingester.ingested) == [("a.txt", b"foo", "OID_X"), ("b.txt", b"bar", "OID_X")]
+    await queue.stop()
+
+
+@pytest.mark.asyncio
+async def test_queue_keeps_long_jobs_alive(tmp_path):
+    ingester = MockIngester()
+    ingester.release.clear()
+    queue = IngestionQueue(
+        IngestionJobStore(str(tmp_path / "jobs.sqlite")),
+        ingester,
+        MockBlobManager({"a.txt": b"foo"}),
+        heartbeat_interval=0.05,
+        stale_after=0.2,
+    )
+    queue.start()
+    job = queue.submit("OID_X", "a.txt", "https://test/a.txt", "hash-a")
+    # The job takes longer than stale_after, but its heartbeats keep it from being queued again
+    await asyncio.sleep(0.5)
+    assert queue.get(job.id, user_oid="OID_X").status == JobStatus.PROCESSING
+    assert queue.store.queued() == []
+    ingester.release.set()
+    await wait_for_status(queue, job.id, JobStatus.SUCCEEDED)
+    assert ingester.ingested == [("a.txt", b"foo", "OID_X")]
+    await queue.stop()
+
+
+@pytest.mark.asyncio
+async def test_queue_forgets_deleted_file(tmp_path):
+    queue = IngestionQueue(IngestionJobStore(str(tmp_path / "jobs.sqlite")), MockIngester(), MockBlobManager({}))
+    job = queue.submit("OID_X", "a.txt", "https://test/a.txt", "hash-a")
+    queue.forget_file("OID_X", "a.txt")
+    assert queue.get(job.id, user_oid="OID_X") is None
+    assert queue.find("OID_X", "a.txt", "hash-a") is None
+    queue.start()
+    await queue.queue.join()
+    await queue.stop()
+
+
+@pytest.mark.asyncio
+async def test_queue_cancels_job_of_file_deleted_while_processing(tmp_path):
+    ingester = MockIngester()
+    ingester.release.clear()
+    queue = IngestionQueue(
+        IngestionJobStore(str(tmp_path / "jobs.sqlite")), ingester, MockBlobManager({"a.txt": b"foo"})
+    )
+    queue.start()
+    job = queue.submit("OID_X", "a.txt", "https://test/a.txt", "hash-a")
+    await wait_for_status(queue, job.id, JobStatus.PROCESSING)
+    while ingester.running == 0:
+        await asyncio.sleep(0.01)
+
+    queue.forget_file("OID_X", "a.txt")
+    assert queue.get(job.id, user_oid="OID_X").status == JobStatus.CANCELLED
+    ingester.release.set()
+    await queue.queue.join()
+
+    # The sections indexed after the file was deleted are removed instead of the job succeeding
+    assert ingester.ingested == [("a.txt", b"foo", "OID_X")]
+    assert ingester.removed == [("a.txt", "OID_X")]
+    assert queue.get(job.id, user_oid="OID_X").status == JobStatus.CANCELLED
+    assert queue.find("OID_X", "a.txt", "hash-a") is None
+    await queue.stop()
+
+
+@pytest.mark.asyncio
+async def test_queue_stopped_while_processing_leaves_job_to_resume(tmp_path):
+    path = str(tmp_path / "jobs.sqlite")
+    ingester = MockIngester()
+    ingester.release.clear()
+    queue = IngestionQueue(IngestionJobStore(path), ingester, MockBlobManager({"a.txt": b"foo"}))
+    queue.start()
+    job = queue.submit("OID_X", "a.txt", "https://test/a.txt", "hash-a")
+    while ingester.running == 0:
+        await asyncio.sleep(0.01)
+
+    # The app stops the queue before closing the clients that the job uses
+    await queue.stop()
+
+    store = IngestionJobStore(path)
+    assert store.get(job.id).status == JobStatus.PROCESSING
+    assert ingester.ingested == []
+    store.close()
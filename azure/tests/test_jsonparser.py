@@ -1,7 +1,9 @@
 import io
+import json
 
 import pytest
 
+import prepdocslib.jsonparser
 from prepdocslib.jsonparser import JsonParser
 
 
@@ -30,3 +32,48 @@ async def test_jsonparser_array_multiple_obj():
     assert pages[1].page_num == 1
     assert pages[1].offset == 19
     assert pages[1].text == '{"test2": "test"}'
+
+
+@pytest.mark.asyncio
+async def test_jsonparser_utf8_bom():
+    file = io.BytesIO('\ufeff[{"test1": "test"},{"test2": "test"}]'.encode())
+    file.name = "test.json"
+    jsonparser = JsonParser()
+    pages = [page async for page in jsonparser.parse(file)]
+    assert [page.text for page in pages] == ['{"test1": "test"}', '{"test2": "test"}']
+    assert pages[0].offset == 1
+
+
+@pytest.mark.asyncio
+async def test_jsonparser_array_streamed(monkeypatch):
+    objects = [{"id": i, "text": f"value {i}", "nested": {"list": [i, -1.5e3, None, True]}} for i in range(50)]
+    file = io.BytesIO(json.dumps(objects, indent=2).encode())
+    file.name = "test.json"
+    # Read a few characters at a time, so that objects span several reads
+    monkeypatch.setattr(prepdocslib.jsonparser, "READ_SIZE", 7)
+    jsonparser = JsonParser()
+    pages = [page async for page in jsonparser.parse(file)]
+    assert [json.loads(page.text) for page in pages] == objects
+    assert not file.closed
+
+
+@pytest.mark.asyncio
+async def test_jsonparser_objects_per_page():
+    file = io.StringIO('[{"test1": "test"}, {"test2": "test"}, {"test3": "test"}]')
+    file.name = "test.json"
+    jsonparser = JsonParser(objects_per_page=2)
+    pages = [page async for page in jsonparser.parse(file)]
+    assert len(pages) == 2
+    assert pages[0].offset == 1
+    assert pages[0].text == '{"test1": "test"}\n{"test2": "test"}'
+    assert pages[1].offset == 1 + len(pages[0].text) + 1
+    assert pages[1].text == '{"test3": "test"}'
+
+
+@pytest.mark.asyncio
+async def test_jsonparser_invalid_array():
+    file = io.StringIO('[{"test1": "test"} {"test2": "test"}]')
+    file.name = "test.json"
+    jsonparser = JsonParser()
+    with pytest.raises(ValueError):
+        [page async for page in jsonparser.parse(file)]
@@ -0,0 +1,85 @@
+import asyncio
+import time
+
+import pytest
+
+from core.latency import (
+    LatencyHistogram,
+    LatencyRecorder,
+    StackSampler,
+    span,
+    track_request,
+    track_stream,
+)
+
+
+def busy_wait(seconds: float):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+def test_latency_histogram_percentiles():
+    histogram = LatencyHistogram(max_samples=100)
+    for latency_ms in range(1, 201):
+        histogram.add(latency_ms)
+    # Percentiles are computed over the most recent samples
+    assert histogram.summary() == {"count": 200, "p50": 151, "p95": 196, "p99": 200, "max": 200}
+
+
+@pytest.mark.asyncio
+async def test_spans_are_recorded_in_current_request():
+    recorder = LatencyRecorder()
+
+    async def search():
+        with span("search"):
+            await asyncio.sleep(0)
+
+    # Spans outside of a request aren't recorded
+    await search()
+    with track_request(recorder, "/chat") as timings:
+        await asyncio.gather(asyncio.create_task(search()), asyncio.create_task(search()))
+        with span("answer"):
+            pass
+
+    assert list(timings.stages) == ["search", "answer"]
+    assert timings.server_timing().startswith("search;dur=")
+    summary = recorder.summary()
+    assert summary["requests"]["/chat"]["count"] == 1
+    assert summary["stages"]["search"]["count"] == 2
+    assert summary["stages"]["answer"]["count"] == 1
+
+
+@pytest.mark.asyncio
+async def test_track_stream_records_first_token():
+    recorder = LatencyRecorder()
+
+    async def events():
+        with span("search"):
+            await asyncio.sleep(0)
+        yield {"delta": {"role": "assistant"}, "context": {}}
+        yield {"delta": {"content": "Paris"}}
+        yield {"delta": {"content": " is the capital"}}
+
+    assert len([event async for event in track_stream(recorder, "/chat/stream", events())]) == 3
+    summary = recorder.summary()
+    assert summary["requests"]["/chat/stream"]["count"] == 1
+    assert summary["stages"]["first_token"]["count"] == 1
+    assert summary["stages"]["search"]["count"] == 1
+
+
+def test_slow_request_logs_sampled_stacks(caplog):
+    profiler = StackSampler(interval=0.001)
+    recorder = LatencyRecorder(profiler=profiler, slow_request_ms=20)
+    profiler.start()
+    try:
+        with track_request(recorder, "/ask"):
+            busy_wait(0.05)
+        with track_request(recorder, "/chat"):
+            pass
+    finally:
+        profiler.stop()
+
+    assert "Slow request to /ask" in caplog.text
+    assert "busy_wait" in caplog.text
+    assert "Slow request to /chat" not in caplog.text
@@ -6,6 +6,7 @@ import tempfile
 import azure
 import pytest
 
+from prepdocslib.filemanifest import FileManifest
 from prepdocslib.listfilestrategy import (
     ADLSGen2ListFileStrategy,
     File,
@@ -115,21 +116,76 @@ async def test_locallistfilestrategy_nesteddir():
         assert files[2].filename() == "c.pdf"
 
 
-def test_locallistfilestrategy_checkmd5():
-    with tempfile.TemporaryDirectory() as tmpdirname:
-        with open(os.path.join(tmpdirname, "test.pdf"), "w") as pdf_file:
-            pdf_file.write("test")
-            f1_hash = hashlib.md5(b"test").hexdigest()
-        with open(os.path.join(tmpdirname, "test.pdf.md5"), "w", encoding="utf-8") as md5_file:
-            md5_file.write(f1_hash)
+@pytest.mark.asyncio
+async def test_locallistfilestrategy_skips_unchanged_files(tmp_path):
+    for filename in ["a.pdf", "b.pdf", "c.pdf"]:
+        (tmp_path / filename).write_text(f"test {filename}")
+    local_list_strategy = LocalListFileStrategy(path_pattern=f"{tmp_path}/*")
 
-        local_list_strategy = LocalListFileStrategy(path_pattern=f"{tmpdirname}/*")
-        assert local_list_strategy.check_md5(md5_file.name) is True
-        assert local_list_strategy.check_md5(pdf_file.name) is True
-        # now change the file, hash should no longer match
-        with open(os.path.join(tmpdirname, "test.pdf"), "w") as pdf_file:
-            pdf_file.write("test2")
-        assert local_list_strategy.check_md5(pdf_file.name) is False
+    async def list_filenames():
+        files = [file async for file in local_list_strategy.list()]
+        for file in files:
+            file.close()
+        return sorted(file.filename() for file in files)
+
+    assert await list_filenames() == ["a.pdf", "b.pdf", "c.pdf"]
+    assert await list_filenames() == []
+    # The manifest replaces the .md5 files and isn't listed itself
+    assert sorted(path.name for path in tmp_path.iterdir()) == [".prepdocs_manifest.sqlite", "a.pdf", "b.pdf", "c.pdf"]
+
+    (tmp_path / "b.pdf").write_text("changed")
+    assert await list_filenames() == ["b.pdf"]
+    assert await list_filenames() == []
+
+    # A file whose modification time changed but whose content didn't is still unchanged
+    os.utime(tmp_path / "c.pdf", ns=(0, 0))
+    assert await list_filenames() == []
+
+
+@pytest.mark.asyncio
+async def test_locallistfilestrategy_only_hashes_modified_files(monkeypatch, tmp_path):
+    for filename in ["a.pdf", "b.pdf", "c.pdf"]:
+        (tmp_path / filename).write_text(f"test {filename}")
+    local_list_strategy = LocalListFileStrategy(path_pattern=f"{tmp_path}/*", manifest_path=str(tmp_path / "manifest"))
+    paths = [path async for path in local_list_strategy.list_paths()]
+    manifest = FileManifest(local_list_strategy.manifest_path)
+    assert sorted(await local_list_strategy.check_changed(manifest, paths)) == sorted(paths)
+
+    hashed = []
+    md5 = hashlib.md5
+
+    def mock_md5(*args, **kwargs):
+        hashed.append(True)
+        return md5(*args, **kwargs)
+
+    monkeypatch.setattr("prepdocslib.listfilestrategy.hashlib.md5", mock_md5)
+    os.utime(tmp_path / "a.pdf", ns=(0, 0))
+    assert await local_list_strategy.check_changed(manifest, paths) == []
+    # Only the file with another modification time is read again
+    assert len(hashed) == 1
+    manifest.close()
+
+
+@pytest.mark.asyncio
+async def test_locallistfilestrategy_respects_md5_files(tmp_path):
+    (tmp_path / "test.pdf").write_text("test")
+    (tmp_path / "test.pdf.md5").write_text(hashlib.md5(b"test").hexdigest())
+    (tmp_path / "other.pdf").write_text("other")
+    (tmp_path / "other.pdf.md5").write_text(hashlib.md5(b"before").hexdigest())
+
+    local_list_strategy = LocalListFileStrategy(path_pattern=f"{tmp_path}/*")
+    files = [file async for file in local_list_strategy.list()]
+    for file in files:
+        file.close()
+    assert [file.filename() for file in files] == ["other.pdf"]
+
+
+def test_locallistfilestrategy_base_directory(tmp_path):
+    assert LocalListFileStrategy.base_directory("data/*") == "data"
+    assert LocalListFileStrategy.base_directory("data/**/*.pdf") == "data"
+    assert LocalListFileStrategy.base_directory("*") == "."
+    assert LocalListFileStrategy.base_directory(f"{tmp_path}/foo.pdf") == str(tmp_path)
+    assert LocalListFileStrategy.base_directory(str(tmp_path)) == str(tmp_path)
 
 
 @pytest.mark.asyncio
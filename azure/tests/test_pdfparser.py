@@ -1,3 +1,4 @@
+import asyncio
 import io
 import json
 import logging
@@ -26,7 +27,11 @@ from prepdocslib.mediadescriber import (
     MultimodalModelDescriber,
 )
 from prepdocslib.page import ImageOnPage
-from prepdocslib.pdfparser import DocumentAnalysisParser, MediaDescriptionStrategy
+from prepdocslib.pdfparser import (
+    DocumentAnalysisParser,
+    MediaDescriptionStrategy,
+    ObjectType,
+)
 
 from .mocks import MockAzureCredential
 
@@ -112,6 +117,60 @@ def test_table_to_html_with_spans():
     assert result_html == expected_html
 
 
+def test_table_to_html_unordered_cells():
+    table = DocumentTable(
+        row_count=2,
+        column_count=2,
+        cells=[
+            DocumentTableCell(row_index=1, column_index=1, content="Cell 2"),
+            DocumentTableCell(row_index=0, column_index=1, content="B & C"),
+            DocumentTableCell(row_index=1, column_index=0, content="Cell 1"),
+            DocumentTableCell(row_index=0, column_index=0, content="A", kind="rowHeader"),
+            # Cells outside the declared rows are ignored
+            DocumentTableCell(row_index=2, column_index=0, content="Stray"),
+        ],
+    )
+
+    assert DocumentAnalysisParser.table_to_html(table) == (
+        "<figure><table>"
+        "<tr><th>A</th><td>B &amp; C</td></tr>"
+        "<tr><td>Cell 1</td><td>Cell 2</td></tr>"
+        "</table></figure>"
+    )
+
+
+def test_page_segments():
+    tables = [
+        DocumentTable(row_count=0, column_count=0, cells=[], spans=[DocumentSpan(offset=105, length=10)]),
+        # A table split into two spans, the second one partially covered by a figure
+        DocumentTable(
+            row_count=0,
+            column_count=0,
+            cells=[],
+            spans=[DocumentSpan(offset=120, length=5), DocumentSpan(offset=130, length=10)],
+        ),
+    ]
+    figures = [
+        DocumentFigure(spans=[DocumentSpan(offset=135, length=10)]),
+        # Spans outside the page are clipped
+        DocumentFigure(spans=[DocumentSpan(offset=90, length=12), DocumentSpan(offset=148, length=20)]),
+    ]
+
+    assert DocumentAnalysisParser.page_segments(100, 50, tables, figures) == [
+        (ObjectType.FIGURE, 1, 0, 2),
+        (ObjectType.NONE, -1, 2, 5),
+        (ObjectType.TABLE, 0, 5, 15),
+        (ObjectType.NONE, -1, 15, 20),
+        (ObjectType.TABLE, 1, 20, 25),
+        (ObjectType.NONE, -1, 25, 30),
+        (ObjectType.TABLE, 1, 30, 35),
+        (ObjectType.FIGURE, 0, 35, 45),
+        (ObjectType.NONE, -1, 45, 48),
+        (ObjectType.FIGURE, 1, 48, 50),
+    ]
+    assert DocumentAnalysisParser.page_segments(0, 10, [], []) == [(ObjectType.NONE, -1, 0, 10)]
+
+
 @pytest.mark.asyncio
 async def test_process_figure_without_bounding_regions():
     doc = MagicMock()
@@ -331,6 +390,152 @@ async def test_parse_doc_with_figures(monkeypatch):
     )
 
 
+@pytest.mark.asyncio
+async def test_parse_doc_with_many_figures_concurrently(monkeypatch):
+    mock_poller = MagicMock()
+    figure_count = 6
+    content_parts = []
+    figures = []
+    for figure_idx in range(figure_count):
+        content_parts.append(f"Text before figure {figure_idx}. ")
+        figure_text = f"<figure>{figure_idx}</figure>"
+        figures.append(
+            DocumentFigure(
+                id=f"1.{figure_idx}",
+                bounding_regions=[
+                    BoundingRegion(
+                        page_number=1, polygon=[0.4295, 1.3072, 1.7071, 1.3076, 1.7067, 2.6088, 0.4291, 2.6085]
+                    )
+                ],
+                spans=[DocumentSpan(offset=len("".join(content_parts)), length=len(figure_text))],
+            )
+        )
+        content_parts.append(figure_text + " ")
+    analyzed_content = "".join(content_parts)
+
+    async def mock_begin_analyze_document(self, model_id, analyze_request, **kwargs):
+        return mock_poller
+
+    async def mock_poller_result():
+        return AnalyzeResult(
+            content=analyzed_content,
+            pages=[DocumentPage(page_number=1, spans=[DocumentSpan(offset=0, length=len(analyzed_content))])],
+            figures=figures,
+        )
+
+    monkeypatch.setattr(DocumentIntelligenceClient, "begin_analyze_document", mock_begin_analyze_document)
+    monkeypatch.setattr(mock_poller, "result", mock_poller_result)
+
+    in_flight = 0
+    max_in_flight = 0
+    calls = 0
+
+    async def mock_describe_image(self, image_bytes):
+        nonlocal in_flight, max_in_flight, calls
+        call = calls
+        calls += 1
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        # Earlier figures take longer, so descriptions complete out of order
+        await asyncio.sleep(0.01 * (figure_count - call))
+        in_flight -= 1
+        return f"Description {call}"
+
+    monkeypatch.setattr(ContentUnderstandingDescriber, "describe_image", mock_describe_image)
+
+    parser = DocumentAnalysisParser(
+        endpoint="https://example.com",
+        credential=MockAzureCredential(),
+        media_description_strategy=MediaDescriptionStrategy.CONTENTUNDERSTANDING,
+        content_understanding_endpoint="https://example.com",
+        max_concurrent_figures=3,
+    )
+    with open(TEST_DATA_DIR / "Simple Figure.pdf", "rb") as f:
+        content = io.BytesIO(f.read())
+        content.name = "Simple Figure.pdf"
+
+    pages = [page async for page in parser.parse(content)]
+
+    assert max_in_flight == 3
+    assert len(pages) == 1
+    assert [image.figure_id for image in pages[0].images] == [f"1.{i}" for i in range(figure_count)]
+    assert pages[0].text == " ".join(
+        f"Text before figure {i}. <figure><figcaption>1.{i} <br>Description {i}</figcaption></figure>"
+        for i in range(figure_count)
+    )
+
+
+@pytest.mark.asyncio
+async def test_parse_doc_with_failing_figure_cancels_other_figures(monkeypatch):
+    mock_poller = MagicMock()
+    content_parts = []
+    figures = []
+    for figure_idx in range(4):
+        figure_text = f"<figure>{figure_idx}</figure>"
+        figures.append(
+            DocumentFigure(
+                id=f"1.{figure_idx}",
+                bounding_regions=[
+                    BoundingRegion(
+                        page_number=1, polygon=[0.4295, 1.3072, 1.7071, 1.3076, 1.7067, 2.6088, 0.4291, 2.6085]
+                    )
+                ],
+                spans=[DocumentSpan(offset=len("".join(content_parts)), length=len(figure_text))],
+            )
+        )
+        content_parts.append(figure_text + " ")
+    analyzed_content = "".join(content_parts)
+
+    async def mock_begin_analyze_document(self, model_id, analyze_request, **kwargs):
+        return mock_poller
+
+    async def mock_poller_result():
+        return AnalyzeResult(
+            content=analyzed_content,
+            pages=[DocumentPage(page_number=1, spans=[DocumentSpan(offset=0, length=len(analyzed_content))])],
+            figures=figures,
+        )
+
+    monkeypatch.setattr(DocumentIntelligenceClient, "begin_analyze_document", mock_begin_analyze_document)
+    monkeypatch.setattr(mock_poller, "result", mock_poller_result)
+
+    calls = 0
+    cancelled = 0
+
+    async def mock_describe_image(self, image_bytes):
+        nonlocal calls, cancelled
+        call = calls
+        calls += 1
+        if call == 0:
+            raise ValueError("Description failed")
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled += 1
+            raise
+        return f"Description {call}"
+
+    monkeypatch.setattr(ContentUnderstandingDescriber, "describe_image", mock_describe_image)
+
+    parser = DocumentAnalysisParser(
+        endpoint="https://example.com",
+        credential=MockAzureCredential(),
+        media_description_strategy=MediaDescriptionStrategy.CONTENTUNDERSTANDING,
+        content_understanding_endpoint="https://example.com",
+        max_concurrent_figures=3,
+    )
+    with open(TEST_DATA_DIR / "Simple Figure.pdf", "rb") as f:
+        content = io.BytesIO(f.read())
+        content.name = "Simple Figure.pdf"
+
+    with pytest.raises(ValueError, match="Description failed"):
+        [page async for page in parser.parse(content)]
+
+    # The figures being described were cancelled and awaited before the error was raised
+    assert calls > 1
+    assert cancelled == calls - 1
+
+
 @pytest.mark.asyncio
 async def test_parse_unsupportedformat(monkeypatch, caplog):
     mock_poller = MagicMock()
@@ -464,3 +669,113 @@ async def test_parse_doc_with_openai_missing_parameters():
     with pytest.raises(ValueError, match="OpenAI client must be provided when using OpenAI media description strategy"):
         # Call the first iteration of the generator without using async for
         await parser.parse(content).__anext__()
+
+
+def build_synthetic_analyze_result(
+    page_count: int, tables_per_page: int = 3, rows_per_table: int = 20
+) -> AnalyzeResult:
+    """Builds a table-heavy multi-page AnalyzeResult, similar to what Document Intelligence returns for tender documents"""
+    content_parts: list[str] = []
+    content_length = 0
+    pages = []
+    tables = []
+    for page_number in range(1, page_count + 1):
+        page_start = content_length
+        for table_idx in range(tables_per_page):
+            paragraph = f"Section {page_number}.{table_idx}: requirements and conditions of the tender.\n\n"
+            content_parts.append(paragraph)
+            content_length += len(paragraph)
+            table_start = content_length
+            cells = []
+            for row_index in range(rows_per_table):
+                for column_index in range(3):
+                    cell_content = f"Item {page_number}-{table_idx}-{row_index}-{column_index}"
+                    content_parts.append(f"| {cell_content} ")
+                    content_length += len(cell_content) + 3
+                    cells.append(
+                        DocumentTableCell(
+                            row_index=row_index,
+                            column_index=column_index,
+                            content=cell_content,
+                            kind="columnHeader" if row_index == 0 else None,
+                        )
+                    )
+                content_parts.append("|\n")
+                content_length += 2
+            tables.append(
+                DocumentTable(
+                    bounding_regions=[BoundingRegion(page_number=page_number, polygon=[0, 0, 1, 0, 1, 1, 0, 1])],
+                    row_count=rows_per_table,
+                    column_count=3,
+                    # Cells are returned column by column to exercise the grouping by row
+                    cells=sorted(cells, key=lambda cell: cell.column_index),
+                    spans=[DocumentSpan(offset=table_start, length=content_length - table_start)],
+                )
+            )
+        footer = f"\nPage {page_number} of {page_count}\n<!-- PageBreak -->\n"
+        content_parts.append(footer)
+        content_length += len(footer)
+        pages.append(
+            DocumentPage(
+                page_number=page_number, spans=[DocumentSpan(offset=page_start, length=content_length - page_start)]
+            )
+        )
+    return AnalyzeResult(content="".join(content_parts), pages=pages, tables=tables, figures=[])
+
+
+def mask_page_text(analyze_result: AnalyzeResult, page: DocumentPage) -> str:
+    """Page text built with a per-character mask, the behavior the span-based page assembly must keep"""
+    tables_on_page = [
+        table for table in analyze_result.tables if table.bounding_regions[0].page_number == page.page_number
+    ]
+    page_offset = page.spans[0].offset
+    page_length = page.spans[0].length
+    mask: list[int] = [-1] * page_length
+    for table_idx, table in enumerate(tables_on_page):
+        for span in table.spans:
+            for i in range(span.length):
+                idx = span.offset - page_offset + i
+                if 0 <= idx < page_length:
+                    mask[idx] = table_idx
+    page_text = ""
+    added_tables = set()
+    for idx, table_idx in enumerate(mask):
+        if table_idx == -1:
+            page_text += analyze_result.content[page_offset + idx]
+        elif table_idx not in added_tables:
+            page_text += DocumentAnalysisParser.table_to_html(tables_on_page[table_idx])
+            added_tables.add(table_idx)
+    return page_text.replace("<!-- PageBreak -->", "").strip()
+
+
+@pytest.mark.asyncio
+async def test_parse_large_table_heavy_document(monkeypatch):
+    analyze_result = build_synthetic_analyze_result(page_count=300, rows_per_table=10)
+    mock_poller = MagicMock()
+
+    async def mock_begin_analyze_document(self, model_id, analyze_request, **kwargs):
+        return mock_poller
+
+    async def mock_poller_result():
+        return analyze_result
+
+    monkeypatch.setattr(DocumentIntelligenceClient, "begin_analyze_document", mock_begin_analyze_document)
+    monkeypatch.setattr(mock_poller, "result", mock_poller_result)
+
+    parser = DocumentAnalysisParser(
+        endpoint="https://example.com",
+        credential=MockAzureCredential(),
+        media_description_strategy=MediaDescriptionStrategy.NONE,
+    )
+    content = io.BytesIO(b"pdf content bytes")
+    content.name = "tender.pdf"
+    pages = [page async for page in parser.parse(content)]
+
+    assert len(pages) == 300
+    assert [page.offset for page in pages] == [sum(len(page.text) for page in pages[:i]) for i in range(300)]
+    for page_num in [0, 1, 149, 298, 299]:
+        assert pages[page_num].text == mask_page_text(analyze_result, analyze_result.pages[page_num])
+    assert pages[0].text.startswith(
+        "Section 1.0: requirements and conditions of the tender.\n\n<figure><table><tr><th>"
+    )
+    assert pages[-1].text.endswith("</table></figure>\nPage 300 of 300")
@@ -1,4 +1,6 @@
+import asyncio
 import logging
+import time
 from argparse import Namespace
 from unittest.mock import AsyncMock
 
@@ -11,7 +13,12 @@ from httpx import Request, Response
 from openai.types.create_embedding_response import Usage
 
 import prepdocs
-from prepdocslib.embeddings import ImageEmbeddings, OpenAIEmbeddings
+from prepdocslib.embeddingcache import EmbeddingCache
+from prepdocslib.embeddings import (
+    EmbeddingRateLimiter,
+    ImageEmbeddings,
+    OpenAIEmbeddings,
+)
 
 from .mocks import (
     MOCK_EMBEDDING_DIMENSIONS,
@@ -162,6 +169,196 @@ async def test_compute_embedding_autherror(monkeypatch):
         await embeddings.create_embeddings(texts=["foo"])
 
 
+class EchoEmbeddingsClient:
+    """Embeds each text as [length of the text], with a delay so that requests overlap"""
+
+    def __init__(self):
+        self.inputs: list = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def create(self, *, model: str, input, **kwargs) -> openai.types.CreateEmbeddingResponse:
+        self.inputs.append(input)
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        texts = input if isinstance(input, list) else [input]
+        # Earlier requests take longer, so responses complete out of order
+        await asyncio.sleep(0.05 / len(self.inputs))
+        self.in_flight -= 1
+        return openai.types.CreateEmbeddingResponse(
+            object="list",
+            data=[
+                openai.types.Embedding(embedding=[float(len(text))], index=i, object="embedding")
+                for i, text in enumerate(texts)
+            ],
+            model=model,
+            usage=Usage(prompt_tokens=1, total_tokens=1),
+        )
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("disable_batch", [False, True])
+async def test_compute_embeddings_concurrently_in_order(disable_batch):
+    client = EchoEmbeddingsClient()
+    embeddings = OpenAIEmbeddings(
+        open_ai_client=MockClient(client),
+        open_ai_model_name=MOCK_EMBEDDING_MODEL_NAME,
+        open_ai_dimensions=MOCK_EMBEDDING_DIMENSIONS,
+        disable_batch=disable_batch,
+        max_concurrent_requests=3,
+    )
+    # 16 texts per batch, so 5 batches when batching
+    texts = ["x" * i for i in range(1, 81)]
+
+    assert await embeddings.create_embeddings(texts) == [[float(i)] for i in range(1, 81)]
+    assert len(client.inputs) == (80 if disable_batch else 5)
+    assert client.max_in_flight == 3
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("disable_batch", [False, True])
+async def test_compute_embeddings_stops_after_failed_request(disable_batch):
+    class FailingEmbeddingsClient(EchoEmbeddingsClient):
+        async def create(self, *, model: str, input, **kwargs) -> openai.types.CreateEmbeddingResponse:
+            if not self.inputs:
+                self.inputs.append(input)
+                raise ValueError("Embedding failed")
+            return await super().create(model=model, input=input, **kwargs)
+
+    client = FailingEmbeddingsClient()
+    embeddings = OpenAIEmbeddings(
+        open_ai_client=MockClient(client),
+        open_ai_model_name=MOCK_EMBEDDING_MODEL_NAME,
+        open_ai_dimensions=MOCK_EMBEDDING_DIMENSIONS,
+        disable_batch=disable_batch,
+        max_concurrent_requests=1,
+    )
+
+    with pytest.raises(ValueError, match="Embedding failed"):
+        await embeddings.create_embeddings(["x" * i for i in range(1, 81)])
+    await asyncio.sleep(0.1)
+    # Only the request that got its turn as the first one failed is sent, the rest are cancelled while waiting
+    assert len(client.inputs) <= 2
+
+
+@pytest.mark.asyncio
+async def test_compute_embeddings_uses_cache(tmp_path):
+    cache_path = str(tmp_path / "embeddings.sqlite")
+    client = EchoEmbeddingsClient()
+    embeddings = OpenAIEmbeddings(
+        open_ai_client=MockClient(client),
+        open_ai_model_name=MOCK_EMBEDDING_MODEL_NAME,
+        open_ai_dimensions=MOCK_EMBEDDING_DIMENSIONS,
+        cache=EmbeddingCache(cache_path),
+    )
+    assert await embeddings.create_embeddings(["a", "bb", "a"]) == [[1.0], [2.0], [1.0]]
+    # Identical texts are only embedded once
+    assert client.inputs == [["a", "bb"]]
+
+    # A new run with the same cache file only embeds the new text
+    client = EchoEmbeddingsClient()
+    embeddings = OpenAIEmbeddings(
+        open_ai_client=MockClient(client),
+        open_ai_model_name=MOCK_EMBEDDING_MODEL_NAME,
+        open_ai_dimensions=MOCK_EMBEDDING_DIMENSIONS,
+        cache=EmbeddingCache(cache_path),
+    )
+    assert await embeddings.create_embeddings(["bb", "ccc", "a"]) == [[2.0], [3.0], [1.0]]
+    assert client.inputs == [["ccc"]]
+    assert await embeddings.create_embeddings(["bb", "ccc", "a"]) == [[2.0], [3.0], [1.0]]
+    assert client.inputs == [["ccc"]]
+
+
+def test_embedding_cache_key_depends_on_model_and_dimensions():
+    key = EmbeddingCache.key("text-embedding-3-large", 3072, "text")
+    assert key == EmbeddingCache.key("text-embedding-3-large", 3072, "text")
+    assert key != EmbeddingCache.key("text-embedding-3-large", 1024, "text")
+    assert key != EmbeddingCache.key("text-embedding-3-small", 3072, "text")
+    assert key != EmbeddingCache.key("text-embedding-3-large", 3072, "text ")
+
+
+class RawResponse:
+    def __init__(self, response: openai.types.CreateEmbeddingResponse, headers: dict[str, str]):
+        self.response = response
+        self.headers = headers
+
+    def parse(self) -> openai.types.CreateEmbeddingResponse:
+        return self.response
+
+
+class RawResponseEmbeddingsClient(EchoEmbeddingsClient):
+    def __init__(self, headers: dict[str, str]):
+        super().__init__()
+        self.headers = headers
+        self.with_raw_response = self
+
+    async def create(self, *, model: str, input, **kwargs):
+        return RawResponse(await super().create(model=model, input=input, **kwargs), self.headers)
+
+
+@pytest.mark.asyncio
+async def test_rate_limiter_follows_response_headers():
+    rate_limiter = EmbeddingRateLimiter(tokens_per_minute=100000, requests_per_minute=1000)
+    embeddings = OpenAIEmbeddings(
+        open_ai_client=MockClient(
+            RawResponseEmbeddingsClient(
+                {
+                    "x-ratelimit-remaining-tokens": "1200",
+                    "x-ratelimit-remaining-requests": "0",
+                    "x-ratelimit-reset-requests": "1m30s",
+                }
+            )
+        ),
+        open_ai_model_name=MOCK_EMBEDDING_MODEL_NAME,
+        open_ai_dimensions=MOCK_EMBEDDING_DIMENSIONS,
+        rate_limiter=rate_limiter,
+    )
+    assert await embeddings.create_embeddings(["foo"]) == [[3.0]]
+
+    assert rate_limiter.token_budget is not None
+    assert rate_limiter.token_budget.tokens == pytest.approx(1200, abs=5)
+    # No requests left until the reset, so every request waits
+    assert rate_limiter.paused_until - time.monotonic() == pytest.approx(90, abs=1)
+
+
+@pytest.mark.asyncio
+async def test_rate_limiter_pauses_on_rate_limit_error(monkeypatch):
+    monkeypatch.setattr(
+        "prepdocslib.embeddings.wait_random_exponential",
+        lambda *args, **kwargs: tenacity.wait_fixed(0),
+    )
+    rate_limiter = EmbeddingRateLimiter(requests_per_minute=60)
+    sleeps = []
+
+    async def mock_sleep(delay):
+        if delay:
+            sleeps.append(delay)
+            rate_limiter.paused_until -= delay
+
+    monkeypatch.setattr(asyncio, "sleep", mock_sleep)
+
+    class RateLimitedOnceClient(EchoEmbeddingsClient):
+        async def create(self, *, model: str, input, **kwargs):
+            if not self.inputs:
+                self.inputs.append(input)
+                response = Response(
+                    429, headers={"retry-after-ms": "2500"}, request=Request("post", "https://foo.bar/")
+                )
+                raise openai.RateLimitError(message="Rate limited", response=response, body=None)
+            return await super().create(model=model, input=input, **kwargs)
+
+    embeddings = OpenAIEmbeddings(
+        open_ai_client=MockClient(RateLimitedOnceClient()),
+        open_ai_model_name=MOCK_EMBEDDING_MODEL_NAME,
+        open_ai_dimensions=MOCK_EMBEDDING_DIMENSIONS,
+        rate_limiter=rate_limiter,
+    )
+    assert await embeddings.create_embeddings(["foo"]) == [[3.0]]
+    # The retry waited for the retry-after from the response
+    assert sleeps[0] == pytest.approx(2.5, abs=0.1)
+    assert rate_limiter.waited_seconds == pytest.approx(2.5, abs=0.1)
+
+
 @pytest.mark.asyncio
 async def test_image_embeddings_success(mock_azurehttp_calls):
     mock_token_provider = AsyncMock(return_value="fake_token")
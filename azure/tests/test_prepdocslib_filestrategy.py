@@ -1,19 +1,31 @@
+import asyncio
+import io
 import os
 
 import pytest
 from azure.search.documents.aio import SearchClient
 
 from prepdocslib.blobmanager import BlobManager
+from prepdocslib.embeddings import TokenBudget
 from prepdocslib.fileprocessor import FileProcessor
-from prepdocslib.filestrategy import FileStrategy
+from prepdocslib.filestrategy import FileStrategy, parse_file
+from prepdocslib.ingestionpipeline import IngestionConcurrency
 from prepdocslib.listfilestrategy import (
     ADLSGen2ListFileStrategy,
+    File,
+    LocalListFileStrategy,
 )
+from prepdocslib.page import ImageOnPage, Page
+from prepdocslib.parser import Parser
 from prepdocslib.strategy import SearchInfo
 from prepdocslib.textparser import TextParser
 from prepdocslib.textsplitter import SimpleTextSplitter
 
-from .mocks import MockAzureCredential
+from .mocks import MockAsyncPageIterator, MockAzureCredential
+
+
+async def mock_search_empty_index(self, *args, **kwargs):
+    return MockAsyncPageIterator(data=[])
 
 
 @pytest.mark.asyncio
@@ -55,6 +67,7 @@ async def test_file_strategy_adls2(monkeypatch, mock_env, mock_data_lake_service
         uploaded_to_search.extend(documents)
 
     monkeypatch.setattr(SearchClient, "upload_documents", mock_upload_documents)
+    monkeypatch.setattr(SearchClient, "search", mock_search_empty_index)
 
     file_strategy = FileStrategy(
         list_file_strategy=adlsgen2_list_strategy,
@@ -68,9 +81,18 @@ async def test_file_strategy_adls2(monkeypatch, mock_env, mock_data_lake_service
 
     assert len(uploaded_to_blob) == 0
     assert len(uploaded_to_search) == 3
+    ids = [document.pop("id") for document in uploaded_to_search]
+    assert ids[0].startswith(
+        "file-a_txt-612E7478747B276F696473273A205B27412D555345522D4944275D2C202767726F757073273A205B27412D47524F55502D4944275D7D-chunk-"
+    )
+    assert ids[1].startswith(
+        "file-b_txt-622E7478747B276F696473273A205B27422D555345522D4944275D2C202767726F757073273A205B27422D47524F55502D4944275D7D-chunk-"
+    )
+    assert ids[2].startswith(
+        "file-c_txt-632E7478747B276F696473273A205B27432D555345522D4944275D2C202767726F757073273A205B27432D47524F55502D4944275D7D-chunk-"
+    )
     assert uploaded_to_search == [
         {
-            "id": "file-a_txt-612E7478747B276F696473273A205B27412D555345522D4944275D2C202767726F757073273A205B27412D47524F55502D4944275D7D-page-0",
             "content": "texttext",
             "category": None,
             "groups": ["A-GROUP-ID"],
@@ -80,7 +102,6 @@ async def test_file_strategy_adls2(monkeypatch, mock_env, mock_data_lake_service
             "storageUrl": "https://test.blob.core.windows.net/a.txt",
         },
         {
-            "id": "file-b_txt-622E7478747B276F696473273A205B27422D555345522D4944275D2C202767726F757073273A205B27422D47524F55502D4944275D7D-page-0",
             "content": "texttext",
             "category": None,
             "groups": ["B-GROUP-ID"],
@@ -90,7 +111,6 @@ async def test_file_strategy_adls2(monkeypatch, mock_env, mock_data_lake_service
             "storageUrl": "https://test.blob.core.windows.net/b.txt",
         },
         {
-            "id": "file-c_txt-632E7478747B276F696473273A205B27432D555345522D4944275D2C202767726F757073273A205B27432D47524F55502D4944275D7D-page-0",
             "content": "texttext",
             "category": None,
             "groups": ["C-GROUP-ID"],
@@ -100,3 +120,432 @@ async def test_file_strategy_adls2(monkeypatch, mock_env, mock_data_lake_service
             "storageUrl": "https://test.blob.core.windows.net/c.txt",
         },
     ]
+
+
+@pytest.mark.asyncio
+async def test_file_strategy_concurrent_adls2(monkeypatch, mock_env, mock_data_lake_service_client):
+    adlsgen2_list_strategy = ADLSGen2ListFileStrategy(
+        data_lake_storage_account="a", data_lake_filesystem="a", data_lake_path="a", credential=MockAzureCredential()
+    )
+    blob_manager = BlobManager(
+        endpoint=f"https://{os.environ['AZURE_STORAGE_ACCOUNT']}.blob.core.windows.net",
+        credential=MockAzureCredential(),
+        container=os.environ["AZURE_STORAGE_CONTAINER"],
+        account=os.environ["AZURE_STORAGE_ACCOUNT"],
+        resource_group=os.environ["AZURE_STORAGE_RESOURCE_GROUP"],
+        subscription_id=os.environ["AZURE_SUBSCRIPTION_ID"],
+    )
+
+    async def mock_exists(*args, **kwargs):
+        return True
+
+    monkeypatch.setattr("azure.storage.blob.aio.ContainerClient.exists", mock_exists)
+
+    upload_calls = []
+
+    async def mock_upload_documents(self, documents):
+        upload_calls.append(list(documents))
+
+    monkeypatch.setattr(SearchClient, "upload_documents", mock_upload_documents)
+    monkeypatch.setattr(SearchClient, "search", mock_search_empty_index)
+
+    file_strategy = FileStrategy(
+        list_file_strategy=adlsgen2_list_strategy,
+        blob_manager=blob_manager,
+        search_info=SearchInfo(
+            endpoint="https://testsearchclient.blob.core.windows.net",
+            credential=MockAzureCredential(),
+            index_name="test",
+        ),
+        file_processors={".txt": FileProcessor(TextParser(), SimpleTextSplitter())},
+        use_acls=True,
+        concurrency=IngestionConcurrency(parse_workers=3, embed_workers=2, upload_batch_size=2),
+    )
+
+    await file_strategy.run()
+
+    uploaded = [document for call in upload_calls for document in call]
+    assert all(len(call) <= 2 for call in upload_calls)
+    assert sorted(document["sourcefile"] for document in uploaded) == ["a.txt", "b.txt", "c.txt"]
+    assert sorted(document["id"].split("-chunk-")[0] for document in uploaded) == [
+        "file-a_txt-612E7478747B276F696473273A205B27412D555345522D4944275D2C202767726F757073273A205B27412D47524F55502D4944275D7D",
+        "file-b_txt-622E7478747B276F696473273A205B27422D555345522D4944275D2C202767726F757073273A205B27422D47524F55502D4944275D7D",
+        "file-c_txt-632E7478747B276F696473273A205B27432D555345522D4944275D2C202767726F757073273A205B27432D47524F55502D4944275D7D",
+    ]
+    report = file_strategy.last_report
+    assert report is not None
+    assert report.files_listed == 3
+    assert report.files_indexed == 3
+    assert report.documents_uploaded == 3
+    assert report.failures == []
+
+
+@pytest.mark.asyncio
+async def test_file_strategy_concurrent_isolates_failures(monkeypatch, tmp_path):
+    for name in ["good1.txt", "bad.txt", "good2.txt"]:
+        (tmp_path / name).write_text(f"Contents of {name}")
+
+    async def mock_upload_blob(self, file):
+        return file.url
+
+    monkeypatch.setattr(BlobManager, "upload_blob", mock_upload_blob)
+
+    class FailingTextParser(TextParser):
+        async def parse(self, content):
+            if os.path.basename(content.name) == "bad.txt":
+                raise ValueError("corrupt file")
+            async for page in super().parse(content):
+                yield page
+
+    uploaded = []
+
+    async def mock_upload_documents(self, documents):
+        uploaded.extend(documents)
+
+    monkeypatch.setattr(SearchClient, "upload_documents", mock_upload_documents)
+    monkeypatch.setattr(SearchClient, "search", mock_search_empty_index)
+
+    file_strategy = FileStrategy(
+        list_file_strategy=LocalListFileStrategy(path_pattern=str(tmp_path / "*.txt")),
+        blob_manager=BlobManager(
+            endpoint="https://test.blob.core.windows.net",
+            credential=MockAzureCredential(),
+            container="test",
+            account="test",
+            resource_group="test",
+            subscription_id="test",
+        ),
+        search_info=SearchInfo(
+            endpoint="https://testsearchclient.blob.core.windows.net",
+            credential=MockAzureCredential(),
+            index_name="test",
+        ),
+        file_processors={".txt": FileProcessor(FailingTextParser(), SimpleTextSplitter())},
+        concurrency=IngestionConcurrency(parse_workers=2, embed_workers=1),
+    )
+
+    await file_strategy.run()
+
+    assert sorted(document["sourcefile"] for document in uploaded) == ["good1.txt", "good2.txt"]
+    report = file_strategy.last_report
+    assert report.files_indexed == 2
+    assert [(failure.filename, failure.stage) for failure in report.failures] == [("bad.txt", "parse")]
+    assert report.to_dict()["files_failed"] == 1
+
+
+@pytest.mark.asyncio
+async def test_file_strategy_concurrent_skips_rest_of_file_after_failed_batch(monkeypatch, tmp_path):
+    (tmp_path / "big.txt").write_text("x" * 3000)
+    (tmp_path / "small.txt").write_text("Contents of small")
+
+    async def mock_upload_blob(self, file):
+        return file.url
+
+    monkeypatch.setattr(BlobManager, "upload_blob", mock_upload_blob)
+
+    uploaded: list[dict] = []
+    failed_once = False
+
+    async def mock_upload_documents(self, documents):
+        nonlocal failed_once
+        if not failed_once and documents[0]["sourcefile"] == "big.txt":
+            failed_once = True
+            raise ValueError("Search service unavailable")
+        uploaded.extend(documents)
+
+    monkeypatch.setattr(SearchClient, "upload_documents", mock_upload_documents)
+    monkeypatch.setattr(SearchClient, "search", mock_search_empty_index)
+
+    file_strategy = FileStrategy(
+        list_file_strategy=LocalListFileStrategy(path_pattern=str(tmp_path / "*.txt")),
+        blob_manager=BlobManager(
+            endpoint="https://test.blob.core.windows.net",
+            credential=MockAzureCredential(),
+            container="test",
+            account="test",
+            resource_group="test",
+            subscription_id="test",
+        ),
+        search_info=SearchInfo(
+            endpoint="https://testsearchclient.blob.core.windows.net",
+            credential=MockAzureCredential(),
+            index_name="test",
+        ),
+        file_processors={".txt": FileProcessor(TextParser(), SimpleTextSplitter(max_object_length=1000))},
+        concurrency=IngestionConcurrency(parse_workers=1, embed_workers=1, upload_batch_size=1),
+    )
+
+    await file_strategy.run()
+
+    # The sections of big.txt after the failed batch aren't uploaded
+    assert [document["sourcefile"] for document in uploaded] == ["small.txt"]
+    report = file_strategy.last_report
+    assert report.files_indexed == 1
+    assert report.documents_uploaded == 1
+    assert [(failure.filename, failure.stage) for failure in report.failures] == [("big.txt", "upload")]
+
+
+@pytest.mark.asyncio
+async def test_file_strategy_concurrent_only_uploads_changed_sections(monkeypatch, tmp_path):
+    (tmp_path / "a.txt").write_text("Contents of a")
+    (tmp_path / "b.txt").write_text("Contents of b")
+
+    async def mock_upload_blob(self, file):
+        return file.url
+
+    monkeypatch.setattr(BlobManager, "upload_blob", mock_upload_blob)
+
+    indexed_ids: set[str] = set()
+    uploaded: list[dict] = []
+    deleted_ids: list[str] = []
+
+    async def mock_search(self, *args, **kwargs):
+        return MockAsyncPageIterator(data=[{"id": document_id} for document_id in indexed_ids])
+
+    async def mock_upload_documents(self, documents):
+        uploaded.extend(documents)
+        indexed_ids.update(document["id"] for document in documents)
+
+    async def mock_delete_documents(self, documents):
+        deleted_ids.extend(document["id"] for document in documents)
+        indexed_ids.difference_update(document["id"] for document in documents)
+
+    monkeypatch.setattr(SearchClient, "search", mock_search)
+    monkeypatch.setattr(SearchClient, "upload_documents", mock_upload_documents)
+    monkeypatch.setattr(SearchClient, "delete_documents", mock_delete_documents)
+
+    def create_file_strategy():
+        return FileStrategy(
+            list_file_strategy=LocalListFileStrategy(path_pattern=str(tmp_path / "*.txt")),
+            blob_manager=BlobManager(
+                endpoint="https://test.blob.core.windows.net",
+                credential=MockAzureCredential(),
+                container="test",
+                account="test",
+                resource_group="test",
+                subscription_id="test",
+            ),
+            search_info=SearchInfo(
+                endpoint="https://testsearchclient.blob.core.windows.net",
+                credential=MockAzureCredential(),
+                index_name="test",
+            ),
+            file_processors={".txt": FileProcessor(TextParser(), SimpleTextSplitter())},
+            concurrency=IngestionConcurrency(parse_workers=2, embed_workers=2),
+        )
+
+    await create_file_strategy().run()
+    assert len(indexed_ids) == 2
+    first_b_id = next(document["id"] for document in uploaded if document["sourcefile"] == "b.txt")
+
+    # Re-ingest both files after b.txt changed
+    (tmp_path / LocalListFileStrategy.MANIFEST_FILENAME).unlink()
+    (tmp_path / "b.txt").write_text("New contents of b")
+    uploaded.clear()
+    file_strategy = create_file_strategy()
+    await file_strategy.run()
+
+    assert [document["content"] for document in uploaded] == ["New contents of b"]
+    assert deleted_ids == [first_b_id]
+    report = file_strategy.last_report
+    assert report.files_indexed == 2
+    assert (report.documents_uploaded, report.sections_kept, report.sections_removed) == (1, 1, 1)
+
+
+@pytest.mark.asyncio
+async def test_token_budget_waits_for_refill(monkeypatch):
+    sleeps = []
+
+    async def mock_sleep(delay):
+        sleeps.append(delay)
+        budget.updated_at -= delay
+
+    monkeypatch.setattr(asyncio, "sleep", mock_sleep)
+
+    budget = TokenBudget(tokens_per_minute=600)
+    assert await budget.acquire(500) == 0
+    waited = await budget.acquire(400)
+    assert waited == pytest.approx(30, abs=0.5)
+    assert sleeps == [pytest.approx(30, abs=0.5)]
+    # Requests larger than the whole budget are capped instead of waiting forever
+    budget.tokens = budget.capacity
+    assert await budget.acquire(10_000) == 0
+
+
+@pytest.mark.asyncio
+async def test_parse_file_processes_images_concurrently():
+    images: list[ImageOnPage] = []
+
+    class ImagesParser(Parser):
+        async def parse(self, content):
+            for page_num in range(3):
+                page_images = [
+                    ImageOnPage(
+                        bytes=f"image {page_num}-{i}".encode(),
+                        bbox=(0, 0, 1, 1),
+                        filename=f"figure{page_num}_{i}.png",
+                        description=f"<figure>{page_num}-{i}</figure>",
+                        figure_id=f"{page_num}.{i}",
+                        page_num=page_num,
+                    )
+                    for i in range(2)
+                ]
+                images.extend(page_images)
+                yield Page(page_num=page_num, offset=0, text=f"Page {page_num}", images=page_images)
+
+    in_flight = 0
+    max_in_flight = 0
+
+    class MockBlobManager:
+        async def upload_document_image(self, document_filename, image_bytes, image_filename, image_page_num, user_oid):
+            nonlocal in_flight, max_in_flight
+            in_flight += 1
+            max_in_flight = max(max_in_flight, in_flight)
+            await asyncio.sleep(0.01)
+            in_flight -= 1
+            return f"https://blob/{image_filename}"
+
+    class MockImageEmbeddings:
+        async def create_embedding_for_image(self, image_bytes):
+            await asyncio.sleep(0.01)
+            return [float(len(image_bytes))]
+
+    content = io.BytesIO(b"content")
+    content.name = "doc.pdf"
+    await parse_file(
+        File(content=content),
+        {".pdf": FileProcessor(ImagesParser(), SimpleTextSplitter())},
+        blob_manager=MockBlobManager(),
+        image_embeddings_client=MockImageEmbeddings(),
+        max_concurrent_images=3,
+    )
+
+    assert max_in_flight == 3
+    assert len(images) == 6
+    assert all(image.url == f"https://blob/{image.filename}" for image in images)
+    assert all(image.embedding == [float(len(image.bytes))] for image in images)
+
+
+@pytest.mark.asyncio
+async def test_parse_file_can_leave_image_embedding_to_the_search_manager():
+    image = ImageOnPage(
+        bytes=b"image",
+        bbox=(0, 0, 1, 1),
+        filename="figure0.png",
+        description="<figure>0</figure>",
+        figure_id="0.0",
+        page_num=0,
+    )
+
+    class ImageParser(Parser):
+        async def parse(self, content):
+            yield Page(page_num=0, offset=0, text="Page 0", images=[image])
+
+    class MockBlobManager:
+        async def upload_document_image(self, document_filename, image_bytes, image_filename, image_page_num, user_oid):
+            return f"https://blob/{image_filename}"
+
+    class MockImageEmbeddings:
+        async def create_embedding_for_image(self, image_bytes):
+            raise AssertionError("Images should only be embedded once the sections are diffed")
+
+    content = io.BytesIO(b"content")
+    content.name = "doc.pdf"
+    sections = await parse_file(
+        File(content=content),
+        {".pdf": FileProcessor(ImageParser(), SimpleTextSplitter())},
+        blob_manager=MockBlobManager(),
+        image_embeddings_client=MockImageEmbeddings(),
+        embed_images=False,
+    )
+
+    # The URL is uploaded up front because it is part of the section ids
+    assert sections[0].chunk.images == [image]
+    assert image.url == "https://blob/figure0.png"
+    assert image.embedding is None
+
+
+@pytest.mark.asyncio
+async def test_parse_file_processes_images_while_parsing():
+    first_image_embedded = asyncio.Event()
+    images: list[ImageOnPage] = []
+
+    class SlowFiguresParser(Parser):
+        async def parse(self, content):
+            for page_num in range(2):
+                image = ImageOnPage(
+                    bytes=f"image {page_num}".encode(),
+                    bbox=(0, 0, 1, 1),
+                    filename=f"figure{page_num}.png",
+                    description=f"<figure>{page_num}</figure>",
+                    figure_id=f"{page_num}.0",
+                    page_num=page_num,
+                )
+                images.append(image)
+                yield Page(page_num=page_num, offset=0, text=f"Page {page_num}", images=[image])
+                # The next page's figures are only described once the first image is processed
+                await asyncio.wait_for(first_image_embedded.wait(), timeout=1)
+
+    class MockBlobManager:
+        async def upload_document_image(self, document_filename, image_bytes, image_filename, image_page_num, user_oid):
+            return f"https://blob/{image_filename}"
+
+    class MockImageEmbeddings:
+        async def create_embedding_for_image(self, image_bytes):
+            first_image_embedded.set()
+            return [float(len(image_bytes))]
+
+    content = io.BytesIO(b"content")
+    content.name = "doc.pdf"
+    await parse_file(
+        File(content=content),
+        {".pdf": FileProcessor(SlowFiguresParser(), SimpleTextSplitter())},
+        blob_manager=MockBlobManager(),
+        image_embeddings_client=MockImageEmbeddings(),
+    )
+
+    assert [image.url for image in images] == ["https://blob/figure0.png", "https://blob/figure1.png"]
+
+
+@pytest.mark.asyncio
+async def test_parse_file_cancels_image_processing_when_parsing_fails():
+    cancelled = 0
+
+    class FailingParser(Parser):
+        async def parse(self, content):
+            image = ImageOnPage(
+                bytes=b"image",
+                bbox=(0, 0, 1, 1),
+                filename="figure0.png",
+                description="<figure>0</figure>",
+                figure_id="0.0",
+                page_num=0,
+            )
+            yield Page(page_num=0, offset=0, text="Page 0", images=[image])
+            await asyncio.sleep(0)
+            raise ValueError("Parsing failed")
+
+    class MockBlobManager:
+        async def upload_document_image(self, document_filename, image_bytes, image_filename, image_page_num, user_oid):
+            nonlocal cancelled
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled += 1
+                raise
+
+    class MockImageEmbeddings:
+        async def create_embedding_for_image(self, image_bytes):
+            return [1.0]
+
+    content = io.BytesIO(b"content")
+    content.name = "doc.pdf"
+    with pytest.raises(ValueError, match="Parsing failed"):
+        await parse_file(
+            File(content=content),
+            {".pdf": FileProcessor(FailingParser(), SimpleTextSplitter())},
+            blob_manager=MockBlobManager(),
+            image_embeddings_client=MockImageEmbeddings(),
+        )
+
+    assert cancelled == 1
@@ -14,6 +14,7 @@ from prepdocslib.textsplitter import (
     SentenceTextSplitter,
     SimpleTextSplitter,
 )
+from prepdocslib.tokenizer import TokenCounter, get_encoding
 
 # Deterministic single-token character used to create token pressure by repetition
 # while keeping tests readable (1 char = 1 token).
@@ -704,3 +705,56 @@ def test_append_overlap_preserves_next_chunk_start():
             # If this occurs, safe_concat would have inserted a space earlier; treat as failure
             boundary_ok = tail_of_first.endswith(" ")
     assert boundary_ok, "First chunk tail and second chunk head joined mid-word without boundary handling"
+
+
+def test_token_counter_matches_encoding():
+    counter = TokenCounter(ENCODING_MODEL, cache_size=3, num_threads=2)
+    bpe = tiktoken.encoding_for_model(ENCODING_MODEL)
+    texts = [f"Sentence number {i} of the tender, with some punctuation." for i in range(40)] + ["", "日本語の文。"]
+
+    assert counter.count_batch(texts + texts[:5]) == [len(bpe.encode(text)) for text in texts + texts[:5]]
+    assert [counter.count(text) for text in texts[:5]] == [len(bpe.encode(text)) for text in texts[:5]]
+    # The cache keeps only the most recently counted texts
+    assert len(counter._counts) == 3
+    assert get_encoding(ENCODING_MODEL) is get_encoding(ENCODING_MODEL)
+
+
+def test_sentencetextsplitter_split_by_max_tokens_encodes_each_text_once(monkeypatch):
+    splitter = SentenceTextSplitter(max_tokens_per_section=50)
+    text = " ".join(f"word{i}" for i in range(400))
+    encoded: list[str] = []
+    original_encode = splitter.token_counter.encoding.encode
+
+    def counting_encode(text, *args, **kwargs):
+        encoded.append(text)
+        return original_encode(text, *args, **kwargs)
+
+    monkeypatch.setattr(splitter.token_counter.encoding, "encode", counting_encode)
+
+    chunks = list(splitter.split_page_by_max_tokens(page_num=0, text=text))
+
+    assert len(chunks) > 1
+    assert all(len(original_encode(chunk.text)) <= 50 for chunk in chunks)
+    assert len(encoded) == len(set(encoded))
+
+
+def test_sentencetextsplitter_split_by_max_tokens_skips_encoding_short_halves(monkeypatch):
+    splitter = SentenceTextSplitter(max_tokens_per_section=50)
+    # Numbers encode to about one token per byte, so the split goes down to halves of at most 50 bytes
+    text = " ".join(str(i) for i in range(60))
+    encoded: list[str] = []
+    original_encode = splitter.token_counter.encoding.encode
+
+    def counting_encode(text, *args, **kwargs):
+        encoded.append(text)
+        return original_encode(text, *args, **kwargs)
+
+    monkeypatch.setattr(splitter.token_counter.encoding, "encode", counting_encode)
+
+    chunks = list(splitter.split_page_by_max_tokens(page_num=0, text=text))
+
+    # Only halves with more UTF-8 bytes than the token limit need to be counted
+    assert len(chunks) > 1
+    assert all(len(original_encode(chunk.text)) <= 50 for chunk in chunks)
+    assert all(len(text.encode("utf-8")) > 50 for text in encoded)
+    assert any(len(chunk.text.encode("utf-8")) <= 50 for chunk in chunks)
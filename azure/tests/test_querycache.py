@@ -0,0 +1,315 @@
+import fnmatch
+import time
+from unittest.mock import ANY
+
+import pytest
+from azure.search.documents.aio import SearchClient
+from azure.search.documents.models import VectorizedQuery
+from openai.types.chat import ChatCompletion
+from openai.types.create_embedding_response import CreateEmbeddingResponse, Usage
+from openai.types.embedding import Embedding
+
+from core.querycache import (
+    MemoryCacheBackend,
+    QueryCache,
+    RedisCacheBackend,
+    SimilarQueryIndex,
+)
+
+from .mocks import MockAsyncSearchResultsIterator
+
+
+class MockEmbeddingsClient:
+    def __init__(self):
+        self.calls = 0
+
+    async def create(self, *args, **kwargs):
+        self.calls += 1
+        return CreateEmbeddingResponse(
+            object="list",
+            data=[Embedding(embedding=[0.1, 0.2, 0.3], index=0, object="embedding")],
+            model=kwargs["model"],
+            usage=Usage(prompt_tokens=4, total_tokens=4),
+        )
+
+
+class MockOpenAIClient:
+    def __init__(self):
+        self.embeddings = MockEmbeddingsClient()
+
+
+def search_query_completion(search_query: str) -> ChatCompletion:
+    return ChatCompletion.model_validate(
+        {
+            "id": "test-id",
+            "object": "chat.completion",
+            "created": 1,
+            "model": "gpt-4.1-mini",
+            "choices": [
+                {
+                    "index": 0,
+                    "finish_reason": "tool_calls",
+                    "message": {
+                        "role": "assistant",
+                        "content": None,
+                        "tool_calls": [
+                            {
+                                "id": "call_1",
+                                "type": "function",
+                                "function": {
+                                    "name": "search_sources",
+                                    "arguments": f'{{"search_query":"{search_query}"}}',
+                                },
+                            }
+                        ],
+                    },
+                }
+            ],
+            "usage": {"completion_tokens": 8, "prompt_tokens": 40, "total_tokens": 48},
+        }
+    )
+
+
+async def mock_search(*args, **kwargs):
+    return MockAsyncSearchResultsIterator(kwargs.get("search_text"), kwargs.get("vector_queries"))
+
+
+class MockRedis:
+    def __init__(self):
+        self.values: dict[str, tuple[str, float]] = {}
+
+    async def get(self, key):
+        value = self.values.get(key)
+        if value is None or value[1] <= time.monotonic():
+            return None
+        return value[0]
+
+    async def set(self, key, value, px):
+        self.values[key] = (value, time.monotonic() + px / 1000)
+
+    async def scan_iter(self, match, count):
+        for key in list(self.values):
+            if fnmatch.fnmatch(key, match):
+                yield key
+
+    async def delete(self, *keys):
+        for key in keys:
+            self.values.pop(key, None)
+
+    async def aclose(self):
+        pass
+
+
+class FailingBackend(MemoryCacheBackend):
+    async def get(self, namespace, key):
+        raise ConnectionError("Cache unavailable")
+
+    async def set(self, namespace, key, value, ttl):
+        raise ConnectionError("Cache unavailable")
+
+
+def test_query_cache_key():
+    assert QueryCache.key("query", None, 3) == QueryCache.key("query", None, 3)
+    assert QueryCache.key("query", None, 3) != QueryCache.key("query", "category eq 'a'", 3)
+    assert "token" not in QueryCache.key("query", "token")
+
+
+@pytest.mark.asyncio
+async def test_query_cache_stats_and_invalidation():
+    query_cache = QueryCache(MemoryCacheBackend(max_entries=2))
+    assert await query_cache.get(QueryCache.EMBEDDINGS, "a") is None
+    await query_cache.set(QueryCache.EMBEDDINGS, "a", [0.1])
+    await query_cache.set(QueryCache.RESULTS, "a", [{"id": "1"}])
+    assert await query_cache.get(QueryCache.EMBEDDINGS, "a") == [0.1]
+    assert await query_cache.get(QueryCache.RESULTS, "a") == [{"id": "1"}]
+
+    # Embeddings stay cached when the index is updated
+    await query_cache.invalidate_results()
+    assert await query_cache.get(QueryCache.RESULTS, "a") is None
+    assert await query_cache.get(QueryCache.EMBEDDINGS, "a") == [0.1]
+
+    assert query_cache.stats() == {
+        "embeddings": {"hits": 2, "misses": 1, "hit_rate": 2 / 3, "size": 1},
+        "results": {"hits": 1, "misses": 1, "hit_rate": 0.5, "size": 0},
+        "rewrites": {"hits": 0, "misses": 0, "hit_rate": None, "size": 0},
+    }
+
+
+@pytest.mark.asyncio
+async def test_memory_backend_evicts_least_recently_used():
+    backend = MemoryCacheBackend(max_entries=2)
+    await backend.set(QueryCache.RESULTS, "a", 1, ttl=60)
+    await backend.set(QueryCache.RESULTS, "b", 2, ttl=60)
+    assert await backend.get(QueryCache.RESULTS, "a") == 1
+    await backend.set(QueryCache.RESULTS, "c", 3, ttl=60)
+    assert await backend.get(QueryCache.RESULTS, "b") is None
+    assert await backend.get(QueryCache.RESULTS, "a") == 1
+    assert backend.size(QueryCache.RESULTS) == 2
+
+
+@pytest.mark.asyncio
+async def test_query_cache_disabled_with_zero_ttl():
+    query_cache = QueryCache(MemoryCacheBackend(), result_ttl=0)
+    await query_cache.set(QueryCache.RESULTS, "a", [{"id": "1"}])
+    assert await query_cache.get(QueryCache.RESULTS, "a") is None
+    assert query_cache.stats()["results"]["misses"] == 0
+
+
+@pytest.mark.asyncio
+async def test_query_cache_backend_errors_are_misses(caplog):
+    query_cache = QueryCache(FailingBackend())
+    await query_cache.set(QueryCache.RESULTS, "a", [{"id": "1"}])
+    assert await query_cache.get(QueryCache.RESULTS, "a") is None
+    assert query_cache.stats()["results"]["misses"] == 1
+    assert "Unable to read from the query cache" in caplog.text
+
+
+@pytest.mark.asyncio
+async def test_redis_backend():
+    redis = MockRedis()
+    query_cache = QueryCache(RedisCacheBackend("redis://localhost", prefix="querycache:index", client=redis))
+    await query_cache.set(QueryCache.EMBEDDINGS, "a", [0.1])
+    await query_cache.set(QueryCache.RESULTS, "a", [{"id": "1"}])
+    assert set(redis.values) == {"querycache:index:embeddings:a", "querycache:index:results:a"}
+    assert await query_cache.get(QueryCache.RESULTS, "a") == [{"id": "1"}]
+
+    await query_cache.invalidate_results()
+    assert set(redis.values) == {"querycache:index:embeddings:a"}
+    assert await query_cache.get(QueryCache.EMBEDDINGS, "a") == [0.1]
+    await query_cache.close()
+
+
+@pytest.mark.asyncio
+async def test_approach_caches_query_embedding(chat_approach):
+    chat_approach.openai_client = MockOpenAIClient()
+    chat_approach.query_cache = QueryCache(MemoryCacheBackend())
+
+    first = await chat_approach.compute_text_embedding("What is included in my plan?")
+    second = await chat_approach.compute_text_embedding("What is included in my plan?")
+    await chat_approach.compute_text_embedding("What is not included in my plan?")
+
+    assert second.vector == first.vector == [0.1, 0.2, 0.3]
+    assert chat_approach.openai_client.embeddings.calls == 2
+    assert chat_approach.query_cache.stats()["embeddings"]["hits"] == 1
+
+
+@pytest.mark.asyncio
+async def test_approach_caches_search_results(chat_approach, monkeypatch):
+    searches = []
+
+    async def record_and_mock_search(*args, **kwargs):
+        searches.append(kwargs)
+        return await mock_search(*args, **kwargs)
+
+    monkeypatch.setattr(SearchClient, "search", record_and_mock_search)
+    chat_approach.query_cache = QueryCache(MemoryCacheBackend())
+
+    async def search(query_text: str, access_token: str):
+        return await chat_approach.search(
+            top=3,
+            query_text=query_text,
+            filter=None,
+            vectors=[],
+            use_text_search=True,
+            use_vector_search=False,
+            use_semantic_ranker=True,
+            use_semantic_captions=True,
+            access_token=access_token,
+        )
+
+    first = await search("whistleblower query", "token-1")
+    second = await search("whistleblower query", "token-1")
+    assert len(searches) == 1
+    assert [document.serialize_for_results() for document in second] == [
+        document.serialize_for_results() for document in first
+    ]
+    assert second[0].captions[0].text == "Caption: A whistleblower policy."
+
+    # Results are neither shared between callers nor between queries
+    await search("whistleblower query", "token-2")
+    await search("other query", "token-1")
+    assert len(searches) == 3
+
+    await chat_approach.query_cache.invalidate_results()
+    await search("whistleblower query", "token-1")
+    assert len(searches) == 4
+
+
+def test_similar_query_index():
+    index = SimilarQueryIndex(threshold=0.95)
+    index.add("user-1", [1.0, 0.0, 0.0], "dental plan coverage")
+    index.add("user-1", [0.0, 1.0, 0.0], "vision plan coverage")
+
+    assert index.find("user-1", [0.98, 0.1, 0.0]) == "dental plan coverage"
+    assert index.find("user-1", [0.7, 0.7, 0.0]) is None
+    # Questions of other scopes are never compared
+    assert index.find("user-2", [1.0, 0.0, 0.0]) is None
+    assert index.stats() == {"hits": 1, "misses": 2, "hit_rate": 1 / 3, "size": 1}
+
+
+@pytest.mark.asyncio
+async def test_chat_approach_caches_search_query(chat_approach, monkeypatch):
+    completions = []
+
+    async def mock_create_chat_completion(*args, **kwargs):
+        completions.append(kwargs["messages"])
+        return search_query_completion("dental plan coverage")
+
+    monkeypatch.setattr(chat_approach, "create_chat_completion", mock_create_chat_completion)
+    monkeypatch.setattr(SearchClient, "search", mock_search)
+    chat_approach.query_cache = QueryCache(MemoryCacheBackend())
+    overrides = {"retrieval_mode": "text"}
+
+    async def search_query(messages, auth_claims={}):
+        extra_info = await chat_approach.run_search_approach(messages, overrides, auth_claims)
+        return extra_info.thoughts[1].description, extra_info.thoughts[0].props
+
+    assert await search_query([{"role": "user", "content": "What does my dental plan cover?"}]) == (
+        "dental plan coverage",
+        {"model": "gpt-4.1-mini", "deployment": "chat", "latency_ms": 0.0, "token_usage": ANY},
+    )
+    # Differences in case, whitespace and trailing punctuation don't matter
+    query_text, props = await search_query([{"role": "user", "content": " what does my dental plan  cover "}])
+    assert query_text == "dental plan coverage"
+    assert props["cached"] is True
+    assert len(completions) == 1
+
+    # The same question in another conversation gets its own search query
+    await search_query(
+        [
+            {"role": "user", "content": "What is my vision plan?"},
+            {"role": "assistant", "content": "Northwind Standard."},
+            {"role": "user", "content": "What does my dental plan cover?"},
+        ]
+    )
+    assert len(completions) == 2
+    assert chat_approach.query_cache.stats()["rewrites"]["hits"] == 1
+
+
+@pytest.mark.asyncio
+async def test_chat_approach_finds_similar_question(chat_approach, monkeypatch):
+    vectors = {"What does my dental plan cover?": [1.0, 0.0], "What does my dental plan include?": [0.99, 0.05]}
+
+    async def mock_compute_text_embedding(q):
+        return VectorizedQuery(vector=vectors.get(q, [0.0, 1.0]), k_nearest_neighbors=50, fields="embedding")
+
+    async def mock_create_chat_completion(*args, **kwargs):
+        return search_query_completion("dental plan coverage")
+
+    monkeypatch.setattr(chat_approach, "compute_text_embedding", mock_compute_text_embedding)
+    monkeypatch.setattr(chat_approach, "create_chat_completion", mock_create_chat_completion)
+    chat_approach.query_cache = QueryCache(MemoryCacheBackend(), similar_rewrites=SimilarQueryIndex(threshold=0.95))
+
+    await chat_approach.cache_search_query(
+        "What does my dental plan cover?", [], {"oid": "user-1"}, "dental plan coverage"
+    )
+    assert (
+        await chat_approach.get_cached_search_query("What does my dental plan include?", [], {"oid": "user-1"})
+        == "dental plan coverage"
+    )
+    # Nearly identical questions of other users aren't looked up, nor are different questions
+    assert (
+        await chat_approach.get_cached_search_query("What does my dental plan include?", [], {"oid": "user-2"}) is None
+    )
+    assert await chat_approach.get_cached_search_query("Who is my manager?", [], {"oid": "user-1"}) is None
+    assert chat_approach.query_cache.stats()["similar_rewrites"]["hits"] == 1
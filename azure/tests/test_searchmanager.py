@@ -1,9 +1,11 @@
+import asyncio
 import io
 
 import openai
 import openai.types
 import pytest
 from azure.core.credentials import AzureKeyCredential
+from azure.core.exceptions import HttpResponseError
 from azure.search.documents.aio import SearchClient
 from azure.search.documents.indexes.aio import SearchIndexClient
 from azure.search.documents.indexes.models import (
@@ -16,7 +18,7 @@ from azure.search.documents.indexes.models import (
 )
 from openai.types.create_embedding_response import Usage
 
-from prepdocslib.embeddings import OpenAIEmbeddings
+from prepdocslib.embeddings import ImageEmbeddings, OpenAIEmbeddings
 from prepdocslib.listfilestrategy import File
 from prepdocslib.page import ImageOnPage
 from prepdocslib.searchmanager import SearchManager, Section
@@ -26,8 +28,10 @@ from prepdocslib.textsplitter import Chunk
 from .mocks import (
     MOCK_EMBEDDING_DIMENSIONS,
     MOCK_EMBEDDING_MODEL_NAME,
+    MockAsyncPageIterator,
     MockClient,
     MockEmbeddingsClient,
+    mock_indexing_results,
 )
 
 
@@ -40,6 +44,18 @@ def search_info():
     )
 
 
+@pytest.fixture
+def indexed_documents(monkeypatch):
+    """Documents already in the search index, which new sections are diffed against"""
+    documents: list[dict] = []
+
+    async def mock_search(self, *args, **kwargs):
+        return MockAsyncPageIterator(data=list(documents))
+
+    monkeypatch.setattr(SearchClient, "search", mock_search)
+    return documents
+
+
 @pytest.mark.asyncio
 async def test_create_index_doesnt_exist_yet(monkeypatch, search_info):
     indexes = []
@@ -59,6 +75,8 @@ async def test_create_index_doesnt_exist_yet(monkeypatch, search_info):
     assert len(indexes) == 1, "It should have created one index"
     assert indexes[0].name == "test"
     assert len(indexes[0].fields) == 6
+    id_field = next(field for field in indexes[0].fields if field.name == "id")
+    assert id_field.sortable and id_field.filterable, "Sections should be pageable by id"
 
 
 @pytest.mark.asyncio
@@ -510,10 +528,10 @@ async def test_create_index_acls_with_existing_fields_no_enforcement(monkeypatch
 
 
 @pytest.mark.asyncio
-async def test_update_content(monkeypatch, search_info):
+async def test_update_content(monkeypatch, search_info, indexed_documents):
     async def mock_upload_documents(self, documents):
         assert len(documents) == 1
-        assert documents[0]["id"] == "file-foo_pdf-666F6F2E706466-page-0"
+        assert documents[0]["id"].startswith("file-foo_pdf-666F6F2E706466-chunk-")
         assert documents[0]["content"] == "test content"
         assert documents[0]["category"] == "test"
         assert documents[0]["sourcepage"] == "foo.pdf#page=1"
@@ -542,7 +560,7 @@ async def test_update_content(monkeypatch, search_info):
 
 
 @pytest.mark.asyncio
-async def test_update_content_many(monkeypatch, search_info):
+async def test_update_content_many(monkeypatch, search_info, indexed_documents):
     ids = []
 
     async def mock_upload_documents(self, documents):
@@ -577,7 +595,7 @@ async def test_update_content_many(monkeypatch, search_info):
 
 
 @pytest.mark.asyncio
-async def test_update_content_with_embeddings(monkeypatch, search_info):
+async def test_update_content_with_embeddings(monkeypatch, search_info, indexed_documents):
     response = openai.types.CreateEmbeddingResponse(
         object="list",
         data=[
@@ -641,7 +659,7 @@ async def test_update_content_with_embeddings(monkeypatch, search_info):
 
 
 @pytest.mark.asyncio
-async def test_update_content_no_images_when_disabled(monkeypatch, search_info):
+async def test_update_content_no_images_when_disabled(monkeypatch, search_info, indexed_documents):
     """Ensure no 'images' field is added when search_images is False (baseline case without any images)."""
 
     documents_uploaded: list[dict] = []
@@ -670,7 +688,7 @@ async def test_update_content_no_images_when_disabled(monkeypatch, search_info):
 
 
 @pytest.mark.asyncio
-async def test_update_content_with_images_when_enabled(monkeypatch, search_info):
+async def test_update_content_with_images_when_enabled(monkeypatch, search_info, indexed_documents):
     """Ensure 'images' field is added with image metadata when search_images is True and chunk has images."""
 
     documents_uploaded: list[dict] = []
@@ -717,6 +735,225 @@ async def test_update_content_with_images_when_enabled(monkeypatch, search_info)
     assert img_entry["embedding"] == image.embedding
 
 
+@pytest.mark.asyncio
+async def test_update_content_only_uploads_changed_sections(monkeypatch, search_info, indexed_documents):
+    documents_uploaded: list[dict] = []
+    deleted_ids: list[str] = []
+    embedded_texts: list[str] = []
+
+    async def mock_upload_documents(self, documents):
+        documents_uploaded.extend(documents)
+
+    async def mock_delete_documents(self, documents):
+        deleted_ids.extend(document["id"] for document in documents)
+
+    async def mock_create_embeddings(self, texts):
+        embedded_texts.extend(texts)
+        return [[float(len(text))] for text in texts]
+
+    monkeypatch.setattr(SearchClient, "upload_documents", mock_upload_documents)
+    monkeypatch.setattr(SearchClient, "delete_documents", mock_delete_documents)
+    monkeypatch.setattr(OpenAIEmbeddings, "create_embeddings", mock_create_embeddings)
+    embeddings = OpenAIEmbeddings(
+        open_ai_client=MockClient(MockEmbeddingsClient(None)),
+        open_ai_model_name=MOCK_EMBEDDING_MODEL_NAME,
+        open_ai_dimensions=MOCK_EMBEDDING_DIMENSIONS,
+    )
+    manager = SearchManager(search_info, embeddings=embeddings, field_name_embedding="embedding")
+
+    test_io = io.BytesIO(b"test content")
+    test_io.name = "test/foo.pdf"
+    file = File(test_io)
+
+    def sections(*texts: str) -> list[Section]:
+        return [Section(chunk=Chunk(page_num=i, text=text), content=file) for i, text in enumerate(texts)]
+
+    first_update = await manager.update_content(sections("page one", "page two", "page three"))
+    assert (first_update.added, first_update.kept, first_update.removed) == (3, 0, 0)
+    assert embedded_texts == ["page one", "page two", "page three"]
+
+    indexed_documents.extend({"id": document["id"]} for document in documents_uploaded)
+    # Sections indexed before ids were content hashes, and the same file uploaded with other ACLs
+    other_file_io = io.BytesIO(b"test content")
+    other_file_io.name = "test/foo.pdf"
+    other_file_id = File(other_file_io, acls={"oids": ["OID_X"]}).filename_to_id()
+    indexed_documents.append({"id": "file-foo_pdf-666F6F2E706466-page-7"})
+    indexed_documents.append({"id": f"{other_file_id}-chunk-1234"})
+    first_ids = [document["id"] for document in documents_uploaded]
+    documents_uploaded.clear()
+    embedded_texts.clear()
+
+    # The second page changes and the third page is removed
+    second_update = await manager.update_content(sections("page one", "page two, revised"))
+
+    assert embedded_texts == ["page two, revised"]
+    assert [document["content"] for document in documents_uploaded] == ["page two, revised"]
+    assert documents_uploaded[0]["embedding"] == [17.0]
+    assert sorted(deleted_ids) == sorted([first_ids[1], first_ids[2], "file-foo_pdf-666F6F2E706466-page-7"])
+    assert (second_update.added, second_update.kept, second_update.removed) == (1, 1, 3)
+
+
+@pytest.mark.asyncio
+async def test_update_content_only_embeds_images_of_changed_sections(monkeypatch, search_info, indexed_documents):
+    documents_uploaded: list[dict] = []
+    embedded_images: list[bytes] = []
+
+    async def mock_upload_documents(self, documents):
+        documents_uploaded.extend(documents)
+
+    async def mock_delete_documents(self, documents):
+        pass
+
+    async def mock_create_embedding_for_image(self, image_bytes):
+        embedded_images.append(image_bytes)
+        return [float(len(image_bytes))]
+
+    monkeypatch.setattr(SearchClient, "upload_documents", mock_upload_documents)
+    monkeypatch.setattr(SearchClient, "delete_documents", mock_delete_documents)
+    monkeypatch.setattr(ImageEmbeddings, "create_embedding_for_image", mock_create_embedding_for_image)
+    image_embeddings = ImageEmbeddings(endpoint="https://mock-endpoint", token_provider=lambda: None)
+    manager = SearchManager(search_info, search_images=True, image_embeddings=image_embeddings)
+
+    test_io = io.BytesIO(b"test content")
+    test_io.name = "test/foo.pdf"
+    file = File(test_io)
+
+    def sections(*texts: str) -> list[Section]:
+        # Images are uploaded but not embedded while parsing, and every section of a page shares its images
+        images = [
+            ImageOnPage(
+                bytes=b"image" * (i + 1),
+                bbox=(1.0, 2.0, 3.0, 4.0),
+                filename=f"img{i}.png",
+                description="Test image",
+                figure_id=f"fig{i}",
+                page_num=i,
+                url=f"http://example.com/img{i}.png",
+            )
+            for i in range(len(texts))
+        ]
+        return [
+            Section(chunk=Chunk(page_num=i, text=text, images=[images[i]]), content=file)
+            for i, text in enumerate(texts)
+        ] + [Section(chunk=Chunk(page_num=0, text="more of page one", images=[images[0]]), content=file)]
+
+    await manager.update_content(sections("page one", "page two"))
+    assert sorted(embedded_images) == [b"image", b"imageimage"]
+    assert [document["images"][0]["embedding"] for document in documents_uploaded] == [[5.0], [10.0], [5.0]]
+
+    indexed_documents.extend({"id": document["id"]} for document in documents_uploaded)
+    documents_uploaded.clear()
+    embedded_images.clear()
+
+    # Only the image of the changed page is embedded again
+    await manager.update_content(sections("page one", "page two, revised"))
+    assert embedded_images == [b"imageimage"]
+    assert [document["images"][0]["embedding"] for document in documents_uploaded] == [[10.0]]
+
+
+@pytest.mark.asyncio
+async def test_get_indexed_ids_pages_through_results_by_id(monkeypatch, search_info):
+    test_io = io.BytesIO(b"test content")
+    test_io.name = "test/foo.pdf"
+    file = File(test_io)
+    indexed_ids = sorted(f"{file.filename_to_id()}-chunk-{i:04}" for i in range(2500))
+    searches: list[dict] = []
+
+    async def mock_search(self, *args, **kwargs):
+        searches.append(kwargs)
+        assert kwargs["order_by"] == ["id asc"] and "skip" not in kwargs
+        _, _, last_id = kwargs["filter"].partition(" and id gt ")
+        page = [document_id for document_id in indexed_ids if document_id > last_id.strip("'")][: kwargs["top"]]
+        return MockAsyncPageIterator(data=[{"id": document_id} for document_id in page])
+
+    monkeypatch.setattr(SearchClient, "search", mock_search)
+    manager = SearchManager(search_info)
+
+    async with search_info.create_search_client() as search_client:
+        assert await manager.get_indexed_ids(search_client, file) == set(indexed_ids)
+    assert [search["filter"] for search in searches] == [
+        "sourcefile eq 'foo.pdf'",
+        f"sourcefile eq 'foo.pdf' and id gt '{indexed_ids[999]}'",
+        f"sourcefile eq 'foo.pdf' and id gt '{indexed_ids[1999]}'",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_get_indexed_ids_falls_back_to_skip_when_id_is_not_sortable(monkeypatch, search_info):
+    test_io = io.BytesIO(b"test content")
+    test_io.name = "test/foo.pdf"
+    file = File(test_io)
+    indexed_ids = [f"{file.filename_to_id()}-chunk-{i}" for i in range(1500)]
+    searches: list[dict] = []
+
+    async def mock_search(self, *args, **kwargs):
+        searches.append(kwargs)
+        if "order_by" in kwargs:
+            raise HttpResponseError(message="Field 'id' is not sortable")
+        top, skip = kwargs["top"], kwargs["skip"]
+        return MockAsyncPageIterator(data=[{"id": document_id} for document_id in indexed_ids[skip : skip + top]])
+
+    monkeypatch.setattr(SearchClient, "search", mock_search)
+    manager = SearchManager(search_info)
+
+    async with search_info.create_search_client() as search_client:
+        assert await manager.get_indexed_ids(search_client, file) == set(indexed_ids)
+        assert await manager.get_indexed_ids(search_client, file) == set(indexed_ids)
+    # The index is only asked to sort by id once
+    assert [search.get("skip") for search in searches] == [None, 0, 1000, 0, 1000]
+
+
+def test_build_documents_ids(search_info):
+    manager = SearchManager(search_info, search_images=True)
+    test_io = io.BytesIO(b"test content")
+    test_io.name = "test/foo.pdf"
+    file = File(test_io)
+
+    def image(embedding: list[float]) -> ImageOnPage:
+        return ImageOnPage(
+            bytes=b"",
+            bbox=(1.0, 2.0, 3.0, 4.0),
+            filename="img1.png",
+            description="Test image",
+            figure_id="fig1",
+            page_num=0,
+            url="http://example.com/img1.png",
+            embedding=embedding,
+        )
+
+    first_ids = [
+        document["id"]
+        for document in manager.build_documents(
+            [
+                Section(chunk=Chunk(page_num=0, text="same text", images=[image([0.1])]), content=file),
+                Section(chunk=Chunk(page_num=0, text="same text", images=[image([0.1])]), content=file),
+                Section(chunk=Chunk(page_num=1, text="same text"), content=file),
+            ]
+        )
+    ]
+    # Identical sections get distinct ids, and a section on another page is another section
+    assert len(set(first_ids)) == 3
+    assert first_ids[1] == f"{first_ids[0]}-2"
+
+    # Ids don't change across runs, even if the image embeddings differ slightly
+    second_ids = [
+        document["id"]
+        for document in manager.build_documents(
+            [
+                Section(chunk=Chunk(page_num=0, text="same text", images=[image([0.1000001])]), content=file),
+                Section(chunk=Chunk(page_num=0, text="same text", images=[image([0.1000001])]), content=file),
+                Section(chunk=Chunk(page_num=1, text="same text"), content=file),
+            ]
+        )
+    ]
+    assert second_ids == first_ids
+    # Any other change to the document, like its storage URL, is a new section
+    assert (
+        manager.build_documents([Section(chunk=Chunk(page_num=1, text="same text"), content=file)], url="x")[0]["id"]
+        != first_ids[2]
+    )
+
+
 class AsyncSearchResultsIterator:
     def __init__(self, results):
         self.results = results
@@ -761,7 +998,7 @@ async def test_remove_content(monkeypatch, search_info):
 
     async def mock_delete_documents(self, documents):
         deleted_documents.extend(documents)
-        return documents
+        return mock_indexing_results(documents)
 
     monkeypatch.setattr(SearchClient, "delete_documents", mock_delete_documents)
 
@@ -789,7 +1026,7 @@ async def test_remove_content_no_docs(monkeypatch, search_info):
 
     async def mock_delete_documents(self, documents):
         deleted_calls.append(documents)
-        return documents
+        return mock_indexing_results(documents)
 
     monkeypatch.setattr(SearchClient, "delete_documents", mock_delete_documents)
 
@@ -846,7 +1083,7 @@ async def test_remove_content_only_oid(monkeypatch, search_info):
 
     async def mock_delete_documents(self, documents):
         deleted_documents.extend(documents)
-        return documents
+        return mock_indexing_results(documents)
 
     monkeypatch.setattr(SearchClient, "delete_documents", mock_delete_documents)
 
@@ -854,7 +1091,9 @@ async def test_remove_content_only_oid(monkeypatch, search_info):
     await manager.remove_content("foo.pdf", only_oid="A-USER-ID")
 
     assert len(searched_filters) == 2, "It should have searched twice (with no results on second try)"
-    assert searched_filters[0] == "sourcefile eq 'foo.pdf'"
+    assert searched_filters[0] == (
+        "sourcefile eq 'foo.pdf' and oids/any(oid: oid eq 'A-USER-ID') and oids/all(oid: oid eq 'A-USER-ID')"
+    )
     assert len(deleted_documents) == 1, "It should have deleted one document"
     assert deleted_documents[0]["id"] == "file-foo_pdf-222"
 
@@ -887,7 +1126,7 @@ async def test_remove_content_no_inf_loop(monkeypatch, search_info):
 
     async def mock_delete_documents(self, documents):
         deleted_documents.extend(documents)
-        return documents
+        return mock_indexing_results(documents)
 
     monkeypatch.setattr(SearchClient, "delete_documents", mock_delete_documents)
 
@@ -895,10 +1134,112 @@ async def test_remove_content_no_inf_loop(monkeypatch, search_info):
     await manager.remove_content("foo.pdf", only_oid="A-USER-ID")
 
     assert len(searched_filters) == 1, "It should have searched once"
-    assert searched_filters[0] == "sourcefile eq 'foo.pdf'"
+    assert searched_filters[0] == (
+        "sourcefile eq 'foo.pdf' and oids/any(oid: oid eq 'A-USER-ID') and oids/all(oid: oid eq 'A-USER-ID')"
+    )
     assert len(deleted_documents) == 0, "It should have deleted no documents"
 
 
+@pytest.mark.asyncio
+async def test_remove_content_waits_for_deletes_to_be_reflected(monkeypatch, search_info):
+    # Deleted sections are still returned by the next search, until the index is refreshed
+    passes_until_refreshed = 2
+    searches: list[dict] = []
+    sleeps: list[float] = []
+
+    async def mock_search(self, *args, **kwargs):
+        searches.append(kwargs)
+        if len(searches) > passes_until_refreshed:
+            return AsyncSearchResultsIterator([])
+        return AsyncSearchResultsIterator([{"id": f"file-foo_pdf-{i}", "oids": []} for i in range(3)])
+
+    async def mock_sleep(delay):
+        sleeps.append(delay)
+
+    deleted_ids: list[str] = []
+
+    async def mock_delete_documents(self, documents):
+        deleted_ids.extend(document["id"] for document in documents)
+        return mock_indexing_results(documents)
+
+    monkeypatch.setattr(SearchClient, "search", mock_search)
+    monkeypatch.setattr(SearchClient, "delete_documents", mock_delete_documents)
+    monkeypatch.setattr(asyncio, "sleep", mock_sleep)
+
+    manager = SearchManager(search_info)
+    await manager.remove_content("foo.pdf")
+
+    assert len(searches) == 3
+    assert all(search["top"] == 1000 and search["include_total_count"] for search in searches)
+    assert sleeps == [0.5]
+    assert sorted(deleted_ids) == ["file-foo_pdf-0", "file-foo_pdf-1", "file-foo_pdf-2"]
+
+
+@pytest.mark.asyncio
+async def test_remove_content_deletes_page_after_page_without_waiting(monkeypatch, search_info):
+    indexed_ids = {f"file-foo_pdf-{i:04}" for i in range(2500)}
+    searches: list[dict] = []
+    sleeps: list[float] = []
+
+    async def mock_search(self, *args, **kwargs):
+        searches.append(kwargs)
+        page = sorted(indexed_ids)[: kwargs["top"]]
+        results = AsyncSearchResultsIterator([{"id": document_id, "oids": []} for document_id in page])
+        count = len(indexed_ids)
+
+        async def get_count():
+            return count
+
+        results.get_count = get_count
+        return results
+
+    async def mock_sleep(delay):
+        sleeps.append(delay)
+
+    async def mock_delete_documents(self, documents):
+        indexed_ids.difference_update(document["id"] for document in documents)
+        return mock_indexing_results(documents)
+
+    monkeypatch.setattr(SearchClient, "search", mock_search)
+    monkeypatch.setattr(SearchClient, "delete_documents", mock_delete_documents)
+    monkeypatch.setattr(asyncio, "sleep", mock_sleep)
+
+    manager = SearchManager(search_info)
+    await manager.remove_content()
+
+    assert indexed_ids == set()
+    assert len(searches) == 4
+    assert all("skip" not in search for search in searches)
+    assert sleeps == []
+
+
+@pytest.mark.asyncio
+async def test_remove_content_gives_up_after_bounded_backoff(monkeypatch, search_info):
+    searches: list[dict] = []
+    sleeps: list[float] = []
+
+    async def mock_search(self, *args, **kwargs):
+        searches.append(kwargs)
+        return AsyncSearchResultsIterator([{"id": "file-foo_pdf-0", "oids": []}])
+
+    async def mock_sleep(delay):
+        sleeps.append(delay)
+
+    async def mock_delete_documents(self, documents):
+        return mock_indexing_results(documents)
+
+    monkeypatch.setattr(SearchClient, "search", mock_search)
+    monkeypatch.setattr(SearchClient, "delete_documents", mock_delete_documents)
+    monkeypatch.setattr(asyncio, "sleep", mock_sleep)
+
+    manager = SearchManager(search_info)
+    await manager.remove_content("foo.pdf")
+
+    # The delete is never reflected, so searching stops after backing off up to 8 seconds
+    assert sleeps == [0.5, 1, 2, 4, 8]
+    assert len(searches) == 7
+
+
 @pytest.mark.asyncio
 async def test_create_index_with_search_images(monkeypatch, search_info):
     """Test that SearchManager correctly creates an index with image search capabilities."""
@@ -0,0 +1,99 @@
+import asyncio
+import os
+
+import pytest
+
+from core.speechcache import SpeechCache
+
+
+@pytest.mark.asyncio
+async def test_speech_cache_memory_eviction():
+    cache = SpeechCache(max_memory_bytes=10)
+    await cache.set("a", b"aaaa")
+    await cache.set("b", b"bbbb")
+    assert await cache.get("a") == b"aaaa"
+
+    # b is the least recently used audio
+    await cache.set("c", b"cccc")
+    assert await cache.get("b") is None
+    assert await cache.get("a") == b"aaaa"
+    assert cache.memory_size == 8
+
+    await cache.set("too_long", b"x" * 11)
+    assert await cache.get("too_long") is None
+
+
+@pytest.mark.asyncio
+async def test_speech_cache_disk(tmp_path):
+    cache = SpeechCache(directory=str(tmp_path), max_memory_bytes=4, max_disk_bytes=10)
+    await cache.set("a", b"aaaa")
+    await cache.set("b", b"bbbb")
+    # Only the most recent audio fits in memory, the other is read from disk
+    assert await cache.get("a") == b"aaaa"
+    await cache.set("c", b"cccc")
+    assert sorted(os.listdir(tmp_path)) == ["a.mp3", "c.mp3"]
+    assert cache.disk_size == 8
+
+    # The audio on disk is found again by another cache using the same directory
+    reloaded_cache = SpeechCache(directory=str(tmp_path), max_memory_bytes=4, max_disk_bytes=10)
+    assert reloaded_cache.disk_size == 8
+    assert await reloaded_cache.get("a") == b"aaaa"
+    assert await reloaded_cache.get("b") is None
+
+
+@pytest.mark.asyncio
+async def test_speech_cache_get_or_create_shares_pending_audio():
+    cache = SpeechCache()
+    created = 0
+
+    async def create():
+        nonlocal created
+        created += 1
+        await asyncio.sleep(0.01)
+        return b"audio"
+
+    results = await asyncio.gather(*(cache.get_or_create("key", create) for _ in range(3)))
+    assert results == [b"audio"] * 3
+    assert created == 1
+    assert await cache.get_or_create("key", create) == b"audio"
+    assert created == 1
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise ValueError("Speech synthesis failed")
+
+    results = await asyncio.gather(*(cache.get_or_create("other", fail) for _ in range(2)), return_exceptions=True)
+    assert [str(result) for result in results] == ["Speech synthesis failed"] * 2
+    assert await cache.get("other") is None
+
+
+@pytest.mark.asyncio
+async def test_speech_cache_get_or_create_retries_when_creator_is_cancelled():
+    cache = SpeechCache()
+    created = 0
+    started = asyncio.Event()
+
+    async def create():
+        nonlocal created
+        created += 1
+        started.set()
+        await asyncio.sleep(0.01)
+        return b"audio"
+
+    creator = asyncio.create_task(cache.get_or_create("key", create))
+    await started.wait()
+    waiters = [asyncio.create_task(cache.get_or_create("key", create)) for _ in range(2)]
+    await asyncio.sleep(0)
+    creator.cancel()
+
+    # One waiting request creates the audio instead of both failing with the cancellation
+    assert await asyncio.gather(*waiters) == [b"audio"] * 2
+    assert created == 2
+    assert creator.cancelled()
+
+
+def test_speech_cache_key():
+    assert SpeechCache.key("en-US-AndrewMultilingualNeural", "test") == SpeechCache.key(
+        "en-US-AndrewMultilingualNeural", "test"
+    )
+    assert SpeechCache.key("en-US-AndrewMultilingualNeural", "test") != SpeechCache.key("en-US-AvaNeural", "test")
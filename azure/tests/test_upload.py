@@ -1,3 +1,4 @@
+import asyncio
 from io import BytesIO
 
 import azure.core.exceptions
@@ -8,8 +9,30 @@ from azure.search.documents.aio import SearchClient
 from azure.storage.filedatalake.aio import DataLakeDirectoryClient, DataLakeFileClient
 from quart.datastructures import FileStorage
 
+import app
 from prepdocslib.embeddings import OpenAIEmbeddings
 
+from .mocks import MockAsyncPageIterator, mock_indexing_results
+
+
+class MockDownloadedFile:
+    def __init__(self, content: bytes):
+        self.content = content
+        self.properties = {"content_type": "text/plain"}
+
+    async def readall(self):
+        return self.content
+
+
+async def wait_for_upload_job(client, job_id: str) -> dict:
+    for _ in range(100):
+        response = await client.get(f"/upload_status/{job_id}", headers={"Authorization": "Bearer test"})
+        job = await response.get_json()
+        if job["status"] not in ("queued", "processing"):
+            return job
+        await asyncio.sleep(0.01)
+    raise AssertionError(f"Upload job {job_id} did not complete")
+
 
 @pytest.mark.asyncio
 @pytest.mark.parametrize("directory_exists", [True, False])
@@ -58,6 +81,11 @@ async def test_upload_file(auth_client, monkeypatch, mock_data_lake_service_clie
 
     monkeypatch.setattr(DataLakeFileClient, "upload_data", mock_upload_file)
 
+    async def mock_download_file(self, *args, **kwargs):
+        return MockDownloadedFile(b"foo;bar")
+
+    monkeypatch.setattr(DataLakeFileClient, "download_file", mock_download_file)
+
     async def mock_create_embeddings(self, texts):
         return [[0.0023064255, -0.009327292, -0.0028842222] for _ in texts]
 
@@ -66,7 +94,12 @@ async def test_upload_file(auth_client, monkeypatch, mock_data_lake_service_clie
     async def mock_upload_documents(self, documents):
         documents_uploaded.extend(documents)
 
+    async def mock_search(self, *args, **kwargs):
+        # No sections of the file are indexed yet
+        return MockAsyncPageIterator(data=[])
+
     monkeypatch.setattr(SearchClient, "upload_documents", mock_upload_documents)
+    monkeypatch.setattr(SearchClient, "search", mock_search)
     monkeypatch.setattr(OpenAIEmbeddings, "create_embeddings", mock_create_embeddings)
 
     response = await auth_client.post(
@@ -74,11 +107,15 @@ async def test_upload_file(auth_client, monkeypatch, mock_data_lake_service_clie
         headers={"Authorization": "Bearer test"},
         files={"file": FileStorage(BytesIO(b"foo;bar"), filename="a.txt")},
     )
-    message = (await response.get_json())["message"]
-    assert message == "File uploaded successfully"
-    assert response.status_code == 200
+    result = await response.get_json()
+    assert result["message"] == "File uploaded successfully"
+    assert response.status_code == 202
+    assert result["job"]["filename"] == "a.txt"
+    assert result["job"]["status"] == "queued"
+    job = await wait_for_upload_job(auth_client, result["job"]["id"])
+    assert job["status"] == "succeeded"
     assert len(documents_uploaded) == 1
-    assert documents_uploaded[0]["id"] == "file-a_txt-612E7478747B276F696473273A205B274F49445F58275D7D-page-0"
+    assert documents_uploaded[0]["id"].startswith("file-a_txt-612E7478747B276F696473273A205B274F49445F58275D7D-chunk-")
     assert documents_uploaded[0]["sourcepage"] == "a.txt"
     assert documents_uploaded[0]["sourcefile"] == "a.txt"
     assert documents_uploaded[0]["embedding"] == [0.0023064255, -0.009327292, -0.0028842222]
@@ -232,7 +269,7 @@ async def test_delete_uploaded(auth_client, monkeypatch, mock_data_lake_service_
 
     async def mock_delete_documents(self, documents):
         deleted_documents.extend(documents)
-        return documents
+        return mock_indexing_results(documents)
 
     monkeypatch.setattr(SearchClient, "delete_documents", mock_delete_documents)
 
@@ -247,7 +284,23 @@ async def test_delete_uploaded(auth_client, monkeypatch, mock_data_lake_service_
     )
     assert response.status_code == 200
     assert len(searched_filters) == 2, "It should have searched twice (with no results on second try)"
-    assert searched_filters[0] == "sourcefile eq 'a''s doc.txt'"
+    assert searched_filters[0] == (
+        "sourcefile eq 'a''s doc.txt' and oids/any(oid: oid eq 'OID_X') and oids/all(oid: oid eq 'OID_X')"
+    )
     assert len(deleted_documents) == 1, "It should have only deleted the document solely owned by OID_X"
     assert deleted_documents[0]["id"] == "file-a_txt-7465737420646F63756D656E742E706466"
     assert len(deleted_directories) == 1, "It should have deleted the directory for the file"
+
+
+@pytest.mark.asyncio
+async def test_upload_status_not_found(auth_client):
+    response = await auth_client.get("/upload_status/unknown", headers={"Authorization": "Bearer test"})
+    assert response.status_code == 404
+    assert (await response.get_json())["message"] == "Upload job not found"
+
+
+@pytest.mark.asyncio
+async def test_upload_status_other_user(auth_client):
+    job = auth_client.config[app.CONFIG_INGESTION_QUEUE].store.add("OID_Y", "a.txt", "https://test/a.txt", "hash-a")
+    response = await auth_client.get(f"/upload_status/{job.id}", headers={"Authorization": "Bearer test"})
+    assert response.status_code == 404
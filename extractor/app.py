@@ -342,11 +342,34 @@ def worker_status():
                 'next_run': str(job.next_run) if job.next_run else None
             })
 
+        # Últimas ejecuciones registradas por el coordinador
+        recent_runs = []
+        try:
+            conn = get_db_connection()
+            cursor = conn.cursor(cursor_factory=RealDictCursor)
+            cursor.execute("""
+                SELECT trigger, holder, status, triggered_at, started_at, finished_at,
+                       queue_delay_seconds, duration_seconds, error
+                FROM run_ledger
+                WHERE job_name = 'extraction'
+                ORDER BY triggered_at DESC
+                LIMIT 20
+            """)
+            recent_runs = [
+                {k: (v.isoformat() if isinstance(v, datetime) else v) for k, v in row.items()}
+                for row in cursor.fetchall()
+            ]
+            cursor.close()
+            conn.close()
+        except Exception as e:
+            logger.warning(f"No se pudo leer run_ledger: {e}")
+
         return jsonify({
             'status': 'running',
             'pid': os.getpid(),
             'scheduled_jobs': len(schedule.jobs),
-            'next_runs': next_runs
+            'next_runs': next_runs,
+            'recent_runs': recent_runs
         }), 200
 
     except Exception as e:
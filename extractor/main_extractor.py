@@ -7,9 +7,8 @@ Ejecuta los 3 extractores y configura la base de datos vectorial automáticament
 import os
 import sys
 import json
-import asyncio
+import time
 from datetime import datetime
-from concurrent.futures import ThreadPoolExecutor
 from loguru import logger
 from dotenv import load_dotenv
 
@@ -21,6 +20,8 @@ from src.utils.vector_manager import VectorManager
 from src.extractors.tianguis_digital_extractor import TianguisDigitalExtractor
 from src.extractors.licita_ya_extractor import LicitaYaExtractor
 from src.extractors.compras_mx_extractor import ComprasMXExtractor
+from src.utils.parallel_executor import ParallelExtractionExecutor, timed_call
+from src.utils.run_coordinator import RunCoordinator
 
 class MainExtractor:
     def __init__(self):
@@ -34,13 +35,21 @@ class MainExtractor:
         self.db_manager = DatabaseManager()
         self.vector_manager = VectorManager()
 
-        # Inicializar extractores
-        self.tianguis_extractor = TianguisDigitalExtractor()
-        self.licita_ya_extractor = LicitaYaExtractor()
-        self.compras_mx_extractor = ComprasMXExtractor()
+        # Inicializar extractores (comparten el modelo de embeddings)
+        self.tianguis_extractor = TianguisDigitalExtractor(self.vector_manager, self.db_manager)
+        self.licita_ya_extractor = LicitaYaExtractor(self.vector_manager, self.db_manager)
+        self._compras_mx_extractor = None
+        self.embedding_stats = {}
 
         logger.info("Extractor principal inicializado correctamente")
 
+    @property
+    def compras_mx_extractor(self):
+        """ComprasMX arranca Selenium: se crea solo cuando se usa en este proceso"""
+        if self._compras_mx_extractor is None:
+            self._compras_mx_extractor = ComprasMXExtractor(self.vector_manager, self.db_manager)
+        return self._compras_mx_extractor
+
     def setup_logging(self):
         """Configurar sistema de logging"""
         log_file = os.getenv('LOG_FILE', 'logs/extractor.log')
@@ -81,29 +90,8 @@ class MainExtractor:
 
     def run_extractor_sequential(self, extractor_func, name):
         """Ejecutar un extractor de forma secuencial"""
-        try:
-            logger.info(f"Iniciando extracción: {name}")
-            start_time = datetime.now()
-
-            result = extractor_func()
-
-            end_time = datetime.now()
-            duration = (end_time - start_time).total_seconds()
-
-            logger.info(f"Extracción {name} completada en {duration:.2f} segundos")
-            return result
-
-        except Exception as e:
-            logger.error(f"Error en extracción {name}: {e}")
-            return {
-                'status': 'error',
-                'source': name.lower().replace(' ', '_'),
-                'error': str(e)
-            }
-
-    def run_extractor_parallel(self, extractor_func, name):
-        """Ejecutar un extractor en paralelo"""
-        return self.run_extractor_sequential(extractor_func, name)
+        logger.info(f"Iniciando extracción: {name}")
+        return timed_call(extractor_func, name, cpu_clock=time.process_time)
 
     def run_all_extractors_sequential(self):
         """Ejecutar todos los extractores de forma secuencial"""
@@ -135,35 +123,19 @@ class MainExtractor:
         return results
 
     def run_all_extractors_parallel(self):
-        """Ejecutar todos los extractors en paralelo"""
-        logger.info("Ejecutando extractores en modo paralelo...")
+        """Ejecutar todos los extractores en paralelo
 
-        extractors = [
-            (self.tianguis_extractor.extract_yesterday_data, "Tianguis Digital"),
-            (self.licita_ya_extractor.extract_keyword_based_data, "Licita Ya"),
-            (self.compras_mx_extractor.extract_yesterday_data, "ComprasMX")
-        ]
-
-        results = []
-
-        with ThreadPoolExecutor(max_workers=3) as executor:
-            # Enviar tareas al pool
-            futures = [
-                executor.submit(self.run_extractor_parallel, func, name)
-                for func, name in extractors
-            ]
+        Las fuentes API corren en hilos y ComprasMX (Selenium) en su propio proceso;
+        los embeddings se calculan en un único worker alimentado por una cola.
+        """
+        logger.info("Ejecutando extractores en modo paralelo...")
 
-            # Recoger resultados
-            for future in futures:
-                try:
-                    result = future.result(timeout=1800)  # 30 minutos timeout
-                    results.append(result)
-                except Exception as e:
-                    logger.error(f"Error en extractor paralelo: {e}")
-                    results.append({
-                        'status': 'error',
-                        'error': str(e)
-                    })
+        executor = ParallelExtractionExecutor(self.vector_manager, self.db_manager)
+        results = executor.run([
+            (lambda vm: TianguisDigitalExtractor(vm, self.db_manager), 'extract_yesterday_data', "Tianguis Digital"),
+            (lambda vm: LicitaYaExtractor(vm, self.db_manager), 'extract_keyword_based_data', "Licita Ya")
+        ])
+        self.embedding_stats = executor.embedding_stats
 
         return results
 
@@ -217,6 +189,7 @@ class MainExtractor:
                 'total_found': sum(r.get('total_found', 0) for r in results if r.get('status') == 'success'),
                 'total_processed': sum(r.get('total_processed', 0) for r in results if r.get('status') == 'success'),
                 'sources_detail': results,
+                'embedding_worker': self.embedding_stats,
                 'vector_db_stats': self.vector_manager.get_collection_stats()
             }
 
@@ -285,6 +258,8 @@ def main():
     parser.add_argument('--parallel', action='store_true', help='Ejecutar extractores en paralelo')
     parser.add_argument('--only-vectors', action='store_true', help='Solo procesar vectores pendientes')
     parser.add_argument('--test-connection', action='store_true', help='Probar conexiones')
+    parser.add_argument('--force', action='store_true',
+                        help='Ejecutar aunque haya una ejecución exitosa dentro de RUN_MIN_INTERVAL')
 
     args = parser.parse_args()
 
@@ -316,10 +291,15 @@ def main():
             logger.info(f"Procesados {count} vectores")
             return
 
-        # Ejecutar extracción completa
-        success = extractor.run_extraction(parallel=args.parallel)
+        # Ejecutar extracción completa (coordinada con el worker y otras réplicas)
+        # Las tablas del coordinador deben existir antes de tomar el lease
+        extractor.initialize_database()
+        coordinator = RunCoordinator(extractor.db_manager, 'extraction')
+        outcome = coordinator.run(lambda: extractor.run_extraction(parallel=args.parallel), trigger='cli', force=args.force)
 
-        if success:
+        if outcome['status'] == 'skipped':
+            logger.info(f"⏭️ Extracción omitida: {outcome['reason']}")
+        elif outcome['status'] == 'success':
             logger.info("🎉 Extracción completada exitosamente")
         else:
             logger.error("❌ Extracción falló")
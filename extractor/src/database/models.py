@@ -38,6 +38,48 @@ class Update(Base):
             'updated_at': self.updated_at
         }
 
+class RunLease(Base):
+    """Lease de ejecución compartido entre réplicas (una fila por job)"""
+    __tablename__ = 'run_leases'
+
+    job_name = Column(String(100), primary_key=True)
+    holder = Column(String(255), nullable=False)
+    acquired_at = Column(DateTime, nullable=False)
+    heartbeat_at = Column(DateTime, nullable=False)
+    expires_at = Column(DateTime, nullable=False)
+
+class RunLedger(Base):
+    """Registro de ejecuciones: disparo, espera en cola y duración"""
+    __tablename__ = 'run_ledger'
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    job_name = Column(String(100), nullable=False, index=True)
+    trigger = Column(String(50))
+    holder = Column(String(255))
+    status = Column(String(20), nullable=False)  # running, success, error, skipped, abandoned
+    triggered_at = Column(DateTime, nullable=False)
+    started_at = Column(DateTime)
+    finished_at = Column(DateTime)
+    queue_delay_seconds = Column(Float)
+    duration_seconds = Column(Float)
+    error = Column(Text)
+    details = Column(JSON)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'job_name': self.job_name,
+            'trigger': self.trigger,
+            'holder': self.holder,
+            'status': self.status,
+            'triggered_at': self.triggered_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'queue_delay_seconds': self.queue_delay_seconds,
+            'duration_seconds': self.duration_seconds,
+            'error': self.error
+        }
+
 class DatabaseManager:
     def __init__(self):
         # Usar la URL de PostgreSQL proporcionada
@@ -17,7 +17,7 @@ from ..database.models import DatabaseManager
 from ..utils.vector_manager import VectorManager
 
 class ComprasMXExtractor:
-    def __init__(self):
+    def __init__(self, vector_manager: VectorManager = None, db_manager: DatabaseManager = None):
         self.base_url = "https://comprasmx.buengobierno.gob.mx"
         self.search_url = f"{self.base_url}/sitiopublico/#/"
         self.session = requests.Session()
@@ -29,8 +29,8 @@ class ComprasMXExtractor:
             'Connection': 'keep-alive'
         })
 
-        self.db_manager = DatabaseManager()
-        self.vector_manager = VectorManager()
+        self.db_manager = db_manager or DatabaseManager()
+        self.vector_manager = vector_manager or VectorManager()
         self.max_retries = int(os.getenv('MAX_RETRIES', 3))
         self.request_delay = int(os.getenv('REQUEST_DELAY', 2))
 
@@ -620,6 +620,7 @@ class ComprasMXExtractor:
 
                 # Generar y almacenar embedding en ChromaDB y PostgreSQL
                 embedding = self.vector_manager.store_in_vector_db({
+                    'update_id': update_id,
                     'id': metadata.get('id'),
                     'titulo': metadata.get('titulo'),
                     'texto_semantico': texto_semantico,
@@ -7,17 +7,14 @@ import time
 import os
 from ..database.models import DatabaseManager
 from ..utils.vector_manager import VectorManager
+from ..utils.http_client import get_http_client
 
 class LicitaYaExtractor:
-    def __init__(self):
+    def __init__(self, vector_manager: VectorManager = None, db_manager: DatabaseManager = None):
         self.base_url = "https://www.licitaya.com.mx/api/v1"
         self.api_key = os.getenv('LICITA_YA_API_KEY')
-        self.session = requests.Session()
-        self.session.headers.update({
-            'User-Agent': os.getenv('USER_AGENT', 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'),
-            'Accept': 'application/json',
-            'Content-Type': 'application/json'
-        })
+        self.http = get_http_client()
+        self.session = self.http.session
 
         # Keywords para búsqueda (agregamos "alimentos" como keyword importante)
         keywords_env = os.getenv('LICITA_YA_KEYWORDS', 'construcción,infraestructura,tecnología,servicios,consultoría,alimentos,obra,adquisición,suministro')
@@ -26,25 +23,13 @@ class LicitaYaExtractor:
         # Límite de licitaciones a procesar para evitar timeouts
         self.max_items = int(os.getenv('LICITA_YA_MAX_ITEMS', 20))
 
-        self.db_manager = DatabaseManager()
-        self.vector_manager = VectorManager()
-        self.max_retries = int(os.getenv('MAX_RETRIES', 3))
-        self.request_delay = int(os.getenv('REQUEST_DELAY', 2))
+        self.db_manager = db_manager or DatabaseManager()
+        self.vector_manager = vector_manager or VectorManager()
+        self.max_retries = self.http.max_retries
 
     def make_request(self, url: str, params: dict = None) -> dict:
-        """Realizar petición HTTP con reintentos"""
-        for attempt in range(self.max_retries):
-            try:
-                time.sleep(self.request_delay)
-                response = self.session.get(url, params=params, timeout=30)
-                response.raise_for_status()
-                return response.json()
-            except requests.exceptions.RequestException as e:
-                logger.warning(f"Intento {attempt + 1} fallido para {url}: {e}")
-                if attempt == self.max_retries - 1:
-                    logger.error(f"Falló después de {self.max_retries} intentos: {url}")
-                    raise e
-                time.sleep(5 * (attempt + 1))
+        """Realizar petición HTTP con reintentos (límite por host en el cliente compartido)"""
+        return self.http.get_json(url, params)
 
     def search_by_keyword(self, keyword: str, target_date: datetime) -> List[Dict]:
         """Buscar licitaciones por palabra clave en Licita Ya usando el endpoint correcto"""
@@ -133,12 +118,18 @@ class LicitaYaExtractor:
             all_licitaciones = []
             seen_ids = set()
 
-            # Hacer consultas individuales pero limitadas
-            for keyword in keywords_to_use:
-                try:
-                    logger.info(f"Buscando con keyword: '{keyword}'")
-                    results = self.search_by_keyword(keyword, target_date)
+            # Consultas por keyword en lotes de HTTP_MAX_CONCURRENCY_PER_HOST; el token bucket
+            # del cliente compartido marca el ritmo y no se lanzan más lotes al llegar a max_items
+            batch_size = max(1, self.http.max_per_host)
+            for start in range(0, len(keywords_to_use), batch_size):
+                batch = keywords_to_use[start:start + batch_size]
+                logger.info(f"Buscando con keywords: {batch}")
+                keyword_results = self.http.map_concurrent(
+                    lambda keyword: self.search_by_keyword(keyword, target_date),
+                    batch
+                )
 
+                for keyword, results in zip(batch, keyword_results):
                     # Agregar resultados únicos
                     for licitacion in results:
                         licitacion_id = (licitacion.get('id') or
@@ -152,16 +143,9 @@ class LicitaYaExtractor:
                             licitacion['unique_id'] = licitacion_id
                             all_licitaciones.append(licitacion)
 
-                    # Pausa entre keywords para no saturar la API
-                    time.sleep(1)
-
-                    # Si ya tenemos suficientes licitaciones, no hacer más consultas
-                    if len(all_licitaciones) >= self.max_items:
-                        break
-
-                except Exception as e:
-                    logger.warning(f"Error con keyword '{keyword}': {e}")
-                    continue
+                # Si ya tenemos suficientes licitaciones, no hacer más consultas
+                if len(all_licitaciones) >= self.max_items:
+                    break
 
             logger.info(f"Total de licitaciones únicas encontradas: {len(all_licitaciones)}")
 
@@ -483,6 +467,7 @@ class LicitaYaExtractor:
 
                 # Generar y almacenar embedding en ChromaDB y PostgreSQL
                 embedding = self.vector_manager.store_in_vector_db({
+                    'update_id': update_id,
                     'id': metadata.get('id'),
                     'titulo': metadata.get('titulo'),
                     'texto_semantico': texto_semantico,
@@ -7,21 +7,17 @@ import time
 import os
 from ..database.models import DatabaseManager
 from ..utils.vector_manager import VectorManager
+from ..utils.http_client import get_http_client
 
 class TianguisDigitalExtractor:
-    def __init__(self):
+    def __init__(self, vector_manager: VectorManager = None, db_manager: DatabaseManager = None):
         self.base_url = "https://datosabiertostianguisdigital.cdmx.gob.mx/api/v1"
         self.contrataciones_api = "http://www.contratosabiertos.cdmx.gob.mx/api"
-        self.session = requests.Session()
-        self.session.headers.update({
-            'User-Agent': os.getenv('USER_AGENT', 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'),
-            'Accept': 'application/json',
-            'Content-Type': 'application/json'
-        })
-        self.db_manager = DatabaseManager()
-        self.vector_manager = VectorManager()
-        self.max_retries = int(os.getenv('MAX_RETRIES', 3))
-        self.request_delay = int(os.getenv('REQUEST_DELAY', 2))
+        self.http = get_http_client()
+        self.session = self.http.session
+        self.db_manager = db_manager or DatabaseManager()
+        self.vector_manager = vector_manager or VectorManager()
+        self.max_retries = self.http.max_retries
 
     def get_yesterday_date_range(self) -> tuple:
         """Obtener rango de fechas del día anterior"""
@@ -31,19 +27,8 @@ class TianguisDigitalExtractor:
         return start_date, end_date
 
     def make_request(self, url: str, params: dict = None) -> dict:
-        """Realizar petición HTTP con reintentos"""
-        for attempt in range(self.max_retries):
-            try:
-                time.sleep(self.request_delay)
-                response = self.session.get(url, params=params, timeout=30)
-                response.raise_for_status()
-                return response.json()
-            except requests.exceptions.RequestException as e:
-                logger.warning(f"Intento {attempt + 1} fallido para {url}: {e}")
-                if attempt == self.max_retries - 1:
-                    logger.error(f"Falló después de {self.max_retries} intentos: {url}")
-                    raise e
-                time.sleep(5 * (attempt + 1))  # Backoff exponencial
+        """Realizar petición HTTP con reintentos (límite por host en el cliente compartido)"""
+        return self.http.get_json(url, params)
 
     def search_licitaciones(self, start_date: datetime, end_date: datetime) -> List[Dict]:
         """Buscar licitaciones en Tianguis Digital usando la API real"""
@@ -262,6 +247,7 @@ class TianguisDigitalExtractor:
 
                 # Generar y almacenar embedding en ChromaDB y PostgreSQL
                 embedding = self.vector_manager.store_in_vector_db({
+                    'update_id': update_id,
                     'id': metadata.get('id'),
                     'titulo': metadata.get('titulo'),
                     'texto_semantico': texto_semantico,
@@ -0,0 +1,204 @@
+import copy
+import requests
+import threading
+import time
+import os
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Any, List, Optional
+from urllib.parse import urlparse, urlencode
+from requests.adapters import HTTPAdapter
+from loguru import logger
+
+
+class TokenBucket:
+    """Token bucket por host: solo espera cuando el presupuesto se agota"""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def acquire(self) -> float:
+        """Consumir un token; devuelve los segundos esperados"""
+        waited = 0.0
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                wait_time = (1 - self.tokens) / self.rate
+            time.sleep(wait_time)
+            waited += wait_time
+
+    def penalize(self, seconds: float):
+        """Vaciar el presupuesto durante `seconds` (p. ej. tras un 429 con Retry-After)"""
+        with self.lock:
+            self._refill()
+            self.tokens = min(self.tokens, 0) - seconds * self.rate
+
+
+class HttpClient:
+    """Cliente HTTP compartido para los extractores del servicio
+
+    - Sesión con pool de conexiones y keep-alive
+    - Límite de peticiones por host (token bucket)
+    - Peticiones condicionales con ETag / If-Modified-Since
+    - Peticiones concurrentes acotadas por host
+    """
+
+    def __init__(self):
+        self.max_retries = int(os.getenv('MAX_RETRIES', 3))
+        self.timeout = int(os.getenv('REQUEST_TIMEOUT', 30))
+
+        # REQUEST_DELAY se mantiene como intervalo medio entre peticiones a un mismo host
+        request_delay = float(os.getenv('REQUEST_DELAY', 2))
+        self.rate = float(os.getenv('HTTP_RATE_PER_SECOND', 1 / request_delay if request_delay > 0 else 10))
+        self.burst = int(os.getenv('HTTP_RATE_BURST', 3))
+        self.max_per_host = int(os.getenv('HTTP_MAX_CONCURRENCY_PER_HOST', 4))
+        self.cache_size = int(os.getenv('HTTP_CONDITIONAL_CACHE_SIZE', 512))
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=16, pool_maxsize=max(self.max_per_host, 10))
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers.update({
+            'User-Agent': os.getenv('USER_AGENT', 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'),
+            'Accept': 'application/json',
+            'Content-Type': 'application/json',
+            'Connection': 'keep-alive'
+        })
+
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._host_semaphores: Dict[str, threading.BoundedSemaphore] = {}
+        self._lock = threading.Lock()
+
+        # Cache de validadores: clave -> (etag, last_modified, json)
+        self._conditional_cache: "OrderedDict[str, tuple]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+
+        self.stats = {'requests': 0, 'not_modified': 0, 'throttled_seconds': 0.0}
+        self._stats_lock = threading.Lock()
+
+    def _host(self, url: str) -> str:
+        return urlparse(url).netloc
+
+    def _bucket(self, host: str) -> TokenBucket:
+        with self._lock:
+            if host not in self._buckets:
+                self._buckets[host] = TokenBucket(self.rate, self.burst)
+            return self._buckets[host]
+
+    def _host_semaphore(self, host: str) -> threading.BoundedSemaphore:
+        with self._lock:
+            if host not in self._host_semaphores:
+                self._host_semaphores[host] = threading.BoundedSemaphore(self.max_per_host)
+            return self._host_semaphores[host]
+
+    def _cache_key(self, url: str, params: Optional[dict]) -> str:
+        if not params:
+            return url
+        return f"{url}?{urlencode(sorted(params.items()), doseq=True)}"
+
+    def _get_cached(self, key: str) -> Optional[tuple]:
+        with self._cache_lock:
+            entry = self._conditional_cache.get(key)
+            if entry is not None:
+                self._conditional_cache.move_to_end(key)
+            return entry
+
+    def _store_cached(self, key: str, response: requests.Response, data: Any):
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        if not etag and not last_modified:
+            return
+        with self._cache_lock:
+            self._conditional_cache[key] = (etag, last_modified, copy.deepcopy(data))
+            self._conditional_cache.move_to_end(key)
+            while len(self._conditional_cache) > self.cache_size:
+                self._conditional_cache.popitem(last=False)
+
+    def _count(self, name: str, amount: float = 1):
+        with self._stats_lock:
+            self.stats[name] += amount
+
+    def get_json(self, url: str, params: dict = None, headers: dict = None) -> Any:
+        """Realizar petición GET con límite por host, reintentos y validación condicional"""
+        host = self._host(url)
+        bucket = self._bucket(host)
+        semaphore = self._host_semaphore(host)
+        key = self._cache_key(url, params)
+
+        for attempt in range(self.max_retries):
+            try:
+                request_headers = dict(headers or {})
+                cached = self._get_cached(key)
+                if cached:
+                    etag, last_modified, _ = cached
+                    if etag:
+                        request_headers['If-None-Match'] = etag
+                    if last_modified:
+                        request_headers['If-Modified-Since'] = last_modified
+
+                self._count('throttled_seconds', bucket.acquire())
+                self._count('requests')
+                with semaphore:
+                    response = self.session.get(url, params=params, headers=request_headers, timeout=self.timeout)
+
+                if response.status_code == 304 and cached:
+                    self._count('not_modified')
+                    # Copia para que los cambios del llamador no alteren la cache
+                    return copy.deepcopy(cached[2])
+
+                if response.status_code == 429:
+                    retry_after = response.headers.get('Retry-After', '')
+                    bucket.penalize(float(retry_after) if retry_after.isdigit() else 5 * (attempt + 1))
+
+                response.raise_for_status()
+                data = response.json()
+                self._store_cached(key, response, data)
+                return data
+
+            except requests.exceptions.RequestException as e:
+                logger.warning(f"Intento {attempt + 1} fallido para {url}: {e}")
+                status = getattr(e.response, 'status_code', None) if isinstance(e, requests.exceptions.HTTPError) else None
+                if attempt == self.max_retries - 1 or (status and 400 <= status < 500 and status != 429):
+                    logger.error(f"Falló después de {attempt + 1} intentos: {url}")
+                    raise e
+                if status != 429:
+                    time.sleep(5 * (attempt + 1))  # Backoff exponencial
+
+    def map_concurrent(self, func: Callable[[Any], Any], items: List[Any]) -> List[Any]:
+        """Aplicar `func` a cada elemento en paralelo conservando el orden
+
+        `func` hace sus peticiones con este cliente, por lo que cada host sigue acotado
+        a HTTP_MAX_CONCURRENCY_PER_HOST peticiones simultáneas y a su token bucket.
+        """
+        if not items:
+            return []
+        with ThreadPoolExecutor(max_workers=min(len(items), self.max_per_host)) as executor:
+            return list(executor.map(func, items))
+
+    def close(self):
+        self.session.close()
+
+
+_shared_client: Optional[HttpClient] = None
+_shared_lock = threading.Lock()
+
+
+def get_http_client() -> HttpClient:
+    """Instancia compartida por proceso para reutilizar conexiones y presupuestos por host"""
+    global _shared_client
+    with _shared_lock:
+        if _shared_client is None:
+            _shared_client = HttpClient()
+        return _shared_client
@@ -0,0 +1,191 @@
+import os
+import time
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
+from typing import List, Dict, Any, Callable
+from loguru import logger
+
+
+def timed_call(func: Callable[[], Dict], name: str, cpu_clock: Callable[[], float] = time.thread_time) -> Dict[str, Any]:
+    """Ejecutar un extractor midiendo tiempo de pared y de CPU"""
+    start_wall = time.perf_counter()
+    start_cpu = cpu_clock()
+    try:
+        result = func()
+    except Exception as e:
+        logger.error(f"Error en extracción {name}: {e}")
+        result = {
+            'status': 'error',
+            'source': name.lower().replace(' ', '_'),
+            'error': str(e)
+        }
+    result = dict(result or {})
+    result['timing'] = {
+        'wall_time': round(time.perf_counter() - start_wall, 3),
+        'cpu_time': round(cpu_clock() - start_cpu, 3)
+    }
+    logger.info(f"Extracción {name}: {result['timing']['wall_time']:.2f}s pared, "
+                f"{result['timing']['cpu_time']:.2f}s CPU")
+    return result
+
+
+class QueuedVectorManager:
+    """Sustituto de VectorManager que envía los embeddings al EmbeddingWorker
+
+    Los extractores siguen llamando a `store_in_vector_db`; el embedding se calcula
+    y se guarda en PostgreSQL de forma asíncrona, por lo que aquí se devuelve None.
+    """
+
+    def __init__(self, queue):
+        self.queue = queue
+
+    def store_in_vector_db(self, licitacion_data: Dict[str, Any]):
+        self.queue.put(dict(licitacion_data))
+        return None
+
+    def get_collection_stats(self) -> Dict:
+        return {}
+
+
+class EmbeddingWorker:
+    """Hilo dedicado que carga un único modelo de embeddings y consume la cola"""
+
+    def __init__(self, vector_manager, db_manager, queue):
+        self.vector_manager = vector_manager
+        self.db_manager = db_manager
+        self.queue = queue
+        self.thread = threading.Thread(target=self._run, name='embedding-worker', daemon=True)
+        self.stats = {'processed': 0, 'errors': 0, 'wall_time': 0.0, 'cpu_time': 0.0}
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def _run(self):
+        start_wall = time.perf_counter()
+        start_cpu = time.thread_time()
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            try:
+                update_id = item.pop('update_id', None)
+                embedding = self.vector_manager.store_in_vector_db(item)
+                if embedding and update_id:
+                    self.db_manager.update_embedding(update_id, embedding)
+                self.stats['processed'] += 1
+            except Exception as e:
+                self.stats['errors'] += 1
+                logger.error(f"Error generando embedding para {item.get('id')}: {e}")
+        self.stats['wall_time'] = round(time.perf_counter() - start_wall, 3)
+        self.stats['cpu_time'] = round(time.thread_time() - start_cpu, 3)
+
+    def stop(self) -> Dict[str, Any]:
+        """Esperar a que se vacíe la cola y detener el hilo"""
+        self.queue.put(None)
+        self.thread.join()
+        logger.info(f"Embeddings procesados: {self.stats['processed']} "
+                    f"({self.stats['errors']} errores, {self.stats['cpu_time']:.2f}s CPU)")
+        return self.stats
+
+
+def run_compras_mx_process(embedding_queue, result_queue):
+    """Punto de entrada del proceso aislado para ComprasMX (Selenium)"""
+    from src.extractors.compras_mx_extractor import ComprasMXExtractor
+
+    extractor = None
+
+    def extract():
+        nonlocal extractor
+        extractor = ComprasMXExtractor(vector_manager=QueuedVectorManager(embedding_queue))
+        return extractor.extract_yesterday_data()
+
+    result = timed_call(extract, "ComprasMX", cpu_clock=time.process_time)
+    if extractor is not None and extractor.driver:
+        extractor.driver.quit()
+        extractor.driver = None
+    result_queue.put(result)
+
+
+class ParallelExtractionExecutor:
+    """Ejecuta las fuentes API en hilos y ComprasMX en un proceso propio
+
+    Todas las fuentes comparten un único EmbeddingWorker alimentado por una cola,
+    de modo que el modelo de embeddings solo se carga una vez.
+    """
+
+    def __init__(self, vector_manager, db_manager, timeout: int = None):
+        self.vector_manager = vector_manager
+        self.db_manager = db_manager
+        self.timeout = timeout or int(os.getenv('EXTRACTION_TIMEOUT', 1800))
+        self.queue_size = int(os.getenv('EMBEDDING_QUEUE_SIZE', 1000))
+        self.embedding_stats: Dict[str, Any] = {}
+
+    def run(self, api_extractors: List[tuple]) -> List[Dict[str, Any]]:
+        """`api_extractors` es una lista de (factory, método, nombre); factory recibe el vector_manager"""
+        ctx = multiprocessing.get_context('spawn')
+        embedding_queue = ctx.Queue(maxsize=self.queue_size)
+        result_queue = ctx.Queue()
+
+        worker = EmbeddingWorker(self.vector_manager, self.db_manager, embedding_queue).start()
+        queued_vector_manager = QueuedVectorManager(embedding_queue)
+
+        process = ctx.Process(
+            target=run_compras_mx_process,
+            args=(embedding_queue, result_queue),
+            name='compras_mx'
+        )
+        process.start()
+        deadline = time.monotonic() + self.timeout
+
+        results = []
+        # Sin `with`: su shutdown(wait=True) esperaría indefinidamente a un extractor colgado
+        executor = ThreadPoolExecutor(max_workers=max(len(api_extractors), 1))
+        futures = []
+        for factory, method_name, name in api_extractors:
+            def run_source(factory=factory, method_name=method_name, name=name):
+                extractor = factory(queued_vector_manager)
+                return timed_call(getattr(extractor, method_name), name)
+            futures.append((executor.submit(run_source), name))
+
+        for future, name in futures:
+            try:
+                results.append(future.result(timeout=max(deadline - time.monotonic(), 0)))
+            except FuturesTimeoutError:
+                logger.error(f"Extractor paralelo {name} excedió EXTRACTION_TIMEOUT ({self.timeout}s)")
+                results.append({
+                    'status': 'error',
+                    'source': name.lower().replace(' ', '_'),
+                    'error': 'timeout'
+                })
+            except Exception as e:
+                logger.error(f"Error en extractor paralelo {name}: {e}")
+                results.append({
+                    'status': 'error',
+                    'source': name.lower().replace(' ', '_'),
+                    'error': str(e)
+                })
+        executor.shutdown(wait=False, cancel_futures=True)
+
+        results.append(self._collect_process_result(process, result_queue, deadline))
+
+        self.embedding_stats = worker.stop()
+        return results
+
+    def _collect_process_result(self, process, result_queue, deadline: float) -> Dict[str, Any]:
+        try:
+            # Leer antes de join() para no bloquear al proceso hijo al vaciar la cola
+            result = result_queue.get(timeout=max(deadline - time.monotonic(), 1))
+            process.join()
+            return result
+        except Exception as e:
+            logger.error(f"Proceso ComprasMX sin resultado (exitcode={process.exitcode}): {e}")
+            if process.is_alive():
+                process.terminate()
+                process.join()
+            return {
+                'status': 'error',
+                'source': 'comprasmx',
+                'error': str(e) or 'timeout'
+            }
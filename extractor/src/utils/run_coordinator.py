@@ -0,0 +1,245 @@
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Any, List
+from loguru import logger
+from sqlalchemy.exc import IntegrityError
+from ..database.models import DatabaseManager, RunLease, RunLedger
+
+
+def job_failed(result: Any) -> bool:
+    """Un job falla si devuelve False o un dict con status 'error' o success False"""
+    if result is False:
+        return True
+    return isinstance(result, dict) and (result.get('status') == 'error' or result.get('success') is False)
+
+
+class RunCoordinator:
+    """Evita ejecuciones solapadas del mismo job entre disparos y réplicas
+
+    - Lease en la tabla `run_leases` con heartbeat; un lease vencido se puede tomar
+    - Política `skip` (descartar el disparo) o `queue` (esperar al lease hasta `queue_timeout`)
+    - Cada disparo queda en `run_ledger` con su espera en cola y duración
+    """
+
+    def __init__(self, db_manager: DatabaseManager, job_name: str = 'extraction'):
+        self.db_manager = db_manager
+        self.job_name = job_name
+        self.holder = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.lease_ttl = int(os.getenv('RUN_LEASE_TTL', 600))
+        self.policy = os.getenv('RUN_OVERLAP_POLICY', 'skip')
+        self.queue_timeout = int(os.getenv('RUN_QUEUE_TIMEOUT', 3600))
+        self.poll_interval = int(os.getenv('RUN_QUEUE_POLL_INTERVAL', 30))
+        self.min_interval = int(os.getenv('RUN_MIN_INTERVAL', 3600))
+        self._local_lock = threading.Lock()
+
+    def try_acquire(self) -> bool:
+        """Intentar tomar el lease; retoma leases vencidos de otras réplicas"""
+        session = self.db_manager.get_session()
+        try:
+            now = datetime.utcnow()
+            expires_at = now + timedelta(seconds=self.lease_ttl)
+            lease = session.query(RunLease).filter_by(job_name=self.job_name).with_for_update().first()
+
+            if lease is None:
+                session.add(RunLease(job_name=self.job_name, holder=self.holder,
+                                     acquired_at=now, heartbeat_at=now, expires_at=expires_at))
+            elif lease.expires_at < now:
+                logger.warning(f"Lease vencido de {lease.holder} para '{self.job_name}', retomando")
+                session.query(RunLedger).filter_by(
+                    job_name=self.job_name, holder=lease.holder, status='running'
+                ).update({'status': 'abandoned', 'finished_at': now}, synchronize_session=False)
+                lease.holder = self.holder
+                lease.acquired_at = now
+                lease.heartbeat_at = now
+                lease.expires_at = expires_at
+            else:
+                session.rollback()
+                return False
+
+            session.commit()
+            return True
+        except IntegrityError:
+            # Otra réplica insertó el lease al mismo tiempo
+            session.rollback()
+            return False
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    def heartbeat(self) -> bool:
+        """Extender el lease mientras el job sigue vivo"""
+        session = self.db_manager.get_session()
+        try:
+            now = datetime.utcnow()
+            updated = session.query(RunLease).filter_by(job_name=self.job_name, holder=self.holder).update({
+                'heartbeat_at': now,
+                'expires_at': now + timedelta(seconds=self.lease_ttl)
+            }, synchronize_session=False)
+            session.commit()
+            return updated > 0
+        except Exception as e:
+            session.rollback()
+            logger.warning(f"Error renovando lease de '{self.job_name}': {e}")
+            return False
+        finally:
+            session.close()
+
+    def release(self):
+        session = self.db_manager.get_session()
+        try:
+            session.query(RunLease).filter_by(job_name=self.job_name, holder=self.holder).delete(
+                synchronize_session=False)
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            logger.warning(f"Error liberando lease de '{self.job_name}': {e}")
+        finally:
+            session.close()
+
+    def _last_success_started_at(self):
+        session = self.db_manager.get_session()
+        try:
+            last = session.query(RunLedger).filter_by(job_name=self.job_name, status='success') \
+                .order_by(RunLedger.started_at.desc()).first()
+            return last.started_at if last else None
+        finally:
+            session.close()
+
+    def _record(self, **fields) -> int:
+        session = self.db_manager.get_session()
+        try:
+            entry = RunLedger(job_name=self.job_name, holder=self.holder, **fields)
+            session.add(entry)
+            session.commit()
+            return entry.id
+        except Exception as e:
+            session.rollback()
+            logger.warning(f"No se pudo registrar ejecución de '{self.job_name}': {e}")
+            return None
+        finally:
+            session.close()
+
+    def _finish(self, entry_id: int, **fields):
+        if entry_id is None:
+            return
+        session = self.db_manager.get_session()
+        try:
+            session.query(RunLedger).filter_by(id=entry_id).update(fields, synchronize_session=False)
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            logger.warning(f"No se pudo cerrar registro {entry_id} de '{self.job_name}': {e}")
+        finally:
+            session.close()
+
+    def _skip(self, trigger: str, triggered_at: datetime, reason: str) -> Dict[str, Any]:
+        logger.info(f"Disparo '{trigger}' de '{self.job_name}' omitido: {reason}")
+        self._record(trigger=trigger, status='skipped', triggered_at=triggered_at,
+                     finished_at=datetime.utcnow(), details={'reason': reason})
+        return {'status': 'skipped', 'trigger': trigger, 'reason': reason}
+
+    def _wait_for_lease(self, deadline: float) -> bool:
+        while True:
+            if self.try_acquire():
+                return True
+            if self.policy != 'queue' or time.monotonic() >= deadline:
+                return False
+            time.sleep(min(self.poll_interval, max(deadline - time.monotonic(), 0)))
+
+    def run(self, job_func: Callable[[], Any], trigger: str = 'manual', force: bool = False) -> Dict[str, Any]:
+        """Ejecutar `job_func` si no hay otra ejecución en curso (local o en otra réplica)
+
+        Los disparos dentro de `RUN_MIN_INTERVAL` desde la última ejecución exitosa se omiten,
+        salvo con `force` (ejecución explícita de un operador); el lease se respeta siempre.
+        """
+        triggered_at = datetime.utcnow()
+        deadline = time.monotonic() + self.queue_timeout
+
+        if self.policy == 'queue':
+            acquired_local = self._local_lock.acquire(timeout=self.queue_timeout)
+        else:
+            acquired_local = self._local_lock.acquire(blocking=False)
+        if not acquired_local:
+            return self._skip(trigger, triggered_at, 'ejecución en curso en este proceso')
+
+        try:
+            try:
+                acquired = self._wait_for_lease(deadline)
+            except Exception as e:
+                logger.error(f"Error obteniendo lease de '{self.job_name}': {e}")
+                return self._skip(trigger, triggered_at, f'lease no disponible: {e}')
+            if not acquired:
+                return self._skip(trigger, triggered_at, 'ejecución en curso en otra réplica')
+
+            try:
+                try:
+                    last_started = None if force else self._last_success_started_at()
+                except Exception as e:
+                    logger.error(f"Error consultando la última ejecución de '{self.job_name}': {e}")
+                    return self._skip(trigger, triggered_at, f'historial no disponible: {e}')
+                if last_started and (datetime.utcnow() - last_started).total_seconds() < self.min_interval:
+                    return self._skip(trigger, triggered_at, f'última ejecución exitosa en {last_started}')
+
+                return self._run_with_lease(job_func, trigger, triggered_at)
+            finally:
+                self.release()
+        finally:
+            self._local_lock.release()
+
+    def _run_with_lease(self, job_func: Callable[[], Any], trigger: str, triggered_at: datetime) -> Dict[str, Any]:
+        started_at = datetime.utcnow()
+        queue_delay = (started_at - triggered_at).total_seconds()
+        entry_id = self._record(trigger=trigger, status='running', triggered_at=triggered_at,
+                                started_at=started_at, queue_delay_seconds=queue_delay)
+        logger.info(f"Ejecución '{trigger}' de '{self.job_name}' iniciada (espera en cola {queue_delay:.1f}s)")
+
+        stop_heartbeat = threading.Event()
+
+        def beat():
+            while not stop_heartbeat.wait(max(self.lease_ttl / 3, 1)):
+                if not self.heartbeat():
+                    logger.warning(f"Lease de '{self.job_name}' perdido durante la ejecución")
+
+        heartbeat_thread = threading.Thread(target=beat, name='run-lease-heartbeat', daemon=True)
+        heartbeat_thread.start()
+
+        status, error, result = 'success', None, None
+        try:
+            result = job_func()
+            if job_failed(result):
+                status = 'error'
+        except Exception as e:
+            status, error = 'error', str(e)
+            logger.error(f"Ejecución '{trigger}' de '{self.job_name}' falló: {e}")
+        finally:
+            stop_heartbeat.set()
+            heartbeat_thread.join()
+
+        finished_at = datetime.utcnow()
+        duration = (finished_at - started_at).total_seconds()
+        self._finish(entry_id, status=status, finished_at=finished_at, duration_seconds=duration, error=error)
+
+        return {
+            'status': status,
+            'trigger': trigger,
+            'queue_delay_seconds': queue_delay,
+            'duration_seconds': duration,
+            'error': error,
+            'result': result
+        }
+
+    def recent_runs(self, limit: int = 20) -> List[Dict[str, Any]]:
+        """Últimas entradas del registro para operadores"""
+        session = self.db_manager.get_session()
+        try:
+            runs = session.query(RunLedger).filter_by(job_name=self.job_name) \
+                .order_by(RunLedger.triggered_at.desc()).limit(limit).all()
+            return [run.to_dict() for run in runs]
+        finally:
+            session.close()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Pruebas del cliente HTTP compartido con una sesión falsa
+"""
+
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+# Agregar directorio raíz al path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from src.utils.http_client import HttpClient
+
+
+class FakeResponse:
+    status_code = 200
+    headers = {}
+
+    def __init__(self, url):
+        self.url = url
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return {'url': self.url}
+
+
+class FakeSession:
+    """Registra cuántas peticiones por host están en curso a la vez"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.active = {}
+        self.peak = {}
+
+    def get(self, url, params=None, headers=None, timeout=None):
+        host = url.split('/')[2]
+        with self.lock:
+            self.active[host] = self.active.get(host, 0) + 1
+            self.peak[host] = max(self.peak.get(host, 0), self.active[host])
+        time.sleep(0.05)
+        with self.lock:
+            self.active[host] -= 1
+        return FakeResponse(url)
+
+
+def make_client(monkeypatch):
+    monkeypatch.setenv('HTTP_MAX_CONCURRENCY_PER_HOST', '2')
+    monkeypatch.setenv('HTTP_RATE_PER_SECOND', '1000')
+    monkeypatch.setenv('HTTP_RATE_BURST', '100')
+    client = HttpClient()
+    client.session = FakeSession()
+    return client
+
+
+def test_get_json_bounds_concurrent_requests_per_host(monkeypatch):
+    client = make_client(monkeypatch)
+    urls = [f"https://{host}/tenders/{i}" for host in ('a.example', 'b.example') for i in range(4)]
+
+    with ThreadPoolExecutor(max_workers=len(urls)) as executor:
+        list(executor.map(client.get_json, urls))
+
+    assert client.session.peak == {'a.example': 2, 'b.example': 2}
+
+
+def test_map_concurrent_keeps_order_and_overlaps_requests(monkeypatch):
+    client = make_client(monkeypatch)
+    urls = [f"https://api.example/tenders/{i}" for i in range(6)]
+
+    start = time.monotonic()
+    results = client.map_concurrent(client.get_json, urls)
+
+    assert results == [{'url': url} for url in urls]
+    assert client.session.peak == {'api.example': 2}
+    assert time.monotonic() - start < 6 * 0.05
+
+
+class ConditionalSession:
+    """Responde 200 con ETag la primera vez y 304 a las peticiones condicionales"""
+
+    def get(self, url, params=None, headers=None, timeout=None):
+        if headers and headers.get('If-None-Match') == '"v1"':
+            response = FakeResponse(url)
+            response.status_code = 304
+            return response
+        response = FakeResponse(url)
+        response.headers = {'ETag': '"v1"'}
+        return response
+
+
+def test_not_modified_returns_a_copy_of_the_cached_body(monkeypatch):
+    client = make_client(monkeypatch)
+    client.session = ConditionalSession()
+    url = "https://api.example/tenders/1"
+
+    first = client.get_json(url)
+    first['url'] = 'modificado'
+    second = client.get_json(url)
+    second['url'] = 'otra vez'
+
+    assert client.get_json(url) == {'url': url}
+    assert client.stats['not_modified'] == 2
+
+
+def test_stats_are_counted_under_concurrent_requests(monkeypatch):
+    client = make_client(monkeypatch)
+    urls = [f"https://{host}/tenders/{i}" for host in ('a.example', 'b.example') for i in range(20)]
+
+    client.map_concurrent(client.get_json, urls)
+
+    assert client.stats['requests'] == len(urls)
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Pruebas de la búsqueda por keywords de Licita Ya con un cliente HTTP falso
+"""
+
+import sys
+import threading
+from datetime import datetime
+from pathlib import Path
+
+# Agregar directorio raíz al path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from src.extractors.licita_ya_extractor import LicitaYaExtractor
+from src.utils.http_client import HttpClient
+
+
+class FakeHttpClient(HttpClient):
+    """Devuelve una página de 10 licitaciones por keyword y registra las peticiones"""
+
+    def __init__(self):
+        self.max_retries = 1
+        self.max_per_host = 2
+        self.session = None
+        self.requests = []
+        self.lock = threading.Lock()
+
+    def get_json(self, url, params=None, headers=None):
+        with self.lock:
+            self.requests.append(params['keyword'])
+        return {'data': [{'id': f"{params['keyword']}-{i}"} for i in range(10)]}
+
+
+def make_extractor(monkeypatch, max_items):
+    monkeypatch.setenv('LICITA_YA_KEYWORDS', 'obra,alimentos,servicios,tecnología,equipo,medicinas')
+    monkeypatch.setenv('LICITA_YA_MAX_ITEMS', str(max_items))
+    http = FakeHttpClient()
+    monkeypatch.setattr('src.extractors.licita_ya_extractor.get_http_client', lambda: http)
+    return LicitaYaExtractor(vector_manager=object(), db_manager=object()), http
+
+
+def test_search_stops_requesting_keywords_once_max_items_is_reached(monkeypatch):
+    extractor, http = make_extractor(monkeypatch, max_items=20)
+
+    results = extractor.search_combined_keywords(datetime(2024, 1, 15))
+
+    # Un lote de 2 keywords ya aporta 20 licitaciones únicas
+    assert len(results) == 20
+    assert sorted(http.requests) == ['alimentos', 'obra']
+
+
+def test_search_keeps_requesting_batches_until_max_items(monkeypatch):
+    extractor, http = make_extractor(monkeypatch, max_items=45)
+
+    results = extractor.search_combined_keywords(datetime(2024, 1, 15))
+
+    assert len(results) == 45
+    assert len(http.requests) == 6
+    assert [r['search_keyword'] for r in results[:10]] == ['obra'] * 10
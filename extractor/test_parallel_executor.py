@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Pruebas de ParallelExtractionExecutor con extractores falsos
+"""
+
+import sys
+import threading
+import time
+from pathlib import Path
+
+# Agregar directorio raíz al path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from src.utils import parallel_executor
+from src.utils.parallel_executor import ParallelExtractionExecutor
+
+
+class FakeVectorManager:
+    def store_in_vector_db(self, licitacion_data):
+        return [0.0]
+
+    def get_collection_stats(self):
+        return {}
+
+
+class FakeDBManager:
+    def update_embedding(self, licitacion_id, embedding):
+        pass
+
+
+class FastExtractor:
+    def __init__(self, vector_manager):
+        self.vector_manager = vector_manager
+
+    def extract(self):
+        self.vector_manager.store_in_vector_db({'id': 1, 'update_id': 1})
+        return {'status': 'success', 'source': 'rapida', 'total_found': 1}
+
+
+class StalledExtractor:
+    release = threading.Event()
+
+    def __init__(self, vector_manager):
+        pass
+
+    def extract(self):
+        self.release.wait()
+        return {'status': 'success', 'source': 'colgada'}
+
+
+def fake_compras_mx_process(embedding_queue, result_queue):
+    """Sustituto del proceso ComprasMX (se importa por nombre en el proceso hijo)"""
+    result_queue.put({'status': 'success', 'source': 'comprasmx'})
+
+
+def test_stalled_extractor_does_not_block_run(monkeypatch):
+    monkeypatch.setattr(parallel_executor, 'run_compras_mx_process', fake_compras_mx_process)
+    executor = ParallelExtractionExecutor(FakeVectorManager(), FakeDBManager(), timeout=1)
+
+    start = time.monotonic()
+    try:
+        results = executor.run([
+            (FastExtractor, 'extract', "Rapida"),
+            (StalledExtractor, 'extract', "Colgada"),
+        ])
+        elapsed = time.monotonic() - start
+    finally:
+        StalledExtractor.release.set()
+
+    assert elapsed < 10
+    assert results[0]['status'] == 'success'
+    assert results[1] == {'status': 'error', 'source': 'colgada', 'error': 'timeout'}
+    assert results[2] == {'status': 'success', 'source': 'comprasmx'}
+    assert executor.embedding_stats['processed'] == 1
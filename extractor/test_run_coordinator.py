@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Pruebas de RunCoordinator sobre una base SQLite temporal
+"""
+
+import sys
+import threading
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+# Agregar directorio raíz al path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from src.database.models import Base, RunLease, RunLedger
+from src.utils.run_coordinator import RunCoordinator
+
+
+class SQLiteDBManager:
+    """Sustituto de DatabaseManager con solo las tablas del coordinador"""
+
+    def __init__(self, path):
+        self.engine = create_engine(f"sqlite:///{path}")
+        Base.metadata.create_all(bind=self.engine, tables=[RunLease.__table__, RunLedger.__table__])
+        self.SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
+
+    def get_session(self):
+        return self.SessionLocal()
+
+
+@pytest.fixture
+def db_manager(tmp_path):
+    return SQLiteDBManager(tmp_path / "runs.db")
+
+
+def ledger(db_manager):
+    session = db_manager.get_session()
+    try:
+        return [(entry.trigger, entry.holder, entry.status) for entry in session.query(RunLedger).order_by(RunLedger.id)]
+    finally:
+        session.close()
+
+
+def test_lease_is_exclusive_until_released(db_manager):
+    first = RunCoordinator(db_manager)
+    second = RunCoordinator(db_manager)
+
+    assert first.try_acquire()
+    assert not second.try_acquire()
+    assert first.heartbeat()
+
+    first.release()
+    assert second.try_acquire()
+    assert not first.heartbeat()
+
+
+def test_stale_lease_is_taken_over_and_its_run_abandoned(db_manager):
+    dead = RunCoordinator(db_manager)
+    assert dead.try_acquire()
+    dead._record(trigger='daily_06', status='running', triggered_at=datetime.utcnow(), started_at=datetime.utcnow())
+
+    session = db_manager.get_session()
+    session.query(RunLease).update({'expires_at': datetime.utcnow() - timedelta(seconds=1)})
+    session.commit()
+    session.close()
+
+    alive = RunCoordinator(db_manager)
+    assert alive.try_acquire()
+    assert not dead.heartbeat()
+    assert ledger(db_manager) == [('daily_06', dead.holder, 'abandoned')]
+
+
+def test_skip_policy_drops_trigger_while_lease_is_held(db_manager):
+    holder = RunCoordinator(db_manager)
+    assert holder.try_acquire()
+    calls = []
+
+    outcome = RunCoordinator(db_manager).run(lambda: calls.append(1), trigger='every_12h')
+
+    assert outcome['status'] == 'skipped'
+    assert calls == []
+    assert [status for _, _, status in ledger(db_manager)] == ['skipped']
+
+
+def test_queue_policy_waits_for_the_lease(db_manager):
+    holder = RunCoordinator(db_manager)
+    assert holder.try_acquire()
+    queued = RunCoordinator(db_manager)
+    queued.policy = 'queue'
+    queued.poll_interval = 0.05
+
+    timer = threading.Timer(0.3, holder.release)
+    timer.start()
+    outcome = queued.run(lambda: {'status': 'success'}, trigger='every_12h')
+    timer.join()
+
+    assert outcome['status'] == 'success'
+    assert outcome['queue_delay_seconds'] >= 0.3
+    assert ledger(db_manager) == [('every_12h', queued.holder, 'success')]
+
+
+def test_min_interval_skips_recent_runs_unless_forced(db_manager):
+    coordinator = RunCoordinator(db_manager)
+
+    assert coordinator.run(lambda: True, trigger='cli')['status'] == 'success'
+    assert coordinator.run(lambda: True, trigger='cli')['status'] == 'skipped'
+    assert coordinator.run(lambda: True, trigger='cli', force=True)['status'] == 'success'
+    assert [status for _, _, status in ledger(db_manager)] == ['success', 'skipped', 'success']
+
+
+def test_failed_jobs_are_recorded_as_errors(db_manager):
+    coordinator = RunCoordinator(db_manager)
+    coordinator.min_interval = 0
+
+    assert coordinator.run(lambda: False)['status'] == 'error'
+    assert coordinator.run(lambda: {'status': 'error'})['status'] == 'error'
+    assert coordinator.run(lambda: {'success': False})['status'] == 'error'
+
+    def crash():
+        raise RuntimeError("boom")
+
+    outcome = coordinator.run(crash)
+    assert (outcome['status'], outcome['error']) == ('error', 'boom')
+    assert [status for _, _, status in ledger(db_manager)] == ['error'] * 4
+
+
+def test_history_failure_skips_the_run_and_releases_the_lease(db_manager):
+    coordinator = RunCoordinator(db_manager)
+    calls = []
+
+    def broken_history():
+        raise RuntimeError('db down')
+
+    coordinator._last_success_started_at = broken_history
+    outcome = coordinator.run(lambda: calls.append(1), trigger='cron')
+
+    assert outcome['status'] == 'skipped'
+    assert calls == []
+    assert RunCoordinator(db_manager).try_acquire()
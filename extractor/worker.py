@@ -13,14 +13,24 @@ from dotenv import load_dotenv
 
 # Importar el extractor principal
 from main_extractor import MainExtractor
+from src.utils.run_coordinator import RunCoordinator
 
 load_dotenv()
 
 class ExtractionWorker:
     def __init__(self):
         self.extractor = MainExtractor()
+        # Las tablas del coordinador (run_leases, run_ledger) deben existir antes del primer disparo
+        self.extractor.initialize_database()
+        self.coordinator = RunCoordinator(self.extractor.db_manager, 'extraction')
         logger.info("Worker de extracción inicializado")
 
+    def trigger_extraction(self, trigger: str = 'manual'):
+        """Disparar extracción a través del coordinador (sin solapamientos entre disparos ni réplicas)"""
+        outcome = self.coordinator.run(self.run_extraction, trigger=trigger)
+        logger.info(f"📒 Disparo '{trigger}': {outcome['status']}")
+        return outcome
+
     def run_extraction(self):
         """Ejecutar proceso de extracción completo"""
         try:
@@ -30,13 +40,16 @@ class ExtractionWorker:
             self.extractor.initialize_database()
 
             # Ejecutar extractores
-            results = self.extractor.run_all_extractors_sequential()
+            if os.getenv('PARALLEL_EXTRACTION', 'true').lower() == 'true':
+                results = self.extractor.run_all_extractors_parallel()
+            else:
+                results = self.extractor.run_all_extractors_sequential()
 
             # Procesar vectores pendientes
             processed = self.extractor.process_unprocessed_vectors()
 
             # Generar resumen
-            summary = self.extractor.generate_summary(results)
+            summary = self.extractor.generate_summary_report(results)
 
             logger.info(f"✅ Extracción completada exitosamente")
             logger.info(f"📊 Resumen: {summary}")
@@ -50,14 +63,15 @@ class ExtractionWorker:
     def setup_schedule(self):
         """Configurar el schedule para ejecución diaria"""
         # Ejecutar todos los días a las 6:00 AM
-        schedule.every().day.at("06:00").do(self.run_extraction)
+        schedule.every().day.at("06:00").do(self.trigger_extraction, 'daily_06')
 
         # También ejecutar cada 12 horas para no perder datos
-        schedule.every(12).hours.do(self.run_extraction)
+        schedule.every(12).hours.do(self.trigger_extraction, 'every_12h')
 
         logger.info("📅 Schedule configurado:")
         logger.info("  - Ejecución diaria a las 6:00 AM")
         logger.info("  - Ejecución adicional cada 12 horas")
+        logger.info(f"  - Política de solapamiento: {self.coordinator.policy}")
 
     def run_once_on_start(self):
         """Ejecutar una vez al iniciar si no hay datos recientes"""
@@ -79,14 +93,14 @@ class ExtractionWorker:
 
             if not last_run or (datetime.now() - last_run).days > 0:
                 logger.info("🔄 Ejecutando extracción inicial...")
-                self.run_extraction()
+                self.trigger_extraction('startup')
             else:
                 logger.info("✅ Datos recientes encontrados, esperando próximo schedule")
 
         except Exception as e:
             logger.warning(f"No se pudo verificar última ejecución: {e}")
             logger.info("🔄 Ejecutando extracción inicial por precaución...")
-            self.run_extraction()
+            self.trigger_extraction('startup')
 
     def start(self):
         """Iniciar el worker"""